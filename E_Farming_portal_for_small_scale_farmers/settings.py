@@ -119,3 +119,6 @@ MEDIA_ROOT = BASE_DIR / "media"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Shared secret payment gateways sign callbacks with; every callback is refused when empty
+PAYMENT_CALLBACK_SECRET = os.environ.get('PAYMENT_CALLBACK_SECRET', '')
@@ -1,14 +1,20 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from django.db.models import Count, Sum
+from django.db.models import Count, Q, Sum
 from django.contrib.admin import SimpleListFilter
 import json
 
 # Import all models
 from .models import *
+from .exports import streaming_export
+from .facets import PRICE_BANDS, price_band_filter
+from .inventory import release_reservations
+from .order_states import transition_orders
+from .pagination import KeysetPaginationMixin
+from .search import matching_products
 
 
 # ============== CUSTOM FILTERS ==============
@@ -62,6 +68,7 @@ class CustomUserAdmin(UserAdmin):
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'preferred_language', 'website']
+    list_select_related = ['user']
     search_fields = ['user__username', 'bio']
     list_filter = ['preferred_language']
 
@@ -73,40 +80,54 @@ class CountyAdmin(admin.ModelAdmin):
     list_display = ['name', 'code', 'population', 'area_sq_km', 'subcounty_count']
     search_fields = ['name', 'code']
     ordering = ['name']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(subcounty_total=Count('subcounties'))
     
     def subcounty_count(self, obj):
-        return obj.subcounties.count()
+        return obj.subcounty_total
     subcounty_count.short_description = 'Sub-Counties'
+    subcounty_count.admin_order_field = 'subcounty_total'
 
 
 @admin.register(SubCounty)
 class SubCountyAdmin(admin.ModelAdmin):
     list_display = ['name', 'county', 'code', 'ward_count']
+    list_select_related = ['county']
     search_fields = ['name', 'code', 'county__name']
     list_filter = ['county']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(ward_total=Count('wards'))
     
     def ward_count(self, obj):
-        return obj.wards.count()
+        return obj.ward_total
     ward_count.short_description = 'Wards'
+    ward_count.admin_order_field = 'ward_total'
 
 
 @admin.register(Ward)
 class WardAdmin(admin.ModelAdmin):
     list_display = ['name', 'subcounty', 'county', 'code']
+    list_select_related = ['subcounty__county']
     search_fields = ['name', 'code', 'subcounty__name']
     list_filter = ['subcounty__county']
+    autocomplete_fields = ['subcounty']
     
     def county(self, obj):
         return obj.subcounty.county.name
     county.short_description = 'County'
+    county.admin_order_field = 'subcounty__county__name'
 
 
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
     list_display = ['name', 'user', 'county', 'subcounty', 'ward', 'is_default']
+    list_select_related = ['user', 'county', 'subcounty__county', 'ward__subcounty']
     search_fields = ['name', 'user__username', 'village']
     list_filter = ['county', 'is_default']
     readonly_fields = ['created_at']
+    autocomplete_fields = ['subcounty', 'ward']
 
 
 # ============== FARMER MODELS ==============
@@ -115,6 +136,7 @@ class LocationAdmin(admin.ModelAdmin):
 class FarmerProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'farm_name', 'farming_type', 'years_of_experience', 
                    'total_farm_size', 'is_cooperative_member', 'created_at']
+    list_select_related = ['user']
     search_fields = ['user__username', 'farm_name', 'cooperative_name']
     list_filter = ['farming_type', 'years_of_experience', 'is_cooperative_member']
     readonly_fields = ['created_at']
@@ -141,6 +163,7 @@ class FarmerProfileAdmin(admin.ModelAdmin):
 @admin.register(Farm)
 class FarmAdmin(admin.ModelAdmin):
     list_display = ['name', 'farmer', 'size', 'location', 'soil_type', 'is_active', 'created_at']
+    list_select_related = ['farmer', 'location']
     search_fields = ['name', 'farmer__user__username', 'description']
     list_filter = ['is_active', 'soil_type', 'water_source']
     readonly_fields = ['created_at']
@@ -151,18 +174,24 @@ class FarmAdmin(admin.ModelAdmin):
 @admin.register(CropCategory)
 class CropCategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'parent', 'is_active', 'crop_count', 'created_at']
+    list_select_related = ['parent']
     search_fields = ['name', 'description']
     list_filter = ['is_active', 'parent']
     readonly_fields = ['created_at']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(crop_total=Count('crops'))
     
     def crop_count(self, obj):
-        return obj.crops.count()
+        return obj.crop_total
     crop_count.short_description = 'Crops'
+    crop_count.admin_order_field = 'crop_total'
 
 
 @admin.register(Crop)
 class CropAdmin(admin.ModelAdmin):
     list_display = ['name', 'scientific_name', 'category', 'variety', 'maturity_period_days', 'is_active']
+    list_select_related = ['category']
     search_fields = ['name', 'scientific_name', 'variety']
     list_filter = ['category', 'is_active', 'growing_season']
     readonly_fields = ['created_at']
@@ -171,6 +200,7 @@ class CropAdmin(admin.ModelAdmin):
 @admin.register(ProductUnit)
 class ProductUnitAdmin(admin.ModelAdmin):
     list_display = ['name', 'abbreviation', 'base_unit', 'conversion_factor']
+    list_select_related = ['base_unit']
     search_fields = ['name', 'abbreviation']
 
 
@@ -180,10 +210,19 @@ class ProductUnitAdmin(admin.ModelAdmin):
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'farmer', 'crop', 'price_per_unit', 'quantity_available', 
                    'quality_grade', 'status', 'featured', 'views_count', 'created_at']
+    list_select_related = ['farmer__user', 'crop']
     search_fields = ['name', 'farmer__user__username', 'crop__name', 'description']
+    search_help_text = 'Matches name, description, crop, category and county by word prefix, or an exact farmer username'
     list_filter = ['status', 'quality_grade', 'featured', 'organic_certified', 'crop__category']
     readonly_fields = ['slug', 'views_count', 'likes_count', 'created_at', 'updated_at']
-    prepopulated_fields = {'slug': ('name',)}
+
+    def get_search_results(self, request, queryset, search_term):
+        # The search index replaces icontains scans across four joined tables
+        matches = matching_products(search_term)
+        if matches is None:
+            return super().get_search_results(request, queryset, search_term)
+        by_farmer = Product.objects.filter(farmer__user__username=search_term.strip()).values('pk')
+        return queryset.filter(Q(pk__in=matches) | Q(pk__in=by_farmer)), False
     
     fieldsets = (
         ('Basic Information', {
@@ -211,8 +250,10 @@ class ProductAdmin(admin.ModelAdmin):
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
     list_display = ['product', 'caption', 'is_primary', 'order', 'image_preview']
+    list_select_related = ['product__farmer__user']
     search_fields = ['product__name', 'caption']
     list_filter = ['is_primary']
+    autocomplete_fields = ['product']
     
     def image_preview(self, obj):
         if obj.image:
@@ -225,9 +266,11 @@ class ProductImageAdmin(admin.ModelAdmin):
 class ProductReviewAdmin(admin.ModelAdmin):
     list_display = ['product', 'buyer', 'rating', 'title', 'is_verified_purchase', 
                    'helpful_votes', 'created_at']
+    list_select_related = ['product__farmer__user', 'buyer']
     search_fields = ['product__name', 'buyer__username', 'title', 'comment']
     list_filter = ['rating', 'is_verified_purchase']
     readonly_fields = ['created_at', 'updated_at']
+    autocomplete_fields = ['product']
 
 
 # ============== BUYER MODELS ==============
@@ -235,6 +278,7 @@ class ProductReviewAdmin(admin.ModelAdmin):
 @admin.register(BuyerProfile)
 class BuyerProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'buyer_type', 'business_name', 'credit_limit', 'created_at']
+    list_select_related = ['user']
     search_fields = ['user__username', 'business_name', 'business_registration']
     list_filter = ['buyer_type']
     readonly_fields = ['created_at']
@@ -243,8 +287,10 @@ class BuyerProfileAdmin(admin.ModelAdmin):
 @admin.register(Wishlist)
 class WishlistAdmin(admin.ModelAdmin):
     list_display = ['buyer', 'product', 'created_at']
+    list_select_related = ['buyer', 'product__farmer__user']
     search_fields = ['buyer__username', 'product__name']
     list_filter = ['created_at']
+    autocomplete_fields = ['product']
 
 
 # ============== ORDER MODELS ==============
@@ -252,33 +298,47 @@ class WishlistAdmin(admin.ModelAdmin):
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ['buyer', 'item_count', 'total_value', 'updated_at']
+    list_select_related = ['buyer']
     search_fields = ['buyer__username']
     readonly_fields = ['created_at', 'updated_at']
+
+    def get_queryset(self, request):
+        # Both aggregates follow the same single join, so neither is inflated
+        return super().get_queryset(request).annotate(
+            item_total=Count('items'), value_total=Sum('items__total_price'),
+        )
     
     def item_count(self, obj):
-        return obj.items.count()
+        return obj.item_total
     item_count.short_description = 'Items'
+    item_count.admin_order_field = 'item_total'
     
     def total_value(self, obj):
-        total = obj.items.aggregate(total=Sum('total_price'))['total']
+        total = obj.value_total
         return f"KES {total:.2f}" if total else "KES 0.00"
     total_value.short_description = 'Total Value'
+    total_value.admin_order_field = 'value_total'
 
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ['product_snapshot']
+    autocomplete_fields = ['product']
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['order_number', 'buyer', 'farmer', 'status', 'payment_status', 
                    'total_amount', 'order_date', 'expected_delivery_date']
+    list_select_related = ['buyer', 'farmer']
     search_fields = ['order_number', 'buyer__username', 'farmer__user__username']
     list_filter = ['status', 'payment_status', 'order_date']
-    readonly_fields = ['order_number', 'created_at', 'updated_at']
+    readonly_fields = ['order_number', 'order_date', 'created_at', 'updated_at']
     inlines = [OrderItemInline]
+    actions = [
+        'mark_confirmed', 'mark_processing', 'mark_ready', 'mark_shipped', 'mark_delivered', 'mark_cancelled',
+    ]
     
     fieldsets = (
         ('Order Information', {
@@ -299,14 +359,76 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_readonly_fields(self, request, obj=None):
+        # Existing orders change status through the actions, which record history
+        if obj is None:
+            return self.readonly_fields
+        return self.readonly_fields + ['status', 'delivered_at', 'cancelled_at']
+
+    def transition(self, request, queryset, status):
+        result = transition_orders(queryset, status, request.user)
+        self.message_user(request, f'{len(result)} orders marked {status}.', messages.SUCCESS)
+        if result.skipped:
+            self.message_user(
+                request, f'{len(result.skipped)} orders cannot move to {status} and were skipped.', messages.WARNING,
+            )
+
+    @admin.action(description='Mark selected orders confirmed')
+    def mark_confirmed(self, request, queryset):
+        self.transition(request, queryset, 'confirmed')
+
+    @admin.action(description='Mark selected orders processing')
+    def mark_processing(self, request, queryset):
+        self.transition(request, queryset, 'processing')
+
+    @admin.action(description='Mark selected orders ready for delivery')
+    def mark_ready(self, request, queryset):
+        self.transition(request, queryset, 'ready')
+
+    @admin.action(description='Mark selected orders shipped')
+    def mark_shipped(self, request, queryset):
+        self.transition(request, queryset, 'shipped')
+
+    @admin.action(description='Mark selected orders delivered')
+    def mark_delivered(self, request, queryset):
+        self.transition(request, queryset, 'delivered')
+
+    @admin.action(description='Cancel selected orders and return their stock')
+    def mark_cancelled(self, request, queryset):
+        self.transition(request, queryset, 'cancelled')
+
 
 @admin.register(OrderStatusHistory)
 class OrderStatusHistoryAdmin(admin.ModelAdmin):
     list_display = ['order', 'previous_status', 'new_status', 'changed_by', 'timestamp']
+    list_select_related = ['order', 'changed_by']
     search_fields = ['order__order_number', 'changed_by__username']
     list_filter = ['new_status', 'timestamp']
     readonly_fields = ['timestamp']
 
+    # History is append-only; rows are written by order_states.transition_orders()
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(InventoryReservation)
+class InventoryReservationAdmin(admin.ModelAdmin):
+    list_display = ['product', 'buyer', 'quantity', 'status', 'order', 'expires_at', 'created_at']
+    list_select_related = ['product__farmer__user', 'buyer', 'order']
+    search_fields = ['product__name', 'buyer__username', 'order__order_number']
+    list_filter = ['status']
+    readonly_fields = ['created_at', 'updated_at']
+    autocomplete_fields = ['product', 'buyer', 'order']
+    actions = ['release_reservations']
+
+    @admin.action(description='Release selected reservations and return their stock')
+    def release_reservations(self, request, queryset):
+        released = release_reservations(list(queryset.values_list('pk', flat=True)))
+        self.message_user(request, f'{released} reservations released.', messages.SUCCESS)
+
 
 # ============== PAYMENT MODELS ==============
 
@@ -321,11 +443,27 @@ class PaymentMethodAdmin(admin.ModelAdmin):
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ['transaction_id', 'order', 'payment_method', 'amount', 
                    'status', 'payment_type', 'paid_at', 'created_at']
+    list_select_related = ['order', 'payment_method']
     search_fields = ['transaction_id', 'order__order_number', 'gateway_reference']
     list_filter = ['status', 'payment_type', 'payment_method']
     readonly_fields = ['created_at']
 
 
+@admin.register(PaymentCallback)
+class PaymentCallbackAdmin(admin.ModelAdmin):
+    list_display = ['gateway_reference', 'transaction_id', 'result', 'amount', 'state', 'attempts',
+                    'error', 'received_at', 'processed_at']
+    search_fields = ['gateway_reference', 'transaction_id']
+    list_filter = ['state', 'result']
+    readonly_fields = ['received_at', 'processed_at', 'claimed_by', 'claimed_at']
+    actions = ['requeue']
+
+    @admin.action(description='Queue selected callbacks again')
+    def requeue(self, request, queryset):
+        requeued = queryset.exclude(state='applied').update(state='queued', attempts=0, claimed_by='', error='')
+        self.message_user(request, f'{requeued} callbacks queued again.', messages.SUCCESS)
+
+
 # ============== DELIVERY MODELS ==============
 
 @admin.register(DeliveryZone)
@@ -343,12 +481,23 @@ class DeliveryPartnerAdmin(admin.ModelAdmin):
     search_fields = ['name', 'contact_person', 'phone_number', 'email']
     list_filter = ['is_active', 'rating']
     filter_horizontal = ['service_areas']
+    autocomplete_fields = ['accounts']
+
+
+@admin.register(DeliveryRoute)
+class DeliveryRouteAdmin(admin.ModelAdmin):
+    list_display = ['id', 'delivery_partner', 'driver_name', 'vehicle_details', 'status', 'distance_km', 'created_at']
+    list_select_related = ['delivery_partner']
+    search_fields = ['driver_name', 'driver_phone', 'vehicle_details']
+    list_filter = ['status', 'delivery_partner']
+    readonly_fields = ['stops', 'distance_km', 'created_at']
 
 
 @admin.register(Delivery)
 class DeliveryAdmin(admin.ModelAdmin):
     list_display = ['order', 'delivery_partner', 'driver_name', 'status', 
                    'estimated_delivery_time', 'actual_delivery_time']
+    list_select_related = ['order', 'delivery_partner']
     search_fields = ['order__order_number', 'driver_name', 'driver_phone']
     list_filter = ['status', 'delivery_partner']
     readonly_fields = ['created_at']
@@ -357,9 +506,11 @@ class DeliveryAdmin(admin.ModelAdmin):
 # ============== MARKET INTELLIGENCE ==============
 
 @admin.register(MarketPrice)
-class MarketPriceAdmin(admin.ModelAdmin):
+class MarketPriceAdmin(KeysetPaginationMixin, admin.ModelAdmin):
+    keyset_ordering = ('-date_recorded', '-id')
     list_display = ['crop', 'location', 'price_per_unit', 'unit', 'quality_grade', 
                    'price_trend', 'date_recorded']
+    list_select_related = ['crop', 'location', 'unit']
     search_fields = ['crop__name', 'location__name', 'market_name']
     list_filter = ['price_trend', 'quality_grade', 'date_recorded', 'location']
     date_hierarchy = 'date_recorded'
@@ -369,6 +520,7 @@ class MarketPriceAdmin(admin.ModelAdmin):
 class CropCalendarAdmin(admin.ModelAdmin):
     list_display = ['crop', 'county', 'planting_season_start', 'planting_season_end',
                    'harvesting_season_start', 'harvesting_season_end']
+    list_select_related = ['crop', 'county']
     search_fields = ['crop__name', 'county__name']
     list_filter = ['county', 'crop__category']
 
@@ -377,6 +529,7 @@ class CropCalendarAdmin(admin.ModelAdmin):
 class MarketDemandForecastAdmin(admin.ModelAdmin):
     list_display = ['crop', 'location', 'forecast_period', 'expected_demand', 
                    'price_prediction', 'confidence_level']
+    list_select_related = ['crop', 'location']
     search_fields = ['crop__name', 'location__name', 'forecast_period']
     list_filter = ['expected_demand', 'price_prediction', 'location']
 
@@ -386,6 +539,7 @@ class MarketDemandForecastAdmin(admin.ModelAdmin):
 @admin.register(InputCategory)
 class InputCategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'parent', 'is_active']
+    list_select_related = ['parent']
     search_fields = ['name', 'description']
     list_filter = ['is_active', 'parent']
 
@@ -393,6 +547,7 @@ class InputCategoryAdmin(admin.ModelAdmin):
 @admin.register(InputSupplier)
 class InputSupplierAdmin(admin.ModelAdmin):
     list_display = ['business_name', 'user', 'is_verified', 'rating', 'total_sales']
+    list_select_related = ['user']
     search_fields = ['business_name', 'user__username', 'license_number']
     list_filter = ['is_verified', 'delivery_available', 'credit_terms_available']
     filter_horizontal = ['specialization', 'service_areas']
@@ -402,6 +557,7 @@ class InputSupplierAdmin(admin.ModelAdmin):
 class AgriculturalInputAdmin(admin.ModelAdmin):
     list_display = ['name', 'supplier', 'input_type', 'brand', 'price_per_unit', 
                    'stock_quantity', 'is_active']
+    list_select_related = ['supplier']
     search_fields = ['name', 'brand', 'supplier__business_name', 'manufacturer']
     list_filter = ['input_type', 'is_active', 'category']
     filter_horizontal = ['compatible_crops']
@@ -412,6 +568,7 @@ class AgriculturalInputAdmin(admin.ModelAdmin):
 @admin.register(ExtensionAgent)
 class ExtensionAgentAdmin(admin.ModelAdmin):
     list_display = ['user', 'employee_id', 'years_of_experience', 'rating', 'is_available']
+    list_select_related = ['user']
     search_fields = ['user__username', 'employee_id', 'qualifications']
     list_filter = ['is_available', 'years_of_experience']
     filter_horizontal = ['service_areas']
@@ -421,9 +578,11 @@ class ExtensionAgentAdmin(admin.ModelAdmin):
 class AdvisoryAdmin(admin.ModelAdmin):
     list_display = ['title', 'agent', 'advisory_type', 'priority', 'is_published', 
                    'valid_from', 'views_count']
+    list_select_related = ['agent__user']
     search_fields = ['title', 'content', 'agent__user__username']
     list_filter = ['advisory_type', 'priority', 'is_published']
     filter_horizontal = ['target_crops', 'target_areas']
+    autocomplete_fields = ['agent']
     date_hierarchy = 'valid_from'
 
 
@@ -431,8 +590,10 @@ class AdvisoryAdmin(admin.ModelAdmin):
 class ConsultationRequestAdmin(admin.ModelAdmin):
     list_display = ['farmer', 'agent', 'subject', 'consultation_type', 'status', 
                    'preferred_date', 'consultation_fee']
+    list_select_related = ['farmer', 'agent__user']
     search_fields = ['farmer__user__username', 'agent__user__username', 'subject']
     list_filter = ['consultation_type', 'status']
+    autocomplete_fields = ['agent']
 
 
 # ============== COOPERATIVE MODELS ==============
@@ -441,6 +602,7 @@ class ConsultationRequestAdmin(admin.ModelAdmin):
 class CooperativeAdmin(admin.ModelAdmin):
     list_display = ['name', 'cooperative_type', 'chairman', 'member_count', 
                    'registration_date', 'is_active']
+    list_select_related = ['chairman']
     search_fields = ['name', 'registration_number', 'description']
     list_filter = ['cooperative_type', 'is_active']
 
@@ -449,6 +611,7 @@ class CooperativeAdmin(admin.ModelAdmin):
 class CooperativeMembershipAdmin(admin.ModelAdmin):
     list_display = ['cooperative', 'member', 'membership_number', 'status', 
                    'shares_owned', 'join_date']
+    list_select_related = ['cooperative', 'member']
     search_fields = ['cooperative__name', 'member__username', 'membership_number']
     list_filter = ['status', 'join_date']
 
@@ -467,6 +630,7 @@ class FinancialInstitutionAdmin(admin.ModelAdmin):
 class LoanProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'institution', 'minimum_amount', 'maximum_amount', 
                    'interest_rate', 'repayment_period_months', 'is_active']
+    list_select_related = ['institution']
     search_fields = ['name', 'institution__name', 'loan_type']
     list_filter = ['institution', 'is_active', 'collateral_required']
 
@@ -475,6 +639,7 @@ class LoanProductAdmin(admin.ModelAdmin):
 class LoanApplicationAdmin(admin.ModelAdmin):
     list_display = ['application_number', 'farmer', 'loan_product', 'requested_amount', 
                    'status', 'submitted_date']
+    list_select_related = ['farmer', 'loan_product']
     search_fields = ['application_number', 'farmer__user__username', 'loan_product__name']
     list_filter = ['status', 'submitted_date', 'loan_product__institution']
     readonly_fields = ['application_number', 'created_at', 'updated_at']
@@ -494,6 +659,7 @@ class InsuranceProviderAdmin(admin.ModelAdmin):
 class InsuranceProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'provider', 'coverage_type', 'coverage_percentage', 
                    'premium_rate', 'is_active']
+    list_select_related = ['provider']
     search_fields = ['name', 'provider__name', 'description']
     list_filter = ['coverage_type', 'is_active', 'provider']
     filter_horizontal = ['covered_crops']
@@ -503,6 +669,7 @@ class InsuranceProductAdmin(admin.ModelAdmin):
 class InsurancePolicyAdmin(admin.ModelAdmin):
     list_display = ['policy_number', 'farmer', 'product', 'coverage_amount', 
                    'status', 'policy_start_date', 'policy_end_date']
+    list_select_related = ['farmer', 'product']
     search_fields = ['policy_number', 'farmer__user__username', 'product__name']
     list_filter = ['status', 'policy_start_date', 'product__provider']
     filter_horizontal = ['covered_farms']
@@ -512,6 +679,7 @@ class InsurancePolicyAdmin(admin.ModelAdmin):
 class InsuranceClaimAdmin(admin.ModelAdmin):
     list_display = ['claim_number', 'policy', 'incident_date', 'claimed_amount', 
                    'status', 'approved_amount']
+    list_select_related = ['policy']
     search_fields = ['claim_number', 'policy__policy_number', 'incident_description']
     list_filter = ['status', 'incident_date']
     readonly_fields = ['created_at', 'updated_at']
@@ -520,16 +688,20 @@ class InsuranceClaimAdmin(admin.ModelAdmin):
 # ============== COMMUNICATION MODELS ==============
 
 @admin.register(Notification)
-class NotificationAdmin(admin.ModelAdmin):
+class NotificationAdmin(KeysetPaginationMixin, admin.ModelAdmin):
+    keyset_ordering = ('-created_at', '-id')
     list_display = ['recipient', 'title', 'notification_type', 'is_read', 'is_sent', 'created_at']
+    list_select_related = ['recipient']
     search_fields = ['recipient__username', 'title', 'message']
     list_filter = ['notification_type', 'is_read', 'is_sent', 'send_email', 'send_sms']
     readonly_fields = ['sent_at', 'read_at', 'created_at']
 
 
 @admin.register(Message)
-class MessageAdmin(admin.ModelAdmin):
+class MessageAdmin(KeysetPaginationMixin, admin.ModelAdmin):
+    keyset_ordering = ('-created_at', '-id')
     list_display = ['sender', 'recipient', 'subject', 'is_read', 'created_at']
+    list_select_related = ['sender', 'recipient']
     search_fields = ['sender__username', 'recipient__username', 'subject', 'content']
     list_filter = ['is_read', 'created_at']
     readonly_fields = ['read_at', 'created_at']
@@ -538,8 +710,10 @@ class MessageAdmin(admin.ModelAdmin):
 # ============== ANALYTICS MODELS ==============
 
 @admin.register(UserActivity)
-class UserActivityAdmin(admin.ModelAdmin):
+class UserActivityAdmin(KeysetPaginationMixin, admin.ModelAdmin):
+    keyset_ordering = ('-timestamp', '-id')
     list_display = ['user', 'activity_type', 'description', 'timestamp']
+    list_select_related = ['user']
     search_fields = ['user__username', 'activity_type', 'description']
     list_filter = ['activity_type', 'timestamp']
     readonly_fields = ['timestamp']
@@ -559,6 +733,7 @@ class SystemMetricsAdmin(admin.ModelAdmin):
 class BlogPostAdmin(admin.ModelAdmin):
     list_display = ['title', 'author', 'content_type', 'is_published', 'is_featured', 
                    'views_count', 'published_at']
+    list_select_related = ['author']
     search_fields = ['title', 'content', 'author__username']
     list_filter = ['content_type', 'is_published', 'is_featured', 'published_at']
     prepopulated_fields = {'slug': ('title',)}
@@ -578,6 +753,7 @@ class FAQAdmin(admin.ModelAdmin):
 class SupportTicketAdmin(admin.ModelAdmin):
     list_display = ['ticket_number', 'user', 'subject', 'category', 'priority', 
                    'status', 'assigned_to', 'created_at']
+    list_select_related = ['user', 'assigned_to']
     search_fields = ['ticket_number', 'user__username', 'subject', 'description']
     list_filter = ['category', 'priority', 'status', 'assigned_to']
     readonly_fields = ['ticket_number', 'created_at', 'updated_at']
@@ -595,6 +771,7 @@ class SubscriptionPlanAdmin(admin.ModelAdmin):
 @admin.register(UserSubscription)
 class UserSubscriptionAdmin(admin.ModelAdmin):
     list_display = ['user', 'plan', 'status', 'start_date', 'end_date', 'auto_renew']
+    list_select_related = ['user', 'plan']
     search_fields = ['user__username', 'plan__name']
     list_filter = ['status', 'auto_renew', 'start_date']
 
@@ -604,6 +781,7 @@ class UserSubscriptionAdmin(admin.ModelAdmin):
 @admin.register(Warehouse)
 class WarehouseAdmin(admin.ModelAdmin):
     list_display = ['name', 'manager', 'capacity', 'monthly_rate', 'is_active']
+    list_select_related = ['manager']
     search_fields = ['name', 'manager__username']
     list_filter = ['is_active']
 
@@ -612,8 +790,10 @@ class WarehouseAdmin(admin.ModelAdmin):
 class StorageBookingAdmin(admin.ModelAdmin):
     list_display = ['booking_number', 'farmer', 'warehouse', 'product', 
                    'status', 'start_date', 'end_date', 'total_cost']
+    list_select_related = ['farmer', 'warehouse', 'product__farmer__user']
     search_fields = ['booking_number', 'farmer__user__username', 'warehouse__name']
     list_filter = ['status', 'start_date']
+    autocomplete_fields = ['product']
 
 
 # ============== QUALITY ASSURANCE ==============
@@ -621,6 +801,7 @@ class StorageBookingAdmin(admin.ModelAdmin):
 @admin.register(QualityStandard)
 class QualityStandardAdmin(admin.ModelAdmin):
     list_display = ['crop', 'standard_name', 'certifying_body', 'validity_period_months', 'is_active']
+    list_select_related = ['crop']
     search_fields = ['crop__name', 'standard_name', 'certifying_body']
     list_filter = ['certifying_body', 'is_active']
 
@@ -628,6 +809,7 @@ class QualityStandardAdmin(admin.ModelAdmin):
 @admin.register(QualityInspector)
 class QualityInspectorAdmin(admin.ModelAdmin):
     list_display = ['user', 'license_number', 'inspection_fee', 'rating', 'is_available']
+    list_select_related = ['user']
     search_fields = ['user__username', 'license_number']
     list_filter = ['is_available', 'rating']
     filter_horizontal = ['specialization', 'service_areas']
@@ -637,8 +819,10 @@ class QualityInspectorAdmin(admin.ModelAdmin):
 class QualityInspectionAdmin(admin.ModelAdmin):
     list_display = ['inspection_number', 'product', 'inspector', 'inspection_type', 
                    'status', 'overall_grade', 'certificate_issued']
+    list_select_related = ['product__farmer__user', 'inspector']
     search_fields = ['inspection_number', 'product__name', 'inspector__user__username']
     list_filter = ['inspection_type', 'status', 'certificate_issued']
+    autocomplete_fields = ['product']
 
 
 # ============== TRAINING MODELS ==============
@@ -655,6 +839,7 @@ class TrainingProviderAdmin(admin.ModelAdmin):
 class TrainingCourseAdmin(admin.ModelAdmin):
     list_display = ['title', 'provider', 'course_type', 'difficulty_level', 
                    'duration_hours', 'course_fee', 'is_active']
+    list_select_related = ['provider']
     search_fields = ['title', 'provider__name', 'description']
     list_filter = ['course_type', 'difficulty_level', 'is_active']
     filter_horizontal = ['target_crops']
@@ -664,6 +849,7 @@ class TrainingCourseAdmin(admin.ModelAdmin):
 class TrainingSessionAdmin(admin.ModelAdmin):
     list_display = ['session_name', 'course', 'instructor', 'start_date', 
                    'status', 'enrolled_count', 'completion_rate']
+    list_select_related = ['course']
     search_fields = ['session_name', 'course__title', 'instructor']
     list_filter = ['status', 'start_date']
 
@@ -672,6 +858,7 @@ class TrainingSessionAdmin(admin.ModelAdmin):
 class TrainingEnrollmentAdmin(admin.ModelAdmin):
     list_display = ['farmer', 'session', 'status', 'progress_percentage', 
                    'completion_date', 'certificate_issued']
+    list_select_related = ['farmer', 'session']
     search_fields = ['farmer__user__username', 'session__session_name']
     list_filter = ['status', 'certificate_issued', 'enrollment_date']
 
@@ -692,6 +879,7 @@ class GovernmentSchemeAdmin(admin.ModelAdmin):
 class SchemeApplicationAdmin(admin.ModelAdmin):
     list_display = ['application_number', 'scheme', 'farmer', 'status', 
                    'submitted_date', 'approved_amount']
+    list_select_related = ['scheme', 'farmer']
     search_fields = ['application_number', 'scheme__name', 'farmer__user__username']
     list_filter = ['status', 'submitted_date', 'scheme']
     readonly_fields = ['application_number', 'created_at', 'updated_at']
@@ -702,6 +890,7 @@ class SchemeApplicationAdmin(admin.ModelAdmin):
 @admin.register(MobileDevice)
 class MobileDeviceAdmin(admin.ModelAdmin):
     list_display = ['user', 'device_type', 'app_version', 'os_version', 'is_active', 'last_seen']
+    list_select_related = ['user']
     search_fields = ['user__username', 'device_id', 'device_token']
     list_filter = ['device_type', 'is_active', 'app_version']
     readonly_fields = ['last_seen', 'created_at']
@@ -719,8 +908,10 @@ class AppVersionAdmin(admin.ModelAdmin):
 # ============== AUDIT TRAIL ==============
 
 @admin.register(AuditLog)
-class AuditLogAdmin(admin.ModelAdmin):
+class AuditLogAdmin(KeysetPaginationMixin, admin.ModelAdmin):
+    keyset_ordering = ('-timestamp', '-id')
     list_display = ['user', 'action', 'object_type', 'object_repr', 'timestamp']
+    list_select_related = ['user']
     search_fields = ['user__username', 'object_type', 'object_repr']
     list_filter = ['action', 'object_type', 'timestamp']
     readonly_fields = ['timestamp']
@@ -818,6 +1009,7 @@ class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
     readonly_fields = ['total_price']
+    autocomplete_fields = ['product']
 
 
 class NotificationInline(admin.TabularInline):
@@ -868,30 +1060,36 @@ class DashboardAdmin(admin.ModelAdmin):
 
 # ============== EXPORT FUNCTIONALITY ==============
 
-def export_as_csv(modeladmin, request, queryset):
-    """Export selected objects as CSV"""
-    import csv
-    from django.http import HttpResponse
-    
-    meta = modeladmin.model._meta
-    field_names = [field.name for field in meta.fields]
-    
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename={meta}.csv'
-    writer = csv.writer(response)
-    
-    writer.writerow(field_names)
-    for obj in queryset:
-        writer.writerow([getattr(obj, field) for field in field_names])
-    
-    return response
+def export_queryset(modeladmin, request, queryset, fmt):
+    """Stream the selected objects to the browser in one of exports.FORMATS"""
+    try:
+        return streaming_export(queryset, fmt, filename=str(modeladmin.model._meta))
+    except ValueError as e:
+        modeladmin.message_user(request, str(e), level=messages.ERROR)
 
+def export_as_csv(modeladmin, request, queryset):
+    return export_queryset(modeladmin, request, queryset, 'csv')
 export_as_csv.short_description = "Export selected as CSV"
 
-# Add export action to relevant admin classes
-# ProductAdmin.actions = ProductAdmin.actions + (export_as_csv,)
-# OrderAdmin.actions = OrderAdmin.actions + (export_as_csv,)
-# CustomUserAdmin.actions = CustomUserAdmin.actions + (export_as_csv,)
+def export_as_csv_gzip(modeladmin, request, queryset):
+    return export_queryset(modeladmin, request, queryset, 'csv.gz')
+export_as_csv_gzip.short_description = "Export selected as gzipped CSV"
+
+def export_as_jsonl(modeladmin, request, queryset):
+    return export_queryset(modeladmin, request, queryset, 'jsonl')
+export_as_jsonl.short_description = "Export selected as JSON lines"
+
+def export_as_parquet(modeladmin, request, queryset):
+    return export_queryset(modeladmin, request, queryset, 'parquet')
+export_as_parquet.short_description = "Export selected as Parquet"
+
+EXPORT_ACTIONS = [export_as_csv, export_as_csv_gzip, export_as_jsonl, export_as_parquet]
+
+# Add export actions to relevant admin classes
+ProductAdmin.actions = ProductAdmin.actions + EXPORT_ACTIONS
+OrderAdmin.actions = OrderAdmin.actions + EXPORT_ACTIONS
+MarketPriceAdmin.actions = EXPORT_ACTIONS
+PaymentAdmin.actions = EXPORT_ACTIONS
 
 
 # ============== ADVANCED FILTERS ==============
@@ -928,22 +1126,11 @@ class PriceRangeFilter(admin.SimpleListFilter):
     parameter_name = 'price_range'
 
     def lookups(self, request, model_admin):
-        return (
-            ('0-100', '0 - 100'),
-            ('100-500', '100 - 500'),
-            ('500-1000', '500 - 1000'),
-            ('1000+', '1000+'),
-        )
+        return [(value, label) for value, label, *_ in PRICE_BANDS]
 
     def queryset(self, request, queryset):
-        if self.value() == '0-100':
-            return queryset.filter(price_per_unit__lt=100)
-        elif self.value() == '100-500':
-            return queryset.filter(price_per_unit__gte=100, price_per_unit__lt=500)
-        elif self.value() == '500-1000':
-            return queryset.filter(price_per_unit__gte=500, price_per_unit__lt=1000)
-        elif self.value() == '1000+':
-            return queryset.filter(price_per_unit__gte=1000)
+        if self.value() in {value for value, *_ in PRICE_BANDS}:
+            return queryset.filter(price_band_filter(self.value()))
         return queryset
 
 
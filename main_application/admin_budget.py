@@ -0,0 +1,249 @@
+"""
+Query and latency budgets for the admin.
+
+Renders the changelist, a change form and a search for every ModelAdmin
+registered for this app, first with a few rows per model and then with
+more, and records the number of queries, time spent in SQL and total
+response time of each page. A page whose query count grows with the rows
+has a per-row lookup; a page above its entry in admin_budgets.json got
+more expensive. Both are reported by check_results(), which the test
+suite (AdminBudgetTests) turns into failures.
+
+Rows are made by FixtureFactory, which fills every required field of any
+model and creates the rows its foreign keys point at, so new models and
+admins are covered without writing fixtures for them.
+
+    ADMIN_BUDGET_REPORT=path   where to write the JSON report
+    ADMIN_BUDGET_UPDATE=1      rewrite admin_budgets.json from this run
+"""
+
+from datetime import time as clock_time, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.db import connection, models
+from django.urls import reverse
+from django.utils import timezone
+from time import perf_counter
+import json
+import os
+import uuid
+
+
+BUDGET_FILE = os.path.join(os.path.dirname(__file__), 'admin_budgets.json')
+DEFAULT_REPORT = os.path.join(settings.BASE_DIR, 'admin_budget_report.json')
+
+SEARCH_TERM = 'fixture'
+
+VIEWS = ['changelist', 'change_form', 'search']
+
+
+class FixtureFactory:
+    """Create rows of any model with every required field filled in"""
+
+    def __init__(self):
+        self.sequence = 0
+
+    def create(self, model, **overrides):
+        self.sequence += 1
+        n = self.sequence
+        values = {}
+        for field in model._meta.concrete_fields:
+            if field.primary_key or field.name in overrides:
+                continue
+            if field.is_relation:
+                # Nullable keys are filled too, so their lookups are measured
+                if field.related_model is not model:
+                    values[field.name] = self.create(field.related_model)
+            elif not self.optional(field):
+                values[field.name] = self.value(field, n)
+        values.update(overrides)
+        obj = model(**values)
+        obj.save()
+        return obj
+
+    def optional(self, field):
+        if field.has_default() or field.null:
+            return True
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            return True
+        return field.blank and field.empty_strings_allowed and not field.unique
+
+    def value(self, field, n):
+        if field.choices:
+            return field.choices[0][0]
+        if isinstance(field, models.EmailField):
+            return f'{SEARCH_TERM}{n}@example.com'
+        if isinstance(field, models.URLField):
+            return f'https://example.com/{SEARCH_TERM}/{n}'
+        if isinstance(field, models.GenericIPAddressField):
+            return '127.0.0.1'
+        if isinstance(field, models.FileField):
+            return f'{SEARCH_TERM}/{n}.jpg'
+        if isinstance(field, (models.CharField, models.TextField)):
+            suffix = f'-{n}'
+            room = (field.max_length or 100) - len(suffix)
+            if room < 1:
+                return str(n)
+            return f'{SEARCH_TERM}-{field.name}'[:room] + suffix
+        if isinstance(field, models.BooleanField):
+            return False
+        if isinstance(field, (models.IntegerField, models.DecimalField, models.FloatField)):
+            low = [v.limit_value for v in field.validators if hasattr(v, 'limit_value') and v.code == 'min_value']
+            value = max(low + [1])
+            return Decimal(value) if isinstance(field, models.DecimalField) else value
+        if isinstance(field, models.DateTimeField):
+            return timezone.now()
+        if isinstance(field, models.DateField):
+            return timezone.now().date()
+        if isinstance(field, models.TimeField):
+            return clock_time(9, 0)
+        if isinstance(field, models.DurationField):
+            return timedelta(hours=1)
+        if isinstance(field, models.UUIDField):
+            return uuid.uuid4()
+        if isinstance(field, models.JSONField):
+            return []
+        raise ValueError(f"No fixture value for {field.model.__name__}.{field.name} ({field.get_internal_type()})")
+
+
+class QueryTimer:
+    """connection.execute_wrapper counting queries and the time spent in them"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += perf_counter() - start
+
+
+def registered_admins(app_label='main_application'):
+    return sorted(
+        ((model, model_admin) for model, model_admin in site._registry.items() if model._meta.app_label == app_label),
+        key=lambda item: item[0]._meta.label,
+    )
+
+
+def admin_urls(model, model_admin):
+    """{view: url} for the pages measured for one admin"""
+    info = (model._meta.app_label, model._meta.model_name)
+    changelist = reverse('admin:%s_%s_changelist' % info)
+    urls = {'changelist': changelist}
+    obj = model._default_manager.order_by('pk').first()
+    if obj is not None:
+        urls['change_form'] = reverse('admin:%s_%s_change' % info, args=[obj.pk])
+    if model_admin.search_fields:
+        urls['search'] = f'{changelist}?q={SEARCH_TERM}'
+    return urls
+
+
+def measure(client, url):
+    timer = QueryTimer()
+    error = None
+    with connection.execute_wrapper(timer):
+        start = perf_counter()
+        try:
+            status = client.get(url).status_code
+        except Exception as e:
+            status, error = 500, f'{type(e).__name__}: {e}'
+        elapsed = perf_counter() - start
+    return {
+        'status': status,
+        'error': error,
+        'queries': timer.count,
+        'sql_ms': round(timer.seconds * 1000, 3),
+        'render_ms': round(elapsed * 1000, 3),
+    }
+
+
+def seed(factory, admins, rows):
+    for model, _model_admin in admins:
+        for _ in range(rows):
+            factory.create(model)
+
+
+def run(client, sizes=(2, 5), factory=None):
+    """
+    Measure every admin page once per entry of sizes, after topping each
+    model up to that many fixture rows. Returns one result per
+    (admin, view, size).
+    """
+    factory = factory or FixtureFactory()
+    admins = registered_admins()
+    results = []
+    seeded = 0
+    for size in sizes:
+        seed(factory, admins, size - seeded)
+        seeded = size
+        for model, model_admin in admins:
+            for view, url in admin_urls(model, model_admin).items():
+                if size == sizes[0]:
+                    # Unmeasured first request fills per-process caches (content types, sessions)
+                    measure(client, url)
+                results.append({'admin': model._meta.label, 'view': view, 'rows': size, 'url': url, **measure(client, url)})
+    return results
+
+
+def load_budgets(path=BUDGET_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def budgets_from(results):
+    """{admin: {view: queries}} at the largest size measured"""
+    largest = max(result['rows'] for result in results)
+    budgets = {}
+    for result in results:
+        if result['rows'] == largest:
+            budgets.setdefault(result['admin'], {})[result['view']] = result['queries']
+    return budgets
+
+
+def check_results(results, budgets):
+    """Human-readable problems: errors, per-row queries and budget overruns"""
+    problems = []
+    by_page = {}
+    for result in results:
+        by_page.setdefault((result['admin'], result['view']), []).append(result)
+    for (label, view), rounds in sorted(by_page.items()):
+        for result in rounds:
+            if result['status'] != 200:
+                detail = result['error'] or f"HTTP {result['status']}"
+                problems.append(f"{label} {view}: {detail} at {result['url']}")
+        counts = [result['queries'] for result in rounds]
+        if len(set(counts)) > 1:
+            sizes = ', '.join(f"{r['rows']} rows: {r['queries']}" for r in rounds)
+            problems.append(f"{label} {view}: queries grow with rows ({sizes})")
+        budget = budgets.get(label, {}).get(view)
+        if budget is None:
+            problems.append(f"{label} {view}: no budget in {os.path.basename(BUDGET_FILE)}")
+        elif max(counts) > budget:
+            problems.append(f"{label} {view}: {max(counts)} queries, budget is {budget}")
+    return problems
+
+
+def write_report(results, problems, path=None):
+    path = path or os.environ.get('ADMIN_BUDGET_REPORT') or DEFAULT_REPORT
+    report = {
+        'generated_at': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'results': results,
+        'problems': problems,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def write_budgets(budgets, path=BUDGET_FILE):
+    with open(path, 'w') as f:
+        json.dump(budgets, f, indent=2, sort_keys=True)
+        f.write('\n')
@@ -0,0 +1,32 @@
+"""
+Rows shared by the benchmark_* management commands.
+"""
+
+from decimal import Decimal
+import uuid
+
+from .models import County, Crop, CropCategory, CustomUser, Farm, FarmerProfile, Location, ProductUnit, SubCounty, Ward
+
+
+def create_fixture():
+    """Minimal related rows a Product needs"""
+    tag = uuid.uuid4().hex[:8]
+    county = County.objects.create(name=f'Bench {tag}', code=tag)
+    subcounty = SubCounty.objects.create(county=county, name='Bench', code=tag)
+    ward = Ward.objects.create(subcounty=subcounty, name='Bench', code=tag)
+    user = CustomUser.objects.create(
+        username=f'bench_{tag}', phone_number=f'+bench{tag}', user_type='farmer',
+    )
+    location = Location.objects.create(
+        user=user, name='Farm', county=county, subcounty=subcounty, ward=ward,
+        village='Bench', detailed_address='Bench',
+    )
+    farmer = FarmerProfile.objects.create(
+        user=user, farm_name='Bench', farming_type='crop',
+        years_of_experience='beginner', total_farm_size=Decimal('1'),
+    )
+    farm = Farm.objects.create(farmer=farmer, name=f'bench-{tag}', location=location, size=Decimal('1'))
+    category = CropCategory.objects.create(name=f'bench-{tag}')
+    crop = Crop.objects.create(name=f'bench-{tag}', category=category)
+    unit = ProductUnit.objects.create(name=f'Bench {tag}', abbreviation=tag)
+    return {'farmer': farmer, 'farm': farm, 'crop': crop, 'unit': unit, 'location': location}
@@ -0,0 +1,287 @@
+"""
+Bulk ingestion of product listings from CSV or JSONL files.
+
+Cooperatives upload thousands of listings at once, so this path skips
+Product.save() entirely: foreign keys are resolved through in-memory lookup
+maps, unique slugs are computed in memory against one snapshot of existing
+slugs, and rows are written with bulk_create inside chunked transactions.
+A bad row is reported with its line number and never aborts the file.
+"""
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from itertools import islice
+import csv
+import json
+import re
+
+from .facets import apply_facet_deltas, count_cells
+from .models import Crop, Farm, FarmerProfile, Product, ProductUnit, SlugSequence
+from .search import index_products
+from .slugs import slug_base
+from .units import unit_graph
+
+
+REQUIRED_COLUMNS = [
+    'farmer', 'crop', 'farm', 'unit', 'name', 'description',
+    'quantity_available', 'price_per_unit', 'harvest_date',
+]
+
+OPTIONAL_COLUMNS = [
+    'slug', 'minimum_order', 'quality_grade', 'expiry_date', 'organic_certified',
+    'certification_body', 'storage_condition', 'packaging_options', 'images',
+    'videos', 'status', 'featured',
+]
+
+SLUG_SCOPE = 'main_application.product.slug'
+
+SUFFIXED_SLUG = re.compile(r'^(?P<base>.+)-(?P<n>[0-9]+)$')
+
+
+class ImportReport:
+    """Outcome of a bulk import: rows read, rows written and per-row errors"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+    def __repr__(self):
+        return f"<ImportReport rows={self.rows} created={self.created} errors={len(self.errors)}>"
+
+
+def read_rows(fileobj, fmt):
+    """Yield (line_number, row_dict) from a CSV or JSONL file object"""
+    if fmt == 'csv':
+        reader = csv.DictReader(fileobj)
+        for row in reader:
+            yield reader.line_num, {k.strip(): v for k, v in row.items() if k}
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(fileobj, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = e
+            yield line_number, row
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+class LookupMaps:
+    """Natural-key -> id maps for the foreign keys a listing references"""
+
+    def __init__(self):
+        self.farmers = {}
+        for pk, username in FarmerProfile.objects.values_list('pk', 'user__username').iterator():
+            self.farmers[str(pk)] = pk
+            self.farmers[username.lower()] = pk
+
+        self.farms = {}
+        for pk, name, farmer_id in Farm.objects.values_list('pk', 'name', 'farmer_id').iterator():
+            self.farms[str(pk)] = (pk, farmer_id)
+            self.farms[name.lower()] = (pk, farmer_id)
+
+        self.crops = {}
+        for pk, name in Crop.objects.values_list('pk', 'name').iterator():
+            self.crops[str(pk)] = pk
+            self.crops[name.lower()] = pk
+
+        self.units = {}
+        for pk, name, abbreviation in ProductUnit.objects.values_list('pk', 'name', 'abbreviation'):
+            self.units[str(pk)] = pk
+            self.units[name.lower()] = pk
+            self.units[abbreviation.lower()] = pk
+
+
+class SlugSnapshot:
+    """
+    Existing product slugs loaded once, used to hand out unique slugs in
+    memory and to push the per-base counters forward afterwards.
+    """
+
+    def __init__(self):
+        self.taken = set()
+        self.next_suffix = {}
+        for slug in Product.objects.values_list('slug', flat=True).iterator():
+            self.taken.add(slug)
+            match = SUFFIXED_SLUG.match(slug)
+            if match:
+                n = int(match['n'])
+                if n >= self.next_suffix.get(match['base'], 1):
+                    self.next_suffix[match['base']] = n + 1
+        for base, last_value in SlugSequence.objects.filter(scope=SLUG_SCOPE).values_list('base_slug', 'last_value'):
+            self.next_suffix[base] = max(self.next_suffix.get(base, 1), last_value + 1)
+        self.used_suffixes = {}
+
+    def allocate(self, name, max_length):
+        base = slug_base(name, max_length, fallback='product')
+        slug = base
+        if slug in self.taken:
+            n = self.next_suffix.get(base, 1)
+            while f'{base}-{n}' in self.taken:
+                n += 1
+            slug = f'{base}-{n}'
+            self.next_suffix[base] = n + 1
+            self.used_suffixes[base] = n
+        self.taken.add(slug)
+        return slug
+
+    def claim(self, slug):
+        """Reserve a slug supplied in the file; False if it is already used"""
+        if slug in self.taken:
+            return False
+        self.taken.add(slug)
+        return True
+
+    def sync_counters(self, batch_size):
+        """Advance SlugSequence rows past every suffix this import handed out"""
+        if not self.used_suffixes:
+            return
+        bases = list(self.used_suffixes)
+        for start in range(0, len(bases), batch_size):
+            chunk = bases[start:start + batch_size]
+            existing = set(
+                SlugSequence.objects.filter(scope=SLUG_SCOPE, base_slug__in=chunk)
+                .values_list('base_slug', flat=True)
+            )
+            SlugSequence.objects.bulk_create(
+                [SlugSequence(scope=SLUG_SCOPE, base_slug=b, last_value=self.used_suffixes[b])
+                 for b in chunk if b not in existing],
+                ignore_conflicts=True,
+            )
+            for base in existing:
+                SlugSequence.objects.filter(scope=SLUG_SCOPE, base_slug=base).update(
+                    last_value=Greatest(F('last_value'), self.used_suffixes[base])
+                )
+
+
+def build_product(row, lookups, slugs):
+    """Turn one input row into an unsaved Product, raising ValidationError"""
+    if not isinstance(row, dict):
+        raise ValidationError(f"Invalid row: {row}")
+
+    missing = [c for c in REQUIRED_COLUMNS if row.get(c) in (None, '')]
+    if missing:
+        raise ValidationError(f"Missing required columns: {', '.join(missing)}")
+
+    def resolve(mapping, column):
+        key = str(row[column]).strip().lower()
+        if key not in mapping:
+            raise ValidationError(f"Unknown {column}: {row[column]}")
+        return mapping[key]
+
+    farmer_id = resolve(lookups.farmers, 'farmer')
+    farm_id, farm_farmer_id = resolve(lookups.farms, 'farm')
+    if farm_farmer_id != farmer_id:
+        raise ValidationError(f"Farm {row['farm']} does not belong to farmer {row['farmer']}")
+
+    values = {}
+    for column in REQUIRED_COLUMNS[4:] + OPTIONAL_COLUMNS:
+        value = row.get(column)
+        if value in (None, ''):
+            continue
+        field = Product._meta.get_field(column)
+        if isinstance(value, str):
+            if field.get_internal_type() == 'JSONField':
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    raise ValidationError(f"{column} must be valid JSON")
+            elif field.get_internal_type() == 'BooleanField':
+                value = value.strip().lower() in ('1', 'true', 'yes', 'y', 't')
+        values[column] = value
+
+    product = Product(
+        farmer_id=farmer_id, farm_id=farm_id,
+        crop_id=resolve(lookups.crops, 'crop'), unit_id=resolve(lookups.units, 'unit'),
+        **values
+    )
+    # Foreign keys were resolved above and the slug is checked against the
+    # snapshot, so skip the per-row queries clean_fields() would issue. List
+    # fields left at their empty default would fail the blank check.
+    defaulted = [f for f in ('packaging_options', 'images', 'videos') if f not in values]
+    product.clean_fields(exclude=['farmer', 'farm', 'crop', 'unit', 'slug'] + defaulted)
+    # bulk_create skips the pre_save signal that fills this in
+    product.price_per_base_unit = unit_graph().base_price(product.price_per_unit, product.unit_id)
+
+    if product.slug:
+        if not slugs.claim(product.slug):
+            raise ValidationError(f"Slug already exists: {product.slug}")
+    else:
+        product.slug = slugs.allocate(product.name, Product._meta.get_field('slug').max_length)
+    return product
+
+
+def _error_message(error):
+    if isinstance(error, ValidationError):
+        if hasattr(error, 'error_dict'):
+            return '; '.join(f"{field}: {' '.join(msgs)}" for field, msgs in error.message_dict.items())
+        return ' '.join(error.messages)
+    return str(error)
+
+
+def _write_chunk(chunk, batch_size, report):
+    """bulk_create a chunk; on failure fall back to row-by-row to isolate bad rows"""
+    try:
+        with transaction.atomic():
+            Product.objects.bulk_create([product for _, product in chunk], batch_size=batch_size)
+            # bulk_create skips the post_save signals that maintain these
+            index_products([product.pk for _, product in chunk])
+            apply_facet_deltas(count_cells(Product.objects.filter(pk__in=[p.pk for _, p in chunk])))
+        report.created += len(chunk)
+        return
+    except IntegrityError:
+        pass
+
+    with transaction.atomic():
+        created = []
+        for line, product in chunk:
+            product.pk = None
+            try:
+                with transaction.atomic():
+                    Product.objects.bulk_create([product])
+                report.created += 1
+                created.append(product.pk)
+            except IntegrityError as e:
+                report.add_error(line, str(e))
+        index_products(created)
+        apply_facet_deltas(count_cells(Product.objects.filter(pk__in=created)))
+
+
+def import_products(rows, batch_size=1000, chunk_size=5000, dry_run=False):
+    """
+    Import (line_number, row_dict) pairs as Product listings.
+
+    Rows are validated and given slugs in memory, then written chunk_size
+    rows per transaction with bulk_create(batch_size=...). Returns an
+    ImportReport with per-row errors; with dry_run nothing is written.
+    """
+    report = ImportReport()
+    lookups = LookupMaps()
+    slugs = SlugSnapshot()
+    rows = iter(rows)
+
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            break
+        chunk = []
+        for line, row in batch:
+            report.rows += 1
+            try:
+                chunk.append((line, build_product(row, lookups, slugs)))
+            except (ValidationError, ValueError, TypeError) as e:
+                report.add_error(line, _error_message(e))
+        if chunk and not dry_run:
+            _write_chunk(chunk, batch_size, report)
+
+    if not dry_run:
+        slugs.sync_counters(batch_size)
+    return report
@@ -0,0 +1,158 @@
+"""
+Checkout: turning a buyer's cart into one Order per farmer.
+
+The whole cart is handled in one transaction with a fixed number of
+queries however many lines or farmers it has:
+
+    1  cart lines with their products, units, crops and farms
+    1  the buyer's held reservations for those products
+    2  conditional stock UPDATE for every product at once, and the
+       sold-out check that follows it (inventory.py)
+    1  held reservations committed to their orders
+    3  bulk_create of orders, order items and their first status history
+       (order numbers come from numbering.py, which only queries once
+       per block of numbers)
+    1  bulk_create of reservations for lines that had no hold
+    1  delete of the checked-out cart lines
+
+Snapshots, line totals, delivery fees (from the cached zone index in
+delivery_quotes.py) and order totals are computed in memory between
+those queries. A product selling out adds the queries that move it out
+of the browse facets and search index, and a cold zone index the two
+that load it.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from django.db import transaction
+from django.db.models import Case, DecimalField, IntegerField, Value, When
+from django.utils import timezone
+
+from .delivery_quotes import CENTS, zone_index
+from .inventory import ReservationExpired, adjust_stock
+from .models import CartItem, InventoryReservation, Order, OrderItem, OrderStatusHistory
+from .numbering import next_numbers
+
+
+class CheckoutError(ValueError):
+    pass
+
+
+def product_snapshot(product):
+    """Product details kept on the order line, as they were when ordered"""
+    return {
+        'id': product.pk,
+        'name': product.name,
+        'slug': product.slug,
+        'crop': product.crop.name,
+        'unit': product.unit.abbreviation,
+        'price_per_unit': str(product.price_per_unit),
+        'quality_grade': product.quality_grade,
+        'organic_certified': product.organic_certified,
+        'farm': product.farm.name,
+        'harvest_date': product.harvest_date.isoformat(),
+    }
+
+
+def checkout(buyer, delivery_location, special_instructions=''):
+    """
+    Place one pending order per farmer for everything in buyer's cart,
+    delivered to delivery_location, and empty the cart. Stock held for
+    the cart is committed; the rest is taken now. Raises CheckoutError
+    (or InsufficientStock / ReservationExpired from inventory.py) without
+    changing anything. Returns the orders.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        lines = list(
+            CartItem.objects.filter(cart__buyer=buyer)
+            .select_related('product__crop', 'product__unit', 'product__farm')
+            .order_by('product__farmer_id', 'pk')
+        )
+        if not lines:
+            raise CheckoutError("The cart is empty")
+        for line in lines:
+            if line.quantity <= 0 or line.quantity < line.product.minimum_order:
+                raise CheckoutError(
+                    f"{line.product.name}: order at least {line.product.minimum_order} {line.product.unit.abbreviation}"
+                )
+        zones = zone_index()
+        if not zones.covers(delivery_location.county_id):
+            raise CheckoutError("No delivery zone covers this delivery location")
+
+        holds = {
+            reservation.product_id: reservation
+            for reservation in InventoryReservation.objects.filter(
+                buyer=buyer, status='held', product_id__in=[line.product_id for line in lines],
+            )
+        }
+        adjust_stock({
+            line.product_id: line.quantity - (holds[line.product_id].quantity if line.product_id in holds else 0)
+            for line in lines
+        })
+
+        by_farmer = defaultdict(list)
+        for line in lines:
+            by_farmer[line.product.farmer_id].append(line)
+        orders = []
+        items = []
+        for farmer_id, farmer_lines in by_farmer.items():
+            subtotal = Decimal('0')
+            order_items = []
+            for line in farmer_lines:
+                total = (line.quantity * line.product.price_per_unit).quantize(CENTS, ROUND_HALF_UP)
+                subtotal += total
+                order_items.append(OrderItem(
+                    product=line.product, quantity=line.quantity, unit_price=line.product.price_per_unit,
+                    total_price=total, product_snapshot=product_snapshot(line.product),
+                ))
+            quote = zones.quote(delivery_location.county_id, subtotal)
+            order = Order(
+                buyer=buyer, farmer_id=farmer_id,
+                delivery_location=delivery_location, expected_delivery_date=now + timedelta(days=quote.days),
+                subtotal=subtotal, delivery_fee=quote.fee, total_amount=subtotal + quote.fee,
+                special_instructions=special_instructions,
+            )
+            orders.append(order)
+            items.append(order_items)
+
+        # bulk_create skips the pre_save signal that numbers orders
+        for order, number in zip(orders, next_numbers(Order, len(orders))):
+            order.order_number = number
+        Order.objects.bulk_create(orders)
+        order_of = {}
+        for order, order_items in zip(orders, items):
+            for item in order_items:
+                item.order = order
+                order_of[item.product_id] = order
+        OrderItem.objects.bulk_create([item for order_items in items for item in order_items])
+        OrderStatusHistory.objects.bulk_create([
+            OrderStatusHistory(order=order, previous_status='', new_status=order.status, changed_by=buyer, notes='Order placed')
+            for order in orders
+        ])
+
+        if holds:
+            committed = InventoryReservation.objects.filter(pk__in=[r.pk for r in holds.values()], status='held').update(
+                status='committed', expires_at=None, updated_at=now,
+                order_id=Case(
+                    *[When(pk=r.pk, then=Value(order_of[product_id].pk)) for product_id, r in holds.items()],
+                    output_field=IntegerField(),
+                ),
+                quantity=Case(
+                    *[When(pk=holds[line.product_id].pk, then=Value(line.quantity)) for line in lines if line.product_id in holds],
+                    output_field=DecimalField(max_digits=10, decimal_places=2),
+                ),
+            )
+            if committed != len(holds):
+                # Swept by expire_reservations(), which already returned the stock
+                raise ReservationExpired("Some cart reservations expired during checkout")
+        InventoryReservation.objects.bulk_create([
+            InventoryReservation(
+                buyer=buyer, product_id=line.product_id, order=order_of[line.product_id],
+                quantity=line.quantity, status='committed',
+            )
+            for line in lines if line.product_id not in holds
+        ])
+        CartItem.objects.filter(pk__in=[line.pk for line in lines]).delete()
+    return orders
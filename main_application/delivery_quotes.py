@@ -0,0 +1,121 @@
+"""
+Delivery fee quotes.
+
+ZoneIndex maps every county to the active DeliveryZones covering it,
+loaded with two queries (zones, then zone-county links) and cached per
+process, so quoting a cart or a batch of orders is a dictionary lookup
+and a comparison of a few zones with no queries at all. Of the zones
+covering a county, a quote picks the one delivering cheapest, counting
+free delivery once the subtotal reaches a zone's threshold, and then the
+fastest.
+
+DeliveryZone saves and deletes, changes to zone counties and county
+deletes drop this process's cache (see signals.py); other processes
+reload theirs after ZONE_TTL seconds.
+"""
+
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+from time import monotonic
+
+from .models import DeliveryZone
+
+
+ZONE_TTL = 300
+
+CENTS = Decimal('0.01')
+
+FREE = Decimal('0')
+
+
+class DeliveryQuote:
+    __slots__ = ['zone_id', 'fee', 'days']
+
+    def __init__(self, zone_id, fee, days):
+        self.zone_id = zone_id
+        self.fee = fee
+        self.days = days
+
+    @property
+    def free(self):
+        return not self.fee
+
+    def __repr__(self):
+        return f"<DeliveryQuote zone={self.zone_id} fee={self.fee} days={self.days}>"
+
+
+class ZoneIndex:
+    """Active delivery zones of every county, as (id, base fee, free delivery threshold, days)"""
+
+    def __init__(self, zones, links):
+        """zones: [(id, base fee, threshold or None, days)]; links: [(zone id, county id)]"""
+        by_id = {zone[0]: zone for zone in zones}
+        by_county = defaultdict(list)
+        for zone_id, county_id in links:
+            if zone_id in by_id:
+                by_county[county_id].append(by_id[zone_id])
+        # Cheapest base fee first, so a quote below every threshold takes the first zone
+        self.by_county = {
+            county_id: tuple(sorted(county_zones, key=lambda zone: (zone[1], zone[3], zone[0])))
+            for county_id, county_zones in by_county.items()
+        }
+
+    def covers(self, county_id):
+        return county_id in self.by_county
+
+    def zones(self, county_id):
+        """Ids of the zones delivering to county_id"""
+        return [zone[0] for zone in self.by_county.get(county_id, ())]
+
+    def quote(self, county_id, subtotal):
+        """DeliveryQuote for an order of subtotal delivered in county_id, or None if no zone covers it"""
+        best = None
+        for zone_id, fee, threshold, days in self.by_county.get(county_id, ()):
+            if threshold is not None and subtotal >= threshold:
+                fee = FREE
+            if best is None or (fee, days, zone_id) < best:
+                best = (fee, days, zone_id)
+        if best is None:
+            return None
+        fee, days, zone_id = best
+        return DeliveryQuote(zone_id, fee, days)
+
+    def quote_orders(self, orders):
+        """Quotes for (county id, subtotal) pairs, in order"""
+        return [self.quote(county_id, subtotal) for county_id, subtotal in orders]
+
+    def quote_cart(self, lines, county_id):
+        """
+        {farmer id: DeliveryQuote} for cart lines (CartItems with their
+        products) delivered in county_id, one order per farmer as checkout
+        places them. Quotes are None if no zone covers the county.
+        """
+        subtotals = defaultdict(Decimal)
+        for line in lines:
+            product = line.product
+            subtotals[product.farmer_id] += (line.quantity * product.price_per_unit).quantize(CENTS, ROUND_HALF_UP)
+        return {farmer_id: self.quote(county_id, subtotal) for farmer_id, subtotal in subtotals.items()}
+
+
+_index = None
+_loaded_at = 0.0
+
+
+def zone_index():
+    """The cached ZoneIndex, loaded on first use and after ZONE_TTL seconds"""
+    global _index, _loaded_at
+    if _index is None or monotonic() - _loaded_at > ZONE_TTL:
+        zones = DeliveryZone.objects.filter(is_active=True).values_list(
+            'id', 'base_delivery_fee', 'free_delivery_threshold', 'estimated_delivery_days',
+        )
+        links = DeliveryZone.counties.through.objects.filter(deliveryzone__is_active=True).values_list(
+            'deliveryzone_id', 'county_id',
+        )
+        _index = ZoneIndex(list(zones), list(links))
+        _loaded_at = monotonic()
+    return _index
+
+
+def invalidate_zone_index():
+    global _index
+    _index = None
@@ -0,0 +1,312 @@
+"""
+Batch demand and price forecasts for every crop and county.
+
+Monthly history is read in two aggregate queries: average prices from the
+monthly MarketPriceRollup cells and ordered quantities from OrderItem,
+both in base units. Each (crop, county) pair becomes one row of a
+(series x months) NumPy matrix, and two lightweight models are fitted to
+every row at once:
+
+    simple exponential smoothing   one level per series, for each alpha in ALPHAS
+    seasonal naive                 the value twelve months earlier
+
+Each series keeps whichever model had the smaller one-step-ahead error
+over its history, and that error sets the forecast's confidence. Fitting is
+pure NumPy, so chunks of series can be spread over a process pool without
+database connections. Forecasts are upserted into MarketDemandForecast
+for the next HORIZON months, keyed by (crop, county, forecast_period).
+"""
+
+from datetime import date
+from django.db import connections, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+import multiprocessing
+import numpy as np
+
+from .models import MarketDemandForecast, MarketPriceRollup, OrderItem
+from .price_trends import TREND_THRESHOLD
+from .units import unit_graph
+
+
+HORIZON = 3
+
+HISTORY_MONTHS = 36
+
+SEASON = 12
+
+ALPHAS = np.array([0.1, 0.2, 0.3, 0.5, 0.7, 0.9])
+
+CHUNK_SERIES = 2000
+
+# Orders that never turned into demand
+EXCLUDED_ORDER_STATUSES = ['cancelled', 'refunded']
+
+# (lowest forecast / average volume ratio, expected_demand), highest first
+DEMAND_LEVELS = [
+    (1.5, 'very_high'),
+    (1.15, 'high'),
+    (0.85, 'medium'),
+    (0.5, 'low'),
+    (0.0, 'very_low'),
+]
+
+RECOMMENDATIONS = {
+    ('rising', True): "Prices and demand are both expected to rise; plan harvests and stock for {period}.",
+    ('rising', False): "Prices are expected to rise; holding stock until {period} may pay off.",
+    ('falling', True): "Demand is strong but prices are expected to soften; sell early or agree forward prices.",
+    ('falling', False): "Expect weaker prices and demand in {period}; consider storage or forward contracts.",
+    ('stable', True): "Strong demand at steady prices is expected; a good period to sell.",
+    ('stable', False): "The market is expected to stay steady in {period}.",
+}
+
+
+def add_months(month, n):
+    """First day of the month n months after month"""
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_index(month, first):
+    return (month.year - first.year) * 12 + month.month - first.month
+
+
+class History:
+    """Monthly price and volume matrices, one row per (crop, county) pair"""
+
+    def __init__(self, pairs, first_month, prices, volumes):
+        self.pairs = pairs
+        self.first_month = first_month
+        self.prices = prices
+        self.volumes = volumes
+
+    def __len__(self):
+        return len(self.pairs)
+
+
+def load_history(as_of=None, months=HISTORY_MONTHS):
+    """
+    History for the months complete before as_of's month. Prices of a pair
+    come from its busiest base unit; months without prices are NaN and
+    months without orders are 0.
+    """
+    end = (as_of or timezone.now().date()).replace(day=1)
+    first = add_months(end, -months)
+
+    price_cells = (
+        MarketPriceRollup.objects.filter(period='month', period_start__gte=first, period_start__lt=end)
+        .order_by().values_list('crop_id', 'county_id', 'unit_id', 'period_start')
+        .annotate(n=Sum('count'), total=Sum('price_sum'))
+    )
+    by_unit = {}
+    for crop_id, county_id, unit_id, month, n, total in price_cells:
+        by_unit.setdefault((crop_id, county_id), {}).setdefault(unit_id, []).append((month, n, total))
+
+    quantity = ExpressionWrapper(
+        F('quantity') * unit_graph().factor_expression('product__unit'),
+        output_field=DecimalField(max_digits=20, decimal_places=4),
+    )
+    volume_rows = (
+        OrderItem.objects.filter(order__order_date__date__gte=first, order__order_date__date__lt=end)
+        .exclude(order__status__in=EXCLUDED_ORDER_STATUSES)
+        .order_by()
+        .values_list('product__crop_id', 'order__delivery_location__county_id', TruncMonth('order__order_date'))
+        .annotate(volume=Sum(quantity))
+    )
+    volumes_by_pair = {}
+    for crop_id, county_id, month, volume in volume_rows:
+        if volume is None:
+            continue  # Only units that do not convert
+        month = timezone.localtime(month).date() if hasattr(month, 'hour') else month
+        volumes_by_pair.setdefault((crop_id, county_id), []).append((month, float(volume)))
+
+    pairs = sorted(set(by_unit) | set(volumes_by_pair))
+    prices = np.full((len(pairs), months), np.nan)
+    volumes = np.zeros((len(pairs), months))
+    for row, pair in enumerate(pairs):
+        units = by_unit.get(pair)
+        if units:
+            cells = max(units.values(), key=lambda cells: sum(n for _, n, _ in cells))
+            for month, n, total in cells:
+                prices[row, month_index(month, first)] = total / n
+        for month, volume in volumes_by_pair.get(pair, ()):
+            volumes[row, month_index(month, first)] += volume
+    return History(pairs, first, prices, volumes)
+
+
+def fit_smoothing(series):
+    """
+    Simple exponential smoothing of every row for every alpha in ALPHAS.
+    Returns (final level, mean absolute one-step error) per row for the best
+    alpha. NaN months leave the level unchanged.
+    """
+    n_alpha, (n_series, n_months) = len(ALPHAS), series.shape
+    alphas = ALPHAS[:, None]
+    level = np.full((n_alpha, n_series), np.nan)
+    errors = np.zeros((n_alpha, n_series))
+    seen = np.zeros(n_series)
+    for t in range(n_months):
+        value = series[:, t]
+        observed = ~np.isnan(value)
+        started = observed & ~np.isnan(level[0])
+        error = np.where(started, value - level, 0.0)
+        errors += np.abs(error)
+        seen += started
+        level = np.where(started, level + alphas * error, level)
+        level = np.where(observed & np.isnan(level), value, level)
+    mae = np.where(seen > 0, errors / np.maximum(seen, 1), np.inf)
+    best = np.argmin(mae, axis=0)
+    rows = np.arange(n_series)
+    return level[best, rows], mae[best, rows]
+
+
+def fit_seasonal_naive(series, horizon):
+    """(forecasts for the next horizon months, mean absolute error) per row"""
+    n_series, n_months = series.shape
+    if n_months <= SEASON:
+        return np.full((n_series, horizon), np.nan), np.full(n_series, np.inf)
+    error = np.abs(series[:, SEASON:] - series[:, :-SEASON])
+    seen = np.sum(~np.isnan(error), axis=1)
+    with np.errstate(invalid='ignore'):
+        mae = np.where(seen > 0, np.nansum(error, axis=1) / np.maximum(seen, 1), np.inf)
+    steps = [n_months - SEASON + h % SEASON for h in range(horizon)]
+    return series[:, steps], mae
+
+
+def fit_series(series, horizon=HORIZON):
+    """
+    Forecast every row of series for the next horizon months. Returns
+    (forecasts, relative error, seasonal) where relative error is the
+    chosen model's mean absolute error over the row's mean level and
+    seasonal marks rows where the seasonal naive model won.
+    """
+    level, smoothing_error = fit_smoothing(series)
+    seasonal_forecast, seasonal_error = fit_seasonal_naive(series, horizon)
+    seasonal = (seasonal_error < smoothing_error) & ~np.isnan(seasonal_forecast).any(axis=1)
+    forecasts = np.where(seasonal[:, None], seasonal_forecast, level[:, None])
+    error = np.where(seasonal, seasonal_error, smoothing_error)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scale = np.nanmean(np.abs(series), axis=1)
+        relative = np.where(scale > 0, error / scale, np.inf)
+    return forecasts, relative, seasonal
+
+
+def fit_chunk(task):
+    """Process pool entry point: fit prices and volumes of one chunk of series"""
+    prices, volumes, horizon = task
+    return fit_series(prices, horizon), fit_series(volumes, horizon)
+
+
+def fit_all(history, horizon=HORIZON, workers=1):
+    """fit_series() results for prices and volumes, chunked across workers"""
+    tasks = [
+        (history.prices[start:start + CHUNK_SERIES], history.volumes[start:start + CHUNK_SERIES], horizon)
+        for start in range(0, len(history), CHUNK_SERIES)
+    ]
+    if workers > 1 and len(tasks) > 1:
+        # Workers only run NumPy, but must not inherit open connections
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            results = pool.map(fit_chunk, tasks)
+    else:
+        results = [fit_chunk(task) for task in tasks]
+    return tuple(
+        tuple(np.concatenate([result[kind][part] for result in results]) for part in range(3))
+        for kind in range(2)
+    )
+
+
+def confidence(relative_error, months_observed, horizon):
+    """Confidence (1-100) per series and forecast month"""
+    accuracy = np.clip(1 - np.where(np.isfinite(relative_error), relative_error, 1.0), 0, 1)
+    coverage = np.clip(months_observed / SEASON, 0, 1)
+    decay = 1 - 0.1 * np.arange(horizon)
+    return np.clip(np.rint(100 * (accuracy * coverage)[:, None] * decay), 1, 100).astype(int)
+
+
+def demand_level(ratio):
+    for lowest, level in DEMAND_LEVELS:
+        if ratio >= lowest:
+            return level
+
+
+def last_observed(series):
+    """Last non-NaN value of every row (NaN for empty rows)"""
+    reversed_series = series[:, ::-1]
+    last = np.argmax(~np.isnan(reversed_series), axis=1)
+    return reversed_series[np.arange(len(series)), last]
+
+
+def build_forecasts(history, fitted, as_of=None, horizon=HORIZON):
+    """MarketDemandForecast rows (unsaved) for every pair and forecast month"""
+    (price_forecast, price_error, price_seasonal), (volume_forecast, volume_error, volume_seasonal) = fitted
+    start = (as_of or timezone.now().date()).replace(day=1)
+    last_price = last_observed(history.prices)
+    has_price = ~np.isnan(history.prices).all(axis=1)
+    has_orders = history.volumes.sum(axis=1) > 0
+    recent_volume = history.volumes[:, -SEASON:].mean(axis=1)
+
+    price_confidence = confidence(price_error, np.sum(~np.isnan(history.prices), axis=1), horizon)
+    volume_confidence = confidence(volume_error, np.sum(history.volumes > 0, axis=1), horizon)
+    # Without order history demand is only a guess; lean on the price model, halved
+    combined = np.where(
+        has_orders[:, None] & has_price[:, None], (price_confidence + volume_confidence) // 2,
+        np.where(has_orders[:, None], volume_confidence, np.maximum(price_confidence // 2, 1)),
+    )
+
+    forecasts = []
+    for row, (crop_id, county_id) in enumerate(history.pairs):
+        for h in range(horizon):
+            period = add_months(start, h).strftime('%B %Y')
+            factors = []
+            if has_price[row]:
+                change = price_forecast[row, h] / last_price[row] - 1
+                prediction = 'rising' if change > TREND_THRESHOLD else 'falling' if change < -TREND_THRESHOLD else 'stable'
+                model = 'seasonal pattern' if price_seasonal[row] else 'smoothed recent prices'
+                factors.append(f"Price {change:+.1%} vs last month ({model})")
+            else:
+                prediction = 'stable'
+                factors.append("No recent market prices")
+            if has_orders[row]:
+                ratio = volume_forecast[row, h] / recent_volume[row] if recent_volume[row] else 1.0
+                demand = demand_level(ratio)
+                model = 'seasonal pattern' if volume_seasonal[row] else 'smoothed recent orders'
+                factors.append(f"Order volume {ratio:.2f}x the monthly average ({model})")
+            else:
+                demand = 'medium'
+                factors.append("No order history; demand assumed medium")
+            strong = demand in ('high', 'very_high')
+            forecasts.append(MarketDemandForecast(
+                crop_id=crop_id,
+                location_id=county_id,
+                forecast_period=period,
+                expected_demand=demand,
+                price_prediction=prediction,
+                confidence_level=int(combined[row, h]),
+                factors=factors,
+                recommendations=RECOMMENDATIONS[prediction, strong].format(period=period),
+            ))
+    return forecasts
+
+
+def save_forecasts(forecasts, batch_size=1000):
+    """Insert forecasts, replacing any stored for the same crop, county and period"""
+    with transaction.atomic():
+        MarketDemandForecast.objects.bulk_create(
+            forecasts,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['crop', 'location', 'forecast_period'],
+            update_fields=['expected_demand', 'price_prediction', 'confidence_level', 'factors', 'recommendations'],
+        )
+    return len(forecasts)
+
+
+def forecast_demand(as_of=None, horizon=HORIZON, history_months=HISTORY_MONTHS, workers=1):
+    """Fit, build and upsert forecasts for every crop/county pair; returns the rows written"""
+    history = load_history(as_of, history_months)
+    if not len(history):
+        return 0
+    fitted = fit_all(history, horizon, workers)
+    return save_forecasts(build_forecasts(history, fitted, as_of, horizon))
@@ -0,0 +1,293 @@
+"""
+Batch dispatch: grouping pending deliveries into multi-stop routes.
+
+Every delivery still waiting for a route is first given a partner that
+serves its delivery county, keeping its current partner when it does and
+otherwise taking the least loaded one. Each partner's drop-offs are then
+cut in two across their wider spread, again and again, until every part
+fits in a route of at most max_stops, so a route covers one patch of the
+map.
+
+A route drives to its farm pickups first and then to its drop-offs. Both
+legs are ordered the same way on a haversine distance matrix computed
+with NumPy: nearest neighbour from a fixed first stop, then 2-opt, which
+keeps reversing the stretch of the path whose reversal shortens it most
+(all candidate reversals are scored at once) until none does.
+
+Plans are written with one bulk_create of DeliveryRoutes and one
+prepared UPDATE, run through executemany(), assigning each delivery its
+partner, route, stop and estimated delivery time, conditional on it
+still being unrouted. Assigning a driver or vehicle to a route, or
+cancelling it, is copied to its deliveries (see signals.py).
+"""
+
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+import numpy as np
+
+from .models import Delivery, DeliveryPartner, DeliveryRoute, OrderItem
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Drop-offs per route
+MAX_STOPS = 25
+
+AVERAGE_SPEED_KMH = 30
+
+STOP_MINUTES = 10
+
+
+def pending_deliveries():
+    return Delivery.objects.filter(status='assigned', route__isnull=True)
+
+
+def haversine_matrix(lat, lon):
+    """Great-circle distances in km between every pair of points given in degrees"""
+    lat, lon = np.radians(lat), np.radians(lon)
+    a = (
+        np.sin((lat[:, None] - lat[None, :]) / 2) ** 2
+        + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin((lon[:, None] - lon[None, :]) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def nearest_neighbour(dist, start=0):
+    """Path through every point of dist from start, always to the closest point not yet visited"""
+    visited = np.zeros(len(dist), dtype=bool)
+    path = [start]
+    visited[start] = True
+    for _ in range(len(dist) - 1):
+        nearest = int(np.where(visited, np.inf, dist[path[-1]]).argmin())
+        visited[nearest] = True
+        path.append(nearest)
+    return np.array(path)
+
+
+def two_opt(dist, path, max_rounds=10000):
+    """Shorten an open path keeping its first point, reversing the best stretch each round"""
+    path = np.array(path)
+    n = len(path)
+    if n < 4:
+        return path
+    # A virtual end point 0 km from everywhere lets the path end anywhere
+    padded = np.zeros((len(dist) + 1, len(dist) + 1))
+    padded[:-1, :-1] = dist
+    end = len(dist)
+    later = np.triu(np.ones((n, n), dtype=bool), k=1)
+    for _ in range(max_rounds):
+        here = path
+        after = np.append(path[1:], end)
+        edges = padded[here, after]
+        # Reversing path[i+1..j] swaps edges (i, i+1) and (j, j+1) for (i, j) and (i+1, j+1)
+        gain = padded[np.ix_(here, here)] + padded[np.ix_(after, after)] - edges[:, None] - edges[None, :]
+        gain[~later] = np.inf
+        i, j = np.unravel_index(gain.argmin(), gain.shape)
+        if gain[i, j] > -1e-9:
+            break
+        path[i + 1:j + 1] = path[i + 1:j + 1][::-1].copy()
+    return path
+
+
+def path_legs(dist, path):
+    """Distance driven to reach each point of path from its first"""
+    return np.concatenate([[0.0], np.cumsum(dist[path[:-1], path[1:]])])
+
+
+def order_stops(pickups, drops):
+    """
+    Driving order of a route: (pickup order, drop order, km driven to
+    reach each drop in that order). pickups and drops are (n, 2) arrays
+    of latitude and longitude.
+    """
+    points = np.vstack([pickups, drops])
+    dist = haversine_matrix(points[:, 0], points[:, 1])
+    k = len(pickups)
+    # Start at the pickup farthest from the drop-offs, so the pickups lead towards them
+    centre = drops.mean(axis=0)
+    from_centre = haversine_matrix(np.append(pickups[:, 0], centre[0]), np.append(pickups[:, 1], centre[1]))[-1, :-1]
+    first = int(from_centre.argmax())
+    pickup_order = [first] + [p for p in range(k) if p != first]
+    leg = dist[np.ix_(pickup_order, pickup_order)]
+    pickup_order = np.array(pickup_order)[two_opt(leg, nearest_neighbour(leg))]
+    to_last_pickup = path_legs(dist, pickup_order)[-1]
+
+    # Drop-offs from the last pickup
+    nodes = np.concatenate([[pickup_order[-1]], k + np.arange(len(drops))])
+    leg = dist[np.ix_(nodes, nodes)]
+    path = two_opt(leg, nearest_neighbour(leg))
+    return pickup_order, path[1:] - 1, to_last_pickup + path_legs(leg, path)[1:]
+
+
+def partition(points, size):
+    """
+    Split points ((n, 2) latitude/longitude) into groups of at most size,
+    cutting them in two across their wider spread until every group fits.
+    Cuts fall on multiples of size, so no more groups are made than needed.
+    """
+    scale = np.array([1.0, np.cos(np.radians(points[:, 0].mean()))])
+    groups = []
+    pending = [np.arange(len(points))]
+    while pending:
+        members = pending.pop()
+        if len(members) <= size:
+            groups.append(members)
+            continue
+        axis = int((np.ptp(points[members], axis=0) * scale).argmax())
+        members = members[np.argsort(points[members, axis], kind='stable')]
+        cut = (-(-len(members) // size) // 2) * size
+        pending += [members[cut:], members[:cut]]
+    return groups
+
+
+class PlannedRoute:
+    """Deliveries of one route: pickups [(location id, [delivery ids])], drops [delivery id], km to each drop"""
+
+    def __init__(self, partner_id, pickups, drops, km):
+        self.partner_id = partner_id
+        self.pickups = pickups
+        self.drops = drops
+        self.km = km
+
+    @property
+    def distance_km(self):
+        return self.km[-1] if self.km else 0.0
+
+    def stops(self):
+        return [
+            {'kind': 'pickup', 'location': location_id, 'deliveries': delivery_ids}
+            for location_id, delivery_ids in self.pickups
+        ] + [
+            {'kind': 'drop', 'delivery': delivery_id, 'km': round(km, 1)}
+            for delivery_id, km in zip(self.drops, self.km)
+        ]
+
+    def __repr__(self):
+        return f"<PlannedRoute partner={self.partner_id} {len(self.pickups)}+{len(self.drops)} stops {self.distance_km:.1f}km>"
+
+
+class DispatchPlan:
+    def __init__(self, routes, unplanned):
+        self.routes = routes
+        self.unplanned = unplanned
+
+    @property
+    def planned(self):
+        return sum(len(route.drops) for route in self.routes)
+
+    @property
+    def distance_km(self):
+        return sum(route.distance_km for route in self.routes)
+
+    def __repr__(self):
+        return f"<DispatchPlan {self.planned} deliveries on {len(self.routes)} routes, {len(self.unplanned)} unplanned>"
+
+
+def load_deliveries(deliveries):
+    """Rows of (id, partner id, county id, drop lat, drop lon, pickup location id, pickup lat, pickup lon)"""
+    farm = OrderItem.objects.filter(order=OuterRef('order')).order_by('pk')
+    pickup = {
+        'pickup_location': Subquery(farm.values('product__farm__location_id')[:1]),
+        'pickup_lat': Subquery(farm.values('product__farm__location__latitude')[:1]),
+        'pickup_lon': Subquery(farm.values('product__farm__location__longitude')[:1]),
+    }
+    return deliveries.annotate(
+        county=F('order__delivery_location__county_id'),
+        drop_lat=F('order__delivery_location__latitude'),
+        drop_lon=F('order__delivery_location__longitude'),
+        **pickup,
+    ).values_list('pk', 'delivery_partner_id', 'county', 'drop_lat', 'drop_lon', *pickup).order_by('pk')
+
+
+def plan_dispatch(deliveries=None, max_stops=MAX_STOPS):
+    """Plan routes for deliveries (by default every pending one) without saving them"""
+    deliveries = pending_deliveries() if deliveries is None else deliveries
+    serving = defaultdict(set)
+    for partner_id, county_id in DeliveryPartner.service_areas.through.objects.filter(
+        deliverypartner__is_active=True,
+    ).values_list('deliverypartner_id', 'county_id'):
+        serving[county_id].add(partner_id)
+
+    load = Counter()
+    by_partner = defaultdict(list)
+    unplanned = {}
+    rows = list(load_deliveries(deliveries))
+    # Deliveries whose partner serves them first, so loads are known when the rest are placed
+    rows.sort(key=lambda row: row[1] not in serving[row[2]])
+    for row in rows:
+        delivery_id, partner_id, county_id, drop_lat, drop_lon, location_id, pickup_lat, pickup_lon = row
+        if None in (drop_lat, drop_lon, pickup_lat, pickup_lon):
+            unplanned[delivery_id] = 'Pickup or delivery location has no coordinates'
+            continue
+        if partner_id not in serving[county_id]:
+            if not serving[county_id]:
+                unplanned[delivery_id] = 'No active delivery partner serves the county'
+                continue
+            partner_id = min(serving[county_id], key=lambda partner: (load[partner], partner))
+        load[partner_id] += 1
+        by_partner[partner_id].append((delivery_id, location_id, float(drop_lat), float(drop_lon), float(pickup_lat), float(pickup_lon)))
+
+    routes = []
+    for partner_id, members in sorted(by_partner.items()):
+        drops = np.array([(m[2], m[3]) for m in members])
+        for group in partition(drops, max_stops):
+            pickup_ids = defaultdict(list)
+            pickup_points = {}
+            for index in group:
+                delivery_id, location_id, _lat, _lon, pickup_lat, pickup_lon = members[index]
+                pickup_ids[location_id].append(delivery_id)
+                pickup_points[location_id] = (pickup_lat, pickup_lon)
+            locations = list(pickup_ids)
+            pickup_order, drop_order, km = order_stops(
+                np.array([pickup_points[location_id] for location_id in locations]), drops[group],
+            )
+            routes.append(PlannedRoute(
+                partner_id,
+                [(locations[p], pickup_ids[locations[p]]) for p in pickup_order],
+                [members[group[d]][0] for d in drop_order],
+                km.tolist(),
+            ))
+    return DispatchPlan(routes, unplanned)
+
+
+def assign_deliveries(rows):
+    """Route (partner id, route id, stop, estimated delivery time, delivery id) rows still unrouted; one prepared UPDATE"""
+    qn = connection.ops.quote_name
+    meta = Delivery._meta
+    fields = [meta.get_field(name) for name in ('delivery_partner', 'route', 'route_stop', 'estimated_delivery_time')]
+    route = qn(meta.get_field('route').column)
+    sql = (
+        f'UPDATE {qn(meta.db_table)} SET ' + ', '.join(f'{qn(field.column)} = %s' for field in fields)
+        + f' WHERE {qn(meta.pk.column)} = %s AND {route} IS NULL'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (*(field.get_db_prep_save(value, connection) for field, value in zip(fields, row)), row[-1])
+            for row in rows
+        ])
+
+
+def dispatch(deliveries=None, max_stops=MAX_STOPS, now=None):
+    """Plan routes for pending deliveries and assign them; returns the DispatchPlan"""
+    now = now or timezone.now()
+    plan = plan_dispatch(deliveries, max_stops)
+    with transaction.atomic():
+        routes = DeliveryRoute.objects.bulk_create([
+            DeliveryRoute(
+                delivery_partner_id=route.partner_id, stops=route.stops(),
+                distance_km=Decimal(route.distance_km).quantize(Decimal('0.01')),
+            )
+            for route in plan.routes
+        ])
+        rows = []
+        for saved, route in zip(routes, plan.routes):
+            stops_before = len(route.pickups)
+            for stop, (delivery_id, km) in enumerate(zip(route.drops, route.km), start=1):
+                eta = now + timedelta(hours=km / AVERAGE_SPEED_KMH, minutes=STOP_MINUTES * (stops_before + stop - 1))
+                rows.append((route.partner_id, saved.pk, stop, eta, delivery_id))
+        assign_deliveries(rows)
+    return plan
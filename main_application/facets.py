@@ -0,0 +1,289 @@
+"""
+Faceted browsing over active product listings.
+
+ProductFacetCount holds one row per combination of facet values (crop
+category, county, quality grade, organic certification, price band) with
+the number of active listings in it. It stays small however large the
+catalog grows, so the counts for every facet value under any combination
+of selected filters, and the total for the result page, are summed from
+it in memory instead of running a GROUP BY per facet over products.
+
+Product signals (signals.py) move a listing between cells when its status,
+grade, certification, price, crop or farm changes. Writes that bypass
+signals need apply_facet_deltas() or rebuild_facets().
+"""
+
+from collections import Counter
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Count, F, Q, Value, When
+from math import ceil
+
+from .models import County, CropCategory, Product, ProductFacetCount
+
+
+BROWSE_STATUS = 'active'
+
+# (value, label, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = [
+    ('0-100', '0 - 100', None, 100),
+    ('100-500', '100 - 500', 100, 500),
+    ('500-1000', '500 - 1000', 500, 1000),
+    ('1000+', '1000+', 1000, None),
+]
+
+FACETS = ['category', 'county', 'quality_grade', 'organic_certified', 'price_band']
+
+# ProductFacetCount columns, in FACETS order
+KEY_FIELDS = ['category_id', 'county_id', 'quality_grade', 'organic_certified', 'price_band']
+
+# Product fields whose change can move a listing to another cell
+FACET_SOURCE_FIELDS = {'status', 'quality_grade', 'organic_certified', 'price_per_unit', 'crop', 'farm'}
+
+# How each facet filters the Product table
+PRODUCT_LOOKUPS = {
+    'category': 'crop__category_id__in',
+    'county': 'farm__location__county_id__in',
+    'quality_grade': 'quality_grade__in',
+    'organic_certified': 'organic_certified__in',
+}
+
+
+def price_band(price):
+    for value, _label, low, high in PRICE_BANDS:
+        if (low is None or price >= low) and (high is None or price < high):
+            return value
+
+
+def price_band_filter(band, field='price_per_unit'):
+    """Q selecting prices inside one of PRICE_BANDS"""
+    for value, _label, low, high in PRICE_BANDS:
+        if value == band:
+            q = Q()
+            if low is not None:
+                q &= Q(**{f'{field}__gte': low})
+            if high is not None:
+                q &= Q(**{f'{field}__lt': high})
+            return q
+    raise ValueError(f"Unknown price band: {band}")
+
+
+def price_band_case(field='price_per_unit'):
+    """SQL expression giving the price band of each row"""
+    return Case(
+        *[When(price_band_filter(value, field), then=Value(value)) for value, *_ in PRICE_BANDS],
+        output_field=CharField(),
+    )
+
+
+def facet_key(product_id):
+    """Cell an existing product counts towards, or None if it is not browsable"""
+    row = Product.objects.filter(pk=product_id).values_list(
+        'status', 'crop__category_id', 'farm__location__county_id',
+        'quality_grade', 'organic_certified', 'price_per_unit',
+    ).first()
+    if row is None or row[0] != BROWSE_STATUS:
+        return None
+    _status, category_id, county_id, grade, organic, price = row
+    return (category_id, county_id, grade, organic, price_band(price))
+
+
+def apply_facet_deltas(deltas):
+    """Add {cell key: delta} to the stored counts, creating cells as needed"""
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        cell = ProductFacetCount.objects.filter(**dict(zip(KEY_FIELDS, key)))
+        if cell.update(count=F('count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                ProductFacetCount.objects.create(count=delta, **dict(zip(KEY_FIELDS, key)))
+        except IntegrityError:
+            # Created concurrently since the UPDATE above
+            cell.update(count=F('count') + delta)
+
+
+def move_listing(old_key, new_key):
+    if old_key == new_key:
+        return
+    deltas = Counter()
+    if old_key is not None:
+        deltas[old_key] -= 1
+    if new_key is not None:
+        deltas[new_key] += 1
+    apply_facet_deltas(deltas)
+
+
+def count_cells(queryset=None):
+    """{cell key: number of browsable listings} computed from products"""
+    queryset = Product.objects.all() if queryset is None else queryset
+    rows = (
+        queryset.filter(status=BROWSE_STATUS).order_by()
+        .values_list(
+            F('crop__category_id'), F('farm__location__county_id'),
+            'quality_grade', 'organic_certified', price_band_case(),
+        )
+        .annotate(n=Count('pk'))
+    )
+    return {tuple(row[:-1]): row[-1] for row in rows}
+
+
+def rebuild_facets():
+    """Recompute every cell from products; returns the number of cells"""
+    cells = count_cells()
+    with transaction.atomic():
+        ProductFacetCount.objects.all().delete()
+        ProductFacetCount.objects.bulk_create(
+            [ProductFacetCount(count=n, **dict(zip(KEY_FIELDS, key))) for key, n in cells.items()],
+            batch_size=1000,
+        )
+    return len(cells)
+
+
+def find_facet_drift():
+    """[(cell key, stored count, actual count)] for cells that disagree"""
+    actual = count_cells()
+    stored = {
+        tuple(row[:-1]): row[-1]
+        for row in ProductFacetCount.objects.exclude(count=0).values_list(*KEY_FIELDS, 'count')
+    }
+    return [
+        (key, stored.get(key, 0), actual.get(key, 0))
+        for key in sorted(set(actual) | set(stored), key=str)
+        if stored.get(key, 0) != actual.get(key, 0)
+    ]
+
+
+def parse_selection(params):
+    """
+    Turn query parameters (a QueryDict or {facet: [values]}) into typed
+    facet selections, raising ValueError on unknown values.
+    """
+    grades = {value for value, _ in Product.QUALITY_CHOICES}
+    bands = {value for value, *_ in PRICE_BANDS}
+    selected = {}
+    for facet in FACETS:
+        raw = params.getlist(facet) if hasattr(params, 'getlist') else params.get(facet, [])
+        values = set()
+        for value in raw:
+            if facet in ('category', 'county'):
+                try:
+                    values.add(int(value))
+                except (TypeError, ValueError):
+                    raise ValueError(f"{facet} must be an id")
+            elif facet == 'organic_certified':
+                if str(value).lower() not in ('true', 'false', '1', '0'):
+                    raise ValueError("organic_certified must be true or false")
+                values.add(str(value).lower() in ('true', '1'))
+            elif value in (grades if facet == 'quality_grade' else bands):
+                values.add(value)
+            else:
+                raise ValueError(f"Unknown {facet}: {value}")
+        if values:
+            selected[facet] = values
+    return selected
+
+
+def filter_products(queryset, selected):
+    queryset = queryset.filter(status=BROWSE_STATUS)
+    for facet, values in selected.items():
+        if facet == 'price_band':
+            q = Q()
+            for band in values:
+                q |= price_band_filter(band)
+            queryset = queryset.filter(q)
+        else:
+            queryset = queryset.filter(**{PRODUCT_LOOKUPS[facet]: values})
+    return queryset
+
+
+def _labels(facet, values):
+    if facet == 'category':
+        names = dict(CropCategory.objects.filter(pk__in=values).values_list('pk', 'name'))
+    elif facet == 'county':
+        names = dict(County.objects.filter(pk__in=values).values_list('pk', 'name'))
+    elif facet == 'quality_grade':
+        names = dict(Product.QUALITY_CHOICES)
+    elif facet == 'organic_certified':
+        names = {True: 'Organic', False: 'Not certified'}
+    else:
+        names = {value: label for value, label, *_ in PRICE_BANDS}
+    return names
+
+
+def facet_counts(selected):
+    """
+    (total, facets) for a selection. Each facet's counts apply every other
+    selected facet but not its own, so alternatives stay visible.
+    """
+    cells = ProductFacetCount.objects.filter(count__gt=0).values_list(*KEY_FIELDS, 'count')
+    chosen = [selected.get(facet) for facet in FACETS]
+    total = 0
+    counts = {facet: Counter() for facet in FACETS}
+    for *key, n in cells:
+        misses = [i for i, values in enumerate(chosen) if values and key[i] not in values]
+        if not misses:
+            total += n
+        for i, facet in enumerate(FACETS):
+            if not misses or misses == [i]:
+                counts[facet][key[i]] += n
+
+    order = {
+        'quality_grade': [value for value, _ in Product.QUALITY_CHOICES],
+        'organic_certified': [True, False],
+        'price_band': [value for value, *_ in PRICE_BANDS],
+    }
+    facets = {}
+    for facet in FACETS:
+        labels = _labels(facet, list(counts[facet]))
+        values = list(counts[facet])
+        if facet in order:
+            values.sort(key=order[facet].index)
+        else:
+            values.sort(key=lambda v: (-counts[facet][v], str(labels.get(v, v))))
+        facets[facet] = [
+            {
+                'value': value, 'label': labels.get(value, str(value)), 'count': counts[facet][value],
+                'selected': value in selected.get(facet, ()),
+            }
+            for value in values
+        ]
+    return total, facets
+
+
+class BrowseResults:
+    """One page of browsable products with the facet counts for the selection"""
+
+    def __init__(self, products, total, page, per_page, facets):
+        self.products = products
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+        self.facets = facets
+
+    @property
+    def num_pages(self):
+        return max(1, ceil(self.total / self.per_page))
+
+    def __iter__(self):
+        return iter(self.products)
+
+    def __len__(self):
+        return len(self.products)
+
+    def __repr__(self):
+        return f"<BrowseResults page {self.page} of {self.num_pages} ({self.total} listings)>"
+
+
+def browse_products(selected=None, page=1, per_page=20, queryset=None, ordering=('-created_at', '-pk')):
+    """
+    One page of active products matching selected ({facet: values}, values
+    ORed within a facet and facets ANDed) plus counts for every facet value.
+    """
+    selected = selected or {}
+    page = max(1, int(page))
+    total, facets = facet_counts(selected)
+    queryset = Product.objects.all() if queryset is None else queryset
+    offset = (page - 1) * per_page
+    products = list(filter_products(queryset, selected).order_by(*ordering)[offset:offset + per_page])
+    return BrowseResults(products, total, page, per_page, facets)
@@ -0,0 +1,198 @@
+"""
+Proximity search over farms, warehouses, input suppliers and extension agents.
+
+Every located Location carries geo_cell, the square of a fixed grid of
+CELL_DEGREES its coordinates fall in, numbered row by row from the south
+pole and the antimeridian (row * COLUMNS + column) and indexed with a
+plain B-tree, so no spatial database is needed. The cells of one grid row
+are consecutive numbers, so the cells under a search circle's bounding
+box are read with one index range per row; beyond MAX_RANGES rows the
+whole latitude band is read as one range instead. Exact great-circle
+distances of the locations found are computed with NumPy, dropping those
+outside the circle.
+
+A k-nearest search runs radius searches from NEAREST_START_KM, doubling
+the radius until k results lie inside it, which makes them the k nearest,
+or MAX_RADIUS_KM is reached.
+
+Farms and warehouses are placed at their location, input suppliers and
+extension agents at their user's locations (the nearest one counts), and
+a search can be limited to those whose county, or service_areas, cover a
+county. geo_cell is set on save (see signals.py); rebuild_geo_cells
+recomputes it after writes that bypass save().
+"""
+
+from decimal import Decimal
+from django.db import connection
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat
+import math
+import numpy as np
+
+from .dispatch import EARTH_RADIUS_KM
+from .models import ExtensionAgent, Farm, InputSupplier, Location, Warehouse
+
+
+# About 5.5 km north to south
+CELL_DEGREES = Decimal('0.05')
+
+ROWS = int(180 / CELL_DEGREES)
+
+COLUMNS = int(360 / CELL_DEGREES)
+
+# Grid rows read as separate index ranges before falling back to one range
+MAX_RANGES = 200
+
+NEAREST_START_KM = 5
+
+MAX_RADIUS_KM = 1000
+
+
+def cell_of(latitude, longitude):
+    """Grid cell of a point given in degrees, or None without coordinates"""
+    if latitude is None or longitude is None:
+        return None
+    row = int((Decimal(str(latitude)) + 90) // CELL_DEGREES)
+    column = int((Decimal(str(longitude)) + 180) // CELL_DEGREES)
+    return min(max(row, 0), ROWS - 1) * COLUMNS + min(max(column, 0), COLUMNS - 1)
+
+
+def cell_ranges(latitude, longitude, radius_km):
+    """(first, last) cell ranges covering every point within radius_km of a point"""
+    step = float(CELL_DEGREES)
+
+    def column(lon):
+        return min(max(int(math.floor((lon + 180) / step)), 0), COLUMNS - 1)
+
+    angle = radius_km / EARTH_RADIUS_KM
+    south, north = latitude - math.degrees(angle), latitude + math.degrees(angle)
+    first_row = max(int(math.floor((south + 90) / step)), 0)
+    last_row = min(int(math.floor((north + 90) / step)), ROWS - 1)
+    if last_row - first_row >= MAX_RANGES:
+        return [(first_row * COLUMNS, last_row * COLUMNS + COLUMNS - 1)]
+
+    # The circle's widest longitude span; a pole inside it takes every longitude
+    if south <= -90 or north >= 90 or angle >= math.pi / 2:
+        spans = [(0, COLUMNS - 1)]
+    else:
+        reach = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(latitude)))))
+        west, east = longitude - reach, longitude + reach
+        if east - west >= 360:
+            spans = [(0, COLUMNS - 1)]
+        elif west < -180:
+            spans = [(0, column(east)), (column(west + 360), COLUMNS - 1)]
+        elif east > 180:
+            spans = [(0, column(east - 360)), (column(west), COLUMNS - 1)]
+        else:
+            spans = [(column(west), column(east))]
+    return [(row * COLUMNS + first, row * COLUMNS + last) for row in range(first_row, last_row + 1) for first, last in spans]
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Great-circle distances in km from one point to arrays of points, all in degrees"""
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    lats, lons = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class ProximityTarget:
+    """What a search finds: rows of model placed at the Location(s) behind location, named by label"""
+
+    def __init__(self, model, location, label, county, **active):
+        self.model = model
+        self.location = location
+        self.label = label
+        self.county = county
+        self.active = active
+
+    def candidates(self, latitude, longitude, radius_km, county=None, queryset=None):
+        """(id, label, latitude, longitude) of rows with a location in the cells around a point"""
+        queryset = self.model.objects.filter(**self.active) if queryset is None else queryset
+        cells = Q()
+        for first, last in cell_ranges(latitude, longitude, radius_km):
+            cells |= Q(**{f'{self.location}__geo_cell__range': (first, last)})
+        queryset = queryset.filter(cells)
+        if county is not None:
+            queryset = queryset.filter(**{self.county: county})
+        return queryset.annotate(
+            found_label=self.label,
+            found_lat=F(f'{self.location}__latitude'),
+            found_lon=F(f'{self.location}__longitude'),
+        ).values_list('pk', 'found_label', 'found_lat', 'found_lon')
+
+
+TARGETS = {
+    'farms': ProximityTarget(Farm, 'location', F('name'), 'location__county', is_active=True),
+    'warehouses': ProximityTarget(Warehouse, 'location', F('name'), 'location__county', is_active=True),
+    'suppliers': ProximityTarget(InputSupplier, 'user__locations', F('business_name'), 'service_areas'),
+    'agents': ProximityTarget(
+        ExtensionAgent, 'user__locations', Concat('user__first_name', Value(' '), 'user__last_name'), 'service_areas',
+        is_available=True,
+    ),
+}
+
+
+class Nearby:
+    __slots__ = ['pk', 'label', 'distance_km']
+
+    def __init__(self, pk, label, distance_km):
+        self.pk = pk
+        self.label = label
+        self.distance_km = distance_km
+
+    def __repr__(self):
+        return f"<Nearby {self.pk} {self.label!r} {self.distance_km:.2f}km>"
+
+
+def within(kind, latitude, longitude, radius_km, county=None, queryset=None):
+    """
+    Nearby results for every row of kind (a TARGETS key) within radius_km
+    of a point, nearest first. queryset narrows the rows searched.
+    """
+    rows = list(TARGETS[kind].candidates(latitude, longitude, radius_km, county, queryset))
+    if not rows:
+        return []
+    coordinates = np.array([(row[2], row[3]) for row in rows], dtype=float)
+    distances = haversine_km(latitude, longitude, coordinates[:, 0], coordinates[:, 1])
+    found = {}
+    for index in np.flatnonzero(distances <= radius_km):
+        pk, label, _lat, _lon = rows[index]
+        distance = float(distances[index])
+        # Rows found through several locations count at the nearest
+        if pk not in found or distance < found[pk].distance_km:
+            found[pk] = Nearby(pk, label, distance)
+    return sorted(found.values(), key=lambda result: (result.distance_km, result.pk))
+
+
+def nearest(kind, latitude, longitude, k, county=None, queryset=None, max_radius_km=MAX_RADIUS_KM):
+    """The k rows of kind nearest to a point, no farther than max_radius_km, nearest first"""
+    radius = min(NEAREST_START_KM, max_radius_km)
+    while True:
+        found = within(kind, latitude, longitude, radius, county, queryset)
+        if len(found) >= k or radius >= max_radius_km:
+            return found[:k]
+        radius = min(radius * 2, max_radius_km)
+
+
+def refresh_geo_cells(batch_size=5000):
+    """Recompute geo_cell of every location whose stored cell is stale; returns the number updated"""
+    rows = [(expected, pk) for pk, _stored, expected in find_geo_cell_drift()]
+    qn = connection.ops.quote_name
+    meta = Location._meta
+    sql = f'UPDATE {qn(meta.db_table)} SET {qn(meta.get_field("geo_cell").column)} = %s WHERE {qn(meta.pk.column)} = %s'
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+    return len(rows)
+
+
+def find_geo_cell_drift():
+    """[(location id, stored, expected)] for locations whose geo_cell is stale"""
+    drift = []
+    rows = Location.objects.order_by('pk').values_list('pk', 'latitude', 'longitude', 'geo_cell')
+    for pk, latitude, longitude, stored in rows.iterator(chunk_size=5000):
+        expected = cell_of(latitude, longitude)
+        if stored != expected:
+            drift.append((pk, stored, expected))
+    return drift
@@ -0,0 +1,220 @@
+"""
+Contention-safe inventory reservation.
+
+Stock is taken with one conditional UPDATE:
+
+    UPDATE product SET quantity_available = quantity_available - x
+    WHERE id = ? AND status = 'active' AND quantity_available >= x
+
+The database applies it atomically, so concurrent buyers can never take
+more than is left and no row lock is held across a read. A buyer's cart
+holds stock through an InventoryReservation that expires RESERVATION_TTL
+after its last change; checkout commits held reservations to an order.
+Releasing a reservation (cart removal, expiry, order cancellation) puts
+the stock back. Every reservation changes state through an UPDATE
+conditional on its current state, so a reservation is released at most
+once however many sweeps or cancellations race for it.
+
+Products flip to sold_out when their stock runs out and back to active
+when released stock returns, keeping facet counts and the search index
+in step as the Product signals would.
+"""
+
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.utils import timezone
+
+from .facets import facet_key, move_listing
+from .models import InventoryReservation, Product
+from .search import index_products
+
+
+RESERVATION_TTL = timedelta(minutes=15)
+
+# Reservations whose stock is taken from the product
+ACTIVE_STATUSES = ['held', 'committed']
+
+SOLD_OUT = Q(status='active', quantity_available__lte=0)
+RESTOCKED = Q(status='sold_out', quantity_available__gt=0)
+
+
+class InsufficientStock(ValueError):
+    def __init__(self, product_id, requested):
+        super().__init__(f"Not enough stock of product {product_id} for {requested}")
+        self.product_id = product_id
+        self.requested = requested
+
+
+class ReservationExpired(ValueError):
+    pass
+
+
+def take_stock(product_id, quantity):
+    """Remove quantity from an active product's stock, raising InsufficientStock"""
+    quantity = Decimal(quantity)
+    if quantity <= 0:
+        raise ValueError(f"Quantity must be positive, not {quantity}")
+    taken = Product.objects.filter(
+        pk=product_id, status='active', quantity_available__gte=quantity,
+    ).update(quantity_available=F('quantity_available') - quantity)
+    if not taken:
+        raise InsufficientStock(product_id, quantity)
+    sync_stock_status([product_id])
+
+
+def adjust_stock(deltas):
+    """
+    Take positive and return negative {product id: quantity} deltas in one
+    conditional UPDATE. Positive deltas are taken only from active
+    products with enough stock; if any is short nothing changes and
+    InsufficientStock names the first such product. Call inside a
+    transaction that also records what the stock was taken for.
+    """
+    deltas = {product_id: Decimal(delta) for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    available = Q()
+    for product_id, delta in deltas.items():
+        if delta > 0:
+            available |= Q(pk=product_id, status='active', quantity_available__gte=delta)
+        else:
+            available |= Q(pk=product_id)
+    change = Case(
+        *[When(pk=product_id, then=Value(delta)) for product_id, delta in deltas.items()],
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+    try:
+        with transaction.atomic():
+            adjusted = Product.objects.filter(available).update(quantity_available=F('quantity_available') - change)
+            if adjusted != len(deltas):
+                raise InsufficientStock(None, None)
+    except InsufficientStock:
+        # Rolled back; name the first product that cannot cover its delta
+        covered = set(Product.objects.filter(available).values_list('pk', flat=True))
+        product_id = min(set(deltas) - covered, default=None)
+        raise InsufficientStock(product_id, deltas.get(product_id))
+    sync_stock_status(list(deltas))
+
+
+def return_stock(quantities):
+    """Put {product id: quantity} back into stock"""
+    adjust_stock({product_id: -quantity for product_id, quantity in quantities.items()})
+
+
+def sync_stock_status(product_ids):
+    """Mark listed products sold_out when out of stock and active again when restocked"""
+    changed = []
+    rows = Product.objects.filter(Q(pk__in=product_ids) & (SOLD_OUT | RESTOCKED)).values_list('pk', 'status')
+    for product_id, status in rows:
+        before = facet_key(product_id)
+        condition, new_status = (SOLD_OUT, 'sold_out') if status == 'active' else (RESTOCKED, 'active')
+        if Product.objects.filter(condition, pk=product_id).update(status=new_status):
+            move_listing(before, facet_key(product_id))
+            changed.append(product_id)
+    if changed:
+        index_products(changed)
+    return changed
+
+
+def hold(buyer, product_id, quantity, ttl=RESERVATION_TTL):
+    """
+    Set the quantity of product_id held for buyer's cart, taking or
+    returning only the difference, and restart its expiry. A quantity of
+    0 releases the hold. Returns the reservation, or None once released.
+    """
+    quantity = Decimal(quantity)
+    if quantity < 0:
+        raise ValueError(f"Quantity must not be negative, not {quantity}")
+    with transaction.atomic():
+        current = InventoryReservation.objects.filter(buyer=buyer, product_id=product_id, status='held').first()
+        if current is None:
+            if not quantity:
+                return None
+            take_stock(product_id, quantity)
+            try:
+                with transaction.atomic():
+                    return InventoryReservation.objects.create(
+                        buyer=buyer, product_id=product_id, quantity=quantity,
+                        expires_at=timezone.now() + ttl,
+                    )
+            except IntegrityError:
+                # Held concurrently by another request of the same buyer
+                raise ReservationExpired(f"Reservation of product {product_id} changed concurrently")
+
+        if not quantity:
+            release_reservations([current.pk])
+            return None
+        delta = quantity - current.quantity
+        # Conditional on the quantity read above, so concurrent resizes cannot both apply
+        resized = InventoryReservation.objects.filter(pk=current.pk, status='held', quantity=current.quantity).update(
+            quantity=quantity, expires_at=timezone.now() + ttl, updated_at=timezone.now(),
+        )
+        if not resized:
+            raise ReservationExpired(f"Reservation {current.pk} changed concurrently")
+        if delta > 0:
+            take_stock(product_id, delta)
+        elif delta < 0:
+            return_stock({product_id: -delta})
+    current.refresh_from_db()
+    return current
+
+
+def commit_reservations(reservation_ids, order):
+    """
+    Attach held reservations to order for good. Raises ReservationExpired,
+    rolling back, if any of them is no longer held.
+    """
+    with transaction.atomic():
+        committed = InventoryReservation.objects.filter(pk__in=reservation_ids, status='held').update(
+            status='committed', order=order, expires_at=None, updated_at=timezone.now(),
+        )
+        if committed != len(set(reservation_ids)):
+            raise ReservationExpired("Some reservations expired before checkout")
+    return committed
+
+
+def release_reservations(reservation_ids, status='released'):
+    """
+    Return the stock of held or committed reservations and mark them with
+    status. Returns the number released; reservations already released
+    are skipped.
+    """
+    returned = Counter()
+    released = 0
+    now = timezone.now()
+    with transaction.atomic():
+        rows = InventoryReservation.objects.filter(pk__in=reservation_ids, status__in=ACTIVE_STATUSES)
+        for pk, product_id, quantity, current in rows.values_list('pk', 'product_id', 'quantity', 'status'):
+            claimed = InventoryReservation.objects.filter(pk=pk, status=current).update(
+                status=status, expires_at=None, updated_at=now,
+            )
+            if claimed:
+                returned[product_id] += quantity
+                released += 1
+        return_stock(returned)
+    return released
+
+
+def release_orders(order_ids):
+    """Return the stock committed to orders, e.g. when they are cancelled"""
+    ids = list(
+        InventoryReservation.objects.filter(order_id__in=order_ids, status='committed').values_list('pk', flat=True)
+    )
+    return release_reservations(ids) if ids else 0
+
+
+def expire_reservations(now=None, batch_size=1000):
+    """Release held reservations past their expiry; returns the number expired"""
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        ids = list(
+            InventoryReservation.objects.filter(status='held', expires_at__lt=now)
+            .order_by('expires_at').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return expired
+        expired += release_reservations(ids, status='expired')
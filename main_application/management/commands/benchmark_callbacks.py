@@ -0,0 +1,145 @@
+"""
+Django management command to benchmark payment callback ingestion
+Usage: python manage.py benchmark_callbacks --payments 2000 --threads 16 --retries 0.3
+
+A fake gateway posts signed completion callbacks for pending payments
+from many threads through the full request stack, resending a share of
+them as gateways do on retry. It reports acknowledgement latency and
+throughput, then drains the queue and checks that every payment was
+completed once with its processing fee. The benchmark orders and payments
+are created for the run and deleted after.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from decimal import Decimal
+import json
+import random
+import time
+
+from main_application.benchmarks import create_fixture
+from main_application.models import CustomUser, Order, Payment, PaymentCallback, PaymentMethod
+from main_application.payment_callbacks import SIGNATURE_HEADER, callback_signature, drain_callbacks, processing_fee
+
+
+class FakeGateway:
+    """Posts callbacks signed with secret the way a payment gateway does"""
+
+    def __init__(self, secret, client=None):
+        self.secret = secret
+        self.client = client or Client(enforce_csrf_checks=True)
+
+    def payload(self, payment, result='completed', amount=None, reference=None):
+        return {
+            'gateway_reference': reference or f'GW{payment.transaction_id}',
+            'transaction_id': payment.transaction_id,
+            'result': result,
+            'amount': str(payment.amount if amount is None else amount),
+        }
+
+    def post(self, payload, secret=None):
+        body = json.dumps(payload).encode()
+        signature = callback_signature(body, self.secret if secret is None else secret)
+        return self.client.post(
+            reverse('payment-callback'), body, content_type='application/json',
+            headers={SIGNATURE_HEADER: signature},
+        )
+
+
+class Command(BaseCommand):
+    help = 'Fires signed gateway callbacks from many threads and checks they are applied exactly once'
+
+    secret = 'benchmark-secret'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=2000,
+                            help='Pending payments to complete')
+        parser.add_argument('--threads', type=int, default=16,
+                            help='Concurrent gateway connections')
+        parser.add_argument('--retries', type=float, default=0.3,
+                            help='Share of callbacks the gateway sends twice')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Worker threads draining the queue')
+
+    def handle(self, *args, **options):
+        fixture = create_fixture()
+        method = PaymentMethod.objects.create(
+            name='Benchmark gateway', code='benchmark', processing_fee_percentage=Decimal('1.5'),
+        )
+        buyer = CustomUser.objects.create(username='benchmark_buyer', phone_number='+254799999999', user_type='buyer')
+        try:
+            with override_settings(PAYMENT_CALLBACK_SECRET=self.secret):
+                self.run(fixture, method, buyer, options)
+        finally:
+            PaymentCallback.objects.filter(transaction_id__startswith='BENCH-').delete()
+            buyer.delete()
+            method.delete()
+            fixture['farmer'].user.delete()
+            fixture['crop'].category.delete()
+            fixture['unit'].delete()
+            fixture['location'].county.delete()
+
+    def run(self, fixture, method, buyer, options):
+        n = options['payments']
+        orders = Order.objects.bulk_create([
+            Order(
+                order_number=f'BENCH-{i}', buyer=buyer, farmer=fixture['farmer'],
+                delivery_location=fixture['location'], subtotal=Decimal('1000'), total_amount=Decimal('1000'),
+                expected_delivery_date=timezone.now(),
+            )
+            for i in range(n)
+        ])
+        payments = Payment.objects.bulk_create([
+            Payment(
+                order=order, payment_method=method, transaction_id=f'BENCH-{i}',
+                amount=Decimal('1000'), net_amount=Decimal('1000'),
+            )
+            for i, order in enumerate(orders)
+        ])
+        gateway = FakeGateway(self.secret)
+        payloads = [gateway.payload(payment) for payment in payments]
+        payloads += random.sample(payloads, int(len(payloads) * options['retries']))
+        random.shuffle(payloads)
+
+        def gateway_thread(share):
+            thread_gateway = FakeGateway(self.secret)
+            latencies = []
+            try:
+                for payload in share:
+                    began = time.perf_counter()
+                    response = thread_gateway.post(payload)
+                    latencies.append((time.perf_counter() - began, response.status_code))
+            finally:
+                connections.close_all()
+            return latencies
+
+        threads = options['threads']
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = [row for share in pool.map(gateway_thread, [payloads[i::threads] for i in range(threads)]) for row in share]
+        elapsed = time.perf_counter() - began
+        latencies = sorted(seconds * 1000 for seconds, _code in results)
+        errors = sum(1 for _seconds, code in results if code != 202)
+        self.stdout.write(
+            f'Acknowledged {len(results) - errors}/{len(results)} callbacks in {elapsed:.1f}s '
+            f'({len(results) / elapsed:.0f}/s); latency p50 {latencies[len(latencies) // 2]:.2f}ms, '
+            f'p99 {latencies[int(len(latencies) * 0.99)]:.2f}ms, max {latencies[-1]:.2f}ms'
+        )
+
+        began = time.perf_counter()
+        done = drain_callbacks(workers=options['workers'])
+        elapsed = time.perf_counter() - began
+        self.stdout.write(f'Drained {sum(done.values())} callbacks in {elapsed:.1f}s ({dict(done)})')
+
+        fee = processing_fee(Decimal('1000'), method.processing_fee_percentage)
+        completed = Payment.objects.filter(
+            pk__in=[payment.pk for payment in payments], status='completed', net_amount=Decimal('1000') - fee,
+        ).count()
+        paid = Order.objects.filter(pk__in=[order.pk for order in orders], payment_status='paid').count()
+        check = self.style.SUCCESS('✓') if completed == paid == n else self.style.ERROR('✗')
+        self.stdout.write(f'{check} {completed}/{n} payments completed, {paid}/{n} orders paid')
@@ -0,0 +1,110 @@
+"""
+Django management command to benchmark proximity search
+Usage: python manage.py benchmark_geo --locations 1000000 --queries 200 --radius 10 --k 10
+
+Scatters farms over Kenya, each at its own location, and times radius
+and k-nearest searches (geo.within and geo.nearest) from random points,
+reporting latency percentiles, results found and, for radius searches,
+the locations read from the grid cells. A few searches are repeated as a
+full scan, every located farm's coordinates read and measured with the
+same NumPy haversine, and both must find the same farms. Everything runs
+inside a transaction that is rolled back, so the database is unchanged.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from decimal import Decimal
+import numpy as np
+import time
+
+from main_application.benchmarks import create_fixture
+from main_application.geo import TARGETS, cell_of, haversine_km, nearest, within
+from main_application.models import Farm, Location
+
+# Kenya's bounding box
+SOUTH, NORTH, WEST, EAST = -4.7, 4.6, 33.9, 41.9
+
+
+class Command(BaseCommand):
+    help = 'Times radius and k-nearest farm searches over many locations against a full scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--locations', type=int, default=1000000,
+                            help='Farms to scatter, one location each')
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Searches of each kind to time')
+        parser.add_argument('--scans', type=int, default=5,
+                            help='Searches to repeat as a full scan')
+        parser.add_argument('--radius', type=float, default=10,
+                            help='Radius of radius searches, in km')
+        parser.add_argument('--k', type=int, default=10,
+                            help='Results of k-nearest searches')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        with transaction.atomic():
+            fixture = create_fixture()
+            started = time.perf_counter()
+            self.scatter(fixture, options['locations'], rng)
+            self.stdout.write(f'Created {options["locations"]} farms in {time.perf_counter() - started:.1f}s')
+
+            points = np.column_stack([rng.uniform(SOUTH, NORTH, options['queries']), rng.uniform(WEST, EAST, options['queries'])])
+            radius = options['radius']
+            self.stdout.write(f'{"search":>18} {"p50 ms":>8} {"p95 ms":>8} {"max ms":>8} {"found":>7} {"read":>7}')
+            read = sum(len(TARGETS['farms'].candidates(lat, lon, radius)) for lat, lon in points.tolist())
+            self.report(f'within {radius:g} km', points, lambda lat, lon: within('farms', lat, lon, radius), read)
+            self.report(f'nearest {options["k"]}', points, lambda lat, lon: nearest('farms', lat, lon, options['k']))
+            self.compare_scan(points[:options['scans']], radius)
+            transaction.set_rollback(True)
+
+    def scatter(self, fixture, count, rng, batch_size=20000):
+        location, farmer = fixture['location'], fixture['farmer']
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            lats = np.round(rng.uniform(SOUTH, NORTH, size), 6)
+            lons = np.round(rng.uniform(WEST, EAST, size), 6)
+            locations = Location.objects.bulk_create([
+                Location(
+                    user_id=location.user_id, name='Farm', county_id=location.county_id, subcounty_id=location.subcounty_id,
+                    ward_id=location.ward_id, village='Bench', detailed_address='Bench',
+                    latitude=Decimal(str(lat)), longitude=Decimal(str(lon)), geo_cell=cell_of(lat, lon),
+                )
+                for lat, lon in zip(lats.tolist(), lons.tolist())
+            ])
+            Farm.objects.bulk_create([
+                Farm(farmer=farmer, name=f'bench-geo-{start + i}', location=saved, size=Decimal('1'))
+                for i, saved in enumerate(locations)
+            ])
+
+    def report(self, label, points, search, read=None):
+        timings, found = [], 0
+        for lat, lon in points.tolist():
+            began = time.perf_counter()
+            found += len(search(lat, lon))
+            timings.append((time.perf_counter() - began) * 1000)
+        timings = np.array(timings)
+        read = f'{read / len(points):7.0f}' if read is not None else f'{"-":>7}'
+        self.stdout.write(
+            f'{label:>18} {np.percentile(timings, 50):8.2f} {np.percentile(timings, 95):8.2f} {timings.max():8.2f} '
+            f'{found / len(points):7.1f} {read}'
+        )
+
+    def compare_scan(self, points, radius):
+        timings = []
+        for lat, lon in points.tolist():
+            began = time.perf_counter()
+            rows = np.array(list(Farm.objects.filter(is_active=True, location__latitude__isnull=False).values_list(
+                'pk', 'location__latitude', 'location__longitude',
+            )), dtype=float)
+            distances = haversine_km(lat, lon, rows[:, 1], rows[:, 2])
+            scanned = set(rows[distances <= radius, 0].astype(int).tolist())
+            timings.append((time.perf_counter() - began) * 1000)
+            indexed = {result.pk for result in within('farms', lat, lon, radius)}
+            if scanned != indexed:
+                raise CommandError(f'Full scan and index disagree at ({lat:.4f}, {lon:.4f})')
+        timings = np.array(timings)
+        self.stdout.write(
+            f'{"full scan":>18} {np.percentile(timings, 50):8.2f} {np.percentile(timings, 95):8.2f} {timings.max():8.2f}'
+        )
+        self.stdout.write(self.style.SUCCESS(f'✓ Full scan and index found the same farms in {len(points)} searches'))
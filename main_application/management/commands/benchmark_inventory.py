@@ -0,0 +1,95 @@
+"""
+Django management command to benchmark concurrent stock reservation
+Usage: python manage.py benchmark_inventory --threads 16 --buyers 400 --stock 100
+
+Many threads, each with its own database connection, race to take one
+unit of a single product until every buyer has tried once. The
+conditional UPDATE used by inventory.take_stock() is compared with a
+naive read-check-save, reporting throughput, rejections, oversold units
+and lost updates. The benchmark product is created for the run and deleted after.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.utils import timezone
+from decimal import Decimal
+import time
+
+from main_application.benchmarks import create_fixture
+from main_application.inventory import InsufficientStock, take_stock
+from main_application.models import Product
+
+
+def naive_take(product_id, quantity):
+    """Read, check and save: the race take_stock() avoids"""
+    product = Product.objects.get(pk=product_id)
+    if product.quantity_available < quantity:
+        raise InsufficientStock(product_id, quantity)
+    product.quantity_available -= quantity
+    product.save(update_fields=['quantity_available'])
+
+
+class Command(BaseCommand):
+    help = 'Hammers one product from many threads and checks that stock is never oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16,
+                            help='Concurrent buyers')
+        parser.add_argument('--buyers', type=int, default=400,
+                            help='Reservation attempts, one unit each')
+        parser.add_argument('--stock', type=int, default=100,
+                            help='Units on sale')
+
+    def handle(self, *args, **options):
+        fixture = create_fixture()
+        try:
+            self.stdout.write(f'{"method":>12} {"taken":>6} {"rejected":>9} {"errors":>7} '
+                              f'{"oversold":>9} {"lost updates":>13} {"attempts/s":>11}')
+            for label, take in [('conditional', take_stock), ('naive', naive_take)]:
+                self.run(label, take, fixture, options)
+        finally:
+            fixture['farmer'].user.delete()
+            fixture['crop'].category.delete()
+            fixture['unit'].delete()
+            fixture['location'].county.delete()
+
+    def run(self, label, take, fixture, options):
+        product = Product.objects.create(
+            name='benchmark', description='benchmark', quantity_available=Decimal(options['stock']),
+            price_per_unit=Decimal('1'), harvest_date=timezone.now().date(), status='active',
+            farmer=fixture['farmer'], farm=fixture['farm'], crop=fixture['crop'], unit=fixture['unit'],
+        )
+
+        def buyer_thread(attempts):
+            outcomes = []
+            try:
+                for _ in range(attempts):
+                    try:
+                        take(product.pk, Decimal('1'))
+                        outcomes.append('taken')
+                    except InsufficientStock:
+                        outcomes.append('rejected')
+                    except OperationalError:
+                        outcomes.append('errors')  # e.g. SQLite's "database is locked"
+            finally:
+                connections.close_all()
+            return outcomes
+
+        threads = options['threads']
+        shares = [options['buyers'] // threads + (1 if i < options['buyers'] % threads else 0) for i in range(threads)]
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            outcomes = [outcome for share in pool.map(buyer_thread, shares) for outcome in share]
+        elapsed = time.perf_counter() - began
+
+        product.refresh_from_db()
+        taken = outcomes.count('taken')
+        # Units promised beyond the stock, and units sold without leaving it
+        oversold = max(0, taken - options['stock'])
+        lost = taken - (options['stock'] - int(product.quantity_available))
+        self.stdout.write(
+            f'{label:>12} {taken:>6} {outcomes.count("rejected"):>9} {outcomes.count("errors"):>7} '
+            f'{oversold:>9} {lost:>13} {len(outcomes) / elapsed:>11.0f}'
+        )
+        product.delete()
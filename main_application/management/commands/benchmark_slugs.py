@@ -0,0 +1,65 @@
+"""
+Django management command to benchmark unique slug allocation
+Usage: python manage.py benchmark_slugs --collisions 1000 --step 100
+
+Inserts products (and farms) that all share one name and reports insert
+latency and queries per insert as the number of collisions grows. Everything
+runs inside a transaction that is rolled back, so the database is unchanged.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from decimal import Decimal
+import time
+
+from main_application.benchmarks import create_fixture
+from main_application.models import *
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks slug allocation for Product.save and Farm.save as collisions grow'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collisions', type=int, default=1000,
+                            help='Number of rows sharing one name to insert')
+        parser.add_argument('--step', type=int, default=100,
+                            help='Report latency every N inserts')
+        parser.add_argument('--name', default='maize',
+                            help='Name shared by every inserted row')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixture = create_fixture()
+            self.run('Product.save', options, lambda i: Product(
+                name=options['name'], description='benchmark', quantity_available=Decimal('1'),
+                price_per_unit=Decimal('1'), harvest_date=timezone.now().date(),
+                farmer=fixture['farmer'], farm=fixture['farm'], crop=fixture['crop'], unit=fixture['unit'],
+            ).save())
+            self.run('Farm.save', options, lambda i: Farm(
+                farmer=fixture['farmer'], name=options['name'], location=fixture['location'],
+                size=Decimal('1'),
+            ).save())
+            transaction.set_rollback(True)
+
+    def run(self, label, options, insert):
+        self.stdout.write(f'\n{label}')
+        self.stdout.write(f'{"collisions":>12} {"avg ms/insert":>14} {"queries/insert":>15}')
+
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        step = max(1, options['step'])
+        for start in range(0, options['collisions'], step):
+            queries.clear()
+            with connection.execute_wrapper(count_queries):
+                began = time.perf_counter()
+                for i in range(start, start + step):
+                    insert(i)
+                elapsed = time.perf_counter() - began
+            self.stdout.write(
+                f'{start + step:>12} {elapsed * 1000 / step:>14.3f} {len(queries) / step:>15.1f}'
+            )
@@ -0,0 +1,42 @@
+"""
+Django management command to compute market price trends
+Usage: python manage.py classify_price_trends [--crop ID ...] [--county ID ...] [--window N] [--threshold F]
+
+Loads every price series (one crop in one county) into NumPy arrays and
+recomputes moving_average, price_change, price_volatility and the
+Rising/Stable/Falling price_trend of each price in one batched pass.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+import time
+
+from main_application.models import MarketPrice
+from main_application.price_trends import TREND_THRESHOLD, WINDOW, classify_price_trends
+
+
+class Command(BaseCommand):
+    help = 'Computes moving averages, volatility and trends for market prices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--crop', type=int, action='append', help='Only series of this crop id (repeatable)')
+        parser.add_argument('--county', type=int, action='append', help='Only series in this county id (repeatable)')
+        parser.add_argument('--window', type=int, default=WINDOW,
+                            help='Prices per moving average and volatility window')
+        parser.add_argument('--threshold', type=float, default=TREND_THRESHOLD,
+                            help='Moving average change (as a fraction) that counts as rising or falling')
+
+    def handle(self, *args, **options):
+        if options['window'] < 1:
+            raise CommandError('--window must be at least 1')
+        started = time.perf_counter()
+        queryset = MarketPrice.objects.all()
+        if options['crop']:
+            queryset = queryset.filter(crop_id__in=options['crop'])
+        if options['county']:
+            queryset = queryset.filter(location_id__in=options['county'])
+
+        counts = classify_price_trends(queryset, window=options['window'], threshold=options['threshold'])
+        summary = ', '.join(f'{n} {label.lower()}' for label, n in counts.items()) or 'no prices'
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Classified {sum(counts.values())} prices ({summary}) in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,74 @@
+"""
+Django management command to bulk import product listings
+Usage: python manage.py import_products listings.csv [--batch-size 1000] [--chunk-size 5000]
+
+Columns: farmer (username or id), crop (name or id), farm (name or id),
+unit (abbreviation, name or id), name, description, quantity_available,
+price_per_unit, harvest_date, plus any optional Product field such as
+quality_grade, expiry_date, organic_certified, status or slug.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+import csv
+import os
+import time
+
+from main_application.bulk_import import import_products, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk imports product listings from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='Input format (defaults to the file extension)',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per INSERT statement')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Rows per transaction')
+        parser.add_argument('--errors', help='Write per-row errors to this CSV file')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate the file without writing anything')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt == 'json':
+            fmt = 'jsonl'
+        if fmt not in ('csv', 'jsonl'):
+            raise CommandError(f'Cannot tell the format of {path}; pass --format csv or --format jsonl')
+
+        started = time.perf_counter()
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                report = import_products(
+                    read_rows(f, fmt),
+                    batch_size=options['batch_size'],
+                    chunk_size=options['chunk_size'],
+                    dry_run=options['dry_run'],
+                )
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+        elapsed = time.perf_counter() - started
+
+        for line, message in report.errors[:20]:
+            self.stdout.write(self.style.WARNING(f'  line {line}: {message}'))
+        if len(report.errors) > 20:
+            self.stdout.write(self.style.WARNING(f'  ... and {len(report.errors) - 20} more'))
+
+        if options['errors'] and report.errors:
+            with open(options['errors'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['line', 'error'])
+                writer.writerows(report.errors)
+            self.stdout.write(f'Wrote {len(report.errors)} errors to {options["errors"]}')
+
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        count = report.rows - len(report.errors) if options['dry_run'] else report.created
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {verb} {count} of {report.rows} rows in {elapsed:.1f}s ({len(report.errors)} errors)'
+        ))
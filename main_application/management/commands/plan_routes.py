@@ -0,0 +1,44 @@
+"""
+Django management command to batch pending deliveries into routes
+Usage: python manage.py plan_routes [--max-stops 25] [--dry-run]
+
+Every delivery still waiting for a route is given a partner serving its
+county and a place on a multi-stop route of that partner (see
+dispatch.py). Assign drivers and vehicles to the planned routes in the
+admin; they are copied to the routes' deliveries.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+import time
+
+from main_application.dispatch import MAX_STOPS, dispatch, plan_dispatch
+
+
+class Command(BaseCommand):
+    help = 'Plans multi-stop delivery routes for pending deliveries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-stops', type=int, default=MAX_STOPS,
+                            help='Drop-offs per route')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Plan and report without assigning anything')
+
+    def handle(self, *args, **options):
+        if options['max_stops'] < 1:
+            raise CommandError('--max-stops must be at least 1')
+        started = time.perf_counter()
+        if options['dry_run']:
+            plan = plan_dispatch(max_stops=options['max_stops'])
+        else:
+            plan = dispatch(max_stops=options['max_stops'])
+        elapsed = time.perf_counter() - started
+
+        verb = 'Would route' if options['dry_run'] else 'Routed'
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {verb} {plan.planned} deliveries on {len(plan.routes)} routes '
+            f'({plan.distance_km:.0f} km) in {elapsed:.1f}s'
+        ))
+        for delivery_id, reason in sorted(plan.unplanned.items())[:20]:
+            self.stdout.write(self.style.WARNING(f'  delivery {delivery_id}: {reason}'))
+        if len(plan.unplanned) > 20:
+            self.stdout.write(self.style.WARNING(f'  ... and {len(plan.unplanned) - 20} more unplanned'))
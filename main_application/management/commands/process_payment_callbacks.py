@@ -0,0 +1,41 @@
+"""
+Django management command to apply queued payment gateway callbacks
+Usage: python manage.py process_payment_callbacks [--workers 4] [--batch-size 500] [--follow]
+
+Drains the callback queue with a pool of worker threads. With --follow
+it keeps polling for new callbacks instead of exiting once the queue is
+empty. Any number of these can run at once.
+"""
+
+from django.core.management.base import BaseCommand
+import time
+
+from main_application.payment_callbacks import BATCH_SIZE, drain_callbacks
+
+
+class Command(BaseCommand):
+    help = 'Applies queued payment callbacks to payments and orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Worker threads, each with its own database connection')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Callbacks applied per transaction')
+        parser.add_argument('--follow', action='store_true',
+                            help='Keep polling for callbacks')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between polls of an empty queue with --follow')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            done = drain_callbacks(workers=options['workers'], batch_size=options['batch_size'])
+            if done:
+                summary = ', '.join(f'{count} {state}' for state, count in sorted(done.items()))
+                self.stdout.write(self.style.SUCCESS(
+                    f'✓ Processed {sum(done.values())} callbacks in {time.perf_counter() - started:.1f}s: {summary}'
+                ))
+            if not options['follow']:
+                return
+            if not done:
+                time.sleep(options['interval'])
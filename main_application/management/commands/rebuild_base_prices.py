@@ -0,0 +1,44 @@
+"""
+Django management command to rebuild stored base-unit prices
+Usage: python manage.py rebuild_base_prices [--verify]
+
+Product.price_per_base_unit and MarketPrice.price_per_base_unit are set
+on save and repriced when a ProductUnit changes. Run this after writes
+that bypass save() (bulk_create, QuerySet.update, raw SQL); --verify
+reports rows whose stored price is stale without writing. Rebuild the
+price rollups afterwards if market prices changed.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+import time
+
+from main_application.units import find_base_price_drift, invalidate_unit_graph, refresh_base_prices
+
+
+class Command(BaseCommand):
+    help = 'Recomputes prices per base unit on products and market prices and reports drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only report rows whose base price has drifted')
+        parser.add_argument('--show', type=int, default=10,
+                            help='Number of drifted rows to list')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        invalidate_unit_graph()
+
+        if options['verify']:
+            drift = find_base_price_drift()
+            for model_name, pk, stored, expected in drift[:options['show']]:
+                self.stdout.write(self.style.WARNING(f'  {model_name} {pk}: stored {stored}, expected {expected}'))
+            elapsed = time.perf_counter() - started
+            if drift:
+                raise CommandError(f'{len(drift)} base prices have drifted ({elapsed:.1f}s)')
+            self.stdout.write(self.style.SUCCESS(f'✓ No base price drift ({elapsed:.1f}s)'))
+            return
+
+        rows = refresh_base_prices()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Rebuilt {rows} base prices in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,42 @@
+"""
+Django management command to rebuild the grid cells of locations
+Usage: python manage.py rebuild_geo_cells [--verify]
+
+Location.geo_cell is set on save from the coordinates. Run this after
+writes that bypass save() (bulk_create, QuerySet.update, raw SQL), or
+they are missing from proximity searches; --verify reports locations
+whose stored cell is stale without writing.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+import time
+
+from main_application.geo import find_geo_cell_drift, refresh_geo_cells
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the proximity search grid cell of every location and reports drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only report locations whose cell has drifted')
+        parser.add_argument('--show', type=int, default=10,
+                            help='Number of drifted locations to list')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        if options['verify']:
+            drift = find_geo_cell_drift()
+            for pk, stored, expected in drift[:options['show']]:
+                self.stdout.write(self.style.WARNING(f'  location {pk}: stored {stored}, expected {expected}'))
+            elapsed = time.perf_counter() - started
+            if drift:
+                raise CommandError(f'{len(drift)} location cells have drifted ({elapsed:.1f}s)')
+            self.stdout.write(self.style.SUCCESS(f'✓ No location cell drift ({elapsed:.1f}s)'))
+            return
+
+        rows = refresh_geo_cells()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Rebuilt {rows} location cells in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,50 @@
+"""
+Django management command to rebuild the market price rollups
+Usage: python manage.py rebuild_price_rollups [--since YYYY-MM-DD] [--verify]
+
+MarketPriceRollup is maintained incrementally when prices are saved or
+deleted. Run this after writes that bypass signals or after changing a
+unit's conversion factor; --since limits the rebuild to the periods from
+that date on, and --verify reports cells that disagree with the raw
+prices without writing.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+import time
+
+from main_application.price_rollups import find_rollup_drift, refresh_price_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes daily, weekly and monthly market price rollups and reports drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild periods from this date (YYYY-MM-DD) on')
+        parser.add_argument('--verify', action='store_true',
+                            help='Only report rollup cells that have drifted')
+        parser.add_argument('--show', type=int, default=10,
+                            help='Number of drifted cells to list')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        if options['verify']:
+            drift = find_rollup_drift()
+            for key, stored, actual in drift[:options['show']]:
+                self.stdout.write(self.style.WARNING(f'  cell {key}: stored {stored} prices, actual {actual}'))
+            elapsed = time.perf_counter() - started
+            if drift:
+                raise CommandError(f'{len(drift)} price rollup cells have drifted ({elapsed:.1f}s)')
+            self.stdout.write(self.style.SUCCESS(f'✓ No price rollup drift ({elapsed:.1f}s)'))
+            return
+
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError(f"--since must be a date (YYYY-MM-DD), not {options['since']!r}")
+        cells = refresh_price_rollups(since=since)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Rebuilt {cells} price rollup cells in {time.perf_counter() - started:.1f}s'
+        ))
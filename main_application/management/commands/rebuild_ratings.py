@@ -0,0 +1,47 @@
+"""
+Django management command to rebuild denormalized product rating aggregates
+Usage: python manage.py rebuild_ratings [--verify] [--batch-size 2000]
+
+Product.rating_sum, rating_count and avg_rating are maintained incrementally
+when reviews are saved or deleted. Run this after loading reviews with
+bulk_create or raw SQL, or with --verify to report drift without writing.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+import time
+
+from main_application.ratings import find_drift, rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recomputes Product rating aggregates from reviews and reports drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only report products whose aggregates have drifted')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Products per UPDATE statement')
+        parser.add_argument('--show', type=int, default=10,
+                            help='Number of drifted products to list')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        drift = find_drift().order_by('pk')
+
+        if options['verify']:
+            drifted = drift.count()
+            for product in drift.values('pk', 'rating_sum', 'rating_count', 'review_sum', 'review_count')[:options['show']]:
+                self.stdout.write(self.style.WARNING(
+                    f"  product {product['pk']}: stored {product['rating_sum']}/{product['rating_count']}, "
+                    f"reviews {product['review_sum']}/{product['review_count']}"
+                ))
+            elapsed = time.perf_counter() - started
+            if drifted:
+                raise CommandError(f'{drifted} products have drifted rating aggregates ({elapsed:.1f}s)')
+            self.stdout.write(self.style.SUCCESS(f'✓ No rating drift ({elapsed:.1f}s)'))
+            return
+
+        drifted = rebuild_ratings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Rebuilt rating aggregates for {drifted} drifted products in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,28 @@
+"""
+Django management command to rebuild the product search index
+Usage: python manage.py rebuild_search_index [--batch-size 2000]
+
+Needed after writes that bypass Product signals (bulk_create, QuerySet.update,
+raw SQL) or after renaming crops, categories or counties.
+"""
+
+from django.core.management.base import BaseCommand
+import time
+
+from main_application.search import rebuild_index, uses_fts
+
+
+class Command(BaseCommand):
+    help = 'Re-indexes every product for search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Products tokenized per transaction (inverted index only)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        backend = 'FTS5' if uses_fts() else 'inverted index'
+        indexed = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Indexed {indexed} products ({backend}) in {time.perf_counter() - started:.1f}s'
+        ))
@@ -1,18 +1,371 @@
 """
 Django management command to seed the database with Kenyan agricultural data
-Usage: python manage.py seed_data
+Usage: python manage.py seed_data [--scale small|medium|large] [--seed 42] [--workers 4]
+
+Rows are generated in memory and written with bulk_create in batches, with
+foreign keys taken from in-memory id maps instead of per-row lookups, so the
+same command builds the small development dataset and production-sized
+load-test databases. Each run tops every group up to its target count.
 """
 
+from django.apps import apps
 from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
 from django.contrib.auth.hashers import make_password
+from django.db import connection, connections, models as models_module, transaction
+from django.db.models import Max
 from django.utils import timezone
+from django.utils.text import slugify
 from decimal import Decimal
+from itertools import islice
+import multiprocessing
 import random
-from datetime import datetime, timedelta, date
-import uuid
+import time
+from datetime import timedelta, date
 
 # Import all models
 from main_application.models import *
+from main_application.facets import rebuild_facets
+from main_application.geo import cell_of
+from main_application.price_rollups import refresh_price_rollups
+from main_application.price_trends import classify_price_trends
+from main_application.ratings import rebuild_ratings
+from main_application.search import clear_index, rebuild_index
+from main_application.units import refresh_base_prices
+
+
+# Target row counts per scale; any of them can be overridden on the command line
+SCALES = {
+    'small': {'farmers': 25, 'buyers': 15, 'products': 250, 'reviews': 150, 'market_prices': 2000},
+    'medium': {'farmers': 2000, 'buyers': 8000, 'products': 50000, 'reviews': 100000, 'market_prices': 500000},
+    'large': {'farmers': 20000, 'buyers': 80000, 'products': 1000000, 'reviews': 1000000, 'market_prices': 10000000},
+}
+
+# Rows handled by one worker task (and one transaction)
+PARTITION_SIZE = 100000
+
+# Longest daily market price history per market; more rows means more markets
+MAX_SERIES_DAYS = 3650
+
+FIRST_NAMES = ['John', 'Mary', 'Peter', 'Jane', 'David', 'Sarah', 'James', 'Lucy', 'Michael', 'Grace',
+               'Daniel', 'Ann', 'Joseph', 'Faith', 'Samuel', 'Ruth', 'Brian', 'Joyce', 'Kevin', 'Alice',
+               'Patrick', 'Rose', 'Simon', 'Catherine', 'Paul', 'Margaret', 'Stephen', 'Elizabeth', 'Moses', 'Hannah']
+
+LAST_NAMES = ['Mwangi', 'Wanjiku', 'Kamau', 'Njeri', 'Kariuki', 'Waithera', 'Kimani', 'Muthoni', 'Omondi', 'Akinyi',
+              'Otieno', 'Adhiambo', 'Kipchoge', 'Chepkemoi', 'Mutua', 'Nduku', 'Ochieng', 'Atieno', 'Wekesa', 'Nekesa']
+
+COUNTIES = [
+    {'name': 'Nairobi', 'code': '001', 'population': 4397073, 'area_sq_km': 696.0},
+    {'name': 'Kiambu', 'code': '023', 'population': 2417735, 'area_sq_km': 2449.0},
+    {'name': 'Murang\'a', 'code': '022', 'population': 1056640, 'area_sq_km': 2325.0},
+    {'name': 'Nakuru', 'code': '033', 'population': 2162202, 'area_sq_km': 7496.0},
+    {'name': 'Meru', 'code': '013', 'population': 1545714, 'area_sq_km': 6930.0},
+    {'name': 'Nyeri', 'code': '021', 'population': 759164, 'area_sq_km': 3337.0},
+    {'name': 'Kirinyaga', 'code': '024', 'population': 610411, 'area_sq_km': 1478.0},
+    {'name': 'Embu', 'code': '014', 'population': 608599, 'area_sq_km': 2555.0},
+    {'name': 'Machakos', 'code': '029', 'population': 1421932, 'area_sq_km': 6281.0},
+    {'name': 'Uasin Gishu', 'code': '035', 'population': 1163186, 'area_sq_km': 3345.0},
+]
+
+SUBCOUNTIES = [
+    # Nairobi (4 sub-counties)
+    {'county_code': '001', 'name': 'Westlands', 'code': '001001'},
+    {'county_code': '001', 'name': 'Dagoretti North', 'code': '001002'},
+    {'county_code': '001', 'name': 'Langata', 'code': '001003'},
+    {'county_code': '001', 'name': 'Embakasi South', 'code': '001004'},
+
+    # Kiambu (5 sub-counties)
+    {'county_code': '023', 'name': 'Thika Town', 'code': '023001'},
+    {'county_code': '023', 'name': 'Ruiru', 'code': '023002'},
+    {'county_code': '023', 'name': 'Limuru', 'code': '023003'},
+    {'county_code': '023', 'name': 'Kikuyu', 'code': '023004'},
+    {'county_code': '023', 'name': 'Gatundu South', 'code': '023005'},
+
+    # Murang'a (4 sub-counties)
+    {'county_code': '022', 'name': 'Kangema', 'code': '022001'},
+    {'county_code': '022', 'name': 'Mathioya', 'code': '022002'},
+    {'county_code': '022', 'name': 'Kiharu', 'code': '022003'},
+    {'county_code': '022', 'name': 'Maragwa', 'code': '022004'},
+
+    # Nakuru (3 sub-counties)
+    {'county_code': '033', 'name': 'Nakuru Town East', 'code': '033001'},
+    {'county_code': '033', 'name': 'Rongai', 'code': '033002'},
+    {'county_code': '033', 'name': 'Naivasha', 'code': '033003'},
+
+    # Meru (3 sub-counties)
+    {'county_code': '013', 'name': 'Imenti North', 'code': '013001'},
+    {'county_code': '013', 'name': 'Imenti South', 'code': '013002'},
+    {'county_code': '013', 'name': 'Tigania East', 'code': '013003'},
+]
+
+CROP_CATEGORIES = [
+    {'name': 'cereals', 'description': 'Cereal crops like maize, wheat, rice'},
+    {'name': 'vegetables', 'description': 'Vegetable crops'},
+    {'name': 'fruits', 'description': 'Fruit crops'},
+    {'name': 'legumes', 'description': 'Beans, peas, and other legumes'},
+    {'name': 'tubers', 'description': 'Root and tuber crops'},
+    {'name': 'cash-crops', 'description': 'Export and cash crops'},
+]
+
+CROPS = [
+    # Cereals
+    {'name': 'maize', 'scientific_name': 'Zea mays', 'category': 'cereals', 'maturity': 120},
+    {'name': 'wheat', 'scientific_name': 'Triticum aestivum', 'category': 'cereals', 'maturity': 140},
+    {'name': 'rice', 'scientific_name': 'Oryza sativa', 'category': 'cereals', 'maturity': 150},
+
+    # Vegetables
+    {'name': 'tomatoes', 'scientific_name': 'Solanum lycopersicum', 'category': 'vegetables', 'maturity': 75},
+    {'name': 'cabbage', 'scientific_name': 'Brassica oleracea', 'category': 'vegetables', 'maturity': 60},
+    {'name': 'kale-sukuma-wiki', 'scientific_name': 'Brassica oleracea', 'category': 'vegetables', 'maturity': 45},
+    {'name': 'spinach', 'scientific_name': 'Spinacia oleracea', 'category': 'vegetables', 'maturity': 40},
+    {'name': 'onions', 'scientific_name': 'Allium cepa', 'category': 'vegetables', 'maturity': 90},
+
+    # Fruits
+    {'name': 'bananas', 'scientific_name': 'Musa acuminata', 'category': 'fruits', 'maturity': 270},
+    {'name': 'avocado', 'scientific_name': 'Persea americana', 'category': 'fruits', 'maturity': 365},
+    {'name': 'mangoes', 'scientific_name': 'Mangifera indica', 'category': 'fruits', 'maturity': 365},
+
+    # Legumes
+    {'name': 'beans', 'scientific_name': 'Phaseolus vulgaris', 'category': 'legumes', 'maturity': 90},
+    {'name': 'peas', 'scientific_name': 'Pisum sativum', 'category': 'legumes', 'maturity': 75},
+
+    # Tubers
+    {'name': 'potatoes', 'scientific_name': 'Solanum tuberosum', 'category': 'tubers', 'maturity': 105},
+    {'name': 'sweet-potatoes', 'scientific_name': 'Ipomoea batatas', 'category': 'tubers', 'maturity': 120},
+
+    # Cash crops
+    {'name': 'coffee', 'scientific_name': 'Coffea arabica', 'category': 'cash-crops', 'maturity': 365},
+    {'name': 'tea', 'scientific_name': 'Camellia sinensis', 'category': 'cash-crops', 'maturity': 365},
+]
+
+PRODUCT_UNITS = [
+    {'name': 'Kilogram', 'abbreviation': 'kg', 'conversion_factor': Decimal('1.0')},
+    {'name': 'Bag (90kg)', 'abbreviation': 'bag', 'conversion_factor': Decimal('90.0')},
+    {'name': 'Crate', 'abbreviation': 'crate', 'conversion_factor': Decimal('10.0')},
+    {'name': 'Piece', 'abbreviation': 'pc', 'conversion_factor': Decimal('1.0')},
+    {'name': 'Bunch', 'abbreviation': 'bunch', 'conversion_factor': Decimal('5.0')},
+    {'name': 'Sack (50kg)', 'abbreviation': 'sack', 'conversion_factor': Decimal('50.0')},
+]
+
+# Models removed by --clear; everything that references them goes too
+MODELS_TO_CLEAR = [
+    ProductReview, MarketPrice, Product, Farm, FarmerProfile, BuyerProfile,
+    Location, CustomUser, Crop, CropCategory,
+    ProductUnit, Ward, SubCounty, County, SlugSequence,
+]
+
+REVIEW_COMMENTS = [
+    "Great quality produce!",
+    "Fresh and well packaged.",
+    "Good value for money.",
+    "Would buy again.",
+    "Excellent service from the farmer.",
+    "Product as described.",
+    "Fast delivery and good quality.",
+]
+
+
+def batched(iterable, size):
+    """Yield lists of up to size items from iterable"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def clear_plan(models):
+    """
+    Work out what clearing models means at the table level.
+
+    Returns (ordered, nullify): ordered is models plus every model that
+    cascades from them, each table before the tables it points to
+    (auto-created many-to-many tables included); nullify lists the
+    (model, field) pairs outside that set whose on_delete is SET_NULL.
+    """
+    all_models = [
+        m for m in apps.get_models(include_auto_created=True)
+        if m._meta.managed and not m._meta.proxy
+    ]
+    relations = {
+        model: [
+            field for field in model._meta.concrete_fields
+            if field.is_relation and field.related_model is not None
+        ]
+        for model in all_models
+    }
+    references = {
+        model: {field.related_model._meta.concrete_model for field in fields}
+        for model, fields in relations.items()
+    }
+
+    def sets_null(field):
+        return field.remote_field.on_delete is models_module.SET_NULL
+
+    selected = set(models)
+    changed = True
+    while changed:
+        changed = False
+        for model, fields in relations.items():
+            if model in selected:
+                continue
+            if any(f.related_model._meta.concrete_model in selected and not sets_null(f) for f in fields):
+                selected.add(model)
+                changed = True
+
+    nullify = [
+        (model, field)
+        for model, fields in relations.items() if model not in selected
+        for field in fields
+        if field.related_model._meta.concrete_model in selected and sets_null(field)
+    ]
+
+    ordered, pending = [], sorted(selected, key=lambda m: m._meta.db_table)
+    while pending:
+        # A table is ready once no other pending table still points at it;
+        # if only cycles remain, break one (FK checks are off while clearing).
+        ready = [
+            m for m in pending
+            if not any(m in references[other] for other in pending if other is not m)
+        ] or pending[:1]
+        ordered.extend(ready)
+        pending = [m for m in pending if m not in ready]
+    return ordered, nullify
+
+
+def referenced_from_outside(ordered, nullify):
+    """
+    Models of ordered that PostgreSQL will not TRUNCATE without CASCADE:
+    those the nullify fields point at, and every model they point at in
+    turn, since a table can only be truncated along with all its referrers.
+    """
+    pointed_at = {
+        model: {
+            field.related_model._meta.concrete_model for field in model._meta.concrete_fields
+            if field.is_relation and field.related_model is not None
+        }
+        for model in ordered
+    }
+    kept = {field.related_model._meta.concrete_model for _model, field in nullify}
+    pending = list(kept)
+    while pending:
+        for target in pointed_at.get(pending.pop(), ()):
+            if target in pointed_at and target not in kept:
+                kept.add(target)
+                pending.append(target)
+    return kept
+
+
+def partition_rng(seed, group, index):
+    """Random generator for one partition, independent of worker scheduling"""
+    return random.Random(f'{seed}:{group}:{index}')
+
+
+def split(total, size=PARTITION_SIZE):
+    """Split total rows into (offset, count) partitions"""
+    return [(start, min(size, total - start)) for start in range(0, total, size)]
+
+
+# ============== PARTITION GENERATORS ==============
+# Module-level so worker processes can run them; each yields unsaved rows.
+
+def generate_products(part, rng, context):
+    offset, count = part
+    farms, crops, units = context['farms'], context['crops'], context['units']
+    quality_grades = ['premium', 'grade_a', 'grade_b', 'standard']
+    statuses = ['active', 'active', 'active', 'sold_out', 'draft']
+    today = context['today']
+
+    for n in range(context['first_number'] + offset, context['first_number'] + offset + count):
+        farm_id, farmer_id, username, farm_name, county_name = rng.choice(farms)
+        crop_id, crop_name = rng.choice(crops)
+        harvest_date = today - timedelta(days=rng.randint(1, 60))
+        name = f'{crop_name}-{username}-{n}'
+        yield Product(
+            farmer_id=farmer_id,
+            crop_id=crop_id,
+            farm_id=farm_id,
+            name=name,
+            slug=slugify(name),
+            description=f'Fresh {crop_name} from {farm_name} in {county_name}',
+            quantity_available=Decimal(rng.randint(10, 500)),
+            unit_id=rng.choice(units),
+            price_per_unit=Decimal(rng.randint(30, 300)),
+            minimum_order=Decimal(rng.choice([1, 2, 5, 10])),
+            quality_grade=rng.choice(quality_grades),
+            harvest_date=harvest_date,
+            expiry_date=harvest_date + timedelta(days=rng.randint(30, 180)),
+            organic_certified=rng.choice([True, False]),
+            status=rng.choice(statuses),
+            featured=rng.choice([True, False, False, False]),  # 25% featured
+            views_count=rng.randint(0, 500),
+        )
+
+
+def generate_reviews(part, rng, context):
+    product_ids, count = part
+    buyers = context['buyers']
+    per_product, extra = divmod(count, len(product_ids))
+
+    for i, product_id in enumerate(product_ids):
+        num_reviews = min(per_product + (1 if i < extra else 0), len(buyers))
+        for buyer_id in rng.sample(buyers, num_reviews):
+            rating = rng.randint(3, 5)  # Mostly positive reviews
+            yield ProductReview(
+                product_id=product_id,
+                buyer_id=buyer_id,
+                rating=rating,
+                title=f'{rating} stars - {rng.choice(["Satisfied", "Good", "Excellent"])}',
+                comment=rng.choice(REVIEW_COMMENTS),
+                is_verified_purchase=True,
+                helpful_votes=rng.randint(0, 20),
+            )
+
+
+def generate_market_prices(part, rng, context):
+    crop_id, county_id, market_name, count = part
+    today = context['today']
+    grades = ['Grade A', 'Grade B', 'Standard']
+    levels = ['High', 'Medium', 'Low']
+    sources = ['Market Survey', 'County Agriculture Office', 'Cooperative']
+    unit_id = rng.choice(context['units'])
+    price = rng.uniform(40, 200)
+
+    # One daily random-walk series per crop and market, oldest first
+    for days_ago in range(count - 1, -1, -1):
+        price = max(5.0, price * rng.uniform(0.95, 1.05))
+        yield MarketPrice(
+            crop_id=crop_id,
+            location_id=county_id,
+            market_name=market_name,
+            date_recorded=today - timedelta(days=days_ago),
+            price_per_unit=Decimal(str(round(price, 2))),
+            unit_id=unit_id,
+            quality_grade=rng.choice(grades),
+            supply_level=rng.choice(levels),
+            demand_level=rng.choice(levels),
+            source=rng.choice(sources),
+        )
+
+
+GENERATORS = {
+    'products': (Product, generate_products, False),
+    'reviews': (ProductReview, generate_reviews, True),
+    'market_prices': (MarketPrice, generate_market_prices, False),
+}
+
+
+def write_partition(task):
+    """Generate and insert one partition inside a single transaction"""
+    group, index, part, seed, context, batch_size = task
+    model, generate, ignore_conflicts = GENERATORS[group]
+    rows = 0
+    with transaction.atomic():
+        for batch in batched(generate(part, partition_rng(seed, group, index), context), batch_size):
+            model.objects.bulk_create(batch, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+            rows += len(batch)
+    return rows
 
 
 class Command(BaseCommand):
@@ -24,182 +377,270 @@ class Command(BaseCommand):
             action='store_true',
             help='Clear existing data before seeding',
         )
+        parser.add_argument(
+            '--truncate',
+            action='store_true',
+            help='Clear existing data with raw FK-ordered DELETE/TRUNCATE statements '
+                 'instead of ORM cascades (implies --clear)',
+        )
+        parser.add_argument(
+            '--scale',
+            choices=list(SCALES),
+            default='small',
+            help='Preset row counts (small for development, large for load tests)',
+        )
+        parser.add_argument('--farmers', type=int, help='Target number of farmer users')
+        parser.add_argument('--buyers', type=int, help='Target number of buyer users')
+        parser.add_argument('--products', type=int, help='Target number of products')
+        parser.add_argument('--reviews', type=int, help='Target number of product reviews')
+        parser.add_argument('--market-prices', type=int, help='Target number of market price records')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Random seed; the same seed generates the same data')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows per bulk INSERT')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Parallel worker processes for products, reviews and market prices')
 
     def handle(self, *args, **options):
-        if options['clear']:
+        if options['truncate']:
+            self.stdout.write('Truncating existing data...')
+            self.fast_clear_data()
+        elif options['clear']:
             self.stdout.write('Clearing existing data...')
             self.clear_data()
-        
-        self.stdout.write('Starting data seeding...')
-        
+
+        self.targets = dict(SCALES[options['scale']])
+        for key in self.targets:
+            if options.get(key) is not None:
+                self.targets[key] = options[key]
+        self.seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+        self.batch_size = options['batch_size']
+        self.workers = max(1, options['workers'])
+        if self.workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('SQLite allows one writer at a time; using a single worker'))
+            self.workers = 1
+        self.today = timezone.now().date()
+
+        self.stdout.write(f'Starting data seeding (scale={options["scale"]}, seed={self.seed})...')
+
         # Seed data in order of dependencies
-        self.seed_counties()
-        self.seed_subcounties()
-        self.seed_wards()
-        self.seed_users()
-        self.seed_locations()
-        self.seed_farmer_profiles()
-        self.seed_buyer_profiles()
-        self.seed_farms()
-        self.seed_crop_categories()
-        self.seed_crops()
-        self.seed_product_units()
-        self.seed_products()
-        self.seed_product_reviews()
-        self.seed_market_prices()
-        
+        self.timed(self.seed_counties)
+        self.timed(self.seed_subcounties)
+        self.timed(self.seed_wards)
+        self.timed(self.seed_users)
+        self.timed(self.seed_locations)
+        self.timed(self.seed_farmer_profiles)
+        self.timed(self.seed_buyer_profiles)
+        self.timed(self.seed_farms)
+        self.timed(self.seed_crop_categories)
+        self.timed(self.seed_crops)
+        self.timed(self.seed_product_units)
+        self.timed(self.seed_products)
+        self.timed(self.seed_product_reviews)
+        self.timed(self.seed_market_prices)
+
         self.stdout.write(self.style.SUCCESS('Successfully seeded database!'))
 
+    def timed(self, step):
+        started = time.perf_counter()
+        message = step()
+        self.stdout.write(f'✓ {message} ({time.perf_counter() - started:.1f}s)')
+
+    def bulk_create(self, model, objs, **kwargs):
+        """Insert objs in batch_size chunks inside one transaction"""
+        count = 0
+        with transaction.atomic():
+            for batch in batched(objs, self.batch_size):
+                model.objects.bulk_create(batch, batch_size=self.batch_size, **kwargs)
+                count += len(batch)
+        return count
+
+    def run_partitions(self, group, parts, context):
+        """Write each partition, across a process pool when --workers > 1"""
+        tasks = [(group, i, part, self.seed, context, self.batch_size) for i, part in enumerate(parts)]
+        if self.workers > 1 and len(tasks) > 1:
+            # Children must open their own connections
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(self.workers) as pool:
+                return sum(pool.imap_unordered(write_partition, tasks))
+        return sum(write_partition(task) for task in tasks)
+
     def clear_data(self):
         """Clear existing data (use with caution)"""
-        models_to_clear = [
-            ProductReview, MarketPrice, Product, Farm, FarmerProfile, BuyerProfile, 
-            Location, CustomUser, Crop, CropCategory, 
-            ProductUnit, Ward, SubCounty, County,
-        ]
-        
-        for model in models_to_clear:
+        for model in MODELS_TO_CLEAR:
             try:
                 model.objects.all().delete()
                 self.stdout.write(f'Cleared {model.__name__}')
             except Exception as e:
                 self.stdout.write(f'Error clearing {model.__name__}: {e}')
 
+    def fast_clear_data(self):
+        """
+        Clear existing data without loading rows into Python.
+
+        Django's delete() collects every cascaded object in memory first; here
+        each affected table is emptied with the backend's own flush statement
+        (DELETE on SQLite, TRUNCATE on PostgreSQL/MySQL), dependents first,
+        with foreign key checks off and sequences reset. PostgreSQL gets one
+        TRUNCATE over the whole plan without CASCADE, so it fails rather than
+        empty a table outside the plan; tables still referenced from outside
+        through nulled SET_NULL keys are emptied with DELETE instead.
+        """
+        ordered, nullify = clear_plan(MODELS_TO_CLEAR)
+        truncate_together = connection.vendor == 'postgresql'
+        deleted_only = referenced_from_outside(ordered, nullify) if truncate_together else set()
+        qn = connection.ops.quote_name
+        total = time.perf_counter()
+
+        # SQLite can only toggle PRAGMA foreign_keys outside a transaction
+        with connection.constraint_checks_disabled():
+            with transaction.atomic(), connection.cursor() as cursor:
+                for model, field in nullify:
+                    table, column = model._meta.db_table, field.column
+                    started = time.perf_counter()
+                    cursor.execute(f'UPDATE {qn(table)} SET {qn(column)} = NULL WHERE {qn(column)} IS NOT NULL')
+                    self.stdout.write(
+                        f'Nulled {table}.{column}: {max(cursor.rowcount, 0)} rows '
+                        f'({(time.perf_counter() - started) * 1000:.0f} ms)'
+                    )
+
+                if truncate_together:
+                    for model in ordered:
+                        if model not in deleted_only:
+                            continue
+                        table = model._meta.db_table
+                        started = time.perf_counter()
+                        cursor.execute(f'DELETE FROM {qn(table)}')
+                        deleted = max(cursor.rowcount, 0)
+                        sequences = connection.introspection.get_sequences(cursor, table, model._meta.local_fields)
+                        for sql in connection.ops.sequence_reset_by_name_sql(no_style(), sequences):
+                            cursor.execute(sql)
+                        self.stdout.write(f'Cleared {table}: {deleted} rows ({(time.perf_counter() - started) * 1000:.0f} ms)')
+                    tables = [model._meta.db_table for model in ordered if model not in deleted_only]
+                    started = time.perf_counter()
+                    for sql in connection.ops.sql_flush(no_style(), tables, reset_sequences=True):
+                        cursor.execute(sql)
+                    self.stdout.write(f'Truncated {len(tables)} tables ({(time.perf_counter() - started) * 1000:.0f} ms)')
+                else:
+                    for model in ordered:
+                        table = model._meta.db_table
+                        started = time.perf_counter()
+                        deleted = 0
+                        for sql in connection.ops.sql_flush(no_style(), [table], reset_sequences=True):
+                            cursor.execute(sql)
+                            if sql.lstrip().upper().startswith('DELETE') and cursor.rowcount > 0:
+                                deleted += cursor.rowcount
+                        rows = f'{deleted} rows' if deleted else 'emptied'
+                        self.stdout.write(f'Cleared {table}: {rows} ({(time.perf_counter() - started) * 1000:.0f} ms)')
+
+                # The FTS5 search table is not a model, so sql_flush never sees it
+                clear_index()
+
+        self.stdout.write(f'✓ Cleared data in {time.perf_counter() - total:.1f}s')
+
+    # ============== REFERENCE DATA ==============
+
     def seed_counties(self):
         """Seed Kenyan counties"""
-        counties_data = [
-            {'name': 'Nairobi', 'code': '001', 'population': 4397073, 'area_sq_km': 696.0},
-            {'name': 'Kiambu', 'code': '023', 'population': 2417735, 'area_sq_km': 2449.0},
-            {'name': 'Murang\'a', 'code': '022', 'population': 1056640, 'area_sq_km': 2325.0},
-            {'name': 'Nakuru', 'code': '033', 'population': 2162202, 'area_sq_km': 7496.0},
-            {'name': 'Meru', 'code': '013', 'population': 1545714, 'area_sq_km': 6930.0},
-            {'name': 'Nyeri', 'code': '021', 'population': 759164, 'area_sq_km': 3337.0},
-            {'name': 'Kirinyaga', 'code': '024', 'population': 610411, 'area_sq_km': 1478.0},
-            {'name': 'Embu', 'code': '014', 'population': 608599, 'area_sq_km': 2555.0},
-            {'name': 'Machakos', 'code': '029', 'population': 1421932, 'area_sq_km': 6281.0},
-            {'name': 'Uasin Gishu', 'code': '035', 'population': 1163186, 'area_sq_km': 3345.0},
-        ]
-        
-        for county_data in counties_data:
-            County.objects.get_or_create(
-                code=county_data['code'],
-                defaults=county_data
-            )
-        
-        self.stdout.write(f'✓ Seeded {len(counties_data)} counties')
+        self.bulk_create(County, [County(**data) for data in COUNTIES], ignore_conflicts=True)
+        self.counties = dict(County.objects.values_list('code', 'id'))
+        self.county_names = dict(County.objects.values_list('id', 'name'))
+        return f'Seeded {len(COUNTIES)} counties'
 
     def seed_subcounties(self):
         """Seed sub-counties"""
-        subcounties_data = [
-            # Nairobi (4 sub-counties)
-            {'county_code': '001', 'name': 'Westlands', 'code': '001001'},
-            {'county_code': '001', 'name': 'Dagoretti North', 'code': '001002'},
-            {'county_code': '001', 'name': 'Langata', 'code': '001003'},
-            {'county_code': '001', 'name': 'Embakasi South', 'code': '001004'},
-            
-            # Kiambu (5 sub-counties)
-            {'county_code': '023', 'name': 'Thika Town', 'code': '023001'},
-            {'county_code': '023', 'name': 'Ruiru', 'code': '023002'},
-            {'county_code': '023', 'name': 'Limuru', 'code': '023003'},
-            {'county_code': '023', 'name': 'Kikuyu', 'code': '023004'},
-            {'county_code': '023', 'name': 'Gatundu South', 'code': '023005'},
-            
-            # Murang'a (4 sub-counties)
-            {'county_code': '022', 'name': 'Kangema', 'code': '022001'},
-            {'county_code': '022', 'name': 'Mathioya', 'code': '022002'},
-            {'county_code': '022', 'name': 'Kiharu', 'code': '022003'},
-            {'county_code': '022', 'name': 'Maragwa', 'code': '022004'},
-            
-            # Nakuru (3 sub-counties)
-            {'county_code': '033', 'name': 'Nakuru Town East', 'code': '033001'},
-            {'county_code': '033', 'name': 'Rongai', 'code': '033002'},
-            {'county_code': '033', 'name': 'Naivasha', 'code': '033003'},
-            
-            # Meru (3 sub-counties)
-            {'county_code': '013', 'name': 'Imenti North', 'code': '013001'},
-            {'county_code': '013', 'name': 'Imenti South', 'code': '013002'},
-            {'county_code': '013', 'name': 'Tigania East', 'code': '013003'},
-        ]
-        
-        for subcounty_data in subcounties_data:
-            county = County.objects.get(code=subcounty_data['county_code'])
-            SubCounty.objects.get_or_create(
-                county=county,
-                code=subcounty_data['code'],
-                defaults={'name': subcounty_data['name']}
-            )
-        
-        self.stdout.write(f'✓ Seeded {len(subcounties_data)} sub-counties')
+        self.bulk_create(SubCounty, [
+            SubCounty(county_id=self.counties[data['county_code']], name=data['name'], code=data['code'])
+            for data in SUBCOUNTIES
+        ], ignore_conflicts=True)
+        return f'Seeded {len(SUBCOUNTIES)} sub-counties'
 
     def seed_wards(self):
         """Seed wards"""
         # Generate 2-3 wards per sub-county
-        subcounties = SubCounty.objects.all()
-        ward_count = 0
-        
-        for subcounty in subcounties:
-            num_wards = random.randint(2, 3)
-            for i in range(num_wards):
-                Ward.objects.get_or_create(
-                    subcounty=subcounty,
-                    code=f'{subcounty.code}{i+1:02d}',
-                    defaults={'name': f'{subcounty.name} Ward {i+1}'}
-                )
-                ward_count += 1
-        
-        self.stdout.write(f'✓ Seeded {ward_count} wards')
+        wards = []
+        for subcounty_id, name, code in SubCounty.objects.order_by('code').values_list('id', 'name', 'code'):
+            for i in range(self.rng.randint(2, 3)):
+                wards.append(Ward(subcounty_id=subcounty_id, code=f'{code}{i+1:02d}', name=f'{name} Ward {i+1}'))
+        self.bulk_create(Ward, wards, ignore_conflicts=True)
+
+        # (ward_id, subcounty_id, county_id, ward_name) for every ward
+        self.wards = list(Ward.objects.order_by('id').values_list('id', 'subcounty_id', 'subcounty__county_id', 'name'))
+        return f'Seeded {len(wards)} wards'
+
+    def seed_crop_categories(self):
+        """Seed crop categories"""
+        self.bulk_create(CropCategory, [CropCategory(**data) for data in CROP_CATEGORIES], ignore_conflicts=True)
+        return f'Seeded {len(CROP_CATEGORIES)} crop categories'
+
+    def seed_crops(self):
+        """Seed diverse crops"""
+        categories = dict(CropCategory.objects.values_list('name', 'id'))
+        self.bulk_create(Crop, [
+            Crop(
+                name=data['name'],
+                scientific_name=data['scientific_name'],
+                category_id=categories[data['category']],
+                maturity_period_days=data['maturity'],
+                growing_season=self.rng.choice(['Long rains', 'Short rains', 'Year-round']),
+            )
+            for data in CROPS if data['category'] in categories
+        ], ignore_conflicts=True)
+        self.crops = list(Crop.objects.order_by('id').values_list('id', 'name'))
+        return f'Seeded {len(CROPS)} crops'
+
+    def seed_product_units(self):
+        """Seed product units"""
+        self.bulk_create(ProductUnit, [ProductUnit(**data) for data in PRODUCT_UNITS], ignore_conflicts=True)
+        self.units = list(ProductUnit.objects.order_by('id').values_list('id', flat=True))
+        return f'Seeded {len(PRODUCT_UNITS)} product units'
+
+    # ============== USERS AND PROFILES ==============
 
     def seed_users(self):
-        """Seed users - 25 farmers, 15 buyers, 1 admin"""
-        first_names = ['John', 'Mary', 'Peter', 'Jane', 'David', 'Sarah', 'James', 'Lucy', 'Michael', 'Grace',
-                      'Daniel', 'Ann', 'Joseph', 'Faith', 'Samuel', 'Ruth', 'Brian', 'Joyce', 'Kevin', 'Alice',
-                      'Patrick', 'Rose', 'Simon', 'Catherine', 'Paul', 'Margaret', 'Stephen', 'Elizabeth', 'Moses', 'Hannah']
-        
-        last_names = ['Mwangi', 'Wanjiku', 'Kamau', 'Njeri', 'Kariuki', 'Waithera', 'Kimani', 'Muthoni', 'Omondi', 'Akinyi',
-                     'Otieno', 'Adhiambo', 'Kipchoge', 'Chepkemoi', 'Mutua', 'Nduku', 'Ochieng', 'Atieno', 'Wekesa', 'Nekesa']
-        
-        # Create 25 farmers
-        for i in range(25):
-            first_name = random.choice(first_names)
-            last_name = random.choice(last_names)
+        """Top up farmer and buyer users to their targets and ensure an admin exists"""
+        # Hashing is deliberately slow, so every seeded user shares one hash
+        password = make_password('password123')
+        new_users = []
+
+        existing = CustomUser.objects.filter(user_type='farmer').count()
+        for i in range(existing, self.targets['farmers']):
+            first_name, last_name = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
             username = f'{first_name.lower()}_{last_name.lower()}_{i}'
-            
-            CustomUser.objects.get_or_create(
+            new_users.append(CustomUser(
                 username=username,
-                defaults={
-                    'first_name': first_name,
-                    'last_name': last_name,
-                    'email': f'{username}@farm.ke',
-                    'phone_number': f'+2547{random.randint(10000000, 99999999)}',
-                    'user_type': 'farmer',
-                    'national_id': f'{random.randint(10000000, 99999999)}',
-                    'is_verified': random.choice([True, True, True, False]),  # 75% verified
-                    'password': make_password('password123'),
-                    'date_of_birth': date(random.randint(1970, 2000), random.randint(1, 12), random.randint(1, 28)),
-                }
-            )
-        
-        # Create 15 buyers
-        for i in range(15):
-            first_name = random.choice(first_names)
-            last_name = random.choice(last_names)
+                first_name=first_name,
+                last_name=last_name,
+                email=f'{username}@farm.ke',
+                phone_number=f'+2547{i + 1:08d}',
+                user_type='farmer',
+                national_id=f'F{i + 1:08d}',
+                is_verified=self.rng.choice([True, True, True, False]),  # 75% verified
+                password=password,
+                date_of_birth=date(self.rng.randint(1970, 2000), self.rng.randint(1, 12), self.rng.randint(1, 28)),
+            ))
+
+        existing = CustomUser.objects.filter(user_type='buyer').count()
+        for i in range(existing, self.targets['buyers']):
+            first_name, last_name = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
             username = f'buyer_{first_name.lower()}_{i}'
-            
-            CustomUser.objects.get_or_create(
+            new_users.append(CustomUser(
                 username=username,
-                defaults={
-                    'first_name': first_name,
-                    'last_name': last_name,
-                    'email': f'{username}@buyer.ke',
-                    'phone_number': f'+2547{random.randint(10000000, 99999999)}',
-                    'user_type': 'buyer',
-                    'national_id': f'{random.randint(10000000, 99999999)}',
-                    'is_verified': True,
-                    'password': make_password('password123'),
-                    'date_of_birth': date(random.randint(1975, 2000), random.randint(1, 12), random.randint(1, 28)),
-                }
-            )
-        
+                first_name=first_name,
+                last_name=last_name,
+                email=f'{username}@buyer.ke',
+                phone_number=f'+2541{i + 1:08d}',
+                user_type='buyer',
+                national_id=f'B{i + 1:08d}',
+                is_verified=True,
+                password=password,
+                date_of_birth=date(self.rng.randint(1975, 2000), self.rng.randint(1, 12), self.rng.randint(1, 28)),
+            ))
+
+        self.bulk_create(CustomUser, new_users)
+        self.new_users = [(u.id, u.user_type, u.first_name, u.last_name, u.username, u.phone_number) for u in new_users]
+
         # Create admin
         CustomUser.objects.get_or_create(
             username='admin',
@@ -217,302 +658,181 @@ class Command(BaseCommand):
                 'date_of_birth': date(1980, 1, 1),
             }
         )
-        
-        self.stdout.write('✓ Seeded 41 users (25 farmers, 15 buyers, 1 admin)')
+
+        return f'Seeded {len(new_users)} users (targets: {self.targets["farmers"]} farmers, {self.targets["buyers"]} buyers)'
 
     def seed_locations(self):
-        """Seed locations for all users"""
-        users = CustomUser.objects.filter(user_type__in=['farmer', 'buyer'])
-        wards = list(Ward.objects.all())
-        
-        for user in users:
-            ward = random.choice(wards)
-            
-            Location.objects.get_or_create(
-                user=user,
+        """Seed a home location for every new user"""
+        locations = []
+        for user_id, _, first_name, _, _, _ in self.new_users:
+            ward_id, subcounty_id, county_id, ward_name = self.rng.choice(self.wards)
+            latitude = Decimal(str(round(self.rng.uniform(-4.5, 1.5), 6)))
+            longitude = Decimal(str(round(self.rng.uniform(33.5, 41.5), 6)))
+            locations.append(Location(
+                user_id=user_id,
                 name='Home',
-                defaults={
-                    'county': ward.subcounty.county,
-                    'subcounty': ward.subcounty,
-                    'ward': ward,
-                    'village': f'{user.first_name} Village',
-                    'detailed_address': f'Plot {random.randint(1, 500)}, {ward.name}',
-                    'latitude': Decimal(str(round(random.uniform(-4.5, 1.5), 6))),
-                    'longitude': Decimal(str(round(random.uniform(33.5, 41.5), 6))),
-                    'is_default': True,
-                }
-            )
-        
-        self.stdout.write(f'✓ Seeded {users.count()} locations')
+                county_id=county_id,
+                subcounty_id=subcounty_id,
+                ward_id=ward_id,
+                village=f'{first_name} Village',
+                detailed_address=f'Plot {self.rng.randint(1, 500)}, {ward_name}',
+                latitude=latitude,
+                longitude=longitude,
+                # bulk_create skips the pre_save signal that sets it
+                geo_cell=cell_of(latitude, longitude),
+                is_default=True,
+            ))
+        return f'Seeded {self.bulk_create(Location, locations)} locations'
 
     def seed_farmer_profiles(self):
         """Seed farmer profiles"""
-        farmer_users = CustomUser.objects.filter(user_type='farmer')
         farming_types = ['crop', 'livestock', 'mixed', 'poultry', 'horticulture']
         experiences = ['beginner', 'intermediate', 'experienced', 'expert']
-        
-        for user in farmer_users:
-            FarmerProfile.objects.get_or_create(
-                user=user,
-                defaults={
-                    'farm_name': f'{user.first_name} {user.last_name} Farm',
-                    'farming_type': random.choice(farming_types),
-                    'years_of_experience': random.choice(experiences),
-                    'total_farm_size': Decimal(str(round(random.uniform(0.5, 20.0), 2))),
-                    'farming_methods': random.sample(['organic', 'conventional', 'mixed'], k=random.randint(1, 2)),
-                    'certifications': random.sample(['GAP', 'Organic', 'GlobalGAP', 'None'], k=random.randint(0, 2)),
-                    'bank_account_number': f'{random.randint(1000000000, 9999999999)}',
-                    'bank_name': random.choice(['Equity Bank', 'KCB', 'Cooperative Bank', 'NCBA']),
-                    'mpesa_number': user.phone_number,
-                    'is_cooperative_member': random.choice([True, False]),
-                }
+        profiles = [
+            FarmerProfile(
+                user_id=user_id,
+                farm_name=f'{first_name} {last_name} Farm',
+                farming_type=self.rng.choice(farming_types),
+                years_of_experience=self.rng.choice(experiences),
+                total_farm_size=Decimal(str(round(self.rng.uniform(0.5, 20.0), 2))),
+                farming_methods=self.rng.sample(['organic', 'conventional', 'mixed'], k=self.rng.randint(1, 2)),
+                certifications=self.rng.sample(['GAP', 'Organic', 'GlobalGAP', 'None'], k=self.rng.randint(0, 2)),
+                bank_account_number=f'{self.rng.randint(1000000000, 9999999999)}',
+                bank_name=self.rng.choice(['Equity Bank', 'KCB', 'Cooperative Bank', 'NCBA']),
+                mpesa_number=phone_number,
+                is_cooperative_member=self.rng.choice([True, False]),
             )
-        
-        self.stdout.write(f'✓ Seeded {farmer_users.count()} farmer profiles')
+            for user_id, user_type, first_name, last_name, _, phone_number in self.new_users
+            if user_type == 'farmer'
+        ]
+        return f'Seeded {self.bulk_create(FarmerProfile, profiles)} farmer profiles'
 
     def seed_buyer_profiles(self):
         """Seed buyer profiles"""
-        buyer_users = CustomUser.objects.filter(user_type='buyer')
         buyer_types = ['individual', 'restaurant', 'hotel', 'retailer', 'wholesaler']
-        
-        for user in buyer_users:
-            buyer_type = random.choice(buyer_types)
-            BuyerProfile.objects.get_or_create(
-                user=user,
-                defaults={
-                    'buyer_type': buyer_type,
-                    'business_name': f'{user.first_name} {buyer_type.title()}' if buyer_type != 'individual' else '',
-                    'preferred_payment_method': random.choice(['mpesa', 'bank_transfer', 'cash']),
-                    'credit_limit': Decimal(str(random.randint(10000, 100000))),
-                }
-            )
-        
-        self.stdout.write(f'✓ Seeded {buyer_users.count()} buyer profiles')
+        profiles = []
+        for user_id, user_type, first_name, _, _, _ in self.new_users:
+            if user_type != 'buyer':
+                continue
+            buyer_type = self.rng.choice(buyer_types)
+            profiles.append(BuyerProfile(
+                user_id=user_id,
+                buyer_type=buyer_type,
+                business_name=f'{first_name} {buyer_type.title()}' if buyer_type != 'individual' else '',
+                preferred_payment_method=self.rng.choice(['mpesa', 'bank_transfer', 'cash']),
+                credit_limit=Decimal(self.rng.randint(10000, 100000)),
+            ))
+        return f'Seeded {self.bulk_create(BuyerProfile, profiles)} buyer profiles'
 
     def seed_farms(self):
-        """Seed 2-4 farms per farmer"""
-        farmer_profiles = FarmerProfile.objects.all()
-        farm_count = 0
-        
-        for farmer in farmer_profiles:
-            user_location = farmer.user.locations.first()
-            num_farms = random.randint(1, 3)
-            
-            for i in range(num_farms):
-                Farm.objects.get_or_create(
-                    farmer=farmer,
-                    name=f'{farmer.farm_name}-plot-{i+1}-{farmer.user.username}',
-                    defaults={
-                        'location': user_location,
-                        'size': Decimal(str(round(random.uniform(0.5, 10.0), 2))),
-                        'soil_type': random.choice(['Loam', 'Clay', 'Sandy', 'Volcanic']),
-                        'water_source': random.choice(['Borehole', 'River', 'Rain', 'Municipal']),
-                        'irrigation_method': random.choice(['Drip', 'Sprinkler', 'Flood', 'None']),
-                        'elevation': random.randint(800, 2500),
-                        'description': f'Quality farm in {user_location.county.name}',
-                        'is_active': True,
-                    }
-                )
-                farm_count += 1
-        
-        self.stdout.write(f'✓ Seeded {farm_count} farms')
-
-    def seed_crop_categories(self):
-        """Seed crop categories"""
-        categories_data = [
-            {'name': 'cereals', 'description': 'Cereal crops like maize, wheat, rice'},
-            {'name': 'vegetables', 'description': 'Vegetable crops'},
-            {'name': 'fruits', 'description': 'Fruit crops'},
-            {'name': 'legumes', 'description': 'Beans, peas, and other legumes'},
-            {'name': 'tubers', 'description': 'Root and tuber crops'},
-            {'name': 'cash-crops', 'description': 'Export and cash crops'},
-        ]
-        
-        for category_data in categories_data:
-            CropCategory.objects.get_or_create(
-                name=category_data['name'],
-                defaults=category_data
-            )
-        
-        self.stdout.write(f'✓ Seeded {len(categories_data)} crop categories')
+        """Seed 1-3 farms per new farmer"""
+        new_farmers = {user_id: username for user_id, user_type, _, _, username, _ in self.new_users
+                       if user_type == 'farmer'}
+        farms = []
+        profiles = FarmerProfile.objects.filter(user__user_type='farmer').values_list('id', 'user_id', 'farm_name')
+        locations = {
+            user_id: (location_id, county_id)
+            for user_id, location_id, county_id in Location.objects.filter(
+                name='Home', user__user_type='farmer'
+            ).values_list('user_id', 'id', 'county_id').iterator()
+        }
+        for profile_id, user_id, farm_name in profiles.iterator():
+            if user_id not in new_farmers:
+                continue
+            location_id, county_id = locations[user_id]
+            for i in range(self.rng.randint(1, 3)):
+                farms.append(Farm(
+                    farmer_id=profile_id,
+                    # Farm.save() slugifies names; bulk_create must do it here
+                    name=slugify(f'{farm_name}-plot-{i+1}-{new_farmers[user_id]}'),
+                    location_id=location_id,
+                    size=Decimal(str(round(self.rng.uniform(0.5, 10.0), 2))),
+                    soil_type=self.rng.choice(['Loam', 'Clay', 'Sandy', 'Volcanic']),
+                    water_source=self.rng.choice(['Borehole', 'River', 'Rain', 'Municipal']),
+                    irrigation_method=self.rng.choice(['Drip', 'Sprinkler', 'Flood', 'None']),
+                    elevation=self.rng.randint(800, 2500),
+                    description=f'Quality farm in {self.county_names[county_id]}',
+                    is_active=True,
+                ))
+        return f'Seeded {self.bulk_create(Farm, farms, ignore_conflicts=True)} farms'
 
-    def seed_crops(self):
-        """Seed diverse crops"""
-        categories = {cat.name: cat for cat in CropCategory.objects.all()}
-        
-        crops_data = [
-            # Cereals
-            {'name': 'maize', 'scientific_name': 'Zea mays', 'category': 'cereals', 'maturity': 120},
-            {'name': 'wheat', 'scientific_name': 'Triticum aestivum', 'category': 'cereals', 'maturity': 140},
-            {'name': 'rice', 'scientific_name': 'Oryza sativa', 'category': 'cereals', 'maturity': 150},
-            
-            # Vegetables
-            {'name': 'tomatoes', 'scientific_name': 'Solanum lycopersicum', 'category': 'vegetables', 'maturity': 75},
-            {'name': 'cabbage', 'scientific_name': 'Brassica oleracea', 'category': 'vegetables', 'maturity': 60},
-            {'name': 'kale-sukuma-wiki', 'scientific_name': 'Brassica oleracea', 'category': 'vegetables', 'maturity': 45},
-            {'name': 'spinach', 'scientific_name': 'Spinacia oleracea', 'category': 'vegetables', 'maturity': 40},
-            {'name': 'onions', 'scientific_name': 'Allium cepa', 'category': 'vegetables', 'maturity': 90},
-            
-            # Fruits
-            {'name': 'bananas', 'scientific_name': 'Musa acuminata', 'category': 'fruits', 'maturity': 270},
-            {'name': 'avocado', 'scientific_name': 'Persea americana', 'category': 'fruits', 'maturity': 365},
-            {'name': 'mangoes', 'scientific_name': 'Mangifera indica', 'category': 'fruits', 'maturity': 365},
-            
-            # Legumes
-            {'name': 'beans', 'scientific_name': 'Phaseolus vulgaris', 'category': 'legumes', 'maturity': 90},
-            {'name': 'peas', 'scientific_name': 'Pisum sativum', 'category': 'legumes', 'maturity': 75},
-            
-            # Tubers
-            {'name': 'potatoes', 'scientific_name': 'Solanum tuberosum', 'category': 'tubers', 'maturity': 105},
-            {'name': 'sweet-potatoes', 'scientific_name': 'Ipomoea batatas', 'category': 'tubers', 'maturity': 120},
-            
-            # Cash crops
-            {'name': 'coffee', 'scientific_name': 'Coffea arabica', 'category': 'cash-crops', 'maturity': 365},
-            {'name': 'tea', 'scientific_name': 'Camellia sinensis', 'category': 'cash-crops', 'maturity': 365},
-        ]
-        
-        for crop_data in crops_data:
-            category = categories.get(crop_data['category'])
-            if category:
-                Crop.objects.get_or_create(
-                    name=crop_data['name'],
-                    defaults={
-                        'scientific_name': crop_data['scientific_name'],
-                        'category': category,
-                        'maturity_period_days': crop_data['maturity'],
-                        'growing_season': random.choice(['Long rains', 'Short rains', 'Year-round']),
-                    }
-                )
-        
-        self.stdout.write(f'✓ Seeded {len(crops_data)} crops')
-
-    def seed_product_units(self):
-        """Seed product units"""
-        units_data = [
-            {'name': 'Kilogram', 'abbreviation': 'kg', 'conversion_factor': Decimal('1.0')},
-            {'name': 'Bag (90kg)', 'abbreviation': 'bag', 'conversion_factor': Decimal('90.0')},
-            {'name': 'Crate', 'abbreviation': 'crate', 'conversion_factor': Decimal('10.0')},
-            {'name': 'Piece', 'abbreviation': 'pc', 'conversion_factor': Decimal('1.0')},
-            {'name': 'Bunch', 'abbreviation': 'bunch', 'conversion_factor': Decimal('5.0')},
-            {'name': 'Sack (50kg)', 'abbreviation': 'sack', 'conversion_factor': Decimal('50.0')},
-        ]
-        
-        for unit_data in units_data:
-            ProductUnit.objects.get_or_create(
-                abbreviation=unit_data['abbreviation'],
-                defaults=unit_data
-            )
-        
-        self.stdout.write(f'✓ Seeded {len(units_data)} product units')
+    # ============== HIGH-VOLUME DATA ==============
 
     def seed_products(self):
-        """Seed 3-8 products per farm"""
-        farms = Farm.objects.all()
-        crops = list(Crop.objects.all())
-        units = list(ProductUnit.objects.all())
-        quality_grades = ['premium', 'grade_a', 'grade_b', 'standard']
-        statuses = ['active', 'active', 'active', 'sold_out', 'draft']
-        product_count = 0
-        
-        for farm in farms:
-            num_products = random.randint(3, 8)
-            selected_crops = random.sample(crops, min(num_products, len(crops)))
-            
-            for crop in selected_crops:
-                unit = random.choice(units)
-                harvest_date = timezone.now().date() - timedelta(days=random.randint(1, 60))
-                
-                Product.objects.get_or_create(
-                    farmer=farm.farmer,
-                    crop=crop,
-                    farm=farm,
-                    name=f'{crop.name}-{farm.farmer.user.username}-{product_count}',
-                    defaults={
-                        'description': f'Fresh {crop.name} from {farm.name} in {farm.location.county.name}',
-                        'quantity_available': Decimal(str(random.randint(10, 500))),
-                        'unit': unit,
-                        'price_per_unit': Decimal(str(random.randint(30, 300))),
-                        'minimum_order': Decimal(str(random.choice([1, 2, 5, 10]))),
-                        'quality_grade': random.choice(quality_grades),
-                        'harvest_date': harvest_date,
-                        'expiry_date': harvest_date + timedelta(days=random.randint(30, 180)),
-                        'organic_certified': random.choice([True, False]),
-                        'status': random.choice(statuses),
-                        'featured': random.choice([True, False, False, False]),  # 25% featured
-                        'views_count': random.randint(0, 500),
-                    }
-                )
-                product_count += 1
-        
-        self.stdout.write(f'✓ Seeded {product_count} products')
+        """Top up products to the target, spread across every farm"""
+        remaining = self.targets['products'] - Product.objects.count()
+        farms = list(Farm.objects.order_by('id').values_list(
+            'id', 'farmer_id', 'farmer__user__username', 'name', 'location__county__name'
+        ))
+        if remaining <= 0 or not farms or not self.crops:
+            return 'Seeded 0 products'
+
+        context = {
+            'farms': farms,
+            'crops': self.crops,
+            'units': self.units,
+            'today': self.today,
+            # Numbers in product names continue past every existing product
+            'first_number': (Product.objects.aggregate(top=Max('id'))['top'] or 0) + 1,
+        }
+        created = self.run_partitions('products', split(remaining), context)
+        # bulk_create skips the signals that keep base prices, the search
+        # index and facet counts current
+        refresh_base_prices(models=[Product])
+        rebuild_index(batch_size=self.batch_size)
+        rebuild_facets()
+        return f'Seeded {created} products'
 
     def seed_product_reviews(self):
-        """Seed reviews for active products"""
-        active_products = Product.objects.filter(status='active')[:50]  # Review first 50 active products
-        buyers = list(CustomUser.objects.filter(user_type='buyer'))
-        review_count = 0
-        
-        for product in active_products:
-            num_reviews = random.randint(0, 5)
-            reviewers = random.sample(buyers, min(num_reviews, len(buyers)))
-            
-            for buyer in reviewers:
-                rating = random.randint(3, 5)  # Mostly positive reviews
-                comments = [
-                    "Great quality produce!",
-                    "Fresh and well packaged.",
-                    "Good value for money.",
-                    "Would buy again.",
-                    "Excellent service from the farmer.",
-                    "Product as described.",
-                    "Fast delivery and good quality.",
-                ]
-                
-                ProductReview.objects.get_or_create(
-                    product=product,
-                    buyer=buyer,
-                    defaults={
-                        'rating': rating,
-                        'title': f'{rating} stars - {random.choice(["Satisfied", "Good", "Excellent"])}',
-                        'comment': random.choice(comments),
-                        'is_verified_purchase': True,
-                        'helpful_votes': random.randint(0, 20),
-                    }
-                )
-                review_count += 1
-        
-        self.stdout.write(f'✓ Seeded {review_count} product reviews')
+        """Top up reviews on active products to the target"""
+        remaining = self.targets['reviews'] - ProductReview.objects.count()
+        product_ids = list(Product.objects.filter(status='active').order_by('id').values_list('id', flat=True))
+        buyers = list(CustomUser.objects.filter(user_type='buyer').order_by('id').values_list('id', flat=True))
+        if remaining <= 0 or not product_ids or not buyers:
+            return 'Seeded 0 product reviews'
+
+        # Review a random sample of active products, roughly three reviews each
+        reviewed = self.rng.sample(product_ids, min(len(product_ids), max(1, remaining // 3)))
+        reviewed.sort()
+        parts = []
+        for start, count in split(remaining):
+            share = reviewed[len(reviewed) * start // remaining:len(reviewed) * (start + count) // remaining]
+            if share:
+                parts.append((share, count))
+
+        context = {'buyers': buyers}
+        created = self.run_partitions('reviews', parts, context)
+        # bulk_create skips the signals that maintain Product rating aggregates
+        rebuild_ratings(batch_size=self.batch_size)
+        return f'Seeded {created} product reviews'
 
     def seed_market_prices(self):
-        """Seed historical market prices"""
-        crops = Crop.objects.all()
-        counties = County.objects.all()
-        units = list(ProductUnit.objects.all())
-        price_count = 0
-        
-        # Create price records for the last 90 days
-        for days_ago in range(0, 90, 7):  # Weekly prices
-            date_recorded = timezone.now().date() - timedelta(days=days_ago)
-            
-            for crop in crops:
-                for county in random.sample(list(counties), min(3, len(counties))):
-                    base_price = random.randint(40, 200)
-                    variation = random.uniform(0.9, 1.1)
-                    
-                    MarketPrice.objects.get_or_create(
-                        crop=crop,
-                        location=county,
-                        date_recorded=date_recorded,
-                        defaults={
-                            'price_per_unit': Decimal(str(round(base_price * variation, 2))),
-                            'unit': random.choice(units),
-                            'quality_grade': random.choice(['Grade A', 'Grade B', 'Standard']),
-                            'supply_level': random.choice(['High', 'Medium', 'Low']),
-                            'demand_level': random.choice(['High', 'Medium', 'Low']),
-                            'price_trend': random.choice(['Rising', 'Stable', 'Falling']),
-                            'source': random.choice(['Market Survey', 'County Agriculture Office', 'Cooperative']),
-                        }
-                    )
-                    price_count += 1
-        
-        self.stdout.write(f'✓ Seeded {price_count} market price records')
\ No newline at end of file
+        """Top up market prices with a daily price series per crop and market"""
+        remaining = self.targets['market_prices'] - MarketPrice.objects.count()
+        if remaining <= 0 or not self.crops or not self.counties:
+            return 'Seeded 0 market price records'
+
+        # Enough markets per county to keep each series within MAX_SERIES_DAYS
+        markets = -(-remaining // (len(self.crops) * len(self.counties) * MAX_SERIES_DAYS))
+        series = [
+            (crop_id, county_id, f'{self.county_names[county_id]} Market {m + 1}')
+            for crop_id, _ in self.crops
+            for county_id in sorted(self.counties.values())
+            for m in range(markets)
+        ]
+        per_series, extra = divmod(remaining, len(series))
+        parts = [
+            (crop_id, county_id, market_name, per_series + (1 if i < extra else 0))
+            for i, (crop_id, county_id, market_name) in enumerate(series)
+            if per_series or i < extra
+        ]
+        context = {'units': self.units, 'today': self.today}
+        created = self.run_partitions('market_prices', parts, context)
+        # bulk_create skips the signals that maintain base prices and the
+        # price rollups, so refresh the periods the new series reach back into
+        refresh_base_prices(models=[MarketPrice])
+        longest = per_series + (1 if extra else 0)
+        refresh_price_rollups(since=self.today - timedelta(days=longest - 1))
+        # Trend metrics are only ever computed in batch, over whole series
+        classify_price_trends()
+        return f'Seeded {created} market price records'
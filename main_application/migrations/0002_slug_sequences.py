@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlugSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(help_text='e.g., main_application.product.slug', max_length=100)),
+                ('base_slug', models.CharField(max_length=220)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'slug_sequences',
+                'unique_together': {('scope', 'base_slug')},
+            },
+        ),
+    ]
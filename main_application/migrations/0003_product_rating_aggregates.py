@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:46
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def backfill_ratings(apps, schema_editor):
+    Product = apps.get_model('main_application', 'Product')
+    ProductReview = apps.get_model('main_application', 'ProductReview')
+    reviews = (
+        ProductReview.objects.filter(product=OuterRef('pk'))
+        .order_by().values('product')
+        .annotate(total=Sum('rating'), n=Count('pk'))
+    )
+    review_sum = Coalesce(Subquery(reviews.values('total')), 0)
+    review_count = Coalesce(Subquery(reviews.values('n')), 0)
+    Product.objects.filter(reviews__isnull=False).distinct().update(
+        avg_rating=Coalesce(
+            Cast(review_sum, FloatField()) / NullIf(review_count, 0), Value(0.0), output_field=FloatField(),
+        ),
+        rating_sum=review_sum,
+        rating_count=review_count,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0002_slug_sequences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='avg_rating',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_fts_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+        cursor.execute(
+            "CREATE VIRTUAL TABLE product_search_fts USING fts5("
+            "status, name, description, crop, category, county, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        cursor.execute(
+            "INSERT INTO product_search_fts (rowid, status, name, description, crop, category, county) "
+            "SELECT p.id, p.status, p.name, p.description, c.name, cc.name, co.name "
+            "FROM main_application_product p "
+            "JOIN main_application_crop c ON c.id = p.crop_id "
+            "JOIN main_application_cropcategory cc ON cc.id = c.category_id "
+            "JOIN farms f ON f.id = p.farm_id "
+            "JOIN locations l ON l.id = f.location_id "
+            "JOIN main_application_county co ON co.id = l.county_id"
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS product_search_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0003_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=40)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='main_application.product')),
+            ],
+            options={
+                'db_table': 'product_search_tokens',
+                'unique_together': {('term', 'product')},
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, CharField, Count, F, Q, Value, When
+
+
+def backfill_facet_counts(apps, schema_editor):
+    Product = apps.get_model('main_application', 'Product')
+    ProductFacetCount = apps.get_model('main_application', 'ProductFacetCount')
+    band = Case(
+        When(price_per_unit__lt=100, then=Value('0-100')),
+        When(Q(price_per_unit__gte=100, price_per_unit__lt=500), then=Value('100-500')),
+        When(Q(price_per_unit__gte=500, price_per_unit__lt=1000), then=Value('500-1000')),
+        default=Value('1000+'),
+        output_field=CharField(),
+    )
+    rows = (
+        Product.objects.filter(status='active').order_by()
+        .values_list(F('crop__category_id'), F('farm__location__county_id'), 'quality_grade', 'organic_certified', band)
+        .annotate(n=Count('pk'))
+    )
+    ProductFacetCount.objects.bulk_create([
+        ProductFacetCount(
+            category_id=category_id, county_id=county_id, quality_grade=grade,
+            organic_certified=organic, price_band=price_band, count=n,
+        )
+        for category_id, county_id, grade, organic, price_band, n in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0004_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quality_grade', models.CharField(max_length=20)),
+                ('organic_certified', models.BooleanField()),
+                ('price_band', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='main_application.cropcategory')),
+                ('county', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='main_application.county')),
+            ],
+            options={
+                'db_table': 'product_facet_counts',
+                'unique_together': {('category', 'county', 'quality_grade', 'organic_certified', 'price_band')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', '-created_at'], name='product_status_created_idx'),
+        ),
+        migrations.RunPython(backfill_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, FloatField, Max, Min, Sum
+from django.db.models.functions import Cast, Coalesce, TruncMonth, TruncWeek
+
+
+def backfill_price_rollups(apps, schema_editor):
+    MarketPrice = apps.get_model('main_application', 'MarketPrice')
+    MarketPriceRollup = apps.get_model('main_application', 'MarketPriceRollup')
+    price = ExpressionWrapper(
+        F('price_per_unit') / F('unit__conversion_factor'),
+        output_field=DecimalField(max_digits=14, decimal_places=4),
+    )
+    as_float = Cast(price, FloatField())
+    starts = {
+        'day': F('date_recorded'),
+        'week': TruncWeek('date_recorded'),
+        'month': TruncMonth('date_recorded'),
+    }
+    for period, start in starts.items():
+        rows = (
+            MarketPrice.objects.filter(unit__conversion_factor__gt=0).order_by()
+            .values_list(start, 'crop_id', 'location_id', 'quality_grade', Coalesce(F('unit__base_unit_id'), F('unit_id')))
+            .annotate(
+                n=Count('pk'), s=Sum(as_float), sq=Sum(as_float * as_float, output_field=FloatField()),
+                lo=Min(price), hi=Max(price),
+            )
+        )
+        MarketPriceRollup.objects.bulk_create([
+            MarketPriceRollup(
+                period=period, period_start=day, crop_id=crop_id, county_id=county_id,
+                quality_grade=grade, unit_id=unit_id, count=n, price_sum=s, price_sq_sum=sq,
+                min_price=lo, max_price=hi,
+            )
+            for day, crop_id, county_id, grade, unit_id, n, s, sq, lo, hi in rows.iterator(chunk_size=2000)
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketPriceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Daily'), ('week', 'Weekly'), ('month', 'Monthly')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('quality_grade', models.CharField(blank=True, max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('price_sum', models.FloatField(default=0)),
+                ('price_sq_sum', models.FloatField(default=0, help_text='Sum of squared prices, for the standard deviation')),
+                ('min_price', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('max_price', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('county', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_rollups', to='main_application.county')),
+                ('crop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_rollups', to='main_application.crop')),
+                ('unit', models.ForeignKey(help_text='Base unit prices are normalized to', on_delete=django.db.models.deletion.CASCADE, to='main_application.productunit')),
+            ],
+            options={
+                'db_table': 'market_price_rollups',
+                'indexes': [models.Index(fields=['crop', 'period', 'period_start'], name='price_rollup_series_idx')],
+                'unique_together': {('period', 'period_start', 'crop', 'county', 'quality_grade', 'unit')},
+            },
+        ),
+        migrations.RunPython(backfill_price_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0007_market_price_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketprice',
+            name='moving_average',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text="Mean of the series' last prices, in this row's unit", max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='marketprice',
+            name='price_change',
+            field=models.FloatField(blank=True, help_text='Change of the moving average over the window, as a fraction', null=True),
+        ),
+        migrations.AddField(
+            model_name='marketprice',
+            name='price_volatility',
+            field=models.FloatField(blank=True, help_text='Standard deviation of the returns between prices over the window', null=True),
+        ),
+        migrations.AlterField(
+            model_name='marketprice',
+            name='price_trend',
+            field=models.CharField(blank=True, choices=[('Rising', 'Rising'), ('Stable', 'Stable'), ('Falling', 'Falling')], help_text='Computed by classify_price_trends', max_length=20),
+        ),
+    ]
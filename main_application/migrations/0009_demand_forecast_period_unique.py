@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:45
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def drop_duplicate_forecasts(apps, schema_editor):
+    """Keep only the newest forecast per crop, county and period"""
+    MarketDemandForecast = apps.get_model('main_application', 'MarketDemandForecast')
+    duplicated = (
+        MarketDemandForecast.objects.order_by()
+        .values('crop_id', 'location_id', 'forecast_period')
+        .annotate(n=Count('id'), newest=Max('id'))
+        .filter(n__gt=1)
+    )
+    for group in duplicated:
+        MarketDemandForecast.objects.filter(
+            crop_id=group['crop_id'], location_id=group['location_id'], forecast_period=group['forecast_period'],
+        ).exclude(id=group['newest']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0008_market_price_trend_metrics'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_forecasts, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='marketdemandforecast',
+            unique_together={('crop', 'location', 'forecast_period')},
+        ),
+    ]
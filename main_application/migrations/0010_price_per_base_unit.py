@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:49
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def root_factor(unit_id, units):
+    """Product of conversion factors from unit_id to the root of its chain, None if unresolvable"""
+    factor, seen = 1, set()
+    while unit_id in units and unit_id not in seen:
+        seen.add(unit_id)
+        base_unit_id, step = units[unit_id]
+        if base_unit_id is None:
+            return factor
+        if not step:
+            return None
+        factor, unit_id = factor * step, base_unit_id
+    return None
+
+
+def backfill_base_prices(apps, schema_editor):
+    ProductUnit = apps.get_model('main_application', 'ProductUnit')
+    units = {pk: (base, factor) for pk, base, factor in ProductUnit.objects.values_list('id', 'base_unit_id', 'conversion_factor')}
+    for unit_id in units:
+        factor = root_factor(unit_id, units)
+        if factor is None:
+            continue
+        for name in ('Product', 'MarketPrice'):
+            apps.get_model('main_application', name).objects.filter(unit_id=unit_id).update(
+                price_per_base_unit=F('price_per_unit') / factor,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0009_demand_forecast_period_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketprice',
+            name='price_per_base_unit',
+            field=models.DecimalField(blank=True, decimal_places=4, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='price_per_base_unit',
+            field=models.DecimalField(blank=True, decimal_places=4, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='marketprice',
+            index=models.Index(fields=['crop', 'price_per_base_unit'], name='market_price_crop_base_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'price_per_base_unit'], name='product_status_base_price_idx'),
+        ),
+        migrations.RunPython(backfill_base_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0011_inventory_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(help_text='e.g., ORD', max_length=10)),
+                ('year', models.PositiveIntegerField()),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'number_sequences',
+                'unique_together': {('prefix', 'year')},
+            },
+        ),
+    ]
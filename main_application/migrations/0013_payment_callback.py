@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0012_number_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentCallback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gateway_reference', models.CharField(max_length=200)),
+                ('transaction_id', models.CharField(help_text='Payment.transaction_id the gateway echoes back', max_length=100)),
+                ('result', models.CharField(choices=[('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('payload', models.JSONField(default=dict)),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('processing', 'Processing'), ('applied', 'Applied'), ('ignored', 'Ignored'), ('rejected', 'Rejected')], default='queued', max_length=20)),
+                ('claimed_by', models.CharField(blank=True, max_length=64)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'payment_callbacks',
+                'indexes': [models.Index(fields=['state', 'id'], name='callback_queue_idx')],
+                'constraints': [models.UniqueConstraint(fields=('gateway_reference', 'result'), name='one_callback_per_outcome')],
+            },
+        ),
+    ]
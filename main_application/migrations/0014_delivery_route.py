@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0013_payment_callback'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='route_stop',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Drop-off position on the route', null=True),
+        ),
+        migrations.CreateModel(
+            name='DeliveryRoute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('driver_name', models.CharField(blank=True, max_length=200)),
+                ('driver_phone', models.CharField(blank=True, max_length=15)),
+                ('vehicle_details', models.CharField(blank=True, max_length=200)),
+                ('stops', models.JSONField(default=list, help_text='Pickups then drop-offs, in driving order')),
+                ('distance_km', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('status', models.CharField(choices=[('planned', 'Planned'), ('dispatched', 'Dispatched'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='planned', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivery_partner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='routes', to='main_application.deliverypartner')),
+            ],
+            options={
+                'db_table': 'delivery_routes',
+            },
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='route',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deliveries', to='main_application.deliveryroute'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0014_delivery_route'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='delivery',
+            name='tracking_updates',
+            field=models.JSONField(default=list, help_text='Latest tracking events, newest first; the full trail is in tracking_events'),
+        ),
+        migrations.CreateModel(
+            name='DeliveryTrackingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField()),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('accuracy', models.FloatField(blank=True, help_text='In metres', null=True)),
+                ('status', models.CharField(blank=True, choices=[('assigned', 'Assigned'), ('picked_up', 'Picked Up'), ('in_transit', 'In Transit'), ('out_for_delivery', 'Out for Delivery'), ('delivered', 'Delivered'), ('failed', 'Failed'), ('returned', 'Returned')], max_length=20)),
+                ('delivery', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracking_events', to='main_application.delivery')),
+            ],
+            options={
+                'db_table': 'delivery_tracking_events',
+                'constraints': [models.UniqueConstraint(fields=('delivery', 'recorded_at'), name='one_tracking_event_per_instant')],
+            },
+        ),
+    ]
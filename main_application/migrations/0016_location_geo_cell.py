@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:00
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+CELL_DEGREES = Decimal('0.05')
+ROWS, COLUMNS = 3600, 7200
+
+
+def cell_of(latitude, longitude):
+    """geo.cell_of as of this migration"""
+    row = int((Decimal(str(latitude)) + 90) // CELL_DEGREES)
+    column = int((Decimal(str(longitude)) + 180) // CELL_DEGREES)
+    return min(max(row, 0), ROWS - 1) * COLUMNS + min(max(column, 0), COLUMNS - 1)
+
+
+def backfill_geo_cells(apps, schema_editor):
+    Location = apps.get_model('main_application', 'Location')
+    located = Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    locations = [
+        Location(pk=pk, geo_cell=cell_of(latitude, longitude))
+        for pk, latitude, longitude in located.values_list('pk', 'latitude', 'longitude')
+    ]
+    Location.objects.bulk_update(locations, ['geo_cell'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0015_delivery_tracking_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geo_cell',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Grid cell of the coordinates, for proximity search (geo.py)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['geo_cell'], name='location_geo_cell_idx'),
+        ),
+        migrations.RunPython(backfill_geo_cells, migrations.RunPython.noop),
+    ]
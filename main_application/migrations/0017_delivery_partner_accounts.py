@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_application', '0016_location_geo_cell'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliverypartner',
+            name='accounts',
+            field=models.ManyToManyField(blank=True, help_text="Dispatchers and drivers who report and follow the partner's deliveries", related_name='delivery_partner_accounts', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -113,11 +113,17 @@ class Location(models.Model):
     detailed_address = models.TextField()
     latitude = models.DecimalField(max_digits=10, decimal_places=8, blank=True, null=True)
     longitude = models.DecimalField(max_digits=11, decimal_places=8, blank=True, null=True)
+    geo_cell = models.PositiveIntegerField(
+        blank=True, null=True, editable=False, help_text="Grid cell of the coordinates, for proximity search (geo.py)",
+    )
     is_default = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         db_table = 'locations'
+        indexes = [
+            models.Index(fields=['geo_cell'], name='location_geo_cell_idx'),
+        ]
 
 
 # ============== FARMER-SPECIFIC MODELS ==============
@@ -159,6 +165,36 @@ class FarmerProfile(models.Model):
 from django.db import models
 from django.utils.text import slugify
 
+from .slugs import save_with_unique_slug
+
+
+class SlugSequence(models.Model):
+    """Last suffix handed out for a base slug, used to allocate unique slugs"""
+    scope = models.CharField(max_length=100, help_text="e.g., main_application.product.slug")
+    base_slug = models.CharField(max_length=220)
+    last_value = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'slug_sequences'
+        unique_together = ['scope', 'base_slug']
+
+    def __str__(self):
+        return f"{self.base_slug}-{self.last_value}"
+
+
+class NumberSequence(models.Model):
+    """Last number claimed for a prefix and year, handed out in blocks (see numbering.py)"""
+    prefix = models.CharField(max_length=10, help_text="e.g., ORD")
+    year = models.PositiveIntegerField()
+    last_value = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'number_sequences'
+        unique_together = ['prefix', 'year']
+
+    def __str__(self):
+        return f"{self.prefix}-{self.year}: {self.last_value}"
+
 
 class Farm(models.Model):
     """Individual farms owned by farmers"""
@@ -182,18 +218,8 @@ class Farm(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        # Always slugify the name
-        base_slug = slugify(self.name)
-        slug = base_slug
-        counter = 1
-
-        # Ensure uniqueness by checking existing records
-        while Farm.objects.filter(name=slug).exclude(pk=self.pk).exists():
-            slug = f"{base_slug}-{counter}"
-            counter += 1
-
-        self.name = slug
-        super().save(*args, **kwargs)
+        # Always slugify the name, suffixing it when another farm has it
+        save_with_unique_slug(self, 'name', self.name, super().save, *args, **kwargs)
 
 
 
@@ -294,6 +320,8 @@ class Product(models.Model):
     quantity_available = models.DecimalField(max_digits=10, decimal_places=2)
     unit = models.ForeignKey(ProductUnit, on_delete=models.CASCADE)
     price_per_unit = models.DecimalField(max_digits=10, decimal_places=2)
+    # Price per root unit of the unit's conversion chain, kept by signals.py (see units.py)
+    price_per_base_unit = models.DecimalField(max_digits=14, decimal_places=4, blank=True, null=True, editable=False)
     minimum_order = models.DecimalField(max_digits=10, decimal_places=2, default=1)
     quality_grade = models.CharField(max_length=20, choices=QUALITY_CHOICES, default='standard')
     harvest_date = models.DateField()
@@ -308,24 +336,39 @@ class Product(models.Model):
     featured = models.BooleanField(default=False)
     views_count = models.PositiveIntegerField(default=0)
     likes_count = models.PositiveIntegerField(default=0)
+    # Review aggregates, kept in step with ProductReview by signals.py
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    avg_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Newest-first catalog pages (see facets.browse_products)
+            models.Index(fields=['status', '-created_at'], name='product_status_created_idx'),
+            # Cheapest-first listings across units
+            models.Index(fields=['status', 'price_per_base_unit'], name='product_status_base_price_idx'),
+        ]
  
     def __str__(self):
         return f"{self.name} - {self.farmer.user.username}"
 
+    # Only moved by the review deltas in ratings.py: a save writes them
+    # when named in update_fields, so a stale instance cannot undo a delta
+    RATING_FIELDS = ('rating_sum', 'rating_count', 'avg_rating')
+
     def save(self, *args, **kwargs):
+        if not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert') and not self._state.adding:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.RATING_FIELDS
+            ]
         # Generate slug if empty
         if not self.slug:
-            base_slug = slugify(self.name)
-            slug = base_slug
-            counter = 1
-            while Product.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-        super().save(*args, **kwargs)
+            save_with_unique_slug(self, 'slug', self.name, super().save, *args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
 
 
 
@@ -358,6 +401,31 @@ class ProductReview(models.Model):
         unique_together = ['product', 'buyer']
 
 
+class ProductSearchToken(models.Model):
+    """Inverted index entry used for product search when FTS5 is unavailable"""
+    term = models.CharField(max_length=40)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_tokens')
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        db_table = 'product_search_tokens'
+        unique_together = ['term', 'product']
+
+
+class ProductFacetCount(models.Model):
+    """Active listings per combination of browse facet values, maintained by signals.py"""
+    category = models.ForeignKey(CropCategory, on_delete=models.CASCADE, related_name='facet_counts')
+    county = models.ForeignKey(County, on_delete=models.CASCADE, related_name='facet_counts')
+    quality_grade = models.CharField(max_length=20)
+    organic_certified = models.BooleanField()
+    price_band = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'product_facet_counts'
+        unique_together = ['category', 'county', 'quality_grade', 'organic_certified', 'price_band']
+
+
 # ============== BUYER MODELS ==============
 
 class BuyerProfile(models.Model):
@@ -491,8 +559,43 @@ class OrderStatusHistory(models.Model):
     changed_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     notes = models.TextField(blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
-    
-   
+
+
+class InventoryReservation(models.Model):
+    """Product stock held for a buyer's cart or committed to an order (see inventory.py)"""
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('committed', 'Committed'),
+        ('released', 'Released'),
+        ('expired', 'Expired'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    buyer = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='reservations')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, blank=True, null=True, related_name='reservations')
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'inventory_reservations'
+        constraints = [
+            # A cart holds one reservation per product, resized as the cart changes
+            models.UniqueConstraint(
+                fields=['buyer', 'product'], condition=models.Q(status='held'),
+                name='one_held_reservation_per_product',
+            ),
+        ]
+        indexes = [
+            # Expiry sweeps (see inventory.expire_reservations)
+            models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for {self.buyer_id} ({self.status})"
+
 
 # ============== PAYMENT MODELS ==============
 
@@ -541,7 +644,51 @@ class Payment(models.Model):
     gateway_response = models.JSONField(default=dict)
     paid_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    
+
+
+class PaymentCallback(models.Model):
+    """Gateway callback queued for the payment workers (see payment_callbacks.py)"""
+    RESULT_CHOICES = [
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    STATE_CHOICES = [
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('applied', 'Applied'),
+        ('ignored', 'Ignored'),
+        ('rejected', 'Rejected'),
+    ]
+
+    gateway_reference = models.CharField(max_length=200)
+    transaction_id = models.CharField(max_length=100, help_text="Payment.transaction_id the gateway echoes back")
+    result = models.CharField(max_length=20, choices=RESULT_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    payload = models.JSONField(default=dict)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='queued')
+    claimed_by = models.CharField(max_length=64, blank=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.CharField(max_length=255, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'payment_callbacks'
+        constraints = [
+            # Gateway retries of the same outcome are acknowledged but queued once
+            models.UniqueConstraint(fields=['gateway_reference', 'result'], name='one_callback_per_outcome'),
+        ]
+        indexes = [
+            # Workers claim the oldest queued callbacks (see payment_callbacks.claim_callbacks)
+            models.Index(fields=['state', 'id'], name='callback_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.gateway_reference}: {self.result} ({self.state})"
+
   
 
 # ============== DELIVERY MODELS ==============
@@ -568,6 +715,10 @@ class DeliveryPartner(models.Model):
     phone_number = models.CharField(max_length=15)
     email = models.EmailField()
     service_areas = models.ManyToManyField(County, related_name='delivery_partners')
+    accounts = models.ManyToManyField(
+        CustomUser, blank=True, related_name='delivery_partner_accounts',
+        help_text="Dispatchers and drivers who report and follow the partner's deliveries",
+    )
     pricing_model = models.CharField(max_length=100, blank=True)
     is_active = models.BooleanField(default=True)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
@@ -579,6 +730,31 @@ class DeliveryPartner(models.Model):
         return self.name
 
 
+class DeliveryRoute(models.Model):
+    """Multi-stop route of one delivery partner's vehicle, planned by dispatch.py"""
+    STATUS_CHOICES = [
+        ('planned', 'Planned'),
+        ('dispatched', 'Dispatched'),
+        ('completed', 'Completed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    delivery_partner = models.ForeignKey(DeliveryPartner, on_delete=models.CASCADE, related_name='routes')
+    driver_name = models.CharField(max_length=200, blank=True)
+    driver_phone = models.CharField(max_length=15, blank=True)
+    vehicle_details = models.CharField(max_length=200, blank=True)
+    stops = models.JSONField(default=list, help_text="Pickups then drop-offs, in driving order")
+    distance_km = models.DecimalField(max_digits=8, decimal_places=2)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='planned')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'delivery_routes'
+
+    def __str__(self):
+        return f"Route {self.pk} ({self.delivery_partner_id}, {len(self.stops)} stops)"
+
+
 class Delivery(models.Model):
     """Delivery tracking"""
     DELIVERY_STATUS_CHOICES = [
@@ -605,23 +781,61 @@ class Delivery(models.Model):
     delivery_notes = models.TextField(blank=True)
     recipient_name = models.CharField(max_length=200, blank=True)
     delivery_fee = models.DecimalField(max_digits=8, decimal_places=2)
-    tracking_updates = models.JSONField(default=list)
+    tracking_updates = models.JSONField(
+        default=list, help_text="Latest tracking events, newest first; the full trail is in tracking_events",
+    )
+    route = models.ForeignKey(DeliveryRoute, on_delete=models.SET_NULL, blank=True, null=True, related_name='deliveries')
+    route_stop = models.PositiveSmallIntegerField(blank=True, null=True, help_text="Drop-off position on the route")
     created_at = models.DateTimeField(auto_now_add=True)
    
 
+class DeliveryTrackingEvent(models.Model):
+    """One GPS or status ping from a driver's app, appended by tracking.py and never updated"""
+    delivery = models.ForeignKey(Delivery, on_delete=models.CASCADE, related_name='tracking_events')
+    recorded_at = models.DateTimeField()
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    accuracy = models.FloatField(blank=True, null=True, help_text="In metres")
+    status = models.CharField(max_length=20, choices=Delivery.DELIVERY_STATUS_CHOICES, blank=True)
+
+    class Meta:
+        db_table = 'delivery_tracking_events'
+        constraints = [
+            # Resent pings are dropped; also the index the trail and latest position are read from
+            models.UniqueConstraint(fields=['delivery', 'recorded_at'], name='one_tracking_event_per_instant'),
+        ]
+
+    def __str__(self):
+        return f"{self.delivery_id} at {self.recorded_at}"
+
+
 # ============== MARKET INTELLIGENCE MODELS ==============
 
 class MarketPrice(models.Model):
     """Historical and current market prices"""
+    TREND_CHOICES = [
+        ('Rising', 'Rising'),
+        ('Stable', 'Stable'),
+        ('Falling', 'Falling'),
+    ]
+
     crop = models.ForeignKey(Crop, on_delete=models.CASCADE, related_name='market_prices')
     location = models.ForeignKey(County, on_delete=models.CASCADE)
     market_name = models.CharField(max_length=200, blank=True)
     price_per_unit = models.DecimalField(max_digits=10, decimal_places=2)
     unit = models.ForeignKey(ProductUnit, on_delete=models.CASCADE)
+    price_per_base_unit = models.DecimalField(max_digits=14, decimal_places=4, blank=True, null=True, editable=False)
     quality_grade = models.CharField(max_length=50, blank=True)
     supply_level = models.CharField(max_length=50, blank=True, help_text="e.g., High, Medium, Low")
     demand_level = models.CharField(max_length=50, blank=True)
-    price_trend = models.CharField(max_length=20, blank=True, help_text="e.g., Rising, Falling, Stable")
+    price_trend = models.CharField(max_length=20, blank=True, choices=TREND_CHOICES,
+                                   help_text="Computed by classify_price_trends")
+    moving_average = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True,
+                                         help_text="Mean of the series' last prices, in this row's unit")
+    price_change = models.FloatField(blank=True, null=True,
+                                     help_text="Change of the moving average over the window, as a fraction")
+    price_volatility = models.FloatField(blank=True, null=True,
+                                         help_text="Standard deviation of the returns between prices over the window")
     source = models.CharField(max_length=100, blank=True)
     date_recorded = models.DateField()
     notes = models.TextField(blank=True)
@@ -632,6 +846,35 @@ class MarketPrice(models.Model):
         indexes = [
             models.Index(fields=['crop', 'location', 'date_recorded']),
             models.Index(fields=['date_recorded']),
+            models.Index(fields=['crop', 'price_per_base_unit'], name='market_price_crop_base_idx'),
+        ]
+
+
+class MarketPriceRollup(models.Model):
+    """Daily/weekly/monthly price aggregates per crop, county and grade, maintained by signals.py"""
+    PERIOD_CHOICES = [
+        ('day', 'Daily'),
+        ('week', 'Weekly'),
+        ('month', 'Monthly'),
+    ]
+
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    crop = models.ForeignKey(Crop, on_delete=models.CASCADE, related_name='price_rollups')
+    county = models.ForeignKey(County, on_delete=models.CASCADE, related_name='price_rollups')
+    quality_grade = models.CharField(max_length=50, blank=True)
+    unit = models.ForeignKey(ProductUnit, on_delete=models.CASCADE, help_text="Base unit prices are normalized to")
+    count = models.PositiveIntegerField(default=0)
+    price_sum = models.FloatField(default=0)
+    price_sq_sum = models.FloatField(default=0, help_text="Sum of squared prices, for the standard deviation")
+    min_price = models.DecimalField(max_digits=14, decimal_places=4)
+    max_price = models.DecimalField(max_digits=14, decimal_places=4)
+
+    class Meta:
+        db_table = 'market_price_rollups'
+        unique_together = ['period', 'period_start', 'crop', 'county', 'quality_grade', 'unit']
+        indexes = [
+            models.Index(fields=['crop', 'period', 'period_start'], name='price_rollup_series_idx'),
         ]
 
 
@@ -680,6 +923,7 @@ class MarketDemandForecast(models.Model):
     
     class Meta:
         db_table = 'market_demand_forecasts'
+        unique_together = ['crop', 'location', 'forecast_period']
 
 
 # ============== AGRICULTURAL INPUT MODELS ==============
@@ -1157,7 +1401,10 @@ class Notification(models.Model):
     read_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
-
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
 
 
 class Message(models.Model):
@@ -1177,6 +1424,7 @@ class Message(models.Model):
         indexes = [
             models.Index(fields=['recipient', 'is_read']),
             models.Index(fields=['sender', 'created_at']),
+            models.Index(fields=['created_at', 'id']),
         ]
 
 
@@ -1197,6 +1445,7 @@ class UserActivity(models.Model):
         indexes = [
             models.Index(fields=['user', 'timestamp']),
             models.Index(fields=['activity_type', 'timestamp']),
+            models.Index(fields=['timestamp', 'id']),
         ]
 
 
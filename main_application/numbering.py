@@ -0,0 +1,217 @@
+"""
+Human-friendly unique numbers for orders, tickets, bookings and claims.
+
+Numbers look like ORD-2026-000123: a prefix naming the record type, the
+year, and a counter per prefix and year. The counter lives in a
+NumberSequence row, but a process never touches it per number: it claims
+a block of BLOCK_SIZE numbers with one atomic UPDATE and hands them out
+from memory, so writers never wait on each other for a number. Blocks
+are disjoint, so numbers are unique across processes and hosts without
+relying on retries. Numbers sort by year, then by the order blocks were
+claimed; numbers left in a block when a process exits are skipped.
+
+A block claimed inside a transaction is only trusted until that
+transaction ends: if it rolls back, so does the claim, and the block is
+dropped instead of being handed out again. On databases with row locks
+blocks are claimed on a separate autocommit connection instead, opened
+for the claim and closed after it, so a long transaction never holds the
+counter row. Forked workers start
+without blocks.
+
+Records saved one at a time get their number from a pre_save signal
+(signals.py); bulk writers call next_numbers().
+"""
+
+from django.db import IntegrityError, connection, connections
+from django.db.models.functions import Length
+from django.utils import timezone
+import os
+import re
+import threading
+import weakref
+
+from .models import (
+    InsuranceClaim, LoanApplication, NumberSequence, Order, SchemeApplication, StorageBooking, SupportTicket,
+)
+
+
+BLOCK_SIZE = 50
+
+DIGITS = 6
+
+# Model: (number field, prefix)
+NUMBERED_FIELDS = {
+    Order: ('order_number', 'ORD'),
+    SupportTicket: ('ticket_number', 'TKT'),
+    StorageBooking: ('booking_number', 'BKG'),
+    LoanApplication: ('application_number', 'LOAN'),
+    InsuranceClaim: ('claim_number', 'CLM'),
+    SchemeApplication: ('application_number', 'SCH'),
+}
+
+
+def format_number(prefix, year, value):
+    return f"{prefix}-{year}-{value:0{DIGITS}d}"
+
+
+def highest_existing(prefix, year):
+    """Largest counter already used in (prefix, year) by rows saved before the sequence existed"""
+    for model, (field, model_prefix) in NUMBERED_FIELDS.items():
+        if model_prefix != prefix:
+            continue
+        pattern = re.compile(rf'^{re.escape(prefix)}-{year}-(\d+)$')
+        numbers = (
+            model._default_manager.filter(**{f'{field}__startswith': f'{prefix}-{year}-'})
+            .order_by(Length(field).desc(), f'-{field}').values_list(field, flat=True)
+        )
+        for number in numbers.iterator():
+            match = pattern.match(number)
+            if match:
+                return int(match.group(1))
+    return 0
+
+
+def bump_sequence(conn, prefix, year, size):
+    """Add size to the (prefix, year) counter on conn, inside its current transaction; returns the new value"""
+    qn = conn.ops.quote_name
+    table = qn(NumberSequence._meta.db_table)
+    where = f'{qn("prefix")} = %s AND {qn("year")} = %s'
+    update = f'UPDATE {table} SET {qn("last_value")} = {qn("last_value")} + %s WHERE {where}'
+    with conn.cursor() as cursor:
+        cursor.execute(update, [size, prefix, year])
+        if not cursor.rowcount:
+            start = highest_existing(prefix, year)
+            sid = conn.savepoint()
+            try:
+                cursor.execute(
+                    f'INSERT INTO {table} ({qn("prefix")}, {qn("year")}, {qn("last_value")}) VALUES (%s, %s, %s)',
+                    [prefix, year, start + size],
+                )
+                conn.savepoint_commit(sid)
+            except IntegrityError:
+                # Created concurrently since the UPDATE above
+                conn.savepoint_rollback(sid)
+                cursor.execute(update, [size, prefix, year])
+        cursor.execute(f'SELECT {qn("last_value")} FROM {table} WHERE {where}', [prefix, year])
+        return cursor.fetchone()[0]
+
+
+def claim_in_transaction(conn, prefix, year, size):
+    """Run bump_sequence() in its own transaction on a connection nobody else is using"""
+    conn.set_autocommit(False)
+    try:
+        last = bump_sequence(conn, prefix, year, size)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.set_autocommit(True)
+    return last
+
+
+class Block:
+    """A claimed run of numbers, next to last inclusive"""
+
+    def __init__(self, first, last):
+        self.next = first
+        self.last = last
+        # Weak reference to the PendingClaim of a block claimed inside a
+        # transaction, until that transaction commits
+        self.pending = None
+
+
+class PendingClaim:
+    """
+    on_commit callback confirming a block claimed inside a transaction.
+    Django drops the callbacks of a transaction or savepoint that rolls
+    back, and with them the only strong reference to this object.
+    """
+
+    def __init__(self, block):
+        self.block = block
+
+    def __call__(self):
+        self.block.pending = None
+
+
+class NumberAllocator:
+    """
+    Hands out numbers from blocks claimed BLOCK_SIZE at a time. claim_on,
+    if given, returns the connection to claim blocks on instead of the
+    default one (used by the tests).
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE, claim_on=None):
+        self.block_size = block_size
+        self.claim_on = claim_on
+        self.lock = threading.Lock()
+        self.blocks = {}
+
+    def reset(self):
+        """Forget every block, e.g. in a forked child that must not reuse its parent's"""
+        self.lock = threading.Lock()
+        self.blocks = {}
+
+    def _usable(self, block):
+        if block is None or block.next > block.last:
+            return False
+        if block.pending is None:
+            return True
+        # Claimed in a transaction still open: its callback is still held
+        return block.pending() is not None
+
+    def _claim_separately(self, prefix, year, size):
+        if self.claim_on is not None:
+            return claim_in_transaction(self.claim_on(), prefix, year, size)
+        # Opened per claim: nothing else would ever close it or notice it died
+        conn = connections.create_connection('default')
+        try:
+            return claim_in_transaction(conn, prefix, year, size)
+        finally:
+            conn.close()
+
+    def _claim(self, prefix, year):
+        size = self.block_size
+        if self.claim_on is not None or (connection.in_atomic_block and connection.vendor != 'sqlite'):
+            last = self._claim_separately(prefix, year, size)
+            return Block(last - size + 1, last)
+        if not connection.in_atomic_block:
+            last = claim_in_transaction(connection, prefix, year, size)
+            return Block(last - size + 1, last)
+        # SQLite serializes writers anyway, so claim inside the caller's transaction
+        last = bump_sequence(connection, prefix, year, size)
+        block = Block(last - size + 1, last)
+        confirm = PendingClaim(block)
+        block.pending = weakref.ref(confirm)
+        connection.on_commit(confirm)
+        return block
+
+    def take(self, prefix, count=1, year=None):
+        """count new numbers for prefix, in the order they were allocated"""
+        year = year or timezone.localdate().year
+        numbers = []
+        with self.lock:
+            while len(numbers) < count:
+                block = self.blocks.get((prefix, year))
+                if not self._usable(block):
+                    block = self.blocks[(prefix, year)] = self._claim(prefix, year)
+                while block.next <= block.last and len(numbers) < count:
+                    numbers.append(format_number(prefix, year, block.next))
+                    block.next += 1
+        return numbers
+
+
+allocator = NumberAllocator()
+
+os.register_at_fork(after_in_child=allocator.reset)
+
+
+def next_numbers(model, count):
+    """count new unique numbers for a model in NUMBERED_FIELDS"""
+    _field, prefix = NUMBERED_FIELDS[model]
+    return allocator.take(prefix, count)
+
+
+def next_number(model):
+    return next_numbers(model, 1)[0]
@@ -0,0 +1,113 @@
+"""
+Order status transitions.
+
+TRANSITIONS lists where each of Order.ORDER_STATUS_CHOICES may move next.
+transition_orders() moves any number of orders at once: one locking read
+of their current statuses, one UPDATE for every order allowed to move,
+and one bulk_create of their OrderStatusHistory rows. delivered_at and
+cancelled_at are stamped in the same UPDATE.
+
+Instead of per-order save signals, each batch sends orders_transitioned
+once; the receivers in signals.py return committed stock of cancelled
+orders and notify buyers in bulk. Order statuses should only change
+through here so the history stays complete; history rows are never
+edited.
+"""
+
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Order, OrderStatusHistory
+
+
+TRANSITIONS = {
+    'pending': {'confirmed', 'cancelled'},
+    'confirmed': {'processing', 'cancelled'},
+    'processing': {'ready', 'cancelled'},
+    'ready': {'shipped', 'cancelled'},
+    'shipped': {'delivered'},
+    'delivered': {'refunded'},
+    'cancelled': {'refunded'},
+    'refunded': set(),
+}
+
+# Timestamp column stamped when an order enters a status
+STAMPED_AT = {'delivered': 'delivered_at', 'cancelled': 'cancelled_at'}
+
+# Sent once per batch with order_ids, previous ({order id: status}), status and changed_by
+orders_transitioned = Signal()
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def can_transition(current, new):
+    return new in TRANSITIONS.get(current, ())
+
+
+class TransitionResult:
+    """Orders moved by transition_orders() and those left where they were"""
+
+    def __init__(self, status, previous, skipped):
+        self.status = status
+        self.previous = previous
+        self.skipped = skipped
+
+    @property
+    def order_ids(self):
+        return list(self.previous)
+
+    def __len__(self):
+        return len(self.previous)
+
+    def __repr__(self):
+        return f"<TransitionResult {len(self.previous)} -> {self.status}, {len(self.skipped)} skipped>"
+
+
+def transition_orders(orders, status, changed_by, notes='', strict=False):
+    """
+    Move orders (Order instances, ids or a queryset) to status. Orders that
+    may not move there are skipped, or with strict=True raise
+    InvalidTransition and nothing moves.
+    """
+    if status not in TRANSITIONS:
+        raise InvalidTransition(f"Unknown order status: {status}")
+    if hasattr(orders, 'values_list'):
+        order_ids = list(orders.values_list('pk', flat=True))
+    else:
+        order_ids = [getattr(order, 'pk', order) for order in orders]
+
+    now = timezone.now()
+    with transaction.atomic():
+        current = dict(
+            Order.objects.select_for_update().filter(pk__in=order_ids).order_by('pk').values_list('pk', 'status')
+        )
+        previous = {pk: old for pk, old in current.items() if can_transition(old, status)}
+        skipped = {pk: old for pk, old in current.items() if pk not in previous}
+        if strict and (skipped or len(current) < len(set(order_ids))):
+            moves = ', '.join(f"{pk}: {old} -> {status}" for pk, old in skipped.items()) or 'unknown orders'
+            raise InvalidTransition(f"Invalid order transitions: {moves}")
+        if previous:
+            changes = {'status': status, 'updated_at': now}
+            if status in STAMPED_AT:
+                changes[STAMPED_AT[status]] = now
+            if status == 'cancelled' and notes:
+                changes['cancellation_reason'] = notes
+            Order.objects.filter(pk__in=list(previous)).update(**changes)
+            OrderStatusHistory.objects.bulk_create([
+                OrderStatusHistory(order_id=pk, previous_status=old, new_status=status, changed_by=changed_by, notes=notes)
+                for pk, old in previous.items()
+            ])
+            orders_transitioned.send(
+                sender=Order, order_ids=list(previous), previous=previous, status=status, changed_by=changed_by,
+            )
+    return TransitionResult(status, previous, skipped)
+
+
+def transition_order(order, status, changed_by, notes=''):
+    """Move one order, raising InvalidTransition if it may not; refreshes order"""
+    transition_orders([order], status, changed_by, notes=notes, strict=True)
+    order.refresh_from_db(fields=['status', 'delivered_at', 'cancelled_at', 'cancellation_reason', 'updated_at'])
+    return order
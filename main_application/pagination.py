@@ -0,0 +1,312 @@
+"""
+Keyset (cursor) pagination for large tables.
+
+OFFSET pagination reads and discards every row before the requested page
+and needs a COUNT(*) over the whole result, both of which grow with the
+table. KeysetPaginator instead remembers the ordering key of the last row
+shown, e.g. (timestamp, id), and asks for rows past it, which an index on
+those columns answers in the same time on page 1 and page 100,000.
+
+estimated_count() replaces the exact count: catalog statistics (or
+MAX(id) on SQLite) for unfiltered tables, a count capped at a threshold
+otherwise.
+
+Used by the admin through KeysetPaginationMixin and by the API through
+KeysetPagination.
+"""
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+import json
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def table_estimate(model, using='default'):
+    """Approximate row count of model's table without scanning it, or None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s', [table],
+            )
+        elif connection.vendor == 'sqlite' and model._meta.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+            # Both ends of the primary key index: exact unless rows were deleted.
+            # Separate subqueries keep SQLite's single-probe min/max optimisation.
+            pk = connection.ops.quote_name(model._meta.pk.column)
+            table = connection.ops.quote_name(table)
+            cursor.execute(f'SELECT (SELECT MAX({pk}) FROM {table}) - (SELECT MIN({pk}) FROM {table}) + 1')
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return 0 if connection.vendor == 'sqlite' else None
+    return max(int(row[0]), 0)
+
+
+class RowCount:
+    """A row count that may be exact, an estimate, or a lower bound"""
+
+    def __init__(self, value, kind='exact'):
+        self.value = value
+        self.kind = kind
+
+    @property
+    def exact(self):
+        return self.kind == 'exact'
+
+    def __int__(self):
+        return self.value
+
+    def __str__(self):
+        if self.kind == 'estimate':
+            return f'about {self.value:,}'
+        if self.kind == 'at_least':
+            return f'more than {self.value:,}'
+        return f'{self.value:,}'
+
+
+def estimated_count(queryset, exact_below=10000):
+    """
+    Count rows cheaply: exact up to exact_below, otherwise the table
+    estimate for unfiltered querysets or 'more than exact_below'.
+    """
+    if not queryset.query.where:
+        estimate = table_estimate(queryset.model, queryset.db)
+        if estimate is not None and estimate > exact_below:
+            return RowCount(estimate, 'estimate')
+    n = queryset.order_by()[:exact_below + 1].count()
+    if n > exact_below:
+        return RowCount(exact_below, 'at_least')
+    return RowCount(n)
+
+
+class KeysetPage:
+    """One page of rows plus the cursors that lead to its neighbours"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __repr__(self):
+        return f"<KeysetPage {len(self.object_list)} rows, next={self.has_next} previous={self.has_previous}>"
+
+
+class KeysetPaginator:
+    """
+    Paginate queryset by ordering, e.g. ('-timestamp', '-id'). Ordering
+    fields must be non-null local columns; the primary key is appended if
+    missing so that the key is unique.
+    """
+
+    def __init__(self, queryset, ordering, per_page=100, exact_count_below=10000):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.exact_count_below = exact_count_below
+        opts = queryset.model._meta
+        self.ordering = []
+        for name in ordering:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            try:
+                field = opts.pk if name == 'pk' else opts.get_field(name)
+            except FieldDoesNotExist:
+                raise ValueError(f"Cannot paginate {opts.label} by {name}")
+            if not field.concrete or field.null:
+                raise ValueError(f"Keyset ordering needs non-null columns; {opts.label}.{name} is not")
+            self.ordering.append((field, descending))
+        if not self.ordering or self.ordering[-1][0] != opts.pk:
+            self.ordering.append((opts.pk, self.ordering[-1][1] if self.ordering else True))
+        self._count = None
+
+    @property
+    def count(self):
+        if self._count is None:
+            self._count = estimated_count(self.queryset, self.exact_count_below)
+        return self._count
+
+    def encode_cursor(self, obj, backwards=False):
+        key = [field.value_to_string(obj) for field, _ in self.ordering]
+        payload = json.dumps({'k': key, 'b': backwards} if backwards else {'k': key}, separators=(',', ':'))
+        return urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            key = payload['k']
+            if len(key) != len(self.ordering):
+                raise ValueError
+            values = [field.to_python(value) for (field, _), value in zip(self.ordering, key)]
+        except (ValueError, TypeError, KeyError, ValidationError):
+            raise InvalidCursor(f"Invalid cursor: {cursor}")
+        return values, bool(payload.get('b'))
+
+    def _after(self, values, backwards):
+        """Q for rows strictly after values in ordering (before, if backwards)"""
+        q = Q()
+        for i, (field, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != backwards else 'gt'
+            step = Q(**{f'{field.attname}__{lookup}': values[i]})
+            for j in range(i):
+                step &= Q(**{self.ordering[j][0].attname: values[j]})
+            q |= step
+        # Redundant bound on the leading column so the index range is obvious
+        field, descending = self.ordering[0]
+        lead = 'lte' if descending != backwards else 'gte'
+        return Q(**{f'{field.attname}__{lead}': values[0]}) & q
+
+    def _order_by(self, backwards):
+        return [
+            f'{"-" if descending != backwards else ""}{field.attname}'
+            for field, descending in self.ordering
+        ]
+
+    def page(self, cursor=None):
+        """The page after (or, for a backwards cursor, before) cursor"""
+        backwards = False
+        queryset = self.queryset
+        if cursor:
+            values, backwards = self.decode_cursor(cursor)
+            queryset = queryset.filter(self._after(values, backwards))
+        rows = list(queryset.order_by(*self._order_by(backwards))[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if more or backwards:
+                next_cursor = self.encode_cursor(rows[-1])
+            if (more and backwards) or (cursor and not backwards):
+                previous_cursor = self.encode_cursor(rows[0], backwards=True)
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+# ============== ADMIN ==============
+
+class KeysetChangeList(ChangeList):
+    """
+    Changelist that pages with a keyset cursor carried in the usual ?p=
+    parameter and shows an estimated count instead of running COUNT(*).
+    """
+
+    def get_results(self, request):
+        paginator = KeysetPaginator(
+            self.queryset, self.model_admin.keyset_ordering, self.list_per_page,
+            exact_count_below=self.model_admin.exact_count_below,
+        )
+        try:
+            page = paginator.page(request.GET.get(PAGE_VAR) or None)
+        except InvalidCursor:
+            raise IncorrectLookupParameters
+
+        self.paginator = paginator
+        self.keyset_page = page
+        self.result_count = int(paginator.count)
+        self.result_count_display = str(paginator.count)
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.result_list = page.object_list
+        self.can_show_all = False
+        self.multi_page = page.has_next or page.has_previous
+        self.first_page_url = self.get_query_string(remove=[PAGE_VAR])
+        self.next_page_url = page.has_next and self.get_query_string({PAGE_VAR: page.next_cursor})
+        self.previous_page_url = page.has_previous and self.get_query_string({PAGE_VAR: page.previous_cursor})
+
+    def get_ordering(self, request, queryset):
+        return list(self.model_admin.keyset_ordering)
+
+
+class KeysetPaginationMixin:
+    """
+    Opt a ModelAdmin into keyset pagination. Set keyset_ordering to columns
+    covered by an index, e.g. ('-timestamp', '-id'). Column sorting is
+    disabled because other orders could not use the cursor.
+    """
+    keyset_ordering = ('-pk',)
+    exact_count_below = 10000
+    show_full_result_count = False
+    sortable_by = ()
+    change_list_template = 'admin/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+# ============== API ==============
+
+class KeysetPagination(BasePagination):
+    """
+    DRF pagination over KeysetPaginator. Views set keyset_ordering (or
+    inherit ordering from this class) and may override page_size.
+    """
+    ordering = ('-pk',)
+    page_size = 100
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'keyset_ordering', self.ordering)
+        self.paginator = KeysetPaginator(queryset, ordering, self.get_page_size(request))
+        self.request = request
+        try:
+            self.page = self.paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return self.page.object_list
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        count = self.paginator.count
+        return Response({
+            'count': int(count),
+            'count_is_exact': count.exact,
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+            'first': remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param),
+            'results': data,
+        })
@@ -0,0 +1,183 @@
+"""
+Payment gateway callbacks: acknowledged at once, applied by workers.
+
+The callback view checks a callback's signature and fields and stores it
+as a PaymentCallback with one INSERT that ignores conflicts on its
+(gateway reference, result) key, then answers 202. Gateway retries of a
+callback hit the key and are acknowledged without being queued again;
+nothing else happens in the request.
+
+Workers (the process_payment_callbacks command, or drain_callbacks())
+claim the oldest queued callbacks in batches with an UPDATE conditional
+on them still being queued, so any number of workers can run without
+two of them taking the same callback. Each batch is applied in one
+transaction with a fixed number of queries:
+
+    1  payments the batch refers to, by gateway reference or transaction id
+    1  prepared UPDATE, run through executemany(), of every payment still
+       open: status, paid_at, processing fee and net amount
+       (reconciliation.write_payments)
+    1  roll-up of the orders of completed payments to partial or paid
+       (reconciliation.roll_up_orders)
+    1  UPDATE per outcome marking the callbacks applied, ignored or rejected
+
+A callback for a payment already settled is ignored, so replays and late
+retries change nothing. Callbacks for unknown payments or for the wrong
+amount are rejected with the reason in error. A batch that fails goes
+back on the queue until it has been tried MAX_ATTEMPTS times, and
+callbacks claimed by a worker that died are taken over after CLAIM_TIMEOUT.
+"""
+
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import ROUND_HALF_UP
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+from uuid import uuid4
+import hashlib
+import hmac
+
+from .delivery_quotes import CENTS
+from .models import Payment, PaymentCallback
+from .reconciliation import OPEN_STATUSES, roll_up_orders, write_payments
+
+
+BATCH_SIZE = 500
+
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+MAX_ATTEMPTS = 5
+
+SIGNATURE_HEADER = 'X-Callback-Signature'
+
+
+def callback_signature(body, secret):
+    """Hex HMAC-SHA256 of a raw callback body, as the gateway signs it"""
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def processing_fee(amount, percentage):
+    return (amount * percentage / 100).quantize(CENTS, ROUND_HALF_UP)
+
+
+def enqueue_callback(gateway_reference, transaction_id, result, amount, payload=None):
+    """Queue a validated callback; a callback already queued with the same outcome is left as it is"""
+    PaymentCallback.objects.bulk_create([
+        PaymentCallback(
+            gateway_reference=gateway_reference, transaction_id=transaction_id,
+            result=result, amount=amount, payload=payload or {},
+        ),
+    ], ignore_conflicts=True)
+
+
+def waiting_callbacks(now):
+    stale = now - CLAIM_TIMEOUT
+    return PaymentCallback.objects.filter(
+        Q(state='queued') | Q(state='processing', claimed_at__lt=stale), attempts__lt=MAX_ATTEMPTS,
+    )
+
+
+def claim_callbacks(batch_size=BATCH_SIZE):
+    """Take up to batch_size of the oldest waiting callbacks for this worker"""
+    now = timezone.now()
+    ids = list(waiting_callbacks(now).order_by('pk').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    claim = uuid4().hex
+    # Conditional on the callbacks still waiting, so a callback is claimed once
+    waiting_callbacks(now).filter(pk__in=ids).update(
+        state='processing', claimed_by=claim, claimed_at=now, attempts=F('attempts') + 1,
+    )
+    return list(PaymentCallback.objects.filter(pk__in=ids, state='processing', claimed_by=claim).order_by('pk'))
+
+
+def apply_callbacks(callbacks):
+    """Apply claimed callbacks to their payments and orders; returns {callback state: count}"""
+    now = timezone.now()
+    outcomes = defaultdict(list)
+    updates = []
+    paid_orders = set()
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update().select_related('payment_method').filter(
+                Q(gateway_reference__in={callback.gateway_reference for callback in callbacks})
+                | Q(transaction_id__in={callback.transaction_id for callback in callbacks})
+            )
+        )
+        by_reference = {payment.gateway_reference: payment for payment in payments if payment.gateway_reference}
+        by_transaction = {payment.transaction_id: payment for payment in payments}
+
+        for callback in callbacks:
+            payment = by_reference.get(callback.gateway_reference) or by_transaction.get(callback.transaction_id)
+            if payment is None:
+                outcomes['rejected', 'Unknown payment'].append(callback.pk)
+                continue
+            if payment.status not in OPEN_STATUSES:
+                outcomes['ignored', f'Payment already {payment.status}'].append(callback.pk)
+                continue
+            if callback.amount != payment.amount:
+                outcomes['rejected', f'Amount does not match payment of {payment.amount}'].append(callback.pk)
+                continue
+            fee = processing_fee(payment.amount, payment.payment_method.processing_fee_percentage)
+            # Later callbacks of this batch for the payment see it settled
+            payment.status = callback.result
+            updates.append((
+                callback.result, now if callback.result == 'completed' else None, fee, payment.amount - fee,
+                callback.gateway_reference, callback.payload, payment.pk,
+            ))
+            if callback.result == 'completed':
+                paid_orders.add(payment.order_id)
+            outcomes['applied', ''].append(callback.pk)
+
+        if updates:
+            write_payments(
+                ['status', 'paid_at', 'processing_fee', 'net_amount', 'gateway_reference', 'gateway_response'], updates,
+            )
+        if paid_orders:
+            roll_up_orders(paid_orders)
+        done = Counter()
+        for (state, error), ids in outcomes.items():
+            PaymentCallback.objects.filter(pk__in=ids).update(state=state, error=error, processed_at=now)
+            done[state] += len(ids)
+    return done
+
+
+def requeue_callbacks(callbacks, error):
+    """Put a failed batch back on the queue, giving up on callbacks tried MAX_ATTEMPTS times"""
+    PaymentCallback.objects.filter(pk__in=[callback.pk for callback in callbacks]).update(
+        state=Case(When(attempts__gte=MAX_ATTEMPTS, then=Value('rejected')), default=Value('queued')),
+        claimed_by='', error=error[:255],
+    )
+
+
+def drain_queue(batch_size=BATCH_SIZE):
+    """Claim and apply batches until the queue is empty; returns {callback state: count}"""
+    done = Counter()
+    while callbacks := claim_callbacks(batch_size):
+        try:
+            done += apply_callbacks(callbacks)
+        except DatabaseError as e:
+            requeue_callbacks(callbacks, str(e))
+            done['requeued'] += len(callbacks)
+    return done
+
+
+def drain_callbacks(workers=4, batch_size=BATCH_SIZE):
+    """
+    Apply every waiting callback with a pool of worker threads, each with
+    its own database connection, or in this thread with workers=1.
+    Returns {callback state: count}.
+    """
+    if workers <= 1:
+        return drain_queue(batch_size)
+
+    def worker(_):
+        try:
+            return drain_queue(batch_size)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(worker, range(workers)), Counter())
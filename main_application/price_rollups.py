@@ -0,0 +1,309 @@
+"""
+Pre-aggregated market price series.
+
+MarketPriceRollup keeps one row per (period, period start, crop, county,
+quality grade, root unit) holding the count, sum, sum of squares, minimum
+and maximum of the prices recorded in it. Prices are read from the stored
+price_per_base_unit (see units.py) so a bag and a kilogram price of the
+same crop land in the same cell. Charts read the few hundred rows of one
+series instead of scanning raw prices, and the average, spread and
+volatility of any period follow from the stored sums.
+
+A new price is added to its day, week and month cells with one UPDATE
+each (see signals.py). Editing or deleting a price recomputes the cells
+it touched from the indexed raw rows, since a minimum cannot be
+decremented. Writes that bypass signals (bulk_create, QuerySet.update)
+and changes to a unit's conversion factor need refresh_price_rollups().
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, FloatField, Max, Min, Sum, Value
+from django.db.models.functions import Cast, Greatest, Least, TruncMonth, TruncWeek
+from math import sqrt
+
+from .models import MarketPrice, MarketPriceRollup, ProductUnit
+from .units import unit_graph
+
+
+PERIODS = ['day', 'week', 'month']
+
+# MarketPriceRollup columns identifying a cell, in key order
+KEY_FIELDS = ['period', 'period_start', 'crop_id', 'county_id', 'quality_grade', 'unit_id']
+
+PRICE_PLACES = Decimal('0.0001')
+
+
+def period_start(period, day):
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    raise ValueError(f"Unknown period: {period}")
+
+
+def period_end(period, start):
+    """First day after the period beginning on start"""
+    if period == 'day':
+        return start + timedelta(days=1)
+    if period == 'week':
+        return start + timedelta(days=7)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def price_snapshot(price_id):
+    """(cell keys, price per root unit) of a stored price, or None; no keys if it does not convert"""
+    row = MarketPrice.objects.filter(pk=price_id).values_list(
+        'date_recorded', 'crop_id', 'location_id', 'quality_grade', 'price_per_base_unit', 'unit_id',
+    ).first()
+    if row is None:
+        return None
+    day, crop_id, county_id, grade, price, unit_id = row
+    root_unit_id = unit_graph().root(unit_id)
+    if price is None or root_unit_id is None:
+        return [], None
+    keys = [
+        (period, period_start(period, day), crop_id, county_id, grade, root_unit_id)
+        for period in PERIODS
+    ]
+    return keys, price
+
+
+def add_price(keys, price):
+    """Add one normalized price to each of its cells"""
+    if price is None:
+        return
+    value = float(price)
+    for key in keys:
+        cell = MarketPriceRollup.objects.filter(**dict(zip(KEY_FIELDS, key)))
+        changes = {
+            'count': F('count') + 1,
+            'price_sum': F('price_sum') + value,
+            'price_sq_sum': F('price_sq_sum') + value * value,
+            'min_price': Least(F('min_price'), Value(price)),
+            'max_price': Greatest(F('max_price'), Value(price)),
+        }
+        if cell.update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                MarketPriceRollup.objects.create(
+                    count=1, price_sum=value, price_sq_sum=value * value,
+                    min_price=price, max_price=price, **dict(zip(KEY_FIELDS, key)),
+                )
+        except IntegrityError:
+            # Created concurrently since the UPDATE above
+            cell.update(**changes)
+
+
+def price_aggregates():
+    as_float = Cast(F('price_per_base_unit'), FloatField())
+    return {
+        'n': Count('pk'),
+        's': Sum(as_float),
+        'sq': Sum(as_float * as_float, output_field=FloatField()),
+        'lo': Min('price_per_base_unit'),
+        'hi': Max('price_per_base_unit'),
+    }
+
+
+def convertible_prices(queryset=None):
+    queryset = MarketPrice.objects.all() if queryset is None else queryset
+    return queryset.filter(price_per_base_unit__isnull=False)
+
+
+def recompute_cells(keys):
+    """Rebuild the given cells from raw prices, dropping cells left empty"""
+    for key in set(keys):
+        period, start, crop_id, county_id, grade, unit_id = key
+        totals = convertible_prices().filter(
+            unit_id__in=unit_graph().members(unit_id), crop_id=crop_id, location_id=county_id, quality_grade=grade,
+            date_recorded__gte=start, date_recorded__lt=period_end(period, start),
+        ).aggregate(**price_aggregates())
+        cell = MarketPriceRollup.objects.filter(**dict(zip(KEY_FIELDS, key)))
+        if not totals['n']:
+            cell.delete()
+            continue
+        MarketPriceRollup.objects.update_or_create(
+            **dict(zip(KEY_FIELDS, key)),
+            defaults={
+                'count': totals['n'], 'price_sum': totals['s'], 'price_sq_sum': totals['sq'],
+                'min_price': totals['lo'], 'max_price': totals['hi'],
+            },
+        )
+
+
+def period_start_expression(period):
+    if period == 'day':
+        return F('date_recorded')
+    return (TruncWeek if period == 'week' else TruncMonth)('date_recorded')
+
+
+def cell_rows(period, queryset=None):
+    """Aggregate query yielding one row per cell, columns in ROLLUP_COLUMNS order"""
+    keys = {
+        'rollup_period': Value(period), 'rollup_start': period_start_expression(period),
+        'rollup_crop': F('crop_id'), 'rollup_county': F('location_id'),
+        'rollup_grade': F('quality_grade'), 'rollup_unit': unit_graph().root_expression(),
+    }
+    return (
+        convertible_prices(queryset).order_by()
+        .annotate(**keys).values(*keys)
+        .annotate(**price_aggregates())
+        .values_list(*keys, *price_aggregates())
+    )
+
+
+ROLLUP_COLUMNS = KEY_FIELDS + ['count', 'price_sum', 'price_sq_sum', 'min_price', 'max_price']
+
+
+def compute_cells(period, queryset=None):
+    """Yield MarketPriceRollup rows for one period computed from raw prices"""
+    for row in cell_rows(period, queryset).iterator(chunk_size=2000):
+        cell = MarketPriceRollup(**dict(zip(ROLLUP_COLUMNS, row)))
+        # Rounded as the column stores them; SQLite returns the raw quotient
+        cell.min_price = Decimal(cell.min_price).quantize(PRICE_PLACES)
+        cell.max_price = Decimal(cell.max_price).quantize(PRICE_PLACES)
+        yield cell
+
+
+def insert_cells(period, queryset=None):
+    """
+    Write the cells of one period with a single INSERT ... SELECT, so the
+    aggregates never round-trip through Python. Returns the rows written.
+    """
+    sql, params = cell_rows(period, queryset).query.sql_with_params()
+    qn = connection.ops.quote_name
+    columns = ', '.join(qn(MarketPriceRollup._meta.get_field(name).column) for name in ROLLUP_COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {qn(MarketPriceRollup._meta.db_table)} ({columns}) {sql}', params)
+        return cursor.rowcount
+
+
+def refresh_price_rollups(since=None):
+    """
+    Recompute every cell of every period from raw prices, or only the
+    cells of periods reaching since or later (e.g. after bulk-loading
+    recent prices). Returns the number of cells written.
+    """
+    written = 0
+    with transaction.atomic():
+        for period in PERIODS:
+            stale = MarketPriceRollup.objects.filter(period=period)
+            prices = None
+            if since is not None:
+                start = period_start(period, since)
+                stale = stale.filter(period_start__gte=start)
+                prices = MarketPrice.objects.filter(date_recorded__gte=start)
+            stale.delete()
+            written += insert_cells(period, prices)
+    return written
+
+
+def find_rollup_drift():
+    """[(cell key, stored count, actual count)] for cells whose count or range disagrees"""
+    def summary(rows):
+        return {
+            tuple(getattr(row, field) for field in KEY_FIELDS): (row.count, row.min_price, row.max_price)
+            for row in rows
+        }
+
+    actual = summary(cell for period in PERIODS for cell in compute_cells(period))
+    stored = summary(MarketPriceRollup.objects.iterator(chunk_size=2000))
+    missing = (0, None, None)
+    return [
+        (key, stored.get(key, missing)[0], actual.get(key, missing)[0])
+        for key in sorted(set(actual) | set(stored), key=str)
+        if stored.get(key, missing) != actual.get(key, missing)
+    ]
+
+
+class PricePoint:
+    """Price statistics of one period, in the unit of the series"""
+
+    def __init__(self, start, count, price_sum, price_sq_sum, min_price, max_price, scale=1):
+        self.start = start
+        self.count = count
+        mean = price_sum / count
+        variance = max(price_sq_sum / count - mean * mean, 0.0)
+        self.avg = mean * scale
+        self.stddev = sqrt(variance) * scale
+        self.min = float(min_price) * scale
+        self.max = float(max_price) * scale
+
+    @property
+    def volatility(self):
+        """Coefficient of variation: standard deviation relative to the average"""
+        return self.stddev / self.avg if self.avg else 0.0
+
+    def as_dict(self):
+        return {
+            'period_start': self.start, 'count': self.count, 'avg': round(self.avg, 2),
+            'min': round(self.min, 2), 'max': round(self.max, 2),
+            'stddev': round(self.stddev, 2), 'volatility': round(self.volatility, 4),
+        }
+
+    def __repr__(self):
+        return f"<PricePoint {self.start} avg={self.avg:.2f} n={self.count}>"
+
+
+class PriceSeries:
+    """Consecutive PricePoints for one crop, priced in unit"""
+
+    def __init__(self, crop_id, period, unit, points):
+        self.crop_id = crop_id
+        self.period = period
+        self.unit = unit
+        self.points = points
+
+    def __iter__(self):
+        return iter(self.points)
+
+    def __len__(self):
+        return len(self.points)
+
+    def __repr__(self):
+        return f"<PriceSeries crop={self.crop_id} {self.period} ({len(self.points)} points)>"
+
+
+def price_series(crop_id, period='week', county_id=None, quality_grade=None, unit=None, start=None, end=None):
+    """
+    Price statistics per period for a crop, from the rollups alone. Counties
+    and grades are combined unless county_id/quality_grade narrow them.
+    Prices are given per unit (a ProductUnit), by default the root unit
+    most of the crop's prices convert to. Raises ValueError for a unit
+    that does not convert.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period: {period}")
+    cells = MarketPriceRollup.objects.filter(crop_id=crop_id, period=period)
+    if county_id is not None:
+        cells = cells.filter(county_id=county_id)
+    if quality_grade is not None:
+        cells = cells.filter(quality_grade=quality_grade)
+    if start is not None:
+        cells = cells.filter(period_start__gte=period_start(period, start))
+    if end is not None:
+        cells = cells.filter(period_start__lte=end)
+
+    if unit is None:
+        busiest = cells.order_by().values('unit').annotate(n=Sum('count')).order_by('-n', 'unit').first()
+        if busiest is None:
+            return PriceSeries(crop_id, period, None, [])
+        unit = ProductUnit.objects.get(pk=busiest['unit'])
+    graph = unit_graph()
+    root_unit_id, factor = graph.root(unit.pk), graph.factor(unit.pk)
+    if root_unit_id is None or not factor:
+        raise ValueError(f"{unit} cannot be converted to a base unit")
+    scale = float(factor)
+
+    rows = (
+        cells.filter(unit_id=root_unit_id).order_by()
+        .values_list('period_start')
+        .annotate(Sum('count'), Sum('price_sum'), Sum('price_sq_sum'), Min('min_price'), Max('max_price'))
+        .order_by('period_start')
+    )
+    return PriceSeries(crop_id, period, unit, [PricePoint(*row, scale=scale) for row in rows])
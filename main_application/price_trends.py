@@ -0,0 +1,155 @@
+"""
+Price trend classification computed over every market price series at once.
+
+A series is the prices of one crop in one county, in date order, read from
+their stored price per base unit (see units.py). All series are loaded into one contiguous NumPy
+array sorted by (crop, county, date), and every statistic is computed with
+cumulative sums that restart at series boundaries, so there is no Python
+loop per row or per series:
+
+    moving_average    mean of the last WINDOW prices
+    price_change      change of the moving average over the last WINDOW prices
+    price_volatility  standard deviation of the last WINDOW price-to-price returns
+    price_trend       Rising/Falling when price_change passes +/-TREND_THRESHOLD,
+                      else Stable
+
+Results are written back by one prepared UPDATE run through executemany().
+Prices saved since the last run keep blank metrics until
+classify_price_trends() runs again.
+"""
+
+from django.db import connection, transaction
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from itertools import islice
+import numpy as np
+
+from .models import MarketPrice
+from .units import unit_graph
+
+
+WINDOW = 7
+
+TREND_THRESHOLD = 0.02
+
+# price_trend labels by code: 0 Falling, 1 Stable, 2 Rising
+TREND_LABELS = np.array(['Falling', 'Stable', 'Rising'], dtype=object)
+
+FETCH_SIZE = 100_000
+
+WRITE_BATCH = 10_000
+
+
+class PriceArrays:
+    """Column arrays of the prices being classified, sorted by series and date"""
+
+    def __init__(self, ids, crops, counties, prices, factors):
+        self.ids = ids
+        self.crops = crops
+        self.counties = counties
+        self.prices = prices
+        self.factors = factors
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def load_prices(queryset=None):
+    """Read (id, crop, county, base unit price, conversion factor) columns into arrays"""
+    queryset = MarketPrice.objects.all() if queryset is None else queryset
+    rows = (
+        queryset.filter(price_per_base_unit__isnull=False)
+        .order_by('crop_id', 'location_id', 'date_recorded', 'id')
+        .values_list('id', 'crop_id', 'location_id', Cast(F('price_per_base_unit'), FloatField()), 'unit_id')
+    )
+    sql, params = rows.query.sql_with_params()
+    chunks = []
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        while batch := cursor.fetchmany(FETCH_SIZE):
+            chunks.append(np.array(batch, dtype=np.float64))
+    data = np.concatenate(chunks) if chunks else np.empty((0, 5))
+    ids, crops, counties, units = (data[:, i].astype(np.int64) for i in (0, 1, 2, 4))
+    return PriceArrays(ids, crops, counties, data[:, 3], unit_graph().factor_array(units))
+
+
+def series_positions(crops, counties):
+    """Index of each price within its (crop, county) series"""
+    n = len(crops)
+    first = np.ones(n, dtype=bool)
+    first[1:] = (crops[1:] != crops[:-1]) | (counties[1:] != counties[:-1])
+    starts = np.flatnonzero(first)
+    return np.arange(n) - np.repeat(starts, np.diff(np.append(starts, n)))
+
+
+def rolling_sum(values, width):
+    """Sum of the width[i] values ending at i (width 0 gives 0)"""
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    end = np.arange(1, len(values) + 1)
+    return sums[end] - sums[end - width]
+
+
+def compute_trends(prices, positions, window=WINDOW, threshold=TREND_THRESHOLD):
+    """
+    (moving average, change, volatility, trend code) arrays for prices laid
+    out in series order, positions as given by series_positions().
+    """
+    index = np.arange(len(prices))
+    width = np.minimum(positions + 1, window)
+    moving_average = rolling_sum(prices, width) / width
+
+    lag = np.minimum(positions, window)
+    change = moving_average / moving_average[index - lag] - 1
+
+    # Return from the previous price of the same series; none for the first price
+    returns = np.zeros(len(prices))
+    has_previous = positions > 0
+    returns[has_previous] = prices[has_previous] / prices[index[has_previous] - 1] - 1
+    n = np.minimum(positions, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = rolling_sum(returns, n) / n
+        variance = rolling_sum(returns * returns, n) / n - mean * mean
+    volatility = np.where(n > 0, np.sqrt(np.clip(variance, 0, None)), 0.0)
+
+    trend = np.ones(len(prices), dtype=np.int8)
+    trend[change > threshold] = 2
+    trend[change < -threshold] = 0
+    return moving_average, change, volatility, trend
+
+
+def write_trends(ids, moving_average, change, volatility, trend):
+    """Store the computed metrics with one prepared UPDATE per batch of rows"""
+    qn = connection.ops.quote_name
+    table = MarketPrice._meta.db_table
+    columns = [MarketPrice._meta.get_field(name).column for name in (
+        'price_trend', 'moving_average', 'price_change', 'price_volatility',
+    )]
+    sql = (
+        f'UPDATE {qn(table)} SET ' + ', '.join(f'{qn(column)} = %s' for column in columns)
+        + f' WHERE {qn(MarketPrice._meta.pk.column)} = %s'
+    )
+    rows = zip(
+        TREND_LABELS[trend].tolist(), np.round(moving_average, 2).tolist(),
+        change.tolist(), volatility.tolist(), ids.tolist(),
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        while batch := list(islice(rows, WRITE_BATCH)):
+            cursor.executemany(sql, batch)
+
+
+def classify_price_trends(queryset=None, window=WINDOW, threshold=TREND_THRESHOLD):
+    """
+    Recompute the trend metrics of every price in queryset (all prices by
+    default) and return {trend label: number of prices}. Filter whole
+    series only, e.g. by crop or location; a date filter would cut the
+    windows short.
+    """
+    arrays = load_prices(queryset)
+    if not len(arrays):
+        return {}
+    positions = series_positions(arrays.crops, arrays.counties)
+    moving_average, change, volatility, trend = compute_trends(arrays.prices, positions, window, threshold)
+    # Moving averages are stored in each row's own unit
+    write_trends(arrays.ids, moving_average * arrays.factors, change, volatility, trend)
+    counts = np.bincount(trend, minlength=len(TREND_LABELS))
+    return {label: int(n) for label, n in zip(TREND_LABELS, counts) if n}
@@ -0,0 +1,100 @@
+"""
+Denormalized review aggregates stored on Product.
+
+Product.rating_sum, rating_count and avg_rating let catalog queries sort
+and display ratings without touching the reviews table. Review saves and
+deletes apply deltas with F-expressions (see signals.py); anything that
+bypasses signals (bulk_create, QuerySet.update/delete, raw SQL) should be
+followed by rebuild_ratings(), and find_drift() reports rows that disagree
+with the reviews table.
+"""
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import Product, ProductReview
+
+
+def average(rating_sum, rating_count):
+    """avg_rating expression for the given sum/count expressions (0 with no reviews)"""
+    return Coalesce(
+        Cast(rating_sum, FloatField()) / NullIf(rating_count, 0),
+        Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def apply_rating_change(product_id, sum_delta, count_delta):
+    """Shift one product's aggregates by a delta in a single UPDATE"""
+    if not sum_delta and not count_delta:
+        return
+    new_sum = F('rating_sum') + sum_delta
+    new_count = F('rating_count') + count_delta
+    Product.objects.filter(pk=product_id).update(
+        # Listed first: MySQL evaluates SET clauses left to right, so this
+        # must read the columns before they are changed, as SQLite and
+        # PostgreSQL always do.
+        avg_rating=average(new_sum, new_count),
+        rating_sum=new_sum,
+        rating_count=new_count,
+    )
+
+
+def review_subqueries():
+    """Correlated (sum, count) subqueries over the reviews of OuterRef('pk')"""
+    reviews = (
+        ProductReview.objects.filter(product=OuterRef('pk'))
+        .order_by().values('product')
+        .annotate(total=Sum('rating'), n=Count('pk'))
+    )
+    return (
+        Coalesce(Subquery(reviews.values('total')), 0),
+        Coalesce(Subquery(reviews.values('n')), 0),
+    )
+
+
+def find_drift(queryset=None):
+    """Products whose stored sum or count disagrees with their reviews"""
+    queryset = Product.objects.all() if queryset is None else queryset
+    review_sum, review_count = review_subqueries()
+    return queryset.annotate(review_sum=review_sum, review_count=review_count).exclude(
+        Q(rating_sum=F('review_sum')) & Q(rating_count=F('review_count'))
+    )
+
+
+def pk_ranges(queryset, batch_size):
+    """(low, high) primary key bounds covering queryset in batch_size slices"""
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    low = None
+    while True:
+        page = pks.filter(pk__gt=low) if low is not None else pks
+        bounds = list(page[:batch_size])
+        if not bounds:
+            return
+        yield bounds[0], bounds[-1]
+        low = bounds[-1]
+
+
+def rebuild_ratings(queryset=None, batch_size=2000):
+    """
+    Recompute aggregates from the reviews table with one set-based UPDATE
+    per batch_size products, skipping batches that have not drifted.
+    Returns the number of products that had drifted.
+    """
+    queryset = Product.objects.all() if queryset is None else queryset
+    drifted = 0
+    for low, high in pk_ranges(queryset, batch_size):
+        batch = queryset.filter(pk__gte=low, pk__lte=high)
+        with transaction.atomic():
+            stale = find_drift(batch).count()
+            if not stale:
+                continue
+            drifted += stale
+            review_sum, review_count = review_subqueries()
+            batch.update(
+                avg_rating=average(review_sum, review_count),
+                rating_sum=review_sum,
+                rating_count=review_count,
+            )
+    return drifted
@@ -0,0 +1,282 @@
+"""
+Reconciliation of M-Pesa and Airtel Money statement files against Payment.
+
+Statement files are read line by line with csv and never held in memory;
+only the payments that can appear on them are. Those are loaded once into
+hash indexes keyed by gateway reference and by our own transaction id and
+order number (the account reference a buyer types in), each pointing at
+the payment's id, amount, order and status. A statement line matches a
+payment by its receipt or account reference and must carry the same
+amount.
+
+Matched payments are written back in batches with one prepared UPDATE
+run through executemany(), conditional on the payment still being open,
+and each batch rolls its orders' payment_status up to partial or paid in
+one more UPDATE. Lines that cannot be applied are streamed to an
+exception report as they are found:
+
+    unmatched         no payment has the line's receipt or account reference
+    duplicate         the receipt was already applied, in this file or before
+    amount_mismatch   the payment exists but for a different amount
+    invalid           the line's amount or reference cannot be read
+
+Lines that are not successful incoming payments (withdrawals, failed or
+reversed transactions) are counted and skipped.
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from django.db import connection, transaction
+from django.db.models import Case, Exists, F, OuterRef, Subquery, Sum, Value, When
+from django.utils import timezone
+from itertools import islice
+import csv
+
+from .models import Order, Payment
+
+
+BATCH_SIZE = 5000
+
+# How far back payments are loaded for matching by default
+LOOKBACK = timedelta(days=35)
+
+OPEN_STATUSES = ['pending', 'processing']
+
+# Payment types that count towards an order's payment_status
+PAYING_TYPES = ['order', 'partial']
+
+# Statement columns per provider, recognised by the header row
+STATEMENT_FORMATS = {
+    'mpesa': {
+        'reference': 'Receipt No.', 'timestamp': 'Completion Time', 'amount': 'Paid In',
+        'status': 'Transaction Status', 'account': 'A/C No.',
+    },
+    'airtel': {
+        'reference': 'Transaction ID', 'timestamp': 'Transaction Date', 'amount': 'Amount',
+        'status': 'Status', 'account': 'Reference',
+    },
+}
+
+SUCCESSFUL = {'completed', 'success', 'successful'}
+
+TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S', '%d-%m-%Y %H:%M:%S', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%Y-%m-%dT%H:%M:%S']
+
+EXCEPTION_COLUMNS = ['line', 'reason', 'reference', 'account', 'amount', 'payment_id', 'detail']
+
+
+class StatementError(ValueError):
+    pass
+
+
+class StatementLine:
+    __slots__ = ['number', 'reference', 'account', 'amount', 'status', 'timestamp']
+
+    def __init__(self, number, reference, account, amount, status, timestamp):
+        self.number = number
+        self.reference = reference
+        self.account = account
+        self.amount = amount
+        self.status = status
+        self.timestamp = timestamp
+
+
+def parse_amount(value):
+    """Decimal amount of a statement cell such as '1,250.00', or None if blank"""
+    value = (value or '').replace(',', '').strip()
+    if not value:
+        return None
+    return Decimal(value)
+
+
+def parse_timestamp(value):
+    value = (value or '').strip()
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return timezone.make_aware(datetime.strptime(value, fmt))
+        except ValueError:
+            continue
+    return None
+
+
+def read_statement(lines, provider=None):
+    """
+    Yield StatementLines from an iterable of text lines (an open file).
+    Preamble rows before the header are skipped; the provider is detected
+    from the header unless given. Unreadable amounts come back as None and
+    timestamps are left as text for parse_timestamp().
+    """
+    rows = enumerate(csv.reader(lines), start=1)
+    positions = None
+    for number, row in rows:
+        cells = [cell.strip() for cell in row]
+        for name, fields in STATEMENT_FORMATS.items():
+            if provider in (None, name) and all(fields[key] in cells for key in ('reference', 'amount', 'status')):
+                positions = [
+                    cells.index(fields[key]) if fields[key] in cells else None
+                    for key in ('reference', 'account', 'amount', 'status', 'timestamp')
+                ]
+                break
+        if positions is not None:
+            break
+    else:
+        raise StatementError("No M-Pesa or Airtel statement header found")
+
+    width = max(position for position in positions if position is not None) + 1
+    for number, row in rows:
+        if len(row) < width:
+            if not any(cell.strip() for cell in row):
+                continue
+            row = row + [''] * (width - len(row))
+        reference, account, amount, status, timestamp = (
+            row[position].strip() if position is not None else '' for position in positions
+        )
+        try:
+            amount = parse_amount(amount)
+        except InvalidOperation:
+            amount = None
+        yield StatementLine(number, reference, account, amount, status.lower(), timestamp)
+
+
+class PaymentIndex:
+    """Payments that can appear on a statement, hashed by every reference a line may carry"""
+
+    def __init__(self, payments):
+        self.by_reference = {}
+        self.by_account = {}
+        # payment id: [amount, order id, status]
+        self.payments = {}
+        rows = payments.values_list('pk', 'amount', 'order_id', 'status', 'gateway_reference', 'transaction_id', 'order__order_number')
+        for pk, amount, order_id, status, reference, transaction_id, order_number in rows.iterator(chunk_size=BATCH_SIZE):
+            self.payments[pk] = [amount, order_id, status]
+            if reference:
+                self.by_reference[reference] = pk
+            self.by_account[transaction_id] = pk
+            # An order number only identifies a payment if it has just one open payment
+            if status in OPEN_STATUSES and order_number:
+                self.by_account[order_number] = None if order_number in self.by_account else pk
+
+    def __len__(self):
+        return len(self.payments)
+
+    def find(self, line):
+        """Id of the payment a line pays, by receipt first and account reference second, or None"""
+        pk = self.by_reference.get(line.reference)
+        if pk is None and line.account:
+            pk = self.by_account.get(line.account)
+        return pk
+
+
+class ReconciliationReport:
+    def __init__(self):
+        self.lines = 0
+        self.matched = 0
+        self.skipped = 0
+        self.exceptions = Counter()
+        self.orders_updated = 0
+
+    def __repr__(self):
+        return (
+            f"<ReconciliationReport {self.lines} lines: {self.matched} matched, {self.skipped} skipped, "
+            f"{sum(self.exceptions.values())} exceptions>"
+        )
+
+
+def write_payments(fields, rows):
+    """
+    Set fields on payments still open with one prepared UPDATE; rows are
+    (value per field..., payment id). Payments settled meanwhile are left alone.
+    """
+    qn = connection.ops.quote_name
+    meta = Payment._meta
+    prepare = [meta.get_field(name) for name in fields]
+    status = qn(meta.get_field('status').column)
+    sql = (
+        f'UPDATE {qn(meta.db_table)} SET ' + ', '.join(f'{qn(field.column)} = %s' for field in prepare)
+        + f' WHERE {qn(meta.pk.column)} = %s AND {status} IN ({", ".join(["%s"] * len(OPEN_STATUSES))})'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (*(field.get_db_prep_save(value, connection) for field, value in zip(prepare, row)), row[-1], *OPEN_STATUSES)
+            for row in rows
+        ])
+
+
+def roll_up_orders(order_ids):
+    """Set payment_status to paid or partial from completed payments; returns orders updated"""
+    completed = Payment.objects.filter(order=OuterRef('pk'), status='completed', payment_type__in=PAYING_TYPES)
+    paid = Subquery(completed.order_by().values('order').annotate(total=Sum('amount')).values('total'))
+    return Order.objects.filter(pk__in=order_ids).exclude(payment_status='refunded').update(
+        payment_status=Case(
+            When(total_amount__lte=paid, then=Value('paid')),
+            When(Exists(completed), then=Value('partial')),
+            default=F('payment_status'),
+        ),
+    )
+
+
+def reconcile_statement(lines, provider=None, payments=None, since=None, exceptions=None, batch_size=BATCH_SIZE):
+    """
+    Apply a statement (an iterable of text lines) to payments: by default
+    every order payment created since LOOKBACK before now. exceptions, if given,
+    is a csv.writer receiving one row per exception in EXCEPTION_COLUMNS.
+    Returns a ReconciliationReport.
+    """
+    if payments is None:
+        payments = Payment.objects.filter(
+            payment_type__in=PAYING_TYPES, created_at__gte=since or timezone.now() - LOOKBACK,
+        )
+    index = PaymentIndex(payments)
+    report = ReconciliationReport()
+    now = timezone.now()
+
+    def reject(line, reason, payment_id=None, detail=''):
+        report.exceptions[reason] += 1
+        if exceptions is not None:
+            exceptions.writerow([line.number, reason, line.reference, line.account, line.amount, payment_id or '', detail])
+
+    def matches(statement):
+        for line in statement:
+            report.lines += 1
+            if line.status not in SUCCESSFUL or (line.amount is not None and line.amount <= 0):
+                report.skipped += 1
+                continue
+            if line.amount is None or not line.reference:
+                reject(line, 'invalid')
+                continue
+            pk = index.find(line)
+            if pk is None:
+                reject(line, 'unmatched')
+                continue
+            amount, order_id, status = index.payments[pk]
+            if status not in OPEN_STATUSES:
+                reject(line, 'duplicate', pk, f'payment already {status}')
+                continue
+            if line.amount != amount:
+                reject(line, 'amount_mismatch', pk, f'expected {amount}')
+                continue
+            index.payments[pk][2] = 'completed'
+            index.by_reference[line.reference] = pk
+            report.matched += 1
+            yield (pk, order_id, parse_timestamp(line.timestamp) or now, line.reference)
+
+    matched = matches(read_statement(lines, provider))
+    while batch := list(islice(matched, batch_size)):
+        with transaction.atomic():
+            write_payments(
+                ['status', 'paid_at', 'gateway_reference'],
+                [('completed', paid_at, reference, pk) for pk, _order_id, paid_at, reference in batch],
+            )
+            report.orders_updated += roll_up_orders({order_id for _pk, order_id, _paid_at, _reference in batch})
+    return report
+
+
+def reconcile_file(path, exceptions_path=None, **kwargs):
+    """reconcile_statement() over a file, writing exceptions to exceptions_path as CSV"""
+    with open(path, newline='', encoding='utf-8-sig') as statement:
+        if exceptions_path is None:
+            return reconcile_statement(statement, **kwargs)
+        with open(exceptions_path, 'w', newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(EXCEPTION_COLUMNS)
+            return reconcile_statement(statement, exceptions=writer, **kwargs)
@@ -0,0 +1,292 @@
+"""
+Product search for buyers and the admin.
+
+On SQLite builds with FTS5 the catalog is indexed in the product_search_fts
+virtual table (rowid = product id) and ranked with bm25. Everywhere else
+ProductSearchToken acts as an inverted index: one row per (term, product)
+carrying a field-weighted score, matched with index range scans.
+
+Either index is kept current by the Product signals in signals.py. Renaming
+a crop, category or county, and writes that bypass signals (bulk_create,
+QuerySet.update, raw SQL), need index_products() or rebuild_index().
+"""
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, IntegerField, Q, Sum, When
+from django.db.models.expressions import RawSQL
+from math import ceil
+import re
+import unicodedata
+
+from .models import Product, ProductSearchToken
+
+
+FTS_TABLE = 'product_search_fts'
+
+# Relative importance of each indexed field, used by both backends
+FIELD_WEIGHTS = {
+    'name': 10,
+    'description': 1,
+    'crop': 5,
+    'category': 3,
+    'county': 2,
+}
+
+DOCUMENT_FIELDS = {
+    'name': 'name',
+    'description': 'description',
+    'crop': 'crop__name',
+    'category': 'crop__category__name',
+    'county': 'farm__location__county__name',
+}
+
+# Product fields whose change requires re-indexing the product
+INDEXED_FIELDS = {'name', 'description', 'crop', 'farm', 'status'}
+
+MAX_TERM_LENGTH = ProductSearchToken._meta.get_field('term').max_length
+
+WORD = re.compile(r'\w+')
+
+_fts_available = {}
+
+
+def tokenize(text):
+    """Lowercased, accent-stripped words of at least two characters"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return [word[:MAX_TERM_LENGTH] for word in WORD.findall(text) if len(word) > 1]
+
+
+def uses_fts():
+    """True when the FTS5 table exists on the current database"""
+    key = connection.settings_dict['NAME']
+    if key not in _fts_available:
+        _fts_available[key] = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_available[key]
+
+
+def _chunks(values, size=500):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _documents(product_ids):
+    fields = ['pk', 'status'] + list(DOCUMENT_FIELDS.values())
+    return Product.objects.filter(pk__in=product_ids).values_list(*fields)
+
+
+def _tokens(document):
+    """ProductSearchToken rows for one (pk, status, *fields) document"""
+    pk, _status, *values = document
+    weights = {}
+    for field, value in zip(DOCUMENT_FIELDS, values):
+        for term in set(tokenize(value)):
+            weights[term] = weights.get(term, 0) + FIELD_WEIGHTS[field]
+    return [ProductSearchToken(term=term, product_id=pk, weight=weight) for term, weight in weights.items()]
+
+
+def index_products(product_ids):
+    """(Re)index the given products, dropping any that no longer exist"""
+    with transaction.atomic(savepoint=False):
+        for chunk in _chunks(product_ids):
+            documents = list(_documents(chunk))
+            if uses_fts():
+                placeholders = ', '.join(['%s'] * len(chunk))
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+                    cursor.executemany(
+                        f'INSERT INTO {FTS_TABLE} (rowid, status, {", ".join(DOCUMENT_FIELDS)}) '
+                        f'VALUES ({", ".join(["%s"] * (len(DOCUMENT_FIELDS) + 2))})',
+                        documents,
+                    )
+            else:
+                ProductSearchToken.objects.filter(product_id__in=chunk).delete()
+                ProductSearchToken.objects.bulk_create(
+                    [token for document in documents for token in _tokens(document)],
+                    batch_size=1000,
+                )
+
+
+def remove_products(product_ids):
+    """Drop products from the index (token rows also cascade with Product)"""
+    for chunk in _chunks(product_ids):
+        if uses_fts():
+            placeholders = ', '.join(['%s'] * len(chunk))
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+        else:
+            ProductSearchToken.objects.filter(product_id__in=chunk).delete()
+
+
+def clear_index():
+    if uses_fts():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    else:
+        ProductSearchToken.objects.all().delete()
+
+
+def rebuild_index(batch_size=2000):
+    """Re-index every product; returns the number indexed"""
+    if uses_fts():
+        # One set-based statement: the joins below are what DOCUMENT_FIELDS spells out
+        query = Product.objects.values_list('pk', 'status', *DOCUMENT_FIELDS.values()).query
+        sql, params = query.sql_with_params()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, status, {", ".join(DOCUMENT_FIELDS)}) {sql}', params,
+            )
+            return cursor.rowcount
+
+    clear_index()
+    indexed = 0
+    last_pk = 0
+    while True:
+        ids = list(
+            Product.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return indexed
+        with transaction.atomic():
+            ProductSearchToken.objects.bulk_create(
+                [token for document in _documents(ids) for token in _tokens(document)],
+                batch_size=1000,
+            )
+        indexed += len(ids)
+        last_pk = ids[-1]
+
+
+def query_terms(query):
+    """
+    Distinct words of query, dropping any that is a prefix of another word:
+    a product matching the longer word matches the shorter one too.
+    """
+    words = sorted(set(tokenize(query)), key=len, reverse=True)
+    terms = []
+    for word in words:
+        if not any(term.startswith(word) for term in terms):
+            terms.append(word)
+    return terms
+
+
+def _fts_query(terms, statuses=None):
+    # Terms are \w+ only, so quoting them cannot inject FTS5 syntax. They
+    # match the document columns only, never status, as with ProductSearchToken
+    query = '{%s} : (%s)' % (' '.join(DOCUMENT_FIELDS), ' AND '.join(f'"{term}"*' for term in terms))
+    if statuses:
+        # status is an indexed column so the filter is served by the index
+        # instead of reading every matching row
+        wanted = ' OR '.join('"{}"'.format(status.replace('"', '')) for status in statuses)
+        query = f'status:({wanted}) AND {query}'
+    return query
+
+
+def _term_filter(term):
+    """Prefix match on term that an index range scan can serve"""
+    return Q(term__gte=term, term__lt=term + '\uffff')
+
+
+def _token_matches(terms, statuses):
+    matches = ProductSearchToken.objects.filter(
+        Q(*[_term_filter(t) for t in terms], _connector=Q.OR)
+    )
+    if statuses:
+        matches = matches.filter(product__status__in=statuses)
+    which_term = Case(
+        *[When(_term_filter(t), then=i) for i, t in enumerate(terms)],
+        output_field=IntegerField(),
+    )
+    return (
+        matches.values('product')
+        .annotate(matched=Count(which_term, distinct=True), score=Sum('weight'))
+        .filter(matched=len(terms))
+    )
+
+
+def matching_products(query, statuses=None):
+    """
+    Expression usable as filter(pk__in=...) selecting every product that
+    contains all words of query (as prefixes); None if query has no words.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return None
+    if uses_fts():
+        sql = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        return RawSQL(sql, [_fts_query(terms, statuses)])
+    return _token_matches(terms, statuses).values('product')
+
+
+class SearchResults:
+    """One ranked page of products matching a search"""
+
+    def __init__(self, query, products, total, page, per_page):
+        self.query = query
+        self.products = products
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+
+    @property
+    def num_pages(self):
+        return max(1, ceil(self.total / self.per_page))
+
+    @property
+    def has_next(self):
+        return self.page < self.num_pages
+
+    def __iter__(self):
+        return iter(self.products)
+
+    def __len__(self):
+        return len(self.products)
+
+    def __repr__(self):
+        return f"<SearchResults {self.query!r} page {self.page} of {self.num_pages} ({self.total} matches)>"
+
+
+def search_products(query, page=1, per_page=20, statuses=('active',), queryset=None):
+    """
+    Rank products matching every word of query (prefix match) and return
+    one page as SearchResults. Each product carries a search_rank; higher
+    is better. statuses=None searches every listing regardless of status.
+    """
+    page = max(1, int(page))
+    offset = (page - 1) * per_page
+    terms = query_terms(query)
+    if not terms:
+        return SearchResults(query, [], 0, page, per_page)
+
+    if uses_fts():
+        where = f'{FTS_TABLE} MATCH %s'
+        params = [_fts_query(terms, statuses)]
+        weights = ', '.join(str(FIELD_WEIGHTS[field]) for field in DOCUMENT_FIELDS)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {FTS_TABLE} WHERE {where}', params)
+            total = cursor.fetchone()[0]
+            # bm25() is negative, more negative meaning a better match
+            cursor.execute(
+                f'SELECT rowid, -bm25({FTS_TABLE}, 0, {weights}) AS score FROM {FTS_TABLE} '
+                f'WHERE {where} ORDER BY score DESC, rowid LIMIT %s OFFSET %s',
+                params + [per_page, offset],
+            )
+            ranked = cursor.fetchall()
+    else:
+        matches = _token_matches(terms, statuses)
+        total = matches.count()
+        ranked = list(matches.order_by('-score', 'product').values_list('product', 'score')[offset:offset + per_page])
+
+    queryset = Product.objects.all() if queryset is None else queryset
+    found = queryset.in_bulk([pk for pk, _ in ranked])
+    products = []
+    for pk, score in ranked:
+        if pk in found:
+            found[pk].search_rank = score
+            products.append(found[pk])
+    return SearchResults(query, products, total, page, per_page)
@@ -0,0 +1,66 @@
+from rest_framework import serializers
+
+from .models import Delivery, MarketPrice, PaymentCallback, Product
+from .tracking import MAX_BATCH
+
+
+class ProductListSerializer(serializers.ModelSerializer):
+    crop = serializers.CharField(source='crop.name')
+    county = serializers.CharField(source='farm.location.county.name')
+    unit = serializers.CharField(source='unit.abbreviation')
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'slug', 'name', 'crop', 'county', 'price_per_unit', 'unit', 'price_per_base_unit',
+            'quantity_available', 'quality_grade', 'organic_certified', 'avg_rating', 'rating_count',
+        ]
+
+
+class ProductSearchResultSerializer(ProductListSerializer):
+    rank = serializers.FloatField(source='search_rank')
+
+    class Meta(ProductListSerializer.Meta):
+        fields = ProductListSerializer.Meta.fields + ['rank']
+
+
+class MarketPriceSerializer(serializers.ModelSerializer):
+    crop = serializers.CharField(source='crop.name')
+    county = serializers.CharField(source='location.name')
+    unit = serializers.CharField(source='unit.abbreviation')
+
+    class Meta:
+        model = MarketPrice
+        fields = [
+            'id', 'crop', 'county', 'market_name', 'price_per_unit', 'unit', 'quality_grade',
+            'supply_level', 'demand_level', 'price_trend', 'date_recorded',
+        ]
+
+
+class PaymentCallbackSerializer(serializers.Serializer):
+    gateway_reference = serializers.CharField(max_length=200)
+    transaction_id = serializers.CharField(max_length=100)
+    result = serializers.ChoiceField(choices=PaymentCallback.RESULT_CHOICES)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+
+
+class TrackingEventSerializer(serializers.Serializer):
+    # A plain id: deliveries are looked up once per batch, not once per event
+    delivery = serializers.IntegerField(min_value=1)
+    recorded_at = serializers.DateTimeField()
+    latitude = serializers.FloatField(min_value=-90, max_value=90, required=False, allow_null=True)
+    longitude = serializers.FloatField(min_value=-180, max_value=180, required=False, allow_null=True)
+    accuracy = serializers.FloatField(min_value=0, required=False, allow_null=True)
+    status = serializers.ChoiceField(choices=Delivery.DELIVERY_STATUS_CHOICES, required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        located = [attrs.get('latitude') is not None, attrs.get('longitude') is not None]
+        if any(located) and not all(located):
+            raise serializers.ValidationError('Latitude and longitude go together.')
+        if not any(located) and not attrs.get('status'):
+            raise serializers.ValidationError('An event needs a position or a status.')
+        return attrs
+
+
+class TrackingBatchSerializer(serializers.Serializer):
+    events = TrackingEventSerializer(many=True, allow_empty=False, max_length=MAX_BATCH)
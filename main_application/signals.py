@@ -0,0 +1,241 @@
+"""
+Signal handlers keeping denormalized columns in step with their sources,
+and the batched hooks run after order status transitions.
+"""
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .delivery_quotes import invalidate_zone_index
+from .facets import FACET_SOURCE_FIELDS, facet_key, move_listing
+from .geo import cell_of
+from .inventory import release_orders
+from .models import (
+    County, Delivery, DeliveryRoute, DeliveryZone, InsuranceClaim, LoanApplication, Location, MarketPrice, Notification,
+    Order, Product, ProductReview, ProductUnit, SchemeApplication, StorageBooking, SupportTicket,
+)
+from .numbering import NUMBERED_FIELDS, next_number
+from .order_states import orders_transitioned
+from .price_rollups import PERIODS, add_price, period_start, price_snapshot, recompute_cells
+from .ratings import apply_rating_change
+from .search import INDEXED_FIELDS, index_products, remove_products
+from .units import invalidate_unit_graph, refresh_base_prices, unit_graph
+
+
+def _touches(update_fields, fields):
+    """Whether a save limited to update_fields may have changed any of fields"""
+    return update_fields is None or bool(fields & {f.removesuffix('_id') for f in update_fields})
+
+
+@receiver(pre_save, sender=ProductReview)
+def remember_review_rating(sender, instance, raw, **kwargs):
+    """Note the stored product/rating so an edit can apply the difference"""
+    if raw or instance.pk is None:
+        return
+    instance._rating_before = (
+        sender.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+    )
+
+
+@receiver(post_save, sender=ProductReview)
+def update_rating_on_save(sender, instance, created, raw, **kwargs):
+    before = instance.__dict__.pop('_rating_before', None)
+    if raw:
+        return
+    if created or before is None:
+        apply_rating_change(instance.product_id, instance.rating, 1)
+        return
+
+    product_id, rating = before
+    if product_id == instance.product_id:
+        apply_rating_change(product_id, instance.rating - rating, 0)
+    else:
+        with transaction.atomic():
+            apply_rating_change(product_id, -rating, -1)
+            apply_rating_change(instance.product_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=ProductReview)
+def update_rating_on_delete(sender, instance, **kwargs):
+    apply_rating_change(instance.product_id, -instance.rating, -1)
+
+
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, raw, update_fields, **kwargs):
+    if raw:
+        return
+    if not _touches(update_fields, INDEXED_FIELDS):
+        return
+    index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index(sender, instance, **kwargs):
+    remove_products([instance.pk])
+
+
+@receiver(pre_save, sender=Product)
+def remember_facet_cell(sender, instance, raw, update_fields, **kwargs):
+    if raw or instance.pk is None or not _touches(update_fields, FACET_SOURCE_FIELDS):
+        return
+    instance._facet_key_before = facet_key(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def update_facet_counts_on_save(sender, instance, raw, update_fields, **kwargs):
+    before = instance.__dict__.pop('_facet_key_before', None)
+    if raw or not _touches(update_fields, FACET_SOURCE_FIELDS):
+        return
+    move_listing(before, facet_key(instance.pk))
+
+
+@receiver(pre_delete, sender=Product)
+def update_facet_counts_on_delete(sender, instance, **kwargs):
+    move_listing(facet_key(instance.pk), None)
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=MarketPrice)
+def set_base_price(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    instance.price_per_base_unit = unit_graph().base_price(instance.price_per_unit, instance.unit_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=MarketPrice)
+def save_base_price(sender, instance, raw, update_fields, **kwargs):
+    # A save limited to update_fields drops the price set above unless listed
+    if update_fields is None or 'price_per_base_unit' in update_fields:
+        return
+    if _touches(update_fields, {'price_per_unit', 'unit'}):
+        sender.objects.filter(pk=instance.pk).update(price_per_base_unit=instance.price_per_base_unit)
+
+
+@receiver(pre_save, sender=Location)
+def set_geo_cell(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    instance.geo_cell = cell_of(instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=Location)
+def save_geo_cell(sender, instance, raw, update_fields, **kwargs):
+    # As with base prices, a save limited to update_fields drops the cell set above unless listed
+    if update_fields is None or 'geo_cell' in update_fields:
+        return
+    if _touches(update_fields, {'latitude', 'longitude'}):
+        sender.objects.filter(pk=instance.pk).update(geo_cell=instance.geo_cell)
+
+
+@receiver(pre_save, sender=ProductUnit)
+@receiver(pre_delete, sender=ProductUnit)
+def remember_unit_factors(sender, instance, **kwargs):
+    # Reloaded, since this process may hold a graph another process has changed
+    invalidate_unit_graph()
+    instance._unit_conversions_before = unit_graph().conversions()
+
+
+@receiver(post_save, sender=ProductUnit)
+@receiver(post_delete, sender=ProductUnit)
+def reprice_on_unit_change(sender, instance, **kwargs):
+    """Drop the cached graph and reprice rows whose unit's root or factor changed"""
+    before = instance.__dict__.pop('_unit_conversions_before', {})
+    invalidate_unit_graph()
+    after = unit_graph().conversions()
+    changed = [unit_id for unit_id, conversion in after.items() if before.get(unit_id) != conversion]
+    if changed:
+        refresh_base_prices(changed)
+
+
+@receiver(post_save, sender=DeliveryRoute)
+def sync_route_deliveries(sender, instance, created, raw, update_fields, **kwargs):
+    """Copy a route's driver and vehicle to its deliveries; a cancelled route lets them be planned again"""
+    if raw or created:
+        return
+    deliveries = Delivery.objects.filter(route=instance)
+    if instance.status == 'cancelled' and _touches(update_fields, {'status'}):
+        deliveries.filter(status='assigned').update(route=None, route_stop=None)
+    elif _touches(update_fields, {'driver_name', 'driver_phone', 'vehicle_details'}):
+        deliveries.update(
+            driver_name=instance.driver_name, driver_phone=instance.driver_phone,
+            vehicle_details=instance.vehicle_details,
+        )
+
+
+@receiver(post_save, sender=DeliveryZone)
+@receiver(post_delete, sender=DeliveryZone)
+@receiver(m2m_changed, sender=DeliveryZone.counties.through)
+@receiver(post_delete, sender=County)
+def drop_zone_index(sender, **kwargs):
+    """Reload the delivery zone index; again on commit, in case it was reloaded mid-transaction"""
+    invalidate_zone_index()
+    transaction.on_commit(invalidate_zone_index)
+
+
+@receiver(pre_save, sender=MarketPrice)
+def remember_price_cells(sender, instance, raw, **kwargs):
+    if raw or instance.pk is None:
+        return
+    instance._price_snapshot_before = price_snapshot(instance.pk)
+
+
+@receiver(post_save, sender=MarketPrice)
+def update_price_rollups_on_save(sender, instance, created, raw, **kwargs):
+    before = instance.__dict__.pop('_price_snapshot_before', None)
+    if raw:
+        return
+    keys, price = price_snapshot(instance.pk)
+    if created or before is None:
+        add_price(keys, price)
+    else:
+        recompute_cells(before[0] + keys)
+
+
+@receiver(post_delete, sender=MarketPrice)
+def update_price_rollups_on_delete(sender, instance, **kwargs):
+    root_unit_id = unit_graph().root(instance.unit_id)
+    if root_unit_id is None:
+        return  # Never rolled up, or deleted along with its unit and the rollups
+    recompute_cells([
+        (period, period_start(period, instance.date_recorded), instance.crop_id,
+         instance.location_id, instance.quality_grade, root_unit_id)
+        for period in PERIODS
+    ])
+
+
+# Order statuses whose committed stock goes back on sale. Not refunded:
+# a refunded order was either delivered, so the goods are with the buyer,
+# or cancelled first, which already released them
+RELEASING_ORDER_STATUSES = {'cancelled'}
+
+
+@receiver(orders_transitioned)
+def release_stock_of_cancelled_orders(sender, order_ids, status, **kwargs):
+    if status in RELEASING_ORDER_STATUSES:
+        release_orders(order_ids)
+
+
+@receiver(orders_transitioned)
+def notify_buyers_of_transition(sender, order_ids, status, **kwargs):
+    label = dict(Order.ORDER_STATUS_CHOICES)[status]
+    Notification.objects.bulk_create([
+        Notification(
+            recipient_id=buyer_id, notification_type='order', related_object_id=str(pk),
+            title=f"Order {number} {label.lower()}", message=f"Your order {number} is now {label.lower()}.",
+        )
+        for pk, number, buyer_id in Order.objects.filter(pk__in=order_ids).values_list('pk', 'order_number', 'buyer_id')
+    ], batch_size=1000)
+
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_save, sender=SupportTicket)
+@receiver(pre_save, sender=StorageBooking)
+@receiver(pre_save, sender=LoanApplication)
+@receiver(pre_save, sender=InsuranceClaim)
+@receiver(pre_save, sender=SchemeApplication)
+def assign_number(sender, instance, raw, **kwargs):
+    field, _prefix = NUMBERED_FIELDS[sender]
+    if not raw and not getattr(instance, field):
+        setattr(instance, field, next_number(sender))
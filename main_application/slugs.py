@@ -0,0 +1,108 @@
+"""
+Unique slug allocation for models that derive a unique field from a name.
+
+Instead of probing ``-1``, ``-2``, ``-3`` ... with one query per attempt, the
+next free suffix for a base slug is kept in a ``SlugSequence`` counter row and
+bumped with a single atomic UPDATE, so allocating a slug costs a constant
+number of queries no matter how many collisions a name already has.
+"""
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Max
+from django.db.models.functions import Cast, Substr
+from django.utils.text import slugify
+
+import re
+
+
+# Room kept at the end of a slug for the "-<n>" suffix
+SUFFIX_RESERVE = 11
+
+# How often a save retries with a fresh slug after losing an insert race
+MAX_SAVE_ATTEMPTS = 5
+
+
+def slug_base(value, max_length=None, fallback='item'):
+    """Slugify value and trim it so a numeric suffix still fits"""
+    base = slugify(value) or fallback
+    if max_length:
+        base = base[:max_length - SUFFIX_RESERVE].rstrip('-') or fallback
+    return base
+
+
+def unique_slug(model, field_name, value, instance=None):
+    """
+    Return a value for model.field_name derived from value that is not
+    used by any other row.
+
+    The plain slug is used when it is free (or already belongs to instance);
+    otherwise the next suffix is taken from the per-base counter.
+    """
+    field = model._meta.get_field(field_name)
+    base = slug_base(value, field.max_length, fallback=model._meta.model_name)
+
+    taken = model._default_manager.filter(**{field_name: base})
+    if instance is not None and instance.pk is not None:
+        taken = taken.exclude(pk=instance.pk)
+    if not taken.exists():
+        return base
+
+    return f'{base}-{next_suffix(model, field_name, base)}'
+
+
+def next_suffix(model, field_name, base):
+    """Atomically reserve the next numeric suffix for base"""
+    from .models import SlugSequence
+
+    scope = f'{model._meta.label_lower}.{field_name}'
+    sequence = SlugSequence.objects.filter(scope=scope, base_slug=base)
+
+    for _ in range(MAX_SAVE_ATTEMPTS):
+        with transaction.atomic():
+            if sequence.update(last_value=F('last_value') + 1):
+                return sequence.values_list('last_value', flat=True).get()
+
+            # First collision for this base: start after the highest suffix
+            # already in the table so rows created before the counter existed
+            # are never reused.
+            start = (max_existing_suffix(model, field_name, base) or 0) + 1
+            try:
+                with transaction.atomic():
+                    SlugSequence.objects.create(scope=scope, base_slug=base, last_value=start)
+            except IntegrityError:
+                # Another writer created the counter first; bump theirs.
+                continue
+            return start
+
+    raise IntegrityError(f'Could not allocate a slug suffix for "{base}"')
+
+
+def max_existing_suffix(model, field_name, base):
+    """Highest n among existing "<base>-<n>" values, in a single query"""
+    return (
+        model._default_manager
+        .filter(**{f'{field_name}__regex': rf'^{re.escape(base)}-[0-9]+$'})
+        .annotate(_suffix=Cast(Substr(field_name, len(base) + 2), models.BigIntegerField()))
+        .aggregate(top=Max('_suffix'))['top']
+    )
+
+
+def save_with_unique_slug(instance, field_name, value, save, *args, **kwargs):
+    """
+    Assign a unique slug to instance.field_name and run save().
+
+    If a concurrent insert takes the same slug between allocation and the
+    INSERT, the IntegrityError is caught and a fresh slug is allocated.
+    """
+    model = type(instance)
+    for attempt in range(MAX_SAVE_ATTEMPTS):
+        setattr(instance, field_name, unique_slug(model, field_name, value, instance))
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            clash = model._default_manager.filter(**{field_name: getattr(instance, field_name)})
+            if instance.pk is not None:
+                clash = clash.exclude(pk=instance.pk)
+            if attempt == MAX_SAVE_ATTEMPTS - 1 or not clash.exists():
+                raise
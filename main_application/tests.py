@@ -1,3 +1,1676 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from decimal import Decimal
 
-# Create your tests here.
+from .models import *
+
+
+def create_marketplace(tag='test'):
+    """Minimal county/farmer/farm/crop/unit rows most tests build on"""
+    county = County.objects.create(name=f'County {tag}', code=tag)
+    subcounty = SubCounty.objects.create(county=county, name=f'Sub {tag}', code=tag)
+    ward = Ward.objects.create(subcounty=subcounty, name=f'Ward {tag}', code=tag)
+    user = CustomUser.objects.create(username=f'farmer_{tag}', phone_number=f'+2547{tag}', user_type='farmer')
+    location = Location.objects.create(
+        user=user, name='Farm', county=county, subcounty=subcounty, ward=ward,
+        village='Village', detailed_address='Plot 1',
+    )
+    farmer = FarmerProfile.objects.create(
+        user=user, farm_name=f'Farm {tag}', farming_type='crop',
+        years_of_experience='beginner', total_farm_size=Decimal('5'),
+    )
+    farm = Farm.objects.create(farmer=farmer, name=f'farm-{tag}', location=location, size=Decimal('5'))
+    category = CropCategory.objects.create(name=f'cereals-{tag}')
+    crop = Crop.objects.create(name=f'maize-{tag}', category=category)
+    unit = ProductUnit.objects.create(name=f'Kilogram {tag}', abbreviation=f'kg{tag}')
+    return {
+        'county': county, 'subcounty': subcounty, 'ward': ward, 'user': user, 'location': location,
+        'farmer': farmer, 'farm': farm, 'category': category, 'crop': crop, 'unit': unit,
+    }
+
+
+def create_product(market, **kwargs):
+    fields = {
+        'farmer': market['farmer'], 'farm': market['farm'], 'crop': market['crop'],
+        'unit': market['unit'], 'name': 'Maize', 'description': 'Dry maize',
+        'quantity_available': Decimal('100'), 'price_per_unit': Decimal('50'),
+        'harvest_date': timezone.now().date(), 'status': 'active',
+    }
+    fields.update(kwargs)
+    return Product.objects.create(**fields)
+
+
+class SlugAllocationTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+
+    def test_colliding_products_get_sequential_suffixes(self):
+        slugs = [create_product(self.market).slug for _ in range(4)]
+        self.assertEqual(slugs, ['maize', 'maize-1', 'maize-2', 'maize-3'])
+
+    def test_suffix_lookup_uses_constant_queries(self):
+        # 8 queries for the save and slug, 3 for the search index, 2 for facet counts
+        for _ in range(3):
+            create_product(self.market)
+        with self.assertNumQueries(13):
+            create_product(self.market)
+        for _ in range(20):
+            create_product(self.market)
+        with self.assertNumQueries(13):
+            create_product(self.market)
+
+    def test_counter_starts_after_existing_suffixes(self):
+        create_product(self.market)
+        create_product(self.market, slug='maize-41')
+        self.assertEqual(create_product(self.market).slug, 'maize-42')
+
+    def test_save_retries_when_allocated_slug_is_taken(self):
+        create_product(self.market)
+        create_product(self.market, slug='maize-1')
+        SlugSequence.objects.create(scope='main_application.product.slug', base_slug='maize', last_value=0)
+        self.assertEqual(create_product(self.market).slug, 'maize-2')
+
+    def test_farm_keeps_its_own_name_on_update(self):
+        farm = Farm.objects.create(
+            farmer=self.market['farmer'], name='Green Acres', location=self.market['location'], size=1,
+        )
+        other = Farm.objects.create(
+            farmer=self.market['farmer'], name='Green Acres', location=self.market['location'], size=1,
+        )
+        self.assertEqual((farm.name, other.name), ('green-acres', 'green-acres-1'))
+
+        farm.size = 2
+        farm.save()
+        self.assertEqual(farm.name, 'green-acres')
+
+
+class BulkImportTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.row = {
+            'farmer': self.market['user'].username, 'farm': self.market['farm'].name,
+            'crop': self.market['crop'].name, 'unit': self.market['unit'].abbreviation,
+            'name': 'Maize', 'description': 'Dry maize', 'quantity_available': '10',
+            'price_per_unit': '45.50', 'harvest_date': '2025-06-01',
+        }
+
+    def test_imports_rows_with_unique_slugs(self):
+        from .bulk_import import import_products
+
+        create_product(self.market)
+        rows = [(i + 2, dict(self.row)) for i in range(5)]
+        report = import_products(rows, batch_size=2, chunk_size=3)
+
+        self.assertEqual((report.rows, report.created, report.errors), (5, 5, []))
+        self.assertEqual(
+            sorted(Product.objects.values_list('slug', flat=True)),
+            ['maize', 'maize-1', 'maize-2', 'maize-3', 'maize-4', 'maize-5'],
+        )
+        # Product.save continues after the imported suffixes
+        self.assertEqual(create_product(self.market).slug, 'maize-6')
+
+    def test_bad_rows_are_reported_without_aborting(self):
+        from .bulk_import import import_products
+
+        rows = [
+            (2, dict(self.row)),
+            (3, dict(self.row, crop='unknown')),
+            (4, dict(self.row, price_per_unit='abc')),
+            (5, dict(self.row, quality_grade='bogus')),
+            (6, dict(self.row)),
+        ]
+        report = import_products(rows)
+
+        self.assertEqual(report.created, 2)
+        self.assertEqual([line for line, _ in report.errors], [3, 4, 5])
+        self.assertIn('Unknown crop', report.errors[0][1])
+
+    def test_reads_csv_and_jsonl(self):
+        from .bulk_import import read_rows
+        import io
+        import json
+
+        csv_rows = list(read_rows(io.StringIO('name,crop\nMaize,maize\n'), 'csv'))
+        jsonl_rows = list(read_rows(io.StringIO(json.dumps(self.row) + '\n\nnot json\n'), 'jsonl'))
+
+        self.assertEqual(csv_rows, [(2, {'name': 'Maize', 'crop': 'maize'})])
+        self.assertEqual(jsonl_rows[0], (1, self.row))
+        self.assertEqual(jsonl_rows[1][0], 3)
+
+
+class RatingAggregateTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.product = create_product(self.market)
+        self.buyers = [
+            CustomUser.objects.create(username=f'buyer{i}', phone_number=f'+2548{i}', user_type='buyer')
+            for i in range(3)
+        ]
+
+    def review(self, buyer, rating, product=None):
+        return ProductReview.objects.create(
+            product=product or self.product, buyer=buyer, rating=rating, title='Good', comment='Fresh',
+        )
+
+    def aggregates(self, product=None):
+        product = product or self.product
+        product.refresh_from_db()
+        return product.rating_sum, product.rating_count, product.avg_rating
+
+    def test_create_edit_and_delete_update_aggregates(self):
+        first = self.review(self.buyers[0], 5)
+        self.review(self.buyers[1], 4)
+        second = self.review(self.buyers[2], 4)
+        self.assertEqual(self.aggregates(), (13, 3, Decimal('4.33')))
+
+        second.rating = 1
+        second.save()
+        self.assertEqual(self.aggregates(), (10, 3, Decimal('3.33')))
+
+        first.delete()
+        ProductReview.objects.filter(buyer=self.buyers[1]).delete()
+        self.assertEqual(self.aggregates(), (1, 1, Decimal('1.00')))
+        second.delete()
+        self.assertEqual(self.aggregates(), (0, 0, Decimal('0.00')))
+
+    def test_saving_a_stale_product_keeps_aggregates(self):
+        from .ratings import find_drift
+
+        stale = Product.objects.get(pk=self.product.pk)
+        self.review(self.buyers[0], 5)
+        stale.name = 'Renamed'
+        stale.save()
+        self.assertEqual(self.aggregates(), (5, 1, Decimal('5.00')))
+        self.assertEqual(self.product.name, 'Renamed')
+        self.assertFalse(find_drift().exists())
+
+    def test_moving_a_review_updates_both_products(self):
+        other = create_product(self.market)
+        review = self.review(self.buyers[0], 3)
+        review.product = other
+        review.rating = 5
+        review.save()
+        self.assertEqual(self.aggregates(), (0, 0, Decimal('0.00')))
+        self.assertEqual(self.aggregates(other), (5, 1, Decimal('5.00')))
+
+    def test_rebuild_repairs_drift(self):
+        from .ratings import find_drift, rebuild_ratings
+
+        ProductReview.objects.bulk_create([
+            ProductReview(product=self.product, buyer=b, rating=r, title='Good', comment='Fresh')
+            for b, r in zip(self.buyers, [5, 3, 2])
+        ])
+        untouched = create_product(self.market)
+        self.assertEqual(list(find_drift()), [self.product])
+
+        self.assertEqual(rebuild_ratings(batch_size=1), 1)
+        self.assertEqual(self.aggregates(), (10, 3, Decimal('3.33')))
+        self.assertEqual(self.aggregates(untouched), (0, 0, Decimal('0.00')))
+        self.assertFalse(find_drift().exists())
+
+
+class ProductSearchTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+
+    def check_search(self):
+        from .search import search_products
+
+        potatoes = create_product(self.market, name='Sweet potatoes', description='Orange fleshed')
+        beans = create_product(self.market, name='Rose coco beans', description='Pairs well with sweet potatoes')
+        vines = create_product(self.market, name='Sweet potato vines', status='draft')
+
+        results = search_products('potat')
+        self.assertEqual([p.pk for p in results], [potatoes.pk, beans.pk])
+        self.assertEqual(results.total, 2)
+        self.assertEqual(len(search_products('potato', statuses=None)), 3)
+        self.assertEqual([p.pk for p in search_products('potatoes beans')], [beans.pk])
+        self.assertEqual([p.pk for p in search_products(f'sweet {self.market["county"].name}')][:1], [potatoes.pk])
+
+        page = search_products('potatoes', page=2, per_page=1)
+        self.assertEqual(([p.pk for p in page], page.num_pages), ([beans.pk], 2))
+
+        potatoes.name, potatoes.description = 'Yellow sorghum', 'Red grain'
+        potatoes.save()
+        vines.delete()
+        self.assertEqual([p.pk for p in search_products('potato', statuses=None)], [beans.pk])
+        self.assertEqual([p.pk for p in search_products('sorghum')], [potatoes.pk])
+        self.assertEqual(search_products('').total, 0)
+        # Status words only match listings through their text
+        self.assertEqual(search_products('active').total, 0)
+        self.assertEqual(search_products('active draft', statuses=None).total, 0)
+
+    def test_fts_search(self):
+        from .search import uses_fts
+
+        if not uses_fts():
+            self.skipTest('SQLite FTS5 not available')
+        self.check_search()
+
+    def test_inverted_index_search(self):
+        from unittest import mock
+
+        with mock.patch('main_application.search.uses_fts', return_value=False):
+            self.check_search()
+            self.assertTrue(ProductSearchToken.objects.filter(term='sorghum').exists())
+
+    def test_admin_and_api_use_the_index(self):
+        from django.contrib.admin.sites import site
+
+        product = create_product(self.market, name='Sukuma wiki')
+        create_product(self.market, name='Cabbage')
+
+        admin = site._registry[Product]
+        found, _ = admin.get_search_results(None, Product.objects.all(), 'sukuma')
+        self.assertEqual(list(found), [product])
+        found, _ = admin.get_search_results(None, Product.objects.all(), self.market['user'].username)
+        self.assertEqual(found.count(), 2)
+
+        response = self.client.get('/api/products/search/', {'q': 'sukuma'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['id'] for r in response.json()['results']], [product.pk])
+        self.assertEqual(self.client.get('/api/products/search/', {'q': 'x', 'page': 'a'}).status_code, 400)
+
+
+class FacetBrowseTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.other = create_marketplace('other')
+
+    def facet(self, results, name):
+        return {f['value']: f['count'] for f in results.facets[name]}
+
+    def test_counts_follow_product_changes(self):
+        from .facets import browse_products, find_facet_drift
+
+        cheap = create_product(self.market, price_per_unit=Decimal('50'))
+        create_product(self.market, price_per_unit=Decimal('150'), organic_certified=True)
+        create_product(self.other, price_per_unit=Decimal('150'), quality_grade='premium')
+        create_product(self.market, status='draft')
+
+        results = browse_products()
+        self.assertEqual(results.total, 3)
+        self.assertEqual(self.facet(results, 'price_band'), {'0-100': 1, '100-500': 2})
+        self.assertEqual(self.facet(results, 'organic_certified'), {True: 1, False: 2})
+
+        cheap.price_per_unit = Decimal('700')
+        cheap.save()
+        self.assertEqual(self.facet(browse_products(), 'price_band'), {'100-500': 2, '500-1000': 1})
+
+        cheap.status = 'sold_out'
+        cheap.save(update_fields=['status'])
+        self.assertEqual(browse_products().total, 2)
+
+        Product.objects.filter(farm=self.other['farm']).get().delete()
+        self.assertEqual(browse_products().total, 1)
+        self.assertEqual(find_facet_drift(), [])
+
+    def test_selection_filters_results_and_other_facets(self):
+        from .facets import browse_products, parse_selection
+
+        mine = create_product(self.market, price_per_unit=Decimal('150'))
+        create_product(self.market, price_per_unit=Decimal('50'))
+        create_product(self.other, price_per_unit=Decimal('150'))
+
+        selected = parse_selection({'county': [str(self.market['county'].pk)], 'price_band': ['100-500']})
+        results = browse_products(selected)
+        self.assertEqual(([p.pk for p in results], results.total), ([mine.pk], 1))
+        # A facet's own selection does not narrow its counts
+        self.assertEqual(
+            self.facet(results, 'county'),
+            {self.market['county'].pk: 1, self.other['county'].pk: 1},
+        )
+        self.assertEqual(self.facet(results, 'price_band'), {'0-100': 1, '100-500': 1})
+        with self.assertRaises(ValueError):
+            parse_selection({'price_band': ['cheap']})
+
+    def test_rebuild_repairs_bulk_writes(self):
+        from .facets import find_facet_drift, rebuild_facets
+
+        create_product(self.market)
+        Product.objects.update(quality_grade='premium')
+        self.assertEqual(len(find_facet_drift()), 2)
+        rebuild_facets()
+        self.assertEqual(find_facet_drift(), [])
+
+    def test_api(self):
+        create_product(self.market, quality_grade='premium')
+        response = self.client.get('/api/products/browse/', {'quality_grade': 'premium'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(self.client.get('/api/products/browse/', {'county': 'x'}).status_code, 400)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='reader', phone_number='+254700', user_type='buyer')
+        Notification.objects.bulk_create([
+            Notification(recipient=self.user, title=f'n{i}', message='m', notification_type='system')
+            for i in range(25)
+        ])
+        # Ties on created_at must be broken by id
+        now = timezone.now()
+        Notification.objects.filter(pk__in=Notification.objects.order_by('pk').values('pk')[:10]).update(created_at=now)
+        self.expected = list(Notification.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def test_pages_forwards_and_backwards(self):
+        from .pagination import KeysetPaginator
+
+        paginator = KeysetPaginator(Notification.objects.all(), ('-created_at',), per_page=10)
+        pages = [paginator.page()]
+        while pages[-1].has_next:
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([obj.pk for page in pages for obj in page], self.expected)
+        self.assertEqual([len(p) for p in pages], [10, 10, 5])
+        self.assertFalse(pages[0].has_previous)
+
+        back = paginator.page(pages[2].previous_cursor)
+        self.assertEqual([o.pk for o in back], [o.pk for o in pages[1]])
+        first = paginator.page(back.previous_cursor)
+        self.assertEqual([o.pk for o in first], [o.pk for o in pages[0]])
+        self.assertFalse(first.has_previous)
+
+    def test_invalid_cursor_and_estimated_count(self):
+        from .pagination import InvalidCursor, KeysetPaginator, estimated_count
+
+        paginator = KeysetPaginator(Notification.objects.all(), ('-created_at', '-id'), per_page=10)
+        with self.assertRaises(InvalidCursor):
+            paginator.page('not-a-cursor')
+        self.assertEqual(str(estimated_count(Notification.objects.all(), exact_below=10)), 'about 25')
+        self.assertEqual(str(estimated_count(Notification.objects.filter(is_read=False), exact_below=10)), 'more than 10')
+        self.assertEqual(str(estimated_count(Notification.objects.filter(title='n1'))), '1')
+
+    def test_admin_changelist_follows_cursor(self):
+        import re
+        from html import unescape
+        from unittest import mock
+        from django.contrib.admin.sites import site
+
+        admin_user = CustomUser.objects.create_superuser(username='admin', password='pw', phone_number='+254799')
+        self.client.force_login(admin_user)
+        url = '/admin/main_application/notification/'
+        with mock.patch.object(site._registry[Notification], 'list_per_page', 10):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, '25 notifications')
+            next_url = unescape(re.search(r'href="(\?p=[^"]+)"[^>]*>Next', response.content.decode()).group(1))
+            response = self.client.get(url + next_url)
+            self.assertEqual(
+                [obj.pk for obj in response.context['cl'].result_list], self.expected[10:20],
+            )
+            self.assertEqual(self.client.get(url + '?p=bogus').status_code, 302)
+
+
+class AdminQueryBudgetTests(TestCase):
+    """Changelist pages must cost the same number of queries however many rows they show"""
+
+    CHANGELISTS = [
+        'county', 'subcounty', 'ward', 'location', 'farm', 'cropcategory', 'crop',
+        'product', 'productreview', 'wishlist', 'cart', 'order',
+    ]
+    BUDGET = 12
+
+    def setUp(self):
+        admin_user = CustomUser.objects.create_superuser(username='admin', password='pw', phone_number='+254799')
+        self.client.force_login(admin_user)
+        self.markets = 0
+
+    def add_markets(self, n):
+        for _ in range(n):
+            self.markets += 1
+            tag = str(100 + self.markets)
+            market = create_marketplace(tag)
+            product = create_product(market, name=f'Produce {tag}')
+            buyer = CustomUser.objects.create(username=f'buyer_{tag}', phone_number=f'+2548{tag}', user_type='buyer')
+            ProductReview.objects.create(product=product, buyer=buyer, rating=4, title='Good', comment='Fresh')
+            Wishlist.objects.create(buyer=buyer, product=product)
+            cart = Cart.objects.create(buyer=buyer)
+            extra = create_product(market, name=f'Greens {tag}')
+            for item, quantity in ((product, 1), (extra, 2)):
+                CartItem.objects.create(
+                    cart=cart, product=item, quantity=quantity, unit_price=Decimal('50'),
+                    total_price=Decimal('50') * quantity,
+                )
+            Order.objects.create(
+                order_number=f'ORD-{tag}', buyer=buyer, farmer=market['farmer'],
+                delivery_location=market['location'], subtotal=Decimal('100'), total_amount=Decimal('100'),
+                expected_delivery_date=timezone.now(),
+            )
+
+    def changelist_queries(self, name):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/admin/main_application/{name}/')
+        self.assertEqual(response.status_code, 200, name)
+        return len(queries)
+
+    def test_changelists_use_constant_queries(self):
+        self.add_markets(2)
+        small = {name: self.changelist_queries(name) for name in self.CHANGELISTS}
+        self.add_markets(8)
+        large = {name: self.changelist_queries(name) for name in self.CHANGELISTS}
+        self.assertEqual(large, small)
+        for name, n in large.items():
+            self.assertLessEqual(n, self.BUDGET, name)
+
+    def test_annotated_counts(self):
+        self.add_markets(1)
+        response = self.client.get('/admin/main_application/cart/')
+        cart = response.context['cl'].result_list[0]
+        self.assertEqual((cart.item_total, cart.value_total), (2, Decimal('150')))
+        self.assertContains(response, 'KES 150.00')
+        county = self.client.get('/admin/main_application/county/').context['cl'].result_list[0]
+        self.assertEqual(county.subcounty_total, 1)
+
+
+class AdminBudgetTests(TestCase):
+    """Every registered admin page within its stored query budget (see admin_budget.py)"""
+
+    def test_admin_pages_within_budget(self):
+        import os
+        from . import admin_budget
+
+        admin_user = CustomUser.objects.create_superuser(username='admin', password='pw', phone_number='+254799')
+        self.client.force_login(admin_user)
+        results = admin_budget.run(self.client)
+        self.assertEqual(
+            {result['admin'] for result in results},
+            {model._meta.label for model, _ in admin_budget.registered_admins()},
+        )
+        if os.environ.get('ADMIN_BUDGET_UPDATE'):
+            admin_budget.write_budgets(admin_budget.budgets_from(results))
+        problems = admin_budget.check_results(results, admin_budget.load_budgets())
+        admin_budget.write_report(results, problems)
+        self.assertEqual(problems, [])
+
+
+class StreamingExportTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.products = [create_product(self.market, name=f'Maize {i}') for i in range(5)]
+
+    def export(self, fmt, chunk_size=2):
+        from .exports import streaming_export
+
+        response = streaming_export(Product.objects.order_by('id'), fmt, chunk_size=chunk_size)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_exports_foreign_keys_as_ids_in_constant_queries(self):
+        import csv
+        import io
+        from .exports import streaming_export
+
+        response = streaming_export(Product.objects.order_by('id'), 'csv', chunk_size=2)
+        with self.assertNumQueries(1):
+            content = b''.join(response.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['farmer_id'], str(self.market['farmer'].id))
+        self.assertEqual(rows[0]['name'], 'Maize 0')
+        self.assertIn('product.csv', response['Content-Disposition'])
+
+    def test_gzip_and_jsonl(self):
+        import gzip
+        import json
+
+        _, compressed = self.export('csv.gz')
+        self.assertEqual(gzip.decompress(compressed).decode().count('\n'), 6)
+        _, content = self.export('jsonl')
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([row['name'] for row in rows], [f'Maize {i}' for i in range(5)])
+        self.assertEqual(rows[0]['price_per_unit'], '50.00')
+
+    def test_parquet(self):
+        import io
+        from .exports import parquet_available
+
+        if not parquet_available():
+            self.skipTest('pyarrow is not installed')
+        import pyarrow.parquet as pq
+
+        _, content = self.export('parquet')
+        table = pq.read_table(io.BytesIO(content))
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.column('crop_id').to_pylist(), [self.market['crop'].id] * 5)
+
+    def test_admin_action_streams(self):
+        admin_user = CustomUser.objects.create_superuser(username='admin', password='pw', phone_number='+254799')
+        self.client.force_login(admin_user)
+        response = self.client.post('/admin/main_application/product/', {
+            'action': 'export_as_csv',
+            '_selected_action': [product.pk for product in self.products[:2]],
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content).decode().count('\n'), 3)
+
+
+class PriceRollupTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.kg = self.market['unit']
+        self.bag = ProductUnit.objects.create(name='Bag 90kg', abbreviation='bag90', base_unit=self.kg, conversion_factor=Decimal('90'))
+        self.monday = timezone.now().date() - timezone.timedelta(days=timezone.now().date().weekday() + 14)
+
+    def record(self, price, days=0, unit=None, grade='Grade A'):
+        return MarketPrice.objects.create(
+            crop=self.market['crop'], location=self.market['county'], unit=unit or self.kg,
+            price_per_unit=Decimal(price), quality_grade=grade,
+            date_recorded=self.monday + timezone.timedelta(days=days),
+        )
+
+    def test_prices_are_normalized_and_rolled_up(self):
+        from .price_rollups import price_series
+
+        self.record('10')
+        self.record('1080', days=1, unit=self.bag)  # 12 per kg
+        self.record('14', days=7)
+        series = price_series(self.market['crop'].id, period='week')
+        self.assertEqual(series.unit, self.kg)
+        self.assertEqual([p.count for p in series], [2, 1])
+        first = series.points[0]
+        self.assertAlmostEqual(first.avg, 11)
+        self.assertAlmostEqual(first.stddev, 1)
+        self.assertEqual((first.min, first.max), (10, 12))
+
+        in_bags = price_series(self.market['crop'].id, period='week', unit=self.bag)
+        self.assertAlmostEqual(in_bags.points[0].avg, 990)
+        days = price_series(self.market['crop'].id, period='day', start=self.monday + timezone.timedelta(days=1))
+        self.assertEqual([p.start for p in days], [self.monday + timezone.timedelta(days=1), self.monday + timezone.timedelta(days=7)])
+
+    def test_edits_and_deletes_keep_rollups_exact(self):
+        from .price_rollups import find_rollup_drift
+
+        prices = [self.record(str(10 + i), days=i) for i in range(5)]
+        prices[0].price_per_unit = Decimal('30')
+        prices[0].save()
+        prices[1].date_recorded = self.monday + timezone.timedelta(days=40)
+        prices[1].save()
+        prices[2].delete()
+        self.assertEqual(find_rollup_drift(), [])
+        week = MarketPriceRollup.objects.get(period='week', period_start=self.monday)
+        self.assertEqual((week.count, week.min_price, week.max_price), (3, Decimal('13'), Decimal('30')))
+
+    def test_refresh_after_bulk_create(self):
+        from .price_rollups import find_rollup_drift, refresh_price_rollups
+
+        self.record('10')
+        MarketPrice.objects.bulk_create([
+            MarketPrice(
+                crop=self.market['crop'], location=self.market['county'], unit=self.kg,
+                price_per_unit=Decimal('20'), price_per_base_unit=Decimal('20'), quality_grade='Grade A',
+                date_recorded=self.monday + timezone.timedelta(days=9),
+            )
+        ])
+        self.assertEqual(len(find_rollup_drift()), 3)
+        refresh_price_rollups(since=self.monday + timezone.timedelta(days=9))
+        self.assertEqual(find_rollup_drift(), [])
+
+    def test_series_endpoint(self):
+        self.record('10')
+        self.record('20', days=2)
+        response = self.client.get('/api/market-prices/series/', {'crop': self.market['crop'].id, 'period': 'week'})
+        self.assertEqual(response.status_code, 200)
+        point = response.json()['points'][0]
+        self.assertEqual((point['count'], point['avg'], point['min'], point['max']), (2, 15.0, 10.0, 20.0))
+        self.assertEqual(self.client.get('/api/market-prices/series/', {'crop': 1, 'period': 'year'}).status_code, 400)
+
+
+class PriceTrendTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.bag = ProductUnit.objects.create(name='Bag 90kg', abbreviation='bag90', base_unit=self.market['unit'], conversion_factor=Decimal('90'))
+        self.start = timezone.now().date() - timezone.timedelta(days=30)
+
+    def series(self, prices, county=None, unit=None):
+        return [
+            MarketPrice.objects.create(
+                crop=self.market['crop'], location=county or self.market['county'], unit=unit or self.market['unit'],
+                price_per_unit=Decimal(price), date_recorded=self.start + timezone.timedelta(days=i),
+            )
+            for i, price in enumerate(prices)
+        ]
+
+    def test_rolling_statistics_restart_at_series_boundaries(self):
+        import numpy as np
+        from .price_trends import compute_trends, series_positions
+
+        positions = series_positions(np.array([1, 1, 1, 1, 2, 2]), np.array([5, 5, 5, 5, 5, 5]))
+        self.assertEqual(positions.tolist(), [0, 1, 2, 3, 0, 1])
+        prices = np.array([10.0, 20.0, 30.0, 40.0, 100.0, 100.0])
+        moving_average, change, volatility, trend = compute_trends(prices, positions, window=2)
+        self.assertEqual(moving_average.tolist(), [10, 15, 25, 35, 100, 100])
+        self.assertAlmostEqual(change[3], 35 / 15 - 1)
+        self.assertEqual(change[4], 0)
+        # Returns 1.0 and 0.5 in the last two-price window of the first series
+        self.assertAlmostEqual(volatility[2], 0.25)
+        self.assertEqual(volatility[4], 0)
+        self.assertEqual(trend.tolist(), [1, 2, 2, 2, 1, 1])
+
+    def test_classify_writes_metrics_back(self):
+        from .price_trends import classify_price_trends
+
+        rising = self.series(['10', '11', '12', '13'])
+        other = County.objects.create(name='Other', code='other')
+        # 900 per bag is 10 per kilogram, so this series is flat
+        flat = self.series(['10', '900', '10', '10'], county=other, unit=None)
+        flat[1].unit = self.bag
+        flat[1].save()
+        counts = classify_price_trends(window=3)
+        self.assertEqual(counts, {'Rising': 3, 'Stable': 5})
+        last = MarketPrice.objects.get(pk=rising[-1].pk)
+        self.assertEqual(last.price_trend, 'Rising')
+        self.assertEqual(last.moving_average, Decimal('12.00'))
+        self.assertAlmostEqual(last.price_change, 12 / 10 - 1)
+        bag_price = MarketPrice.objects.get(pk=flat[1].pk)
+        self.assertEqual((bag_price.price_trend, bag_price.moving_average), ('Stable', Decimal('900.00')))
+        self.assertEqual(bag_price.price_volatility, 0)
+
+
+class DemandForecastTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.as_of = timezone.now().date().replace(day=15)
+
+    def months_ago(self, n):
+        from .demand_forecasts import add_months
+
+        return add_months(self.as_of.replace(day=1), -n)
+
+    def test_models_fit_every_series_at_once(self):
+        import numpy as np
+        from .demand_forecasts import fit_series
+
+        months = np.arange(36)
+        seasonal = 100 + 20 * np.sin(2 * np.pi * months / 12)
+        flat = np.full(36, 50.0)
+        sparse = np.full(36, np.nan)
+        sparse[[3, 20]] = 80.0
+        forecasts, error, is_seasonal = fit_series(np.vstack([seasonal, flat, sparse]), horizon=2)
+        self.assertEqual(is_seasonal.tolist(), [True, False, False])
+        np.testing.assert_allclose(forecasts[0], seasonal[24:26])
+        np.testing.assert_allclose(forecasts[1:], [[50, 50], [80, 80]])
+        np.testing.assert_allclose(error[:3], [0, 0, 0], atol=1e-9)
+
+    def test_forecasts_are_upserted_per_crop_county_and_month(self):
+        from .demand_forecasts import add_months, forecast_demand
+        from .price_rollups import refresh_price_rollups
+
+        MarketPrice.objects.bulk_create([
+            MarketPrice(
+                crop=self.market['crop'], location=self.market['county'], unit=self.market['unit'],
+                price_per_unit=Decimal(50 + 5 * (12 - n)), price_per_base_unit=Decimal(50 + 5 * (12 - n)),
+                date_recorded=self.months_ago(n),
+            )
+            for n in range(1, 13)
+        ])
+        refresh_price_rollups()
+        product = create_product(self.market)
+        buyer = CustomUser.objects.create(username='buyer', phone_number='+254800', user_type='buyer')
+        for n in range(1, 7):
+            order = Order.objects.create(
+                order_number=f'ORD-{n}', buyer=buyer, farmer=self.market['farmer'],
+                delivery_location=self.market['location'], subtotal=Decimal('100'), total_amount=Decimal('100'),
+                expected_delivery_date=timezone.now(),
+            )
+            Order.objects.filter(pk=order.pk).update(order_date=timezone.make_aware(
+                timezone.datetime.combine(self.months_ago(n), timezone.datetime.min.time())
+            ))
+            OrderItem.objects.create(
+                order=order, product=product, quantity=Decimal('10'), unit_price=Decimal('10'), total_price=Decimal('100'),
+            )
+
+        self.assertEqual(forecast_demand(as_of=self.as_of, horizon=2), 2)
+        self.assertEqual(forecast_demand(as_of=self.as_of, horizon=2), 2)
+        forecasts = list(MarketDemandForecast.objects.order_by('id'))
+        self.assertEqual(len(forecasts), 2)
+        first = forecasts[0]
+        self.assertEqual(first.forecast_period, add_months(self.as_of.replace(day=1), 0).strftime('%B %Y'))
+        self.assertEqual((first.crop_id, first.location_id), (self.market['crop'].id, self.market['county'].id))
+        # Smoothing settles just under the last price of the rising series
+        self.assertEqual(first.price_prediction, 'stable')
+        # Six months of 10 units against a 12-month average of 5
+        self.assertEqual(first.expected_demand, 'very_high')
+        self.assertIn('2.00x the monthly average', first.factors[1])
+        self.assertTrue(1 <= first.confidence_level <= 100)
+
+
+class UnitConversionTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.tonne = ProductUnit.objects.create(name='Tonne', abbreviation='t')
+        self.kg = self.market['unit']
+        self.kg.base_unit, self.kg.conversion_factor = self.tonne, Decimal('0.001')
+        self.kg.save()
+        self.crate = ProductUnit.objects.create(name='Crate', abbreviation='crate', base_unit=self.kg, conversion_factor=Decimal('10'))
+
+    def test_chains_resolve_to_the_root_unit(self):
+        from .units import UnitGraph, unit_graph
+
+        graph = unit_graph()
+        self.assertEqual(graph.root(self.crate.id), self.tonne.id)
+        self.assertEqual(graph.factor(self.crate.id), Decimal('0.01'))
+        self.assertEqual(graph.members(self.tonne.id), sorted([self.tonne.id, self.kg.id, self.crate.id]))
+        self.assertEqual(graph.convert_price(Decimal('300'), self.crate.id, self.kg.id), Decimal('30'))
+        self.assertEqual(graph.factor_array([self.crate.id, 999]).tolist()[0], 0.01)
+
+        cyclic = UnitGraph({1: (2, Decimal('2')), 2: (1, Decimal('3')), 3: (None, Decimal('1')), 4: (9, Decimal('5'))})
+        self.assertEqual([cyclic.root(unit_id) for unit_id in (1, 2, 3, 4)], [None, None, 3, None])
+        with self.assertRaises(ValueError):
+            cyclic.convert_quantity(1, 1, 3)
+
+    def test_base_price_is_stored_and_follows_unit_changes(self):
+        product = create_product(self.market, unit=self.crate, price_per_unit=Decimal('300'))
+        self.assertEqual(product.price_per_base_unit, Decimal('30000'))
+
+        product.price_per_unit = Decimal('600')
+        product.save(update_fields=['price_per_unit'])
+        product.refresh_from_db()
+        self.assertEqual(product.price_per_base_unit, Decimal('60000'))
+
+        # A factor change reprices every row in the affected chain
+        self.kg.conversion_factor = Decimal('0.002')
+        self.kg.save()
+        product.refresh_from_db()
+        self.assertEqual(product.price_per_base_unit, Decimal('30000'))
+
+        from .units import find_base_price_drift
+
+        Product.objects.filter(pk=product.pk).update(price_per_unit=Decimal('900'))
+        self.assertEqual(find_base_price_drift(), [('product', product.pk, Decimal('30000'), Decimal('45000'))])
+
+    def test_prices_can_be_sorted_and_converted(self):
+        from .units import annotate_price_in
+
+        cheap = create_product(self.market, unit=self.crate, price_per_unit=Decimal('100'))
+        dear = create_product(self.market, price_per_unit=Decimal('20'))
+        response = self.client.get('/api/products/browse/', {'sort': 'price'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [cheap.id, dear.id])
+        self.assertEqual(self.client.get('/api/products/browse/', {'sort': 'name'}).status_code, 400)
+        converted = annotate_price_in(Product.objects.order_by('pk'), self.kg.id)
+        self.assertEqual([p.unit_price for p in converted], [Decimal('10'), Decimal('20')])
+
+
+class InventoryReservationTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.product = create_product(self.market, quantity_available=Decimal('10'))
+        self.buyer = CustomUser.objects.create(username='buyer', phone_number='+254800', user_type='buyer')
+
+    def test_stock_is_taken_conditionally_and_sells_out(self):
+        from .facets import find_facet_drift
+        from .inventory import InsufficientStock, take_stock
+
+        take_stock(self.product.pk, Decimal('4'))
+        with self.assertRaises(InsufficientStock):
+            take_stock(self.product.pk, Decimal('7'))
+        take_stock(self.product.pk, Decimal('6'))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.quantity_available, self.product.status), (Decimal('0'), 'sold_out'))
+        self.assertEqual(find_facet_drift(), [])
+        with self.assertRaises(InsufficientStock):
+            take_stock(self.product.pk, Decimal('1'))
+
+    def test_cart_holds_resize_and_expire(self):
+        from .inventory import expire_reservations, hold
+
+        reservation = hold(self.buyer, self.product.pk, Decimal('10'))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.status, 'sold_out')
+        hold(self.buyer, self.product.pk, Decimal('3'))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.quantity_available, self.product.status), (Decimal('7'), 'active'))
+
+        self.assertEqual(expire_reservations(now=timezone.now()), 0)
+        self.assertEqual(expire_reservations(now=timezone.now() + timezone.timedelta(hours=1)), 1)
+        self.assertEqual(expire_reservations(now=timezone.now() + timezone.timedelta(hours=1)), 0)
+        reservation.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((reservation.status, self.product.quantity_available), ('expired', Decimal('10')))
+
+    def test_cancelled_orders_return_committed_stock(self):
+        from .inventory import ReservationExpired, commit_reservations, hold
+
+        reservation = hold(self.buyer, self.product.pk, Decimal('4'))
+        order = Order.objects.create(
+            order_number='ORD-1', buyer=self.buyer, farmer=self.market['farmer'],
+            delivery_location=self.market['location'], subtotal=Decimal('200'), total_amount=Decimal('200'),
+            expected_delivery_date=timezone.now(),
+        )
+        commit_reservations([reservation.pk], order)
+        with self.assertRaises(ReservationExpired):
+            commit_reservations([reservation.pk], order)
+
+        from .order_states import transition_orders
+
+        transition_orders([order], 'cancelled', self.buyer)
+        transition_orders([order], 'cancelled', self.buyer)
+        reservation.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((reservation.status, self.product.quantity_available), ('released', Decimal('10')))
+
+    def test_refunded_deliveries_keep_their_stock_sold(self):
+        from .inventory import commit_reservations, hold
+        from .order_states import transition_orders
+
+        reservation = hold(self.buyer, self.product.pk, Decimal('4'))
+        order = Order.objects.create(
+            order_number='ORD-1', buyer=self.buyer, farmer=self.market['farmer'],
+            delivery_location=self.market['location'], subtotal=Decimal('200'), total_amount=Decimal('200'),
+            expected_delivery_date=timezone.now(),
+        )
+        commit_reservations([reservation.pk], order)
+        Order.objects.filter(pk=order.pk).update(status='delivered')
+        self.assertEqual(len(transition_orders([order], 'refunded', self.buyer)), 1)
+        reservation.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((reservation.status, self.product.quantity_available), ('committed', Decimal('6')))
+
+
+class CheckoutTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace('a')
+        self.other = create_marketplace('b')
+        self.buyer = CustomUser.objects.create(username='buyer', phone_number='+254800', user_type='buyer')
+        self.cart = Cart.objects.create(buyer=self.buyer)
+        zone = DeliveryZone.objects.create(
+            name='Nairobi', base_delivery_fee=Decimal('150'), free_delivery_threshold=Decimal('1000'),
+            estimated_delivery_days=2,
+        )
+        zone.counties.add(self.market['county'])
+
+    def add_to_cart(self, market, quantity, price='50'):
+        product = create_product(market, price_per_unit=Decimal(price))
+        CartItem.objects.create(
+            cart=self.cart, product=product, quantity=Decimal(quantity),
+            unit_price=product.price_per_unit, total_price=product.price_per_unit * Decimal(quantity),
+        )
+        return product
+
+    def checkout_queries(self, lines):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .checkout import checkout
+
+        for i in range(lines):
+            self.add_to_cart(self.market if i % 2 else self.other, '2')
+        with CaptureQueriesContext(connection) as queries:
+            checkout(self.buyer, self.market['location'])
+        return len(queries)
+
+    def test_cart_is_split_into_one_order_per_farmer(self):
+        from .checkout import checkout
+        from .inventory import hold
+
+        held = self.add_to_cart(self.market, '3')
+        self.add_to_cart(self.market, '1', price='20')
+        self.add_to_cart(self.other, '30')
+        reservation = hold(self.buyer, held.pk, Decimal('1'))
+
+        orders = checkout(self.buyer, self.market['location'], special_instructions='Gate B')
+        self.assertEqual(len(orders), 2)
+        mine, theirs = sorted(orders, key=lambda order: order.farmer_id != self.market['farmer'].id)
+        self.assertEqual((mine.subtotal, mine.delivery_fee, mine.total_amount), (Decimal('170'), Decimal('150'), Decimal('320')))
+        self.assertEqual((theirs.subtotal, theirs.delivery_fee), (Decimal('1500'), Decimal('0')))
+        self.assertEqual(OrderItem.objects.filter(order=mine).count(), 2)
+        self.assertEqual(OrderStatusHistory.objects.filter(new_status='pending').count(), 2)
+        item = OrderItem.objects.get(order=mine, product=held)
+        self.assertEqual((item.product_snapshot['name'], item.product_snapshot['price_per_unit']), ('Maize', '50.00'))
+
+        held.refresh_from_db()
+        reservation.refresh_from_db()
+        self.assertEqual(held.quantity_available, Decimal('97'))
+        self.assertEqual((reservation.status, reservation.order_id, reservation.quantity), ('committed', mine.pk, Decimal('3')))
+        self.assertEqual(InventoryReservation.objects.filter(status='committed').count(), 3)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_failed_checkout_changes_nothing(self):
+        from .checkout import CheckoutError, checkout
+        from .inventory import InsufficientStock
+
+        cheap = self.add_to_cart(self.market, '2')
+        scarce = self.add_to_cart(self.other, '200')
+        with self.assertRaises(InsufficientStock) as raised:
+            checkout(self.buyer, self.market['location'])
+        self.assertEqual(raised.exception.product_id, scarce.pk)
+        with self.assertRaises(CheckoutError):
+            checkout(self.buyer, self.other['location'])
+        cheap.refresh_from_db()
+        self.assertEqual((cheap.quantity_available, Order.objects.count(), CartItem.objects.count()), (Decimal('100'), 0, 2))
+
+    def test_queries_do_not_grow_with_the_cart(self):
+        from .delivery_quotes import zone_index
+        from .numbering import next_number
+
+        next_number(Order)  # Claims the block of order numbers both checkouts draw from
+        zone_index()
+        small = self.checkout_queries(2)
+        self.assertEqual(self.checkout_queries(8), small)
+
+
+def take_numbers(path, count, results):
+    """Worker for NumberingTests: allocate count numbers against the SQLite file at path"""
+    from django.db import connections
+    from .numbering import NumberAllocator
+
+    default = connections['default']
+    conn = type(default)({**default.settings_dict, 'NAME': path})
+    allocator = NumberAllocator(block_size=7, claim_on=lambda: conn)
+    numbers = [number for _ in range(count) for number in allocator.take('ORD', year=2026)]
+    conn.close()
+    results.put(numbers)
+
+
+class NumberingTests(TestCase):
+
+    def test_numbers_are_assigned_on_save(self):
+        market = create_marketplace()
+        buyer = CustomUser.objects.create(username='buyer', phone_number='+254800', user_type='buyer')
+        year = timezone.localdate().year
+        Order.objects.create(
+            order_number=f'ORD-{year}-000041', buyer=buyer, farmer=market['farmer'],
+            delivery_location=market['location'], subtotal=Decimal('1'), total_amount=Decimal('1'),
+            expected_delivery_date=timezone.now(),
+        )
+        orders = [
+            Order.objects.create(
+                buyer=buyer, farmer=market['farmer'], delivery_location=market['location'],
+                subtotal=Decimal('1'), total_amount=Decimal('1'), expected_delivery_date=timezone.now(),
+            )
+            for _ in range(3)
+        ]
+        # Counting starts after numbers saved before the sequence existed
+        self.assertEqual([o.order_number for o in orders], [f'ORD-{year}-0000{n}' for n in (42, 43, 44)])
+        with self.assertNumQueries(0):
+            from .numbering import next_numbers
+            next_numbers(Order, 10)
+
+    def test_rolled_back_blocks_are_not_reused(self):
+        from django.db import transaction
+        from .numbering import NumberAllocator
+
+        allocator = NumberAllocator(block_size=5)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                lost = allocator.take('TKT', 2, year=2026)
+                raise RuntimeError
+        self.assertEqual(allocator.take('TKT', 2, year=2026), lost)  # the claim rolled back with it
+        kept = allocator.take('TKT', 4, year=2026)
+        self.assertEqual(kept, ['TKT-2026-000003', 'TKT-2026-000004', 'TKT-2026-000005', 'TKT-2026-000006'])
+
+    def test_processes_never_share_a_number(self):
+        from django.db import connections
+        import multiprocessing
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/numbers.sqlite3'
+            default = connections['default']
+            conn = type(default)({**default.settings_dict, 'NAME': path})
+            with conn.schema_editor() as editor:
+                editor.create_model(NumberSequence)
+            with conn.cursor() as cursor:
+                cursor.execute("INSERT INTO number_sequences (prefix, year, last_value) VALUES ('ORD', 2026, 0)")
+            conn.close()
+
+            context = multiprocessing.get_context('fork')
+            results = context.Queue()
+            workers = [context.Process(target=take_numbers, args=(path, 300, results)) for _ in range(6)]
+            for worker in workers:
+                worker.start()
+            numbers = [number for _ in workers for number in results.get(timeout=60)]
+            for worker in workers:
+                worker.join()
+        self.assertEqual(len(numbers), 1800)
+        self.assertEqual(len(set(numbers)), 1800)
+
+
+class OrderStateTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.buyer = CustomUser.objects.create(username='buyer', phone_number='+254800', user_type='buyer')
+
+    def create_orders(self, n, status='pending'):
+        orders = [
+            Order.objects.create(
+                buyer=self.buyer, farmer=self.market['farmer'], delivery_location=self.market['location'],
+                subtotal=Decimal('10'), total_amount=Decimal('10'), expected_delivery_date=timezone.now(),
+            )
+            for _ in range(n)
+        ]
+        Order.objects.filter(pk__in=[o.pk for o in orders]).update(status=status)
+        return orders
+
+    def test_bulk_transition_records_history_and_stamps(self):
+        from .order_states import transition_orders
+
+        shipped = self.create_orders(3, 'shipped')
+        pending = self.create_orders(1)
+        result = transition_orders(shipped + pending, 'delivered', self.buyer, notes='Run 7')
+        self.assertEqual((len(result), result.skipped), (3, {pending[0].pk: 'pending'}))
+        self.assertEqual(Order.objects.filter(status='delivered', delivered_at__isnull=False).count(), 3)
+        history = OrderStatusHistory.objects.filter(new_status='delivered')
+        self.assertEqual(sorted(history.values_list('previous_status', flat=True)), ['shipped'] * 3)
+        self.assertEqual(Notification.objects.filter(recipient=self.buyer, notification_type='order').count(), 3)
+
+    def test_strict_transitions_reject_invalid_moves(self):
+        from .order_states import InvalidTransition, transition_order
+
+        order = self.create_orders(1)[0]
+        with self.assertRaises(InvalidTransition):
+            transition_order(order, 'shipped', self.buyer)
+        transition_order(order, 'cancelled', self.buyer, notes='Changed my mind')
+        self.assertEqual((order.status, order.cancellation_reason), ('cancelled', 'Changed my mind'))
+        self.assertIsNotNone(order.cancelled_at)
+        with self.assertRaises(InvalidTransition):
+            transition_order(order, 'confirmed', self.buyer)
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .order_states import transition_orders
+
+        counts = []
+        for n in (2, 40):
+            orders = self.create_orders(n)
+            with CaptureQueriesContext(connection) as queries:
+                transition_orders(orders, 'confirmed', self.buyer)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_admin_action_transitions_orders(self):
+        admin_user = CustomUser.objects.create_superuser(username='admin', password='pw', phone_number='+254799')
+        self.client.force_login(admin_user)
+        ready = self.create_orders(2, 'ready')
+        response = self.client.post('/admin/main_application/order/', {
+            'action': 'mark_shipped', '_selected_action': [order.pk for order in ready],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.filter(status='shipped').count(), 2)
+        history = OrderStatusHistory.objects.filter(new_status='shipped', changed_by=admin_user)
+        self.assertEqual(sorted(history.values_list('order_id', flat=True)), sorted(order.pk for order in ready))
+        self.assertEqual(set(history.values_list('previous_status', flat=True)), {'ready'})
+
+
+class ReconciliationTests(TestCase):
+
+    MPESA_HEADER = (
+        'Receipt No.,Completion Time,Initiation Time,Details,Transaction Status,Paid In,Withdrawn,Balance,'
+        'Balance Confirmed,Reason Type,Other Party Info,Linked Transaction ID,A/C No.\n'
+    )
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.buyer = CustomUser.objects.create(username='buyer', phone_number='+254800', user_type='buyer')
+        self.method = PaymentMethod.objects.create(name='M-Pesa', code='mpesa')
+
+    def create_payment(self, total, amount, transaction_id, **kwargs):
+        order = Order.objects.create(
+            buyer=self.buyer, farmer=self.market['farmer'], delivery_location=self.market['location'],
+            subtotal=Decimal(total), total_amount=Decimal(total), expected_delivery_date=timezone.now(),
+        )
+        return Payment.objects.create(
+            order=order, payment_method=self.method, transaction_id=transaction_id,
+            amount=Decimal(amount), net_amount=Decimal(amount), **kwargs,
+        )
+
+    def mpesa_line(self, receipt, amount, account='', status='Completed'):
+        return f'{receipt},2026-10-15 09:30:00,2026-10-15 09:29:58,Pay Bill,{status},"{amount}",,0,,Pay Bill,Buyer,,{account}\n'
+
+    def reconcile(self, text, **kwargs):
+        import csv
+        import io
+        from .reconciliation import reconcile_statement
+
+        out = io.StringIO()
+        report = reconcile_statement(io.StringIO(text), exceptions=csv.writer(out), **kwargs)
+        return report, list(csv.reader(io.StringIO(out.getvalue())))
+
+    def test_mpesa_statement_completes_payments_and_rolls_up_orders(self):
+        full = self.create_payment('1200', '1200', 'TX1', gateway_reference='QK1')
+        part = self.create_payment('1000', '400', 'TX2')
+        statement = (
+            'Organization Name,Mkulima Ltd\n\n' + self.MPESA_HEADER
+            + self.mpesa_line('QK1', '1,200.00')
+            + self.mpesa_line('QK2', '400.00', account='TX2')
+            + self.mpesa_line('QK1', '1,200.00')
+            + self.mpesa_line('QK9', '50.00', account='nobody')
+            + self.mpesa_line('QK8', '10.00', status='Failed')
+        )
+        report, rows = self.reconcile(statement)
+        self.assertEqual((report.lines, report.matched, report.skipped), (5, 2, 1))
+        self.assertEqual(dict(report.exceptions), {'duplicate': 1, 'unmatched': 1})
+        self.assertEqual([(row[1], row[2]) for row in rows], [('duplicate', 'QK1'), ('unmatched', 'QK9')])
+
+        full.refresh_from_db()
+        part.refresh_from_db()
+        self.assertEqual((full.status, part.status, part.gateway_reference), ('completed', 'completed', 'QK2'))
+        self.assertIsNotNone(part.paid_at)
+        self.assertEqual(Order.objects.get(pk=full.order_id).payment_status, 'paid')
+        self.assertEqual(Order.objects.get(pk=part.order_id).payment_status, 'partial')
+
+        # Running the same statement again applies nothing twice
+        report, rows = self.reconcile(statement)
+        self.assertEqual((report.matched, report.exceptions['duplicate']), (0, 3))
+
+    def test_airtel_statement_reports_amount_mismatch(self):
+        payment = self.create_payment('500', '500', 'TX3')
+        statement = (
+            'Transaction ID,Transaction Date,Sender MSISDN,Amount,Status,Reference\n'
+            'AT1,15/10/2026 10:00:00,254700000000,450,SUCCESS,TX3\n'
+            'AT2,15/10/2026 10:05:00,254700000000,abc,SUCCESS,TX3\n'
+        )
+        report, rows = self.reconcile(statement, provider='airtel')
+        self.assertEqual(dict(report.exceptions), {'amount_mismatch': 1, 'invalid': 1})
+        self.assertEqual(rows[0][1:3] + rows[0][-1:], ['amount_mismatch', 'AT1', 'expected 500.00'])
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+
+    def test_unknown_layout_is_rejected(self):
+        from .reconciliation import StatementError
+
+        with self.assertRaises(StatementError):
+            self.reconcile('Date,Narrative,Credit\n2026-10-15,Deposit,100\n')
+
+    def test_queries_do_not_grow_with_the_statement(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        counts = []
+        for n in (2, 30):
+            payments = [self.create_payment('10', '10', f'N{n}-{i}') for i in range(n)]
+            statement = self.MPESA_HEADER + ''.join(
+                self.mpesa_line(f'R{n}-{i}', '10.00', account=p.transaction_id) for i, p in enumerate(payments)
+            )
+            with CaptureQueriesContext(connection) as queries:
+                report, _rows = self.reconcile(statement, payments=Payment.objects.filter(pk__in=[p.pk for p in payments]))
+            self.assertEqual(report.matched, n)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+@override_settings(PAYMENT_CALLBACK_SECRET='secret')
+class PaymentCallbackTests(TestCase):
+
+    def setUp(self):
+        from .management.commands.benchmark_callbacks import FakeGateway
+
+        self.market = create_marketplace()
+        self.buyer = CustomUser.objects.create(username='buyer', phone_number='+254800', user_type='buyer')
+        self.method = PaymentMethod.objects.create(name='M-Pesa', code='mpesa', processing_fee_percentage=Decimal('1.5'))
+        self.gateway = FakeGateway('secret', client=self.client)
+
+    def create_payment(self, transaction_id, amount='1000', total='1000'):
+        order = Order.objects.create(
+            buyer=self.buyer, farmer=self.market['farmer'], delivery_location=self.market['location'],
+            subtotal=Decimal(total), total_amount=Decimal(total), expected_delivery_date=timezone.now(),
+        )
+        return Payment.objects.create(
+            order=order, payment_method=self.method, transaction_id=transaction_id,
+            amount=Decimal(amount), net_amount=Decimal(amount),
+        )
+
+    def test_callbacks_are_queued_once_and_applied_idempotently(self):
+        from .payment_callbacks import drain_callbacks
+
+        paid = self.create_payment('TX1')
+        part = self.create_payment('TX2', amount='400')
+        for payload in [self.gateway.payload(paid), self.gateway.payload(paid), self.gateway.payload(part)]:
+            self.assertEqual(self.gateway.post(payload).status_code, 202)
+        self.assertEqual(self.gateway.post(self.gateway.payload(paid), secret='forged').status_code, 403)
+        self.assertEqual(self.gateway.post({'transaction_id': 'TX1'}).status_code, 400)
+        self.assertEqual(PaymentCallback.objects.count(), 2)
+        self.assertEqual(Payment.objects.filter(status='completed').count(), 0)
+
+        self.assertEqual(drain_callbacks(workers=1), {'applied': 2})
+        paid.refresh_from_db()
+        self.assertEqual((paid.status, paid.processing_fee, paid.net_amount), ('completed', Decimal('15.00'), Decimal('985.00')))
+        self.assertEqual((paid.gateway_reference, paid.gateway_response['result']), ('GWTX1', 'completed'))
+        self.assertEqual(Order.objects.get(pk=paid.order_id).payment_status, 'paid')
+        self.assertEqual(Order.objects.get(pk=part.order_id).payment_status, 'partial')
+
+        # A late failure callback for a settled payment changes nothing
+        self.gateway.post(self.gateway.payload(paid, result='failed'))
+        self.assertEqual(drain_callbacks(workers=1), {'ignored': 1})
+        paid.refresh_from_db()
+        self.assertEqual(paid.status, 'completed')
+
+    def test_unsigned_callbacks_are_refused(self):
+        payment = self.create_payment('TX4')
+        unsigned = self.client.post('/api/payments/callback/', self.gateway.payload(payment), content_type='application/json')
+        self.assertEqual(unsigned.status_code, 403)
+        # Without a configured secret nothing is accepted, signed or not
+        with override_settings(PAYMENT_CALLBACK_SECRET=''):
+            self.assertEqual(self.gateway.post(self.gateway.payload(payment), secret='').status_code, 403)
+        self.assertFalse(PaymentCallback.objects.exists())
+
+    def test_unknown_payments_and_wrong_amounts_are_rejected(self):
+        from .payment_callbacks import drain_callbacks
+
+        payment = self.create_payment('TX3')
+        self.gateway.post(self.gateway.payload(payment, amount='10'))
+        self.gateway.post({'gateway_reference': 'GW9', 'transaction_id': 'nope', 'result': 'completed', 'amount': '5'})
+        self.assertEqual(drain_callbacks(workers=1), {'rejected': 2})
+        self.assertEqual(
+            sorted(PaymentCallback.objects.values_list('error', flat=True)),
+            ['Amount does not match payment of 1000.00', 'Unknown payment'],
+        )
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+
+    def test_claims_are_exclusive_and_stale_claims_taken_over(self):
+        from .payment_callbacks import CLAIM_TIMEOUT, claim_callbacks
+
+        for i in range(3):
+            self.gateway.post(self.gateway.payload(self.create_payment(f'TX{i}')))
+        first = claim_callbacks(batch_size=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(claim_callbacks()), 1)
+        self.assertEqual(claim_callbacks(), [])
+        PaymentCallback.objects.filter(pk=first[0].pk).update(claimed_at=timezone.now() - CLAIM_TIMEOUT * 2)
+        self.assertEqual([callback.pk for callback in claim_callbacks()], [first[0].pk])
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .payment_callbacks import apply_callbacks, claim_callbacks
+
+        counts = []
+        for n in (2, 30):
+            for i in range(n):
+                self.gateway.post(self.gateway.payload(self.create_payment(f'Q{n}-{i}')))
+            callbacks = claim_callbacks()
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(apply_callbacks(callbacks), {'applied': n})
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class DeliveryQuoteTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.county = self.market['county']
+        self.standard = DeliveryZone.objects.create(
+            name='Standard', base_delivery_fee=Decimal('100'), estimated_delivery_days=3,
+        )
+        self.express = DeliveryZone.objects.create(
+            name='Express', base_delivery_fee=Decimal('250'), free_delivery_threshold=Decimal('2000'),
+            estimated_delivery_days=1,
+        )
+        self.standard.counties.add(self.county)
+        self.express.counties.add(self.county)
+
+    def test_quotes_pick_the_cheapest_then_fastest_zone_without_queries(self):
+        from .delivery_quotes import zone_index
+
+        zone_index()
+        with self.assertNumQueries(0):
+            small, large, nowhere = zone_index().quote_orders([
+                (self.county.pk, Decimal('500')), (self.county.pk, Decimal('2000')), (0, Decimal('500')),
+            ])
+        self.assertEqual((small.zone_id, small.fee, small.days), (self.standard.pk, Decimal('100'), 3))
+        self.assertEqual((large.zone_id, large.free, large.days), (self.express.pk, True, 1))
+        self.assertIsNone(nowhere)
+
+    def test_cart_is_quoted_per_farmer(self):
+        from .delivery_quotes import zone_index
+
+        other = create_marketplace('b')
+        buyer = CustomUser.objects.create(username='buyer', phone_number='+254800', user_type='buyer')
+        cart = Cart.objects.create(buyer=buyer)
+        for market, quantity in ((self.market, '50'), (other, '1')):
+            product = create_product(market)
+            CartItem.objects.create(
+                cart=cart, product=product, quantity=Decimal(quantity),
+                unit_price=product.price_per_unit, total_price=product.price_per_unit * Decimal(quantity),
+            )
+        lines = list(cart.items.select_related('product'))
+        zone_index()
+        with self.assertNumQueries(0):
+            quotes = zone_index().quote_cart(lines, self.county.pk)
+        self.assertEqual(
+            {farmer_id: quote.fee for farmer_id, quote in quotes.items()},
+            {self.market['farmer'].pk: Decimal('0'), other['farmer'].pk: Decimal('100')},
+        )
+
+    def test_zone_and_county_changes_reload_the_index(self):
+        from .delivery_quotes import zone_index
+
+        self.assertEqual(zone_index().zones(self.county.pk), [self.standard.pk, self.express.pk])
+        self.standard.counties.remove(self.county)
+        self.assertEqual(zone_index().zones(self.county.pk), [self.express.pk])
+        self.express.is_active = False
+        self.express.save()
+        self.assertFalse(zone_index().covers(self.county.pk))
+        self.express.is_active = True
+        self.express.save()
+        self.assertTrue(zone_index().covers(self.county.pk))
+        self.county.delete()
+        self.assertEqual(zone_index().by_county, {})
+
+
+class DispatchTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.market['location'].latitude, self.market['location'].longitude = Decimal('-0.30'), Decimal('36.07')
+        self.market['location'].save()
+        self.product = create_product(self.market)
+        self.buyer = CustomUser.objects.create(username='buyer', phone_number='+254800', user_type='buyer')
+        self.partner = self.create_partner('Rider', self.market['county'])
+
+    def create_partner(self, name, *counties):
+        partner = DeliveryPartner.objects.create(name=name, contact_person=name, phone_number='0700', email='d@example.com')
+        partner.service_areas.add(*counties)
+        return partner
+
+    def create_delivery(self, lat, lon, partner=None, county=None):
+        market = self.market
+        location = Location.objects.create(
+            user=self.buyer, name='Home', county=county or market['county'], subcounty=market['subcounty'],
+            ward=market['ward'], village='V', detailed_address='A', latitude=lat, longitude=lon,
+        )
+        order = Order.objects.create(
+            buyer=self.buyer, farmer=market['farmer'], delivery_location=location,
+            subtotal=Decimal('10'), total_amount=Decimal('10'), expected_delivery_date=timezone.now(),
+        )
+        OrderItem.objects.create(
+            order=order, product=self.product, quantity=1, unit_price=Decimal('10'), total_price=Decimal('10'),
+        )
+        return Delivery.objects.create(
+            order=order, delivery_partner=partner or self.partner, pickup_address='Farm', delivery_address='Home',
+            estimated_delivery_time=timezone.now(), delivery_fee=Decimal('100'),
+        )
+
+    def test_two_opt_untangles_a_crossed_path(self):
+        import numpy as np
+        from .dispatch import haversine_matrix, path_legs, two_opt
+
+        # Points along a line visited out of order: 0, 2, 1, 3
+        lat = np.array([0.0, 0.1, 0.2, 0.3])
+        dist = haversine_matrix(lat, np.zeros(4))
+        self.assertAlmostEqual(dist[0, 1], 11.12, places=1)
+        path = two_opt(dist, [0, 2, 1, 3])
+        self.assertEqual(path.tolist(), [0, 1, 2, 3])
+        self.assertAlmostEqual(path_legs(dist, path)[-1], dist[0, 3])
+
+    def test_pending_deliveries_are_routed_in_driving_order(self):
+        from .dispatch import dispatch
+
+        far = self.create_delivery(Decimal('-0.10'), Decimal('36.07'))
+        near = self.create_delivery(Decimal('-0.25'), Decimal('36.07'))
+        middle = self.create_delivery(Decimal('-0.20'), Decimal('36.07'))
+        other_county = County.objects.create(name='Elsewhere', code='zz')
+        stray = self.create_delivery(Decimal('-1.00'), Decimal('37.00'), county=other_county)
+        unmapped = self.create_delivery(None, None)
+
+        plan = dispatch(max_stops=2)
+        self.assertEqual(set(plan.unplanned), {stray.pk, unmapped.pk})
+        self.assertEqual(DeliveryRoute.objects.count(), 2)
+        routed = {d.pk: (d.route_id, d.route_stop) for d in Delivery.objects.filter(route__isnull=False)}
+        self.assertEqual(set(routed), {far.pk, near.pk, middle.pk})
+        # The two nearest share a route, nearest dropped first
+        self.assertEqual(routed[near.pk][0], routed[middle.pk][0])
+        self.assertEqual((routed[near.pk][1], routed[middle.pk][1]), (1, 2))
+        # Planning again leaves routed deliveries alone
+        self.assertEqual(dispatch().planned, 0)
+
+    def test_partner_not_serving_the_county_is_replaced(self):
+        from .dispatch import plan_dispatch
+
+        elsewhere = County.objects.create(name='Elsewhere', code='zz')
+        outsider = self.create_partner('Outsider', elsewhere)
+        delivery = self.create_delivery(Decimal('-0.20'), Decimal('36.07'), partner=outsider)
+        plan = plan_dispatch()
+        self.assertEqual([(route.partner_id, route.drops) for route in plan.routes], [(self.partner.pk, [delivery.pk])])
+        self.assertEqual(plan.routes[0].stops()[0], {'kind': 'pickup', 'location': self.market['location'].pk, 'deliveries': [delivery.pk]})
+
+    def test_route_driver_and_cancellation_reach_deliveries(self):
+        from .dispatch import dispatch
+
+        delivery = self.create_delivery(Decimal('-0.20'), Decimal('36.07'))
+        dispatch()
+        route = DeliveryRoute.objects.get()
+        route.driver_name, route.vehicle_details = 'Otieno', 'KCA 123A'
+        route.save()
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.driver_name, delivery.vehicle_details), ('Otieno', 'KCA 123A'))
+        route.status = 'cancelled'
+        route.save(update_fields=['status'])
+        delivery.refresh_from_db()
+        self.assertIsNone(delivery.route_id)
+
+
+class DeliveryTrackingTests(TestCase):
+
+    def setUp(self):
+        market = create_marketplace()
+        self.buyer = buyer = CustomUser.objects.create(username='buyer', phone_number='+254800', user_type='buyer')
+        partner = DeliveryPartner.objects.create(name='Rider', contact_person='R', phone_number='0700', email='d@example.com')
+        self.dispatcher = CustomUser.objects.create(username='dispatch', phone_number='+254810')
+        partner.accounts.add(self.dispatcher)
+        self.deliveries = []
+        for _ in range(3):
+            order = Order.objects.create(
+                buyer=buyer, farmer=market['farmer'], delivery_location=market['location'],
+                subtotal=Decimal('10'), total_amount=Decimal('10'), expected_delivery_date=timezone.now(),
+            )
+            self.deliveries.append(Delivery.objects.create(
+                order=order, delivery_partner=partner, pickup_address='Farm', delivery_address='Home',
+                estimated_delivery_time=timezone.now(), delivery_fee=Decimal('100'),
+            ))
+        self.start = timezone.now().replace(microsecond=0)
+
+    def ping(self, delivery, minute, status='', located=True):
+        event = {'delivery': delivery.pk, 'recorded_at': self.start + timezone.timedelta(minutes=minute), 'status': status}
+        if located:
+            event.update(latitude=-1.0 - minute / 100, longitude=36.8)
+        return event
+
+    def test_ingest_appends_and_keeps_a_capped_summary(self):
+        from .tracking import SUMMARY_SIZE, ingest_events
+
+        delivery = self.deliveries[0]
+        events = [self.ping(delivery, 0, 'picked_up')] + [self.ping(delivery, m) for m in range(1, 15)]
+        events.append(self.ping(delivery, 15, 'in_transit', located=False))
+        self.assertEqual(ingest_events(events + [{'delivery': 999999, 'recorded_at': self.start}]), [999999])
+        # A resent batch is skipped
+        ingest_events(events)
+        self.assertEqual(delivery.tracking_events.count(), 16)
+
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, 'in_transit')
+        self.assertEqual(delivery.actual_pickup_time, self.start)
+        self.assertEqual(len(delivery.tracking_updates), SUMMARY_SIZE)
+        self.assertEqual(delivery.tracking_updates[0], {'at': events[-1]['recorded_at'].isoformat(), 'status': 'in_transit'})
+        self.assertAlmostEqual(delivery.tracking_updates[1]['lat'], -1.14)
+
+    def test_ingest_queries_do_not_grow_with_the_batch(self):
+        from .tracking import ingest_events
+
+        def batch(start):
+            return [self.ping(delivery, minute) for minute in range(start, start + 20) for delivery in self.deliveries]
+
+        ingest_events(batch(0))
+        with self.assertNumQueries(5) as small:
+            ingest_events(batch(20)[:2])
+        with self.assertNumQueries(len(small)):
+            ingest_events(batch(40))
+
+    def test_latest_position_and_trail(self):
+        from .tracking import ingest_events, latest_positions, trail
+
+        first, second, quiet = self.deliveries
+        ingest_events([self.ping(first, m) for m in range(5)] + [self.ping(first, 5, 'delivered', located=False)])
+        ingest_events([self.ping(second, 2)])
+        latest = latest_positions([first.pk, second.pk, quiet.pk])
+        self.assertEqual(latest, {
+            first.pk: (self.start + timezone.timedelta(minutes=4), -1.04, 36.8),
+            second.pk: (self.start + timezone.timedelta(minutes=2), -1.02, 36.8),
+        })
+        self.assertEqual([lat for _at, lat, _lon in trail(first.pk, since=self.start + timezone.timedelta(minutes=2))], [-1.03, -1.04])
+
+    def post_events(self, events):
+        for event in events:
+            event['recorded_at'] = event['recorded_at'].isoformat()
+        return self.client.post('/api/deliveries/tracking/', {'events': events}, content_type='application/json')
+
+    def test_tracking_endpoints(self):
+        self.client.force_login(self.dispatcher)
+        delivery = self.deliveries[0]
+        events = [self.ping(delivery, m) for m in range(3)] + [self.ping(delivery, 3, 'out_for_delivery', located=False)]
+        for event in events:
+            event['recorded_at'] = event['recorded_at'].isoformat()
+        response = self.client.post('/api/deliveries/tracking/', {'events': events}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'accepted': 4, 'unknown_deliveries': []})
+
+        bad = {'events': [{'delivery': delivery.pk, 'recorded_at': events[0]['recorded_at'], 'latitude': -1.0}]}
+        self.assertEqual(self.client.post('/api/deliveries/tracking/', bad, content_type='application/json').status_code, 400)
+
+        body = self.client.get(f'/api/deliveries/{delivery.pk}/tracking/', {'since': events[0]['recorded_at']}).json()
+        self.assertEqual(body['status'], 'out_for_delivery')
+        self.assertEqual(body['latest']['lat'], -1.02)
+        self.assertEqual([point[1] for point in body['trail']], [-1.01, -1.02])
+        self.assertEqual(self.client.get('/api/deliveries/999999/tracking/').status_code, 404)
+
+    def test_tracking_is_limited_to_partner_driver_and_buyer(self):
+        delivery = self.deliveries[0]
+        url = f'/api/deliveries/{delivery.pk}/tracking/'
+        self.assertEqual(self.post_events([self.ping(delivery, 0, 'delivered')]).status_code, 403)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        # Another partner's dispatcher can neither report nor follow the
+        # delivery, and cannot tell it from one that does not exist
+        outsider = CustomUser.objects.create(username='other', phone_number='+254820')
+        other = DeliveryPartner.objects.create(name='Other', contact_person='O', phone_number='0701', email='o@example.com')
+        other.accounts.add(outsider)
+        self.client.force_login(outsider)
+        response = self.post_events([self.ping(delivery, 0, 'delivered')])
+        self.assertEqual((response.status_code, response.json()), (202, {'accepted': 0, 'unknown_deliveries': [delivery.pk]}))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get('/api/deliveries/999999/tracking/').status_code, 404)
+        self.assertFalse(delivery.tracking_events.exists())
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.actual_delivery_time), ('assigned', None))
+
+        # The driver reports by phone number; the buyer follows but cannot report
+        Delivery.objects.filter(pk=delivery.pk).update(driver_phone=outsider.phone_number)
+        self.assertEqual(self.post_events([self.ping(delivery, 0)]).json()['accepted'], 1)
+        self.assertEqual(self.post_events([self.ping(self.deliveries[1], 0)]).json()['accepted'], 0)
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.client.get(url).json()['latest']['lat'], -1.0)
+        self.assertEqual(self.post_events([self.ping(delivery, 1)]).json()['accepted'], 0)
+        self.assertEqual(delivery.tracking_events.count(), 1)
+
+
+class GeoSearchTests(TestCase):
+
+    def setUp(self):
+        self.market = create_marketplace()
+        self.centre = (-0.30, 36.07)
+
+    def place(self, user, lat, lon):
+        market = self.market
+        return Location.objects.create(
+            user=user, name='Place', county=market['county'], subcounty=market['subcounty'], ward=market['ward'],
+            village='V', detailed_address='A', latitude=Decimal(str(lat)), longitude=Decimal(str(lon)),
+        )
+
+    def test_radius_and_nearest_match_a_full_scan(self):
+        import numpy as np
+        from .geo import haversine_km, nearest, within
+
+        rng = np.random.default_rng(3)
+        points = np.round(np.column_stack([
+            self.centre[0] + rng.uniform(-0.3, 0.3, 60), self.centre[1] + rng.uniform(-0.3, 0.3, 60),
+        ]), 5)
+        farms = [
+            Farm.objects.create(farmer=self.market['farmer'], name=f'farm {i}', location=self.place(self.market['user'], lat, lon), size=1)
+            for i, (lat, lon) in enumerate(points.tolist())
+        ]
+        distances = haversine_km(*self.centre, points[:, 0], points[:, 1])
+        by_distance = [farms[i].pk for i in np.argsort(distances)]
+
+        found = within('farms', *self.centre, 12)
+        self.assertEqual([result.pk for result in found], by_distance[:int((distances <= 12).sum())])
+        self.assertTrue(all(result.distance_km <= 12 for result in found))
+        # More than the first radius holds, so the search widens
+        self.assertEqual([result.pk for result in nearest('farms', *self.centre, 25)], by_distance[:25])
+        Farm.objects.filter(pk=by_distance[0]).update(is_active=False)
+        self.assertEqual(nearest('farms', *self.centre, 1)[0].pk, by_distance[1])
+
+    def test_suppliers_and_agents_are_placed_at_their_nearest_location(self):
+        from .geo import nearest, within
+
+        user = CustomUser.objects.create(username='agrovet', phone_number='+254801', user_type='supplier')
+        self.place(user, -0.50, 36.07)
+        self.place(user, -0.31, 36.07)
+        supplier = InputSupplier.objects.create(user=user, business_name='Agrovet')
+        supplier.service_areas.add(self.market['county'])
+        found = within('suppliers', *self.centre, 50)
+        self.assertEqual([(result.pk, result.label) for result in found], [(supplier.pk, 'Agrovet')])
+        self.assertLess(found[0].distance_km, 2)
+        other = County.objects.create(name='Elsewhere', code='zz')
+        self.assertEqual(within('suppliers', *self.centre, 50, county=other.pk), [])
+
+        agent_user = CustomUser.objects.create(
+            username='agent', phone_number='+254802', user_type='agent', first_name='Wanjiku', last_name='M',
+        )
+        self.place(agent_user, -0.30, 36.08)
+        agent = ExtensionAgent.objects.create(user=agent_user, employee_id='E1', qualifications='BSc', years_of_experience=3)
+        self.assertEqual([result.label for result in nearest('agents', *self.centre, 5)], ['Wanjiku M'])
+        agent.is_available = False
+        agent.save()
+        self.assertEqual(nearest('agents', *self.centre, 5, max_radius_km=20), [])
+
+    def test_geo_cell_follows_coordinates_and_rebuild_fixes_drift(self):
+        import io
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from .geo import cell_of, cell_ranges, within
+
+        location = self.place(self.market['user'], -0.30, 36.07)
+        self.assertEqual(location.geo_cell, cell_of(Decimal('-0.30'), Decimal('36.07')))
+        self.assertTrue(any(first <= location.geo_cell <= last for first, last in cell_ranges(-0.301, 36.071, 1)))
+        location.latitude = Decimal('1.5')
+        location.save(update_fields=['latitude'])
+        location.refresh_from_db()
+        self.assertEqual(location.geo_cell, cell_of(Decimal('1.5'), Decimal('36.07')))
+
+        Farm.objects.create(farmer=self.market['farmer'], name='moved', location=location, size=1)
+        Location.objects.filter(pk=location.pk).update(latitude=Decimal('-0.30'))
+        self.assertEqual(within('farms', *self.centre, 5), [])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_geo_cells', verify=True, stdout=io.StringIO())
+        call_command('rebuild_geo_cells', stdout=io.StringIO())
+        self.assertEqual(len(within('farms', *self.centre, 5)), 1)
+
+    def test_nearby_endpoint(self):
+        location = self.place(self.market['user'], -0.31, 36.07)
+        Warehouse.objects.create(
+            name='Cold store', location=location, manager=self.market['user'], capacity=10, contact_phone='0700',
+        )
+        body = self.client.get('/api/nearby/warehouses/', {'lat': -0.30, 'lon': 36.07, 'k': 3}).json()
+        self.assertEqual([(result['name'], result['distance_km']) for result in body['results']], [('Cold store', 1.11)])
+        body = self.client.get('/api/nearby/warehouses/', {'lat': -0.30, 'lon': 36.07, 'radius': 1}).json()
+        self.assertEqual(body['results'], [])
+        self.assertEqual(self.client.get('/api/nearby/warehouses/', {'lat': -0.30}).status_code, 400)
+        self.assertEqual(self.client.get('/api/nearby/banks/', {'lat': -0.30, 'lon': 36.07}).status_code, 404)
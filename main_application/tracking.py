@@ -0,0 +1,166 @@
+"""
+Delivery tracking.
+
+Driver apps send their GPS and status pings in batches. Every ping is a
+DeliveryTrackingEvent row, appended with one INSERT per batch that skips
+pings already stored for the same delivery and instant, so an app can
+resend a batch safely and no row is ever rewritten. The (delivery,
+recorded_at) key also serves a delivery's latest position and its full
+trail from one index range.
+
+Delivery.tracking_updates only keeps a summary: the SUMMARY_SIZE latest
+events, newest first. A batch reads the summaries of its deliveries in
+the query that checks they exist, merges its events into them and writes
+them back with one prepared UPDATE run through executemany(), which also
+moves each delivery to the status of its latest status ping and stamps
+its pickup and delivery times. A batch costs the same few queries
+however many events and deliveries it holds.
+
+Events are reported by the accounts of a delivery's partner, its driver
+(matched by phone number) and staff; the buyer of the order may also
+follow the trail.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from django.db import connection, transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Delivery, DeliveryTrackingEvent
+
+
+SUMMARY_SIZE = 10
+
+# Events accepted per ingest request
+MAX_BATCH = 1000
+
+# Delivery columns stamped by the first ping of a status
+STAMPED_AT = {'picked_up': 'actual_pickup_time', 'delivered': 'actual_delivery_time'}
+
+
+def reporter_filter(user):
+    """Q of the deliveries user may send tracking events for"""
+    if user.is_staff:
+        return Q()
+    reporter = Q(delivery_partner__accounts=user)
+    if user.phone_number:
+        reporter |= Q(driver_phone=user.phone_number)
+    return reporter
+
+
+def viewer_filter(user):
+    """Q of the deliveries whose tracking user may read"""
+    if user.is_staff:
+        return Q()
+    return reporter_filter(user) | Q(order__buyer=user)
+
+
+def latest_events(delivery_ids, count=SUMMARY_SIZE, located=False):
+    """The count latest events of each delivery, newest first; only those with a position if located"""
+    events = DeliveryTrackingEvent.objects.filter(delivery_id__in=delivery_ids)
+    if located:
+        events = events.filter(latitude__isnull=False, longitude__isnull=False)
+    return events.annotate(
+        rank=Window(RowNumber(), partition_by=F('delivery_id'), order_by=F('recorded_at').desc()),
+    ).filter(rank__lte=count).order_by('delivery_id', 'rank')
+
+
+def latest_positions(delivery_ids):
+    """{delivery id: (recorded_at, latitude, longitude)} of the last known position of each delivery"""
+    rows = latest_events(delivery_ids, count=1, located=True).values_list('delivery_id', 'recorded_at', 'latitude', 'longitude')
+    return {delivery_id: tuple(position) for delivery_id, *position in rows}
+
+
+def trail(delivery_id, since=None):
+    """(recorded_at, latitude, longitude) of every position of a delivery, oldest first"""
+    events = DeliveryTrackingEvent.objects.filter(delivery_id=delivery_id, latitude__isnull=False, longitude__isnull=False)
+    if since is not None:
+        events = events.filter(recorded_at__gt=since)
+    return events.order_by('recorded_at').values_list('recorded_at', 'latitude', 'longitude')
+
+
+def summary_entry(event):
+    entry = {'at': event['recorded_at'].astimezone(dt_timezone.utc).isoformat()}
+    if event.get('latitude') is not None:
+        entry.update(lat=event['latitude'], lon=event['longitude'])
+    if event.get('accuracy') is not None:
+        entry['accuracy'] = event['accuracy']
+    if event.get('status'):
+        entry['status'] = event['status']
+    return entry
+
+
+def merge_summary(summary, events):
+    """A delivery's summary with events added: the SUMMARY_SIZE latest, newest first, resent events once"""
+    # Entries written before the events table have no time and make way
+    entries = {datetime.fromisoformat(entry['at']): entry for entry in summary if 'at' in entry}
+    for event in events:
+        entries.setdefault(event['recorded_at'], summary_entry(event))
+    return [entries[at] for at in sorted(entries, reverse=True)[:SUMMARY_SIZE]]
+
+
+def write_summaries(rows):
+    """
+    Set (summary, status or None to keep it, pickup time, delivery time,
+    delivery id) rows with one prepared UPDATE; times only fill empty columns.
+    """
+    qn = connection.ops.quote_name
+    meta = Delivery._meta
+    summary, status = meta.get_field('tracking_updates'), meta.get_field('status')
+    stamped = [meta.get_field(name) for name in STAMPED_AT.values()]
+    sql = (
+        f'UPDATE {qn(meta.db_table)} SET {qn(summary.column)} = %s, '
+        f'{qn(status.column)} = COALESCE(%s, {qn(status.column)})'
+        + ''.join(f', {qn(field.column)} = COALESCE({qn(field.column)}, %s)' for field in stamped)
+        + f' WHERE {qn(meta.pk.column)} = %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (
+                summary.get_db_prep_save(row[0], connection), row[1],
+                *(field.get_db_prep_save(value, connection) for field, value in zip(stamped, row[2:])),
+                row[-1],
+            )
+            for row in rows
+        ])
+
+
+def ingest_events(events, deliveries=None):
+    """
+    Append tracking events, dicts of delivery (id), recorded_at, and
+    latitude, longitude, accuracy and status where known, and merge them
+    into their deliveries' summaries. deliveries narrows the deliveries
+    events may be added to. Events of unknown deliveries, or of those
+    outside deliveries, are dropped; returns their delivery ids.
+    """
+    by_delivery = defaultdict(list)
+    for event in events:
+        by_delivery[event['delivery']].append(event)
+    with transaction.atomic():
+        locked = Delivery.objects.select_for_update().filter(pk__in=by_delivery)
+        if deliveries is not None:
+            # A subquery, so the rows locked are never on the nullable side of a join
+            locked = locked.filter(pk__in=deliveries.values('pk'))
+        summaries = dict(locked.values_list('pk', 'tracking_updates'))
+        DeliveryTrackingEvent.objects.bulk_create([
+            DeliveryTrackingEvent(
+                delivery_id=event['delivery'], recorded_at=event['recorded_at'],
+                latitude=event.get('latitude'), longitude=event.get('longitude'),
+                accuracy=event.get('accuracy'), status=event.get('status') or '',
+            )
+            for delivery_id in summaries for event in by_delivery[delivery_id]
+        ], ignore_conflicts=True)
+        rows = []
+        for delivery_id, summary in summaries.items():
+            delivery_events = by_delivery[delivery_id]
+            summary = merge_summary(summary, delivery_events)
+            # The newest status ping still in the summary, so a late ping never winds the status back
+            status = next((entry['status'] for entry in summary if 'status' in entry), None)
+            stamps = {
+                column: min((event['recorded_at'] for event in delivery_events if event.get('status') == stamped), default=None)
+                for stamped, column in STAMPED_AT.items()
+            }
+            rows.append((summary, status, *(stamps[column] for column in STAMPED_AT.values()), delivery_id))
+        write_summaries(rows)
+    return sorted(set(by_delivery) - set(summaries))
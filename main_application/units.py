@@ -0,0 +1,205 @@
+"""
+Conversions between ProductUnits.
+
+A unit holds conversion_factor of its base_unit, and base units may point
+further (crate -> kilogram -> tonne). UnitGraph resolves every chain once
+to the root unit at its end and the product of the factors along the way,
+so converting any quantity or price is a dictionary lookup. The graph is
+loaded with one query and cached per process. ProductUnit saves and
+deletes drop this process's cache (see signals.py); other processes
+reload theirs after GRAPH_TTL seconds.
+
+Product.price_per_base_unit and MarketPrice.price_per_base_unit store the
+price per root unit so listings and market reports compare, sort and
+aggregate on an indexed column. Writes that bypass save() need
+refresh_base_prices().
+"""
+
+from decimal import Decimal
+from django.db.models import Case, DecimalField, F, IntegerField, Value, When
+from time import monotonic
+import numpy as np
+
+from .models import MarketPrice, Product, ProductUnit
+
+
+PRICE_PLACES = Decimal('0.0001')
+
+GRAPH_TTL = 300
+
+# Models storing price_per_base_unit next to price_per_unit and unit
+PRICED_MODELS = [Product, MarketPrice]
+
+
+class UnitGraph:
+    """Root unit and total conversion factor of every ProductUnit"""
+
+    def __init__(self, units):
+        """units: {unit id: (base unit id or None, conversion factor)}"""
+        self.roots = {}
+        self.factors = {}
+        for unit_id in units:
+            self._resolve(unit_id, units)
+
+    def _resolve(self, unit_id, units):
+        path = []
+        current = unit_id
+        while current not in self.roots:
+            if current in path or current not in units:
+                # A cycle or a dangling base unit: nothing on the path converts
+                for member in path:
+                    self.roots[member] = self.factors[member] = None
+                return
+            path.append(current)
+            base_unit_id, _factor = units[current]
+            if base_unit_id is None:
+                self.roots[current], self.factors[current] = current, Decimal(1)
+                path.pop()
+                break
+            current = base_unit_id
+        root, factor = self.roots[current], self.factors[current]
+        for member in reversed(path):
+            step = units[member][1]
+            if root is None or not step:
+                root = factor = None
+            else:
+                factor = step * factor
+            self.roots[member], self.factors[member] = root, factor
+
+    def root(self, unit_id):
+        """Id of the unit unit_id converts to, or None if it cannot be converted"""
+        return self.roots.get(unit_id)
+
+    def factor(self, unit_id):
+        """Root units in one unit_id, or None if it cannot be converted"""
+        return self.factors.get(unit_id)
+
+    def conversions(self):
+        """{unit id: (root id, factor)}"""
+        return {unit_id: (self.roots[unit_id], self.factors[unit_id]) for unit_id in self.roots}
+
+    def members(self, root_id):
+        """Ids of every unit converting to root_id, root_id included"""
+        return sorted(unit_id for unit_id, root in self.roots.items() if root == root_id)
+
+    def base_price(self, price, unit_id):
+        """Price per root unit of a price per unit_id"""
+        factor = self.factor(unit_id)
+        if price is None or not factor:
+            return None
+        return (Decimal(price) / factor).quantize(PRICE_PLACES)
+
+    def base_quantity(self, quantity, unit_id):
+        factor = self.factor(unit_id)
+        if quantity is None or factor is None:
+            return None
+        return Decimal(quantity) * factor
+
+    def convert_quantity(self, quantity, from_unit_id, to_unit_id):
+        return self.base_quantity(quantity, from_unit_id) / self._target_factor(from_unit_id, to_unit_id)
+
+    def convert_price(self, price, from_unit_id, to_unit_id):
+        return self.base_price(price, from_unit_id) * self._target_factor(from_unit_id, to_unit_id)
+
+    def _target_factor(self, from_unit_id, to_unit_id):
+        root = self.root(from_unit_id)
+        if root is None or root != self.root(to_unit_id) or not self.factor(to_unit_id):
+            raise ValueError(f"Unit {from_unit_id} cannot be converted to unit {to_unit_id}")
+        return self.factor(to_unit_id)
+
+    def factor_array(self, unit_ids):
+        """float64 factors for an array of unit ids (NaN where not convertible)"""
+        unit_ids = np.asarray(unit_ids, dtype=np.int64)
+        lookup = np.full(max(self.factors, default=0) + 1, np.nan)
+        for unit_id, factor in self.factors.items():
+            if factor:
+                lookup[unit_id] = float(factor)
+        inside = (unit_ids >= 0) & (unit_ids < len(lookup))
+        return np.where(inside, lookup[np.clip(unit_ids, 0, len(lookup) - 1)], np.nan)
+
+    def factor_expression(self, unit_field='unit'):
+        """SQL CASE giving the factor of the unit in unit_field (NULL if not convertible)"""
+        return Case(
+            *[When(**{f'{unit_field}_id': unit_id}, then=Value(factor))
+              for unit_id, factor in sorted(self.factors.items()) if factor],
+            default=None,
+            output_field=DecimalField(max_digits=20, decimal_places=10),
+        )
+
+    def root_expression(self, unit_field='unit'):
+        """SQL CASE giving the root unit id of the unit in unit_field"""
+        return Case(
+            *[When(**{f'{unit_field}_id': unit_id}, then=Value(root))
+              for unit_id, root in sorted(self.roots.items()) if root is not None],
+            default=None,
+            output_field=IntegerField(),
+        )
+
+    def base_price_expression(self, price_field='price_per_unit', unit_field='unit'):
+        return F(price_field) / self.factor_expression(unit_field)
+
+
+_graph = None
+_loaded_at = 0.0
+
+
+def unit_graph():
+    """The cached UnitGraph, loaded on first use and after GRAPH_TTL seconds"""
+    global _graph, _loaded_at
+    if _graph is None or monotonic() - _loaded_at > GRAPH_TTL:
+        _graph = UnitGraph({
+            unit_id: (base_unit_id, factor)
+            for unit_id, base_unit_id, factor in ProductUnit.objects.values_list('id', 'base_unit_id', 'conversion_factor')
+        })
+        _loaded_at = monotonic()
+    return _graph
+
+
+def invalidate_unit_graph():
+    global _graph
+    _graph = None
+
+
+def annotate_price_in(queryset, unit_id, name='unit_price'):
+    """
+    Annotate every row of a priced queryset with its price converted to
+    unit_id, computed in SQL from price_per_base_unit. Rows whose unit
+    does not share unit_id's root get NULL.
+    """
+    graph = unit_graph()
+    root, factor = graph.root(unit_id), graph.factor(unit_id)
+    if root is None or not factor:
+        raise ValueError(f"Unit {unit_id} cannot be converted")
+    return queryset.annotate(**{name: Case(
+        When(unit_id__in=graph.members(root), then=F('price_per_base_unit') * Value(factor)),
+        default=None,
+        output_field=DecimalField(max_digits=20, decimal_places=4),
+    )})
+
+
+def refresh_base_prices(unit_ids=None, models=PRICED_MODELS):
+    """
+    Recompute price_per_base_unit with one UPDATE per model, for rows in
+    unit_ids or all rows. Returns the number of rows updated.
+    """
+    graph = unit_graph()
+    updated = 0
+    for model in models:
+        rows = model.objects.all()
+        if unit_ids is not None:
+            rows = rows.filter(unit_id__in=unit_ids)
+        updated += rows.update(price_per_base_unit=graph.base_price_expression())
+    return updated
+
+
+def find_base_price_drift(models=PRICED_MODELS):
+    """[(model name, pk, stored, expected)] for rows whose price_per_base_unit is stale"""
+    graph = unit_graph()
+    drift = []
+    for model in models:
+        rows = model.objects.order_by('pk').values_list('pk', 'price_per_unit', 'unit_id', 'price_per_base_unit')
+        for pk, price, unit_id, stored in rows.iterator(chunk_size=2000):
+            expected = graph.base_price(price, unit_id)
+            if stored != expected:
+                drift.append((model._meta.model_name, pk, stored, expected))
+    return drift
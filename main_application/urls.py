@@ -0,0 +1,15 @@
+from django.urls import path
+
+from . import views
+
+
+urlpatterns = [
+    path('api/market-prices/', views.MarketPriceListView.as_view(), name='market-price-list'),
+    path('api/market-prices/series/', views.MarketPriceSeriesView.as_view(), name='market-price-series'),
+    path('api/products/browse/', views.ProductBrowseView.as_view(), name='product-browse'),
+    path('api/deliveries/tracking/', views.DeliveryTrackingIngestView.as_view(), name='delivery-tracking-ingest'),
+    path('api/deliveries/<int:pk>/tracking/', views.DeliveryTrackingView.as_view(), name='delivery-tracking'),
+    path('api/nearby/<slug:kind>/', views.NearbyView.as_view(), name='nearby'),
+    path('api/payments/callback/', views.PaymentCallbackView.as_view(), name='payment-callback'),
+    path('api/products/search/', views.ProductSearchView.as_view(), name='product-search'),
+]
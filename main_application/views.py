@@ -11,3 +11,277 @@ def custom_403(request, exception):
 
 def custom_400(request, exception):
     return render(request, "errors/400.html", status=400)
+
+
+# ============== API ==============
+
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.generics import ListAPIView
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+import hmac
+
+from .facets import browse_products, parse_selection
+from .geo import MAX_RADIUS_KM, TARGETS, nearest, within
+from .models import Delivery, MarketPrice, Product, ProductUnit
+from .pagination import KeysetPagination
+from .payment_callbacks import SIGNATURE_HEADER, callback_signature, enqueue_callback
+from .price_rollups import PERIODS, price_series
+from .search import search_products
+from .serializers import (
+    MarketPriceSerializer, PaymentCallbackSerializer, ProductListSerializer, ProductSearchResultSerializer,
+    TrackingBatchSerializer,
+)
+from .tracking import ingest_events, latest_positions, reporter_filter, trail, viewer_filter
+
+
+def int_param(request, name, default, minimum=1, maximum=None):
+    """Read a positive integer query parameter, raising a 400 on bad input"""
+    value = request.query_params.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({name: 'Must be an integer.'})
+    if value < minimum:
+        raise ValidationError({name: f'Must be at least {minimum}.'})
+    return min(value, maximum) if maximum else value
+
+
+def float_param(request, name, minimum, maximum):
+    """Read a required number query parameter within [minimum, maximum], raising a 400 on bad input"""
+    if name not in request.query_params:
+        raise ValidationError({name: 'This parameter is required.'})
+    try:
+        value = float(request.query_params[name])
+    except ValueError:
+        raise ValidationError({name: 'Must be a number.'})
+    if not minimum <= value <= maximum:
+        raise ValidationError({name: f'Must be between {minimum} and {maximum}.'})
+    return value
+
+
+LISTING_QUERYSET = Product.objects.select_related('crop', 'unit', 'farm__location__county')
+
+
+class ProductSearchView(APIView):
+    """Ranked full-text search over active product listings: ?q=maize nakuru&page=2"""
+    max_page_size = 100
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        results = search_products(
+            query,
+            page=int_param(request, 'page', 1),
+            per_page=int_param(request, 'page_size', 20, maximum=self.max_page_size),
+            queryset=LISTING_QUERYSET,
+        )
+        return Response({
+            'query': query,
+            'count': results.total,
+            'page': results.page,
+            'num_pages': results.num_pages,
+            'results': ProductSearchResultSerializer(results.products, many=True).data,
+        })
+
+
+class ProductBrowseView(APIView):
+    """
+    Active listings filtered by facets, with counts for every facet value:
+    ?category=3&county=12&county=14&quality_grade=premium&organic_certified=true&price_band=100-500
+    &sort=price orders by price per base unit instead of newest first.
+    """
+    max_page_size = 100
+    orderings = {
+        'newest': ('-created_at', '-pk'),
+        'price': ('price_per_base_unit', 'pk'),
+        '-price': ('-price_per_base_unit', '-pk'),
+    }
+
+    def get(self, request):
+        try:
+            selected = parse_selection(request.query_params)
+        except ValueError as e:
+            raise ValidationError({'detail': str(e)})
+        sort = request.query_params.get('sort', 'newest')
+        if sort not in self.orderings:
+            raise ValidationError({'sort': f"Must be one of {', '.join(self.orderings)}."})
+        results = browse_products(
+            selected,
+            page=int_param(request, 'page', 1),
+            per_page=int_param(request, 'page_size', 20, maximum=self.max_page_size),
+            queryset=LISTING_QUERYSET,
+            ordering=self.orderings[sort],
+        )
+        return Response({
+            'count': results.total,
+            'page': results.page,
+            'num_pages': results.num_pages,
+            'facets': results.facets,
+            'results': ProductListSerializer(results.products, many=True).data,
+        })
+
+
+class MarketPriceListView(ListAPIView):
+    """Market prices, newest first, paged by cursor: ?crop=3&county=12&cursor=..."""
+    serializer_class = MarketPriceSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-date_recorded', '-id')
+
+    def get_queryset(self):
+        queryset = MarketPrice.objects.select_related('crop', 'location', 'unit')
+        for param, field in (('crop', 'crop_id'), ('county', 'location_id')):
+            if param in self.request.query_params:
+                queryset = queryset.filter(**{field: int_param(self.request, param, None)})
+        return queryset
+
+
+def date_param(request, name):
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValidationError({name: 'Must be a date (YYYY-MM-DD).'})
+    return day
+
+
+class MarketPriceSeriesView(APIView):
+    """
+    Price statistics per period for one crop, served from the rollups:
+    ?crop=3&period=month&county=12&quality_grade=Grade A&unit=2&start=2026-01-01&end=2026-06-30
+    """
+
+    def get(self, request):
+        if 'crop' not in request.query_params:
+            raise ValidationError({'crop': 'This parameter is required.'})
+        period = request.query_params.get('period', 'week')
+        if period not in PERIODS:
+            raise ValidationError({'period': f"Must be one of {', '.join(PERIODS)}."})
+        unit = None
+        if 'unit' in request.query_params:
+            unit = ProductUnit.objects.filter(pk=int_param(request, 'unit', None)).first()
+            if unit is None:
+                raise ValidationError({'unit': 'Unknown unit.'})
+        try:
+            series = price_series(
+                int_param(request, 'crop', None),
+                period=period,
+                county_id=int_param(request, 'county', None) if 'county' in request.query_params else None,
+                quality_grade=request.query_params.get('quality_grade'),
+                unit=unit,
+                start=date_param(request, 'start'),
+                end=date_param(request, 'end'),
+            )
+        except ValueError as e:
+            raise ValidationError({'unit': str(e)})
+        return Response({
+            'crop': series.crop_id,
+            'period': series.period,
+            'unit': series.unit.abbreviation if series.unit else None,
+            'points': [point.as_dict() for point in series],
+        })
+
+
+class PaymentCallbackView(APIView):
+    """
+    Gateway payment callbacks, signed with PAYMENT_CALLBACK_SECRET in the
+    X-Callback-Signature header; every callback is refused until a secret
+    is configured. Callbacks are only queued here; the payment workers
+    apply them (see payment_callbacks.py).
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        # Read the raw body before DRF parses it
+        body = request.body
+        secret = settings.PAYMENT_CALLBACK_SECRET
+        if not secret:
+            raise PermissionDenied('Payment callbacks are not configured.')
+        if not hmac.compare_digest(request.headers.get(SIGNATURE_HEADER, ''), callback_signature(body, secret)):
+            raise PermissionDenied('Bad callback signature.')
+        serializer = PaymentCallbackSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        enqueue_callback(payload=request.data, **serializer.validated_data)
+        return Response({'status': 'queued'}, status=status.HTTP_202_ACCEPTED)
+
+
+class DeliveryTrackingIngestView(APIView):
+    """
+    Batched GPS and status pings from driver apps:
+    {"events": [{"delivery": 12, "recorded_at": "...", "latitude": -1.28, "longitude": 36.82, "status": "in_transit"}]}
+    Pings already stored are skipped, so a batch can be resent. Pings of
+    deliveries the caller does not partner or drive are dropped and listed
+    as unknown, like those of deliveries that do not exist.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = TrackingBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        events = serializer.validated_data['events']
+        unknown = ingest_events(events, Delivery.objects.filter(reporter_filter(request.user)))
+        return Response({
+            'accepted': sum(event['delivery'] not in unknown for event in events),
+            'unknown_deliveries': unknown,
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class DeliveryTrackingView(APIView):
+    """
+    A delivery's status, last known position and trail of positions:
+    ?since=2026-05-01T08:00:00Z. Open to the order's buyer, the delivery
+    partner's accounts, the driver and staff; not found for anyone else.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        followed = Delivery.objects.filter(viewer_filter(request.user)).values('pk')
+        delivery = get_object_or_404(Delivery.objects.filter(pk__in=followed).only('pk', 'status'), pk=pk)
+        since = request.query_params.get('since')
+        if since is not None:
+            since = parse_datetime(since)
+            if since is None:
+                raise ValidationError({'since': 'Must be a date and time (ISO 8601).'})
+        latest = latest_positions([delivery.pk]).get(delivery.pk)
+        return Response({
+            'delivery': delivery.pk,
+            'status': delivery.status,
+            'latest': {'at': latest[0], 'lat': latest[1], 'lon': latest[2]} if latest else None,
+            # Compact [time, lat, lon] rows; trails run to thousands of points
+            'trail': [[at, lat, lon] for at, lat, lon in trail(delivery.pk, since)],
+        })
+
+
+class NearbyView(APIView):
+    """
+    Farms, warehouses, input suppliers or agents near a point, nearest first:
+    /api/nearby/farms/?lat=-0.30&lon=36.07&radius=10, or &k=5 for the five nearest;
+    &county=12 keeps those in (or, for suppliers and agents, serving) a county.
+    """
+    max_results = 100
+
+    def get(self, request, kind):
+        if kind not in TARGETS:
+            raise NotFound(f"Search one of {', '.join(TARGETS)}.")
+        latitude = float_param(request, 'lat', -90, 90)
+        longitude = float_param(request, 'lon', -180, 180)
+        county = int_param(request, 'county', None) if 'county' in request.query_params else None
+        k = int_param(request, 'k', 10, maximum=self.max_results)
+        if 'radius' in request.query_params:
+            radius = float_param(request, 'radius', 0, MAX_RADIUS_KM)
+            results = within(kind, latitude, longitude, radius, county)[:self.max_results]
+        else:
+            results = nearest(kind, latitude, longitude, k, county)
+        return Response({
+            'kind': kind,
+            'results': [
+                {'id': result.pk, 'name': result.label, 'distance_km': round(result.distance_km, 2)}
+                for result in results
+            ],
+        })